@@ -0,0 +1,163 @@
+# 複数施設の一括シフト生成 (施設フォルダごとに 読み込み → ルール構造化 → モデル構築 → 求解 → 出力 をプロセスプールで並列実行)
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from src.constants import (
+    START_DATE, END_DATE, FACILITIES_DIR, BATCH_MAX_JOBS, BATCH_MIN_WORKERS_PER_JOB, BATCH_LOG_FILE, BATCH_REPORT_PREFIX,
+    AI_FAST_MODE, DATA_LOADER_VERBOSE, SNAPSHOT_ENABLED
+)
+from src.utils import facility_paths
+from shift_generator import main, solve_from_stored_rules
+
+SOLVED_STATUSES = ("OPTIMAL", "FEASIBLE")
+
+
+def find_facilities(facilities_dir):
+    """
+    従業員情報 (input/employees.csv) を持つ施設フォルダを (施設名, フォルダ) のリストで返す。
+    求解時間は職員数にほぼ比例するため、従業員ファイルの大きい施設から順に並べる (最後に大きな施設が残らないように)。
+    """
+    if not os.path.isdir(facilities_dir):
+        print(f"エラー: 施設ディレクトリが見つかりません: {facilities_dir}")
+        return []
+    facilities = []
+    for name in sorted(os.listdir(facilities_dir)):
+        facility_dir = os.path.join(facilities_dir, name)
+        employee_file = facility_paths(facility_dir)['employee_file']
+        if os.path.isdir(facility_dir) and os.path.exists(employee_file):
+            facilities.append((name, facility_dir, os.path.getsize(employee_file)))
+        elif os.path.isdir(facility_dir):
+            print(f"警告: {facility_dir} に従業員情報がないためスキップします。")
+    facilities.sort(key=lambda item: item[2], reverse=True)
+    return [(name, facility_dir) for name, facility_dir, _ in facilities]
+
+
+def plan_cpu_budget(num_facilities, total_cpus=None, max_jobs=BATCH_MAX_JOBS):
+    """
+    同時実行数と1施設あたりの探索ワーカー数を決める。
+    CP-SAT は既定で全コアを使うため、並列に解く施設数 × ワーカー数 が CPUコア数を超えないように分ける。
+    """
+    total_cpus = total_cpus or os.cpu_count() or 1
+    if max_jobs is None:
+        max_jobs = max(1, total_cpus // BATCH_MIN_WORKERS_PER_JOB)
+    jobs = max(1, min(max_jobs, num_facilities))
+    workers_per_job = max(1, total_cpus // jobs)
+    return jobs, workers_per_job, total_cpus
+
+
+def run_facility(name, facility_dir, solver_workers, from_store=False, fast_mode=AI_FAST_MODE,
+                 use_snapshot=SNAPSHOT_ENABLED, verbose=DATA_LOADER_VERBOSE):
+    """1施設分のパイプラインを実行し、結果の辞書を返す (プロセスプールのワーカーで実行。ログは施設の出力先に書く)"""
+    paths = facility_paths(facility_dir)
+    os.makedirs(paths['output_dir'], exist_ok=True)
+    log_file = os.path.join(paths['output_dir'], BATCH_LOG_FILE)
+    report = {
+        'facility': name, 'status': 'error', 'solver_status': None, 'output_file': None,
+        'log_file': log_file, 'solver_workers': solver_workers, 'elapsed_sec': None, 'error': None
+    }
+    started = time.perf_counter()
+    with open(log_file, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            if from_store:
+                result = solve_from_stored_rules(verbose=verbose, use_snapshot=use_snapshot, paths=paths, solver_workers=solver_workers)
+            else:
+                result = main(fast_mode=fast_mode, verbose=verbose, use_snapshot=use_snapshot, paths=paths, solver_workers=solver_workers)
+            report['solver_status'] = result['solver_status']
+            report['output_file'] = result['output_file']
+            report['status'] = 'ok' if result['solver_status'] in SOLVED_STATUSES and result['output_file'] else 'no_solution'
+        except SystemExit:
+            # shift_generator は入力・AI呼び出しの失敗時に中断する。理由は施設のログに出力済み
+            report['status'] = 'aborted'
+            report['error'] = f"処理が中断されました (詳細は {log_file})"
+        except Exception as e:
+            traceback.print_exc(file=log)
+            report['error'] = f"{type(e).__name__}: {e}"
+    report['elapsed_sec'] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def run_batch(facilities_dir=FACILITIES_DIR, max_jobs=BATCH_MAX_JOBS, total_cpus=None, from_store=False, fast_mode=AI_FAST_MODE,
+              use_snapshot=SNAPSHOT_ENABLED, verbose=DATA_LOADER_VERBOSE, report_file=None):
+    """全施設を並列に処理し、集計レポートを書き出す。戻り値はレポートの辞書 (施設が見つからない場合は None)"""
+    facilities = find_facilities(facilities_dir)
+    if not facilities:
+        print("エラー: 処理できる施設がありません。")
+        return None
+    jobs, workers_per_job, total_cpus = plan_cpu_budget(len(facilities), total_cpus, max_jobs)
+    print(f"--- Batch Start: {len(facilities)} 施設, 期間 {START_DATE} 〜 {END_DATE}, "
+          f"同時実行 {jobs}, 1施設あたりの探索ワーカー {workers_per_job} (CPU {total_cpus}) ---")
+
+    started_at = datetime.now()
+    started = time.perf_counter()
+    results = []
+    # AIクライアントのリトライ予算・統計は実行単位のため、1施設ごとに新しいプロセスで処理する
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as executor:
+        futures = {
+            executor.submit(run_facility, name, facility_dir, workers_per_job, from_store, fast_mode, use_snapshot, verbose): name
+            for name, facility_dir in facilities
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e: # ワーカープロセス自体の異常終了
+                result = {'facility': name, 'status': 'error', 'solver_status': None, 'output_file': None, 'log_file': None,
+                          'solver_workers': workers_per_job, 'elapsed_sec': None, 'error': f"{type(e).__name__}: {e}"}
+            results.append(result)
+            print(f"  [{len(results)}/{len(facilities)}] {name}: {result['status']} "
+                  f"({result['solver_status'] or '-'}, {result['elapsed_sec'] if result['elapsed_sec'] is not None else '-'} 秒)")
+
+    results.sort(key=lambda r: r['facility'])
+    status_counts = {}
+    for result in results:
+        status_counts[result['status']] = status_counts.get(result['status'], 0) + 1
+    report = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'period': {'start': START_DATE.isoformat(), 'end': END_DATE.isoformat()},
+        'facilities_dir': facilities_dir,
+        'total_cpus': total_cpus,
+        'jobs': jobs,
+        'solver_workers_per_job': workers_per_job,
+        'elapsed_sec': round(time.perf_counter() - started, 2),
+        'status_counts': status_counts,
+        'facilities': results,
+    }
+    if report_file is None:
+        report_file = os.path.join(facilities_dir, f"{BATCH_REPORT_PREFIX}_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    try:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"集計レポートを出力しました: {report_file}")
+    except OSError as e:
+        print(f"警告: 集計レポートの書き込みに失敗しました: {e}")
+
+    print(f"--- Batch End: {report['elapsed_sec']} 秒, {status_counts} ---")
+    for result in results:
+        if result['status'] != 'ok':
+            print(f"  {result['facility']}: {result['status']} {result['error'] or ''} (ログ: {result['log_file']})")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="複数施設のシフトを一括生成する")
+    parser.add_argument("facilities_dir", nargs="?", default=FACILITIES_DIR, help="施設フォルダを並べたディレクトリ")
+    parser.add_argument("--jobs", type=int, default=BATCH_MAX_JOBS, help="同時に処理する施設数 (省略時は CPUコア数から決める)")
+    parser.add_argument("--cpus", type=int, default=None, help="バッチ全体で使う CPUコア数 (省略時は全コア)")
+    parser.add_argument("--from-store", action="store_true", help="各施設の保存済みルールセットから求解する (AI・パース処理を省略)")
+    parser.add_argument("--fast", action="store_true", help="確認用文章と structured_data を1回の呼び出しで生成する")
+    parser.add_argument("--verbose", action="store_true", help="読み込んだ入力データの内容を各施設のログに出力する")
+    parser.add_argument("--no-snapshot", action="store_true", help="入力スナップショットを使わずにCSVから読み込む")
+    parser.add_argument("--report", default=None, help="集計レポートの出力先 (省略時は施設ディレクトリ直下)")
+    args = parser.parse_args()
+    report = run_batch(args.facilities_dir, max_jobs=args.jobs, total_cpus=args.cpus, from_store=args.from_store,
+                       fast_mode=args.fast or AI_FAST_MODE, use_snapshot=SNAPSHOT_ENABLED and not args.no_snapshot,
+                       verbose=args.verbose or DATA_LOADER_VERBOSE, report_file=args.report)
+    if report is None or report['status_counts'].get('ok', 0) != len(report['facilities']):
+        sys.exit(1)
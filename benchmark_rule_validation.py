@@ -0,0 +1,75 @@
+# ルール検証のマイクロベンチマーク (合成ルールを大量に検証して処理時間を測る)
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from src.constants import START_DATE, END_DATE
+from src.rule_parser import validate_rules_batch
+
+# 有効なルールの雛形 (一部を壊して無効なルールも混ぜる)
+PERSONAL_TEMPLATES = [
+    {"rule_type": "SPECIFY_DATE_SHIFT", "employee": "EMP001", "date": "2025-04-15", "shift": "公", "is_hard": True},
+    {"rule_type": "MAX_CONSECUTIVE_WORK", "employee": "EMP001", "max_days": 4, "is_hard": True},
+    {"rule_type": "FORBID_SHIFT", "employee": "EMP002", "shift": "夜"},
+    {"rule_type": "ALLOW_ONLY_SHIFTS", "employee": "EMP008", "allowed_shifts": ["日", "早"]},
+    {"rule_type": "FORBID_SIMULTANEOUS_SHIFT", "employee1": "EMP003", "employee2": "EMP004", "shift": "夜"},
+    {"rule_type": "TOTAL_SHIFT_COUNT", "employee": "EMP010", "shifts": ["日", "早", "夜", "明"], "min": 10, "max": 12, "is_hard": True},
+    {"rule_type": "PREFER_WEEKDAY_SHIFT", "employee": "EMP002", "weekday": 0, "shift": "公", "weight": 1, "is_hard": False},
+    {"rule_type": "MAX_CONSECUTIVE_OFF", "employee": "EMP005", "max_days": 2, "is_hard": False},
+    {"rule_type": "FORBID_SHIFT_SEQUENCE", "employee": "EMP006", "preceding_shift": "夜", "subsequent_shift": "日"},
+]
+FACILITY_TEMPLATES = [
+    {"rule_type": "REQUIRED_STAFFING", "floor": "ALL", "date_type": "平日", "shift": "日", "min_count": 3, "is_hard": True},
+    {"rule_type": "MIN_ROLE_ON_DUTY", "role": "主任", "date_type": "土日祝", "min_count": 1, "is_hard": True},
+    {"rule_type": "MAX_CONSECUTIVE_OFF", "employee_group": "ALL", "max_days": 3, "is_hard": True},
+    {"rule_type": "BALANCE_OFF_DAYS", "employee_group": "常勤", "weight": 1},
+    {"rule_type": "BALANCE_SPECIFIC_SHIFT_TOTALS", "employee_group": "ALL", "target_shifts": ["夜"]},
+    {"rule_type": "MIN_TOTAL_SHIFT_DAYS", "employee_group": "ALL", "shift": "公", "min_count": 8, "is_hard": True},
+    {"rule_type": "ENFORCE_SHIFT_SEQUENCE", "employee_group": "ALL", "preceding_shift": "夜", "subsequent_shift": "明", "is_hard": True},
+]
+# 無効化に使う値 (フィールド -> 不正な値)
+BROKEN_VALUES = {"shift": "X", "max_days": 0, "min_count": -1, "is_hard": "yes", "weekday": 9, "date_type": "毎日"}
+
+
+def make_synthetic_rules(templates, count, invalid_ratio, rng):
+    """雛形から合成ルールを count 件作る (invalid_ratio の割合で1項目を壊す)"""
+    period_days = (END_DATE - START_DATE).days + 1
+    rules = []
+    for i in range(count):
+        rule = dict(rng.choice(templates))
+        if 'date' in rule:
+            rule['date'] = (START_DATE + timedelta(days=rng.randrange(period_days))).isoformat()
+        if 'employee' in rule:
+            rule['employee'] = f"EMP{rng.randrange(1, 1000):03d}"
+        if rng.random() < invalid_ratio:
+            breakable = [field for field in rule if field in BROKEN_VALUES]
+            if breakable:
+                field = rng.choice(breakable)
+                rule[field] = BROKEN_VALUES[field]
+        rules.append(rule)
+    return rules
+
+
+def run_benchmark(count, invalid_ratio, repeat, seed):
+    rng = random.Random(seed)
+    for scope, templates in (("personal", PERSONAL_TEMPLATES), ("facility", FACILITY_TEMPLATES)):
+        best = None
+        for _ in range(repeat):
+            rules = make_synthetic_rules(templates, count, invalid_ratio, rng) # 検証は日付を書き換えるので毎回作り直す
+            started = time.perf_counter()
+            valid_rules, invalid_rules = validate_rules_batch(rules, START_DATE, END_DATE, scope=scope)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{scope:8s}: {count} rules, valid {len(valid_rules)}, invalid {len(invalid_rules)}, "
+              f"best {best * 1000:.1f} ms ({count / best:,.0f} rules/sec, {best / count * 1e6:.2f} us/rule)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ルール検証のマイクロベンチマーク")
+    parser.add_argument("--count", type=int, default=100000, help="合成ルールの件数")
+    parser.add_argument("--invalid-ratio", type=float, default=0.1, help="無効なルールの割合")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数 (最良値を表示)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run_benchmark(args.count, args.invalid_ratio, args.repeat, args.seed)
@@ -0,0 +1,67 @@
+# シフト表の版どうしの差分表示 (CSV / .npy、またはスケジュールカタログの実行 id を指定)
+import argparse
+import sys
+
+import numpy as np
+
+from src.constants import EMPLOYEE_INFO_FILE, SCHEDULE_CATALOG_FILE, SHIFT_MAP_SYM
+from src.data_loader import load_employee_data
+from src.schedule_diff import load_schedule, load_catalog_schedule, diff_schedules, pairwise_change_counts
+
+
+def print_diff(diff, limit):
+    print(f"--- {diff.old_path}\n+++ {diff.new_path}")
+    print(f"職員 {len(diff.employee_keys)} 名 × {len(diff.dates)} 日, 変更セル {diff.num_changed}")
+    if diff.only_in_old or diff.only_in_new:
+        print(f"  旧版のみの職員: {diff.only_in_old}  新版のみの職員: {diff.only_in_new}")
+    changes = diff.change_list()
+    for emp_key, day, old_sym, new_sym in changes[:limit]:
+        print(f"  {emp_key} {day.isoformat()} {old_sym} -> {new_sym}")
+    if len(changes) > limit:
+        print(f"  ... 他 {len(changes) - limit} 件")
+    changed_employees = np.flatnonzero(diff.per_employee_changes)
+    if len(changed_employees):
+        print("職員別の変更数: " + ", ".join(f"{diff.employee_keys[e_idx]} {diff.per_employee_changes[e_idx]}" for e_idx in changed_employees))
+    coverage_changes = diff.coverage_changes()
+    if coverage_changes:
+        print("日別の人数差: " + ", ".join(f"{day.month}/{day.day} {sym}{delta:+d}" for day, sym, delta in coverage_changes[:limit]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シフト表の版どうしの差分を表示する")
+    parser.add_argument("files", nargs="*", help="比較するシフト表 (旧 新)。--pairwise では全ての版")
+    parser.add_argument("--runs", nargs=2, type=int, metavar=("OLD_ID", "NEW_ID"), help="スケジュールカタログの実行 id で指定")
+    parser.add_argument("--pairwise", action="store_true", help="全ての版の組の変更セル数を求める")
+    parser.add_argument("--employees", default=EMPLOYEE_INFO_FILE, help="職員名を職員IDに揃えるための従業員情報")
+    parser.add_argument("--db", default=SCHEDULE_CATALOG_FILE)
+    parser.add_argument("--limit", type=int, default=50, help="表示する変更の最大件数")
+    args = parser.parse_args(argv)
+
+    employees_df = load_employee_data(args.employees)
+    if args.runs:
+        schedules = [load_catalog_schedule(run_id, employees_df, db_path=args.db) for run_id in args.runs]
+    elif (args.pairwise and len(args.files) >= 2) or len(args.files) == 2:
+        schedules = [load_schedule(path, employees_df) for path in args.files]
+    else:
+        parser.error("比較するシフト表を2つ (--pairwise では2つ以上) 指定してください。")
+    if any(schedule is None for schedule in schedules):
+        return 1
+
+    if args.pairwise:
+        counts = pairwise_change_counts(schedules)
+        if counts is None:
+            return 1
+        upper = counts[np.triu_indices(len(schedules), k=1)]
+        print(f"{len(schedules)} 版, {len(upper)} 組: 変更セル 平均 {upper.mean():.1f}, 最小 {upper.min()}, 最大 {upper.max()}")
+        for i in range(len(schedules) - 1):
+            print(f"  {schedules[i].path} -> {schedules[i + 1].path}: {counts[i, i + 1]}")
+    else:
+        diff = diff_schedules(schedules[0], schedules[1])
+        if diff is None:
+            return 1
+        print_diff(diff, args.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# シフト表の採点 (ソルバーを使わずに、保存済みルールに対するハード制約の違反とソフト制約のペナルティを求める)
+import argparse
+import sys
+
+from src.constants import START_DATE, END_DATE, SCHEDULE_CATALOG_FILE, HISTORY_FROM_RESULTS, SNAPSHOT_ENABLED
+from src.snapshot import load_inputs
+from src.rule_store import load_rules_for_period
+from src.utils import get_date_range, facility_paths, parse_period_date
+from src.schedule_diff import load_schedule, load_catalog_schedule, reindex_schedule
+from src.schedule_evaluator import evaluate_schedule
+from src.schedule_delta import IncrementalEvaluator
+from src.weights import weight_profile_name, objective_shares
+
+
+def print_evaluation(schedule, evaluation, limit):
+    print(f"=== {schedule.path} ===")
+    if evaluation.is_feasible:
+        print("ハード制約: 違反なし")
+    else:
+        print(f"ハード制約: {evaluation.num_violations} 件の違反")
+        for violation in evaluation.hard_violations[:limit]:
+            dates = ", ".join(f"{d.month}/{d.day}" for d in violation['dates'][:10])
+            more = " ..." if violation['count'] > 10 else ""
+            print(f"  {violation['rule_type']:<26} {violation['employee'] or '-'} {violation['detail']} ({violation['count']}: {dates}{more})")
+        if len(evaluation.hard_violations) > limit:
+            print(f"  ... 他 {len(evaluation.hard_violations) - limit} 件")
+    print(f"ペナルティ (重み付き合計): {evaluation.objective}")
+    shares = objective_shares(evaluation.penalties)
+    for category, total in sorted(evaluation.penalties.items(), key=lambda item: -item[1]):
+        if total:
+            print(f"  {category:<32} {total} ({shares[category]:.1%})")
+    # 保存時の目的関数値との照合 (応援変数はシフト表に残らないため、応援なしとして比べる)
+    recorded = (schedule.metadata or {}).get('objective')
+    if recorded is not None:
+        result = "一致" if abs(recorded - evaluation.objective) < 1e-6 else "不一致"
+        recorded_profile = (schedule.metadata or {}).get('weight_profile')
+        if recorded_profile and recorded_profile != weight_profile_name():
+            result += f"、求解時の重みのプロファイルは {recorded_profile}"
+        print(f"ソルバーの目的関数値: {recorded:g} ({result})")
+
+
+def print_swap_candidates(evaluator, employee_id, target_date, limit):
+    candidates = evaluator.find_swaps(employee_id, target_date)
+    print(f"--- {employee_id} の {target_date.month}/{target_date.day} と入れ替えられる職員 ({len(candidates)} 名、違反が増えない候補のみ) ---")
+    for candidate in candidates[:limit]:
+        own, partner = (candidate.changes if candidate.changes[0][0] == employee_id else candidate.changes[::-1])
+        breakdown = ", ".join(f"{category} {amount:+d}" for category, amount in candidate.penalty_deltas.items())
+        violations = f" 違反 {candidate.hard_delta:+d}" if candidate.hard_delta else ""
+        print(f"  {candidate.partner:<10} {candidate.partner_floor or '-':<4} {own[2]}⇄{partner[2]}  "
+              f"ペナルティ {candidate.objective_delta:+d}{violations}" + (f" ({breakdown})" if breakdown else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シフト表をルールに対して採点する")
+    parser.add_argument("files", nargs="*", help="採点するシフト表 (CSV / .npy)")
+    parser.add_argument("--runs", nargs="+", type=int, default=[], help="スケジュールカタログの実行 id で指定")
+    parser.add_argument("--input-hash", default=None, help="使うルールセットの入力ハッシュ (省略時は版のメタデータ、無ければ期間の最新)")
+    parser.add_argument("--db", default=SCHEDULE_CATALOG_FILE)
+    parser.add_argument("--no-snapshot", action="store_true", help="入力スナップショットを使わずにCSVから読み込む")
+    parser.add_argument("--limit", type=int, default=30, help="表示する違反・入れ替え候補の最大件数")
+    parser.add_argument("--swap", nargs=2, metavar=("EMPLOYEE_ID", "DATE"), default=None,
+                        help="指定した職員・日 (YYYY-MM-DD または M/D) とシフトを入れ替えられる職員をペナルティの差の小さい順に表示する")
+    args = parser.parse_args(argv)
+    if not args.files and not args.runs:
+        parser.error("採点するシフト表または --runs を指定してください。")
+
+    paths = facility_paths()
+    base_inputs = load_inputs(START_DATE, END_DATE, employee_file=paths['employee_file'], past_shift_file=paths['past_shift_file'],
+                              history_file=paths['history_file'], output_dir=paths['output_dir'] if HISTORY_FROM_RESULTS else None,
+                              use_snapshot=SNAPSHOT_ENABLED and not args.no_snapshot, snapshot_dir=paths['snapshot_dir'])
+    if base_inputs is None:
+        return 1
+    employees_df, shift_history, jp_holidays, _ = base_inputs
+    date_range = get_date_range(START_DATE, END_DATE)
+    employee_ids = employees_df['職員ID'].tolist()
+
+    schedules = [load_schedule(path, employees_df) for path in args.files]
+    schedules += [load_catalog_schedule(run_id, employees_df, db_path=args.db) for run_id in args.runs]
+    rule_sets = {}
+    exit_code = 0
+    for schedule in schedules:
+        if schedule is None:
+            exit_code = 1
+            continue
+        input_hash = args.input_hash or (schedule.metadata or {}).get('input_hash')
+        if input_hash not in rule_sets:
+            rule_sets[input_hash] = load_rules_for_period(date_range[0], date_range[-1], input_hash, db_path=paths['rule_store_file'])
+        personal_rules, facility_rules = rule_sets[input_hash]
+        if personal_rules is None:
+            print(f"エラー: 期間 {date_range[0]} 〜 {date_range[-1]} の保存済みルールセットがありません (入力ハッシュ: {input_hash or '-'})。")
+            return 1
+        matrix, missing_employees, missing_dates = reindex_schedule(schedule, employee_ids, date_range)
+        if missing_employees or missing_dates:
+            print(f"警告: {schedule.path} に無い職員 {len(missing_employees)} 名・日付 {len(missing_dates)} 日は空欄として評価します。")
+        evaluation = evaluate_schedule(matrix, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+                                       shift_history=shift_history)
+        print_evaluation(schedule, evaluation, args.limit)
+        if not evaluation.is_feasible:
+            exit_code = 2
+        if args.swap:
+            employee_id, target_date = args.swap[0], parse_period_date(args.swap[1], date_range)
+            if employee_id not in employee_ids or target_date not in date_range:
+                print(f"エラー: 職員 {employee_id} / 日付 {args.swap[1]} は対象期間のシフト表にありません。")
+                return 1
+            evaluator = IncrementalEvaluator(matrix, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+                                             shift_history=shift_history)
+            print_swap_candidates(evaluator, employee_id, target_date, args.limit)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# スケジュールカタログの検索 (生成済みシフト表の比較を CSV を開かずに行う)
+import argparse
+import sys
+
+from src.constants import SCHEDULE_CATALOG_FILE, OUTPUT_DIR
+from src.schedule_catalog import list_runs, find_best_run, find_runs_with_shortfall, get_run_details, register_existing_files
+
+
+def format_run(run):
+    objective = f"{run['objective']:g}" if run.get('objective') is not None else '-'
+    solve_time = f"{run['solve_time_sec']:.2f}s" if run.get('solve_time_sec') is not None else '-'
+    return (f"#{run['id']:<5} {run['period_start']}〜{run['period_end'] or '?'}  {run['status']:<10} "
+            f"objective {objective:<8} {solve_time:<8} workers {run['solver_workers'] if run.get('solver_workers') is not None else '-'}  {run['path']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成済みシフト表のカタログを検索する")
+    parser.add_argument("--db", default=SCHEDULE_CATALOG_FILE, help="カタログのパス")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="記録済みの実行を新しい順に表示")
+    list_parser.add_argument("--period", default=None, help="期間開始日 (YYYY-MM-DD)")
+    list_parser.add_argument("--status", default=None, help="ソルバーのステータス (OPTIMAL, FEASIBLE, INFEASIBLE, UNKNOWN など)")
+    list_parser.add_argument("--limit", type=int, default=20)
+
+    best_parser = subparsers.add_parser("best", help="期間内で目的関数値が最小の実行")
+    best_parser.add_argument("--period", required=True, help="期間開始日 (YYYY-MM-DD)")
+
+    shortfall_parser = subparsers.add_parser("shortfall", help="人員不足のある実行 (例: --floor 2F --shift 夜)")
+    shortfall_parser.add_argument("--floor", default=None)
+    shortfall_parser.add_argument("--shift", default=None)
+    shortfall_parser.add_argument("--min", type=int, default=1, help="不足人数の合計の下限")
+    shortfall_parser.add_argument("--period", default=None, help="期間開始日 (YYYY-MM-DD)")
+
+    show_parser = subparsers.add_parser("show", help="実行1件のペナルティ・人員不足の内訳")
+    show_parser.add_argument("run_id", type=int)
+
+    scan_parser = subparsers.add_parser("scan", help="カタログに無い出力済みのシフト表を登録する")
+    scan_parser.add_argument("--output-dir", default=OUTPUT_DIR)
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        runs = list_runs(args.period, args.status, args.limit, db_path=args.db)
+        for run in runs:
+            print(format_run(run))
+        print(f"{len(runs)} 件")
+    elif args.command == "best":
+        run = find_best_run(args.period, db_path=args.db)
+        if run is None:
+            print(f"期間 {args.period} で解が得られた実行はありません。")
+            return 1
+        print(format_run(run))
+    elif args.command == "shortfall":
+        runs = find_runs_with_shortfall(args.floor, args.shift, args.min, args.period, db_path=args.db)
+        for run in runs:
+            print(f"{format_run(run)}\n        不足 {run['shortfall_floor']} {run['shortfall_shift']}: "
+                  f"合計 {run['shortfall_total']} 人 ({run['shortfall_days']} 日)")
+        print(f"{len(runs)} 件")
+    elif args.command == "show":
+        run = get_run_details(args.run_id, db_path=args.db)
+        if run is None:
+            print(f"実行 #{args.run_id} は記録されていません。")
+            return 1
+        print(format_run(run))
+        print(f"  ルール入力ハッシュ: {run['rules_input_hash'] or '-'}")
+        print(f"  基本入力ハッシュ:   {run['base_input_hash'] or '-'}")
+        print("  ペナルティ (重み付き合計):")
+        for category, total in run['penalties'].items():
+            print(f"    {category:<32} {total}")
+        print("  人員不足:")
+        for shortfall in run['shortfalls']:
+            print(f"    {shortfall['floor']} {shortfall['shift']}: 合計 {shortfall['total']} 人 ({shortfall['days']} 日)")
+    elif args.command == "scan":
+        registered = register_existing_files(args.output_dir, db_path=args.db)
+        print(f"{registered} 件のシフト表を登録しました。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# シフト表の修正 (既存のシフト表の一部のセルを固定し、残りを最小限の変更で解き直して新しい版として出力する)
+import argparse
+import sys
+
+from src.constants import (START_DATE, END_DATE, SCHEDULE_CATALOG_FILE, SNAPSHOT_ENABLED, SHIFT_MAP_INT, SHIFT_MAP_SYM,
+                           REPAIR_NEIGHBORHOOD_DAYS, REPAIR_MAX_TIME_SEC, REPAIR_FALLBACK_FULL, SOLVER_NUM_WORKERS)
+from src.rule_store import load_rules_for_period
+from src.utils import get_date_range, facility_paths, parse_period_date
+from src.schedule_diff import load_schedule, load_catalog_schedule, reindex_schedule
+from src.repair import repair_schedule, repair_absence
+from shift_generator import load_base_inputs, output_solution
+
+
+def parse_pins(pin_args, employee_ids, date_range):
+    """--pin の (職員ID, 日付, シフト記号) を {(e_idx, d_idx): シフト整数} にする。不正な指定があれば None"""
+    pinned_cells = {}
+    for employee_id, date_text, shift_sym in pin_args:
+        target_date = parse_period_date(date_text, date_range)
+        if employee_id not in employee_ids or target_date not in date_range or shift_sym not in SHIFT_MAP_INT:
+            print(f"エラー: 固定セル {employee_id} {date_text} {shift_sym} が不正です (職員ID・期間内の日付・シフト記号を確認してください)。")
+            return None
+        pinned_cells[(employee_ids.index(employee_id), date_range.index(target_date))] = SHIFT_MAP_INT[shift_sym]
+    return pinned_cells
+
+
+def print_changes(existing_matrix, repaired_matrix, pinned_cells, employee_ids, date_range, limit):
+    changed = sorted(zip(*(repaired_matrix != existing_matrix).nonzero()))
+    print(f"--- 変更したセル {len(changed)} (うち固定セル {sum(cell in pinned_cells for cell in changed)}) ---")
+    for e_idx, d_idx in changed[:limit]:
+        d = date_range[d_idx]
+        mark = " (固定)" if (e_idx, d_idx) in pinned_cells else ""
+        print(f"  {employee_ids[e_idx]:<10} {d.month}/{d.day}  {SHIFT_MAP_SYM.get(int(existing_matrix[e_idx, d_idx]), '-')} → "
+              f"{SHIFT_MAP_SYM.get(int(repaired_matrix[e_idx, d_idx]), '-')}{mark}")
+    if len(changed) > limit:
+        print(f"  ... 他 {len(changed) - limit} セル")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="既存のシフト表を、指定したセルを固定して最小限の変更で修正する")
+    parser.add_argument("file", nargs="?", default=None, help="修正するシフト表 (CSV / .npy)")
+    parser.add_argument("--run", type=int, default=None, help="スケジュールカタログの実行 id で指定")
+    parser.add_argument("--pin", nargs=3, action="append", default=[], metavar=("EMPLOYEE_ID", "DATE", "SHIFT"),
+                        help="固定するセル (職員ID, YYYY-MM-DD または M/D, シフト記号)。複数指定可")
+    parser.add_argument("--absence", nargs=3, default=None, metavar=("EMPLOYEE_ID", "DATE", "STATUS"),
+                        help="期間の途中からの休み (職員ID, 開始日, 育休/病休)。開始日より前は固定し、残りの日を変更最小で解き直す")
+    parser.add_argument("--radius", type=int, default=REPAIR_NEIGHBORHOOD_DAYS, help="固定セルの前後何日までを解き直すか")
+    parser.add_argument("--full", action="store_true", help="近傍に限らず全セルを対象に解き直す")
+    parser.add_argument("--no-fallback", action="store_true", help="近傍で解けなくても全セルでの解き直しをしない")
+    parser.add_argument("--time", type=float, default=REPAIR_MAX_TIME_SEC, help="求解の時間制限 (秒)")
+    parser.add_argument("--workers", type=int, default=SOLVER_NUM_WORKERS)
+    parser.add_argument("--input-hash", default=None, help="使うルールセットの入力ハッシュ (省略時は版のメタデータ、無ければ期間の最新)")
+    parser.add_argument("--db", default=SCHEDULE_CATALOG_FILE)
+    parser.add_argument("--no-snapshot", action="store_true", help="入力スナップショットを使わずにCSVから読み込む")
+    parser.add_argument("--limit", type=int, default=50, help="表示する変更セルの最大件数")
+    args = parser.parse_args(argv)
+    if (args.file is None) == (args.run is None):
+        parser.error("修正するシフト表か --run のどちらか一方を指定してください。")
+    if bool(args.pin) == bool(args.absence):
+        parser.error("固定するセル (--pin) か期間途中からの休み (--absence) のどちらか一方を指定してください。")
+
+    paths = facility_paths()
+    base_inputs = load_base_inputs(paths, use_snapshot=SNAPSHOT_ENABLED and not args.no_snapshot)
+    if base_inputs is None:
+        return 1
+    employees_df, shift_history, jp_holidays, group_indices = base_inputs
+    date_range = get_date_range(START_DATE, END_DATE)
+    employee_ids = employees_df['職員ID'].tolist()
+
+    schedule = load_schedule(args.file, employees_df) if args.file else load_catalog_schedule(args.run, employees_df, db_path=args.db)
+    if schedule is None:
+        return 1
+    input_hash = args.input_hash or (schedule.metadata or {}).get('input_hash')
+    personal_rules, facility_rules = load_rules_for_period(date_range[0], date_range[-1], input_hash, db_path=paths['rule_store_file'])
+    if personal_rules is None:
+        print(f"エラー: 期間 {date_range[0]} 〜 {date_range[-1]} の保存済みルールセットがありません (入力ハッシュ: {input_hash or '-'})。")
+        return 1
+    existing_matrix, missing_employees, missing_dates = reindex_schedule(schedule, employee_ids, date_range)
+    if missing_employees or missing_dates:
+        print(f"警告: {schedule.path} に無い職員 {len(missing_employees)} 名・日付 {len(missing_dates)} 日は自由に割り当てます。")
+    if args.absence:
+        employee_id, date_text, leave_status = args.absence
+        start_date = parse_period_date(date_text, date_range)
+        result = repair_absence(existing_matrix, employee_id, start_date, leave_status, employees_df, date_range,
+                                jp_holidays, personal_rules, facility_rules, shift_history=shift_history,
+                                max_time_sec=args.time, solver_workers=args.workers)
+        if result is None:
+            return 1
+        pinned_cells = {}
+        repair_info = {'repair_absence': [employee_id, start_date.isoformat(), leave_status]}
+    else:
+        pinned_cells = parse_pins(args.pin, employee_ids, date_range)
+        if pinned_cells is None:
+            return 1
+        result = repair_schedule(existing_matrix, pinned_cells, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+                                 shift_history=shift_history, group_indices=group_indices, use_neighborhood=not args.full,
+                                 radius=args.radius, fallback_full=REPAIR_FALLBACK_FULL and not args.no_fallback,
+                                 max_time_sec=args.time, solver_workers=args.workers)
+        repair_info = {'repair_pins': [[employee_ids[e_idx], date_range[d_idx].isoformat(), SHIFT_MAP_SYM[value]]
+                                       for (e_idx, d_idx), value in sorted(pinned_cells.items())]}
+    status, solver = result['status'], result['solver']
+    if result['shift_matrix'] is None:
+        print(f"エラー: 固定セルを満たすシフト表が見つかりませんでした ({solver.StatusName(status)})。")
+        return 2
+    print_changes(existing_matrix, result['shift_matrix'], pinned_cells, employee_ids, date_range, args.limit)
+
+    # 出力・カタログには変更セル数を除いたルールのペナルティを記録する (採点 evaluate_schedule.py の値と揃える)
+    penalty_exprs = dict(result['penalty_exprs'])
+    change_penalty = solver.Value(penalty_exprs.pop('schedule_change', 0))
+    extra_metadata = {
+        'objective': solver.ObjectiveValue() - change_penalty,
+        'repair_of': schedule.path, 'repair_scope': result['scope'], 'repair_changed_cells': result['num_changed'], **repair_info,
+    }
+    output_file = output_solution(status, solver, result['shifts'], penalty_exprs, employees_df, shift_history, date_range, jp_holidays,
+                                  employee_ids, facility_rules, paths['output_dir'], paths['catalog_file'], input_hash=input_hash,
+                                  solver_workers=args.workers, extra_metadata=extra_metadata)
+    print(f"修正 ({result['scope']}): {result['num_changed']} セル変更, {solver.WallTime():.2f} 秒 → {output_file}")
+    return 0 if output_file else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,8 @@
 # メイン実行スクリプト
 import sys
+import argparse
 import pandas as pd # 過去シフト転記で必要
 from datetime import timedelta, date # 日付処理と祝日展開で追加
-import google.generativeai as genai
 import os
 import json
 from dotenv import load_dotenv
@@ -13,40 +13,50 @@ import re
 # sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.constants import (
-    EMPLOYEE_INFO_FILE, PAST_SHIFT_FILE, OUTPUT_DIR,
+    DATA_LOADER_VERBOSE, SNAPSHOT_ENABLED, HISTORY_FROM_RESULTS, SOLVER_NUM_WORKERS,
     START_DATE, END_DATE,
     # AI関連の定数を更新
     # AI_PROMPT_FILE, # 古い個人ルールプロンプトは削除またはコメントアウト
     PERSONAL_INTERMEDIATE_PROMPT_FILE, # 個人Step1用
     PERSONAL_STRUCTURED_DATA_PROMPT_FILE, # 個人Step2用
-    AI_MODEL_NAME,
     FACILITY_INTERMEDIATE_PROMPT_FILE, # 施設Step1用
-    FACILITY_STRUCTURED_DATA_PROMPT_FILE # 施設Step2用
+    FACILITY_STRUCTURED_DATA_PROMPT_FILE, # 施設Step2用
+    PERSONAL_FAST_PROMPT_FILE, FACILITY_FAST_PROMPT_FILE, # 高速モード用
+    AI_ABORT_ON_FAILURE, AI_STREAM_STEP2, AI_USE_RESPONSE_SCHEMA, AI_FAST_MODE
 )
-from src.data_loader import load_employee_data, load_past_shifts, load_natural_language_rules, load_facility_rules
-from src.utils import get_date_range, get_holidays, get_employee_indices
-from src.shift_model import build_shift_model
+from src.data_loader import load_natural_language_rules, load_facility_rules
+from src.snapshot import load_inputs
+from src.utils import get_date_range, get_employee_indices, facility_paths
+from src.shift_model import build_shift_model, PENALTY_WEIGHTS
+from src.weights import weight_profile_name, objective_shares, print_objective_shares
 from src.solver import solve_shift_model
+from ortools.sat.python import cp_model
 from src.output_processor import create_shift_dataframe, process_solver_results, save_shift_to_csv
+from src.output_processor import extract_solution_matrix, build_schedule_metadata, save_schedule_outputs
 # from src.rule_parser import parse_structured_rules_from_ai, validate_facility_rule # parse_structured_rules_from_ai は main 内で処理するように変更
 from src.rule_parser import validate_and_transform_rule, validate_facility_rule # 検証関数を直接使う
+from src.rule_parser import build_personal_response_schema, build_facility_response_schema, parse_structured_response
+from src.rule_parser import build_personal_fast_response_schema, build_facility_fast_response_schema
+from src.ai_client import create_ai_client, AIStreamTruncatedError
+from src.json_stream import IncrementalJSONParser
+from src.schedule_catalog import compute_base_input_hash, evaluate_penalty_totals, compute_staffing_shortfalls, record_schedule_run
+from src.rule_store import compute_rules_input_hash, save_rule_set, load_rules_for_period, find_latest_input_hash
 
 # --- AI 関連処理 --- (ai_rule_experiment.py から移植・統合)
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
-# APIキーを設定 (環境変数 GEMINI_API_KEY を設定してください)
-api_key = os.getenv("GEMINI_API_KEY")
-if api_key:
-    try:
-        genai.configure(api_key=api_key)
-        print("Gemini API Key configured.")
-    except Exception as e:
-        print(f"警告: Gemini APIキーの設定に失敗しました: {e}")
-        api_key = None # APIキーが無効な場合はNoneにしておく
-else:
-    print("警告: 環境変数 'GEMINI_API_KEY' が設定されていません。AIルール解釈はスキップされます。")
+# AI呼び出しは全て ai_client (タイムアウト・リトライ付き) を経由する。AIが使えない場合は None
+# import しただけでは作らず (repair_schedule.py などは AI を使わない)、main() の最初に init_ai_client() で作る
+ai_client = None
+
+def init_ai_client():
+    """AIクライアントを作成する (作成済みならそのまま)。APIキーは環境変数 GEMINI_API_KEY から読む"""
+    global ai_client
+    if ai_client is None:
+        ai_client = create_ai_client(os.getenv("GEMINI_API_KEY"))
+    return ai_client
 
 def load_prompt(file_path: str) -> str | None:
     """プロンプトファイルを読み込む"""
@@ -69,10 +79,21 @@ def format_rules_for_prompt(rules_dict: dict) -> str:
         lines.append(f"{emp_id},\"{escaped_rule_text}\"")
     return "\n".join(lines)
 
+def split_prompt(prompt_template: str, placeholder: str, value: str, target_year: int) -> tuple[str, str]:
+    """
+    プロンプトを静的プレフィックス (入力データより前の指示文) と可変サフィックス (入力データ以降) に分ける。
+    プレフィックスは ai_client の static_prefix として渡し、キャッシュ済みコンテキストとして再利用する。
+    """
+    rendered = prompt_template.replace("{target_year}", str(target_year))
+    prefix, found, rest = rendered.partition(placeholder)
+    if not found:
+        return "", rendered
+    return prefix, value + rest.replace(placeholder, value)
+
 # --- 個人ルール用AI呼び出し関数 (ステップ1: 中間翻訳) ---
 def call_ai_to_translate_personal_rules(natural_language_rules: dict, prompt_template: str, target_year: int) -> str | None:
     """自然言語の個人ルール辞書をAIに渡し、(必須)/(推奨)付き確認用文章(改行区切りテキスト)を返す"""
-    if not api_key or not prompt_template or not natural_language_rules:
+    if ai_client is None or not prompt_template or not natural_language_rules:
         print("AI処理スキップ(個人 Step1): APIキー、プロンプト、または入力ルールが不足しています。")
         return None
 
@@ -84,15 +105,14 @@ def call_ai_to_translate_personal_rules(natural_language_rules: dict, prompt_tem
     print(f"Calling AI for Step 1: Translating personal rules (Target Year: {target_year})...")
     input_rules_text = format_rules_for_prompt(natural_language_rules) # ★修正: natural_language_rules を使用
     try:
-        final_prompt = prompt_template.replace("{input_csv_data}", input_rules_text).replace("{target_year}", str(target_year))
+        prompt_prefix, final_prompt = split_prompt(prompt_template, "{input_csv_data}", input_rules_text, target_year)
     except Exception as e:
         print(f"エラー(個人 Step1): プロンプトのフォーマット中にエラーが発生しました: {e}")
         return None
 
     try:
-        model = genai.GenerativeModel(AI_MODEL_NAME)
-        response = model.generate_content(final_prompt)
-        intermediate_texts = response.text.strip()
+        response_text = ai_client.generate(final_prompt, label="personal_step1", static_prefix=prompt_prefix)
+        intermediate_texts = response_text.strip()
         print("--- Raw AI Response (Personal Step 1: Intermediate Texts) ---")
         print(intermediate_texts)
         if intermediate_texts:
@@ -102,27 +122,26 @@ def call_ai_to_translate_personal_rules(natural_language_rules: dict, prompt_tem
             print("警告(個人 Step1): AIからの応答が空でした。")
             return None
     except Exception as e:
-        print(f"エラー(個人 Step1): Gemini API呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        print(f"エラー(個人 Step1): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
         return None
 
 # --- 個人ルール用AI呼び出し関数 (ステップ2: structured_data生成) ---
-def call_ai_to_generate_structured_data_personal(intermediate_texts: str, prompt_template: str, target_year: int) -> str | None:
+def call_ai_to_generate_structured_data_personal(intermediate_texts: str, prompt_template: str, target_year: int, response_schema=None) -> str | None:
     """(必須)/(推奨)付き確認用文章テキストをAIに渡し、職員IDごとのstructured_data辞書のJSON文字列を返す"""
-    if not api_key or not prompt_template or not intermediate_texts:
+    if ai_client is None or not prompt_template or not intermediate_texts:
         print("AI処理スキップ(個人 Step2): APIキー、プロンプト、または入力テキストが不足しています。")
         return None
 
     print(f"Calling AI for Step 2: Generating structured_data dictionary (Target Year: {target_year})...")
     try:
-        final_prompt = prompt_template.replace("{intermediate_confirmation_texts}", intermediate_texts).replace("{target_year}", str(target_year))
+        prompt_prefix, final_prompt = split_prompt(prompt_template, "{intermediate_confirmation_texts}", intermediate_texts, target_year)
     except Exception as e:
         print(f"エラー(個人 Step2): プロンプトのフォーマット中にエラーが発生しました: {e}")
         return None
 
     try:
-        model = genai.GenerativeModel(AI_MODEL_NAME)
-        response = model.generate_content(final_prompt)
-        structured_data_dict_str = response.text
+        response_text = ai_client.generate(final_prompt, label="personal_step2", response_schema=response_schema, static_prefix=prompt_prefix)
+        structured_data_dict_str = response_text
         print("--- Raw AI Response (Personal Step 2: Structured Data Dictionary String) ---")
         print(structured_data_dict_str)
         if structured_data_dict_str:
@@ -132,13 +151,13 @@ def call_ai_to_generate_structured_data_personal(intermediate_texts: str, prompt
             print("警告(個人 Step2): AIからの応答が空でした。")
             return None
     except Exception as e:
-        print(f"エラー(個人 Step2): Gemini API呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        print(f"エラー(個人 Step2): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
         return None
 
 # --- 施設ルール用AI呼び出し関数 (ステップ1: 中間翻訳) ---
 def call_ai_to_translate_facility_rules(facility_rules_list: list[str], prompt_template: str, target_year: int) -> str | None:
     """自然言語の施設ルールリストをAIに渡し、(必須)/(推奨)付き確認用文章(改行区切りテキスト)を返す"""
-    if not api_key or not prompt_template or not facility_rules_list:
+    if ai_client is None or not prompt_template or not facility_rules_list:
         print("AI処理スキップ(施設 Step1): APIキー、プロンプト、または入力ルールが不足しています。")
         return None
 
@@ -147,20 +166,15 @@ def call_ai_to_translate_facility_rules(facility_rules_list: list[str], prompt_t
     try:
         # ステップ1プロンプトのプレースホルダーは {facility_rules_text} と {target_year} と想定
         # .format() の代わりに replace() を使用
-        final_prompt = prompt_template.replace(
-            "{facility_rules_text}", input_rules_text
-        ).replace(
-            "{target_year}", str(target_year)
-        )
+        prompt_prefix, final_prompt = split_prompt(prompt_template, "{facility_rules_text}", input_rules_text, target_year)
     except Exception as e:
         print(f"エラー(施設 Step1): プロンプトのフォーマット中にエラーが発生しました: {e}")
         return None
 
     try:
-        model = genai.GenerativeModel(AI_MODEL_NAME)
-        response = model.generate_content(final_prompt)
+        response_text = ai_client.generate(final_prompt, label="facility_step1", static_prefix=prompt_prefix)
         # AIは確認用文章を改行区切りで返す想定
-        intermediate_texts = response.text.strip()
+        intermediate_texts = response_text.strip()
         print("--- Raw AI Response (Facility Step 1: Intermediate Texts) ---")
         print(intermediate_texts)
         if intermediate_texts:
@@ -170,13 +184,13 @@ def call_ai_to_translate_facility_rules(facility_rules_list: list[str], prompt_t
              print("警告(施設 Step1): AIからの応答が空でした。")
              return None
     except Exception as e:
-        print(f"エラー(施設 Step1): Gemini API呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        print(f"エラー(施設 Step1): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
         return None
 
 # --- 施設ルール用AI呼び出し関数 (ステップ2: structured_data生成) ---
-def call_ai_to_generate_structured_data(intermediate_texts: str, prompt_template: str, target_year: int) -> str | None:
+def call_ai_to_generate_structured_data(intermediate_texts: str, prompt_template: str, target_year: int, response_schema=None) -> str | None:
     """(必須)/(推奨)付き確認用文章テキストをAIに渡し、structured_dataのJSONリスト文字列を返す"""
-    if not api_key or not prompt_template or not intermediate_texts:
+    if ai_client is None or not prompt_template or not intermediate_texts:
         print("AI処理スキップ(施設 Step2): APIキー、プロンプト、または入力テキストが不足しています。")
         return None
 
@@ -184,20 +198,15 @@ def call_ai_to_generate_structured_data(intermediate_texts: str, prompt_template
     try:
         # ステップ2プロンプトのプレースホルダーは {intermediate_confirmation_texts} と {target_year} と想定
         # .format() の代わりに replace() を使用
-        final_prompt = prompt_template.replace(
-            "{intermediate_confirmation_texts}", intermediate_texts
-        ).replace(
-            "{target_year}", str(target_year)
-        )
+        prompt_prefix, final_prompt = split_prompt(prompt_template, "{intermediate_confirmation_texts}", intermediate_texts, target_year)
     except Exception as e:
         print(f"エラー(施設 Step2): プロンプトのフォーマット中にエラーが発生しました: {e}")
         return None
 
     try:
-        model = genai.GenerativeModel(AI_MODEL_NAME)
-        response = model.generate_content(final_prompt)
+        response_text = ai_client.generate(final_prompt, label="facility_step2", response_schema=response_schema, static_prefix=prompt_prefix)
         # AIはstructured_dataのJSONリスト文字列を返す想定
-        structured_data_json_list_str = response.text
+        structured_data_json_list_str = response_text
         print("--- Raw AI Response (Facility Step 2: Structured Data JSON List String) ---")
         print(structured_data_json_list_str)
         if structured_data_json_list_str:
@@ -207,37 +216,284 @@ def call_ai_to_generate_structured_data(intermediate_texts: str, prompt_template
             print("警告(施設 Step2): AIからの応答が空でした。")
             return None
     except Exception as e:
-        print(f"エラー(施設 Step2): Gemini API呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        print(f"エラー(施設 Step2): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        return None
+
+# --- ステップ2 ストリーミング版 (チャンク受信と並行してルールを検証) ---
+def stream_structured_data_personal(intermediate_texts: str, prompt_template: str, target_year: int, response_schema=None) -> tuple[list, dict] | None:
+    """
+    個人ルールのステップ2をストリーミングで実行し、職員ごとのルールリストが閉じた時点で検証する。
+    応答が途中で途切れても、それまでに閉じた職員のルールは残る。戻り値は (最終個人ルールリスト, 件数集計)。
+    """
+    if ai_client is None or not prompt_template or not intermediate_texts:
+        print("AI処理スキップ(個人 Step2 stream): APIキー、プロンプト、または入力テキストが不足しています。")
+        return None
+
+    print(f"Calling AI for Step 2 (stream): Generating structured_data dictionary (Target Year: {target_year})...")
+    prompt_prefix, final_prompt = split_prompt(prompt_template, "{intermediate_confirmation_texts}", intermediate_texts, target_year)
+    personal_final_rules = []
+    counts = new_rule_counts()
+    parser = IncrementalJSONParser()
+    try:
+        for chunk in ai_client.generate_stream(final_prompt, label="personal_step2", response_schema=response_schema, static_prefix=prompt_prefix):
+            for employee_id, rules_list in parser.feed(chunk):
+                add_personal_rules_for_employee(employee_id, rules_list, personal_final_rules, counts)
+    except AIStreamTruncatedError as e:
+        print(f"警告(個人 Step2 stream): {e}")
+    except Exception as e:
+        print(f"エラー(個人 Step2 stream): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        return None
+    report_stream_parse_issues(parser, "個人 Step2 stream")
+    if parser.top_level_type not in (None, 'dict'):
+        print(f"エラー(個人 Step2 stream): 応答が辞書形式ではありません。")
+        return None
+    return personal_final_rules, counts
+
+def stream_structured_data_facility(intermediate_texts: str, prompt_template: str, target_year: int, response_schema=None) -> tuple[list, dict] | None:
+    """
+    施設ルールのステップ2をストリーミングで実行し、ルールオブジェクトが閉じた時点で
+    同じ順番の確認用文章と組み合わせて検証する。戻り値は (最終施設ルールリスト, 件数集計)。
+    """
+    if ai_client is None or not prompt_template or not intermediate_texts:
+        print("AI処理スキップ(施設 Step2 stream): APIキー、プロンプト、または入力テキストが不足しています。")
+        return None
+
+    print(f"Calling AI for Step 2 (stream): Generating structured_data JSON list (Target Year: {target_year})...")
+    prompt_prefix, final_prompt = split_prompt(prompt_template, "{intermediate_confirmation_texts}", intermediate_texts, target_year)
+    intermediate_lines = [line for line in intermediate_texts.strip().split('\n') if line.strip()]
+    facility_final_rules = []
+    counts = new_rule_counts()
+    parser = IncrementalJSONParser()
+    truncated = False
+    try:
+        for chunk in ai_client.generate_stream(final_prompt, label="facility_step2", response_schema=response_schema, static_prefix=prompt_prefix):
+            # 確認用文章とは要素の通し番号で組み合わせる (同じチャンクで閉じた要素・壊れた要素があってもずれない)
+            for index, struct_data in parser.feed_indexed(chunk):
+                if index >= len(intermediate_lines):
+                    print(f"  警告(施設 Step2 stream): 確認用文章より多い構造化データを受信しました。スキップ: {struct_data}")
+                    continue
+                add_facility_rule(intermediate_lines[index], struct_data, facility_final_rules, counts)
+    except AIStreamTruncatedError as e:
+        print(f"警告(施設 Step2 stream): {e}")
+        truncated = True
+    except Exception as e:
+        print(f"エラー(施設 Step2 stream): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        return None
+    report_stream_parse_issues(parser, "施設 Step2 stream")
+    if parser.top_level_type not in (None, 'list'):
+        print(f"エラー(施設 Step2 stream): 応答がリスト形式ではありません。")
+        return None
+    # 完全に受信できた場合は、確認用文章と要素の件数が一致することを確認する
+    received = parser.elements_seen
+    if not truncated and parser.done and received != len(intermediate_lines):
+        print(f"エラー(施設ルール構築): 確認テキストの行数({len(intermediate_lines)})と構造化データ数({received})が一致しません。")
+        return [], new_rule_counts()
+    return facility_final_rules, counts
+
+def report_stream_parse_issues(parser, context: str):
+    """ストリーム解析で読み飛ばした要素や途切れた末尾を表示する"""
+    for text, error in parser.errors:
+        print(f"  警告({context}): 壊れた要素をスキップしました: {error} - {text[:200]}")
+    pending = parser.pending_text()
+    if pending:
+        print(f"  警告({context}): 途中で途切れた末尾を破棄しました: {pending[:200]}")
+
+# --- 高速モード (ステップ1とステップ2を1回の呼び出しで実行) ---
+def build_fast_prompt(fast_template: str, step1_prompt: str, step2_prompt: str, step1_placeholder: str) -> str:
+    """
+    高速モード用プロンプト: ステップ1・ステップ2のプロンプトを1つにまとめる。
+    入力データは末尾の {input_data} にだけ入れ、指示文全体を静的プレフィックスとしてキャッシュできるようにする。
+    """
+    step1_prompt = step1_prompt.replace(step1_placeholder, "(末尾の「Input Data」セクションを参照)")
+    # ステップ2の入力はステップ1で作成した確認用文章そのものなので、プレースホルダーは説明文に置き換える
+    step2_prompt = step2_prompt.replace("{intermediate_confirmation_texts}", "(ステップ1で作成した確認用文章)")
+    return fast_template.replace("{step1_prompt}", step1_prompt).replace("{step2_prompt}", step2_prompt)
+
+def single_line(text) -> str:
+    """確認用文章を1行にする (改行区切りで intermediate_lines に戻すため)"""
+    return " ".join(str(text).split())
+
+def call_ai_fast_personal(natural_language_rules: dict, fast_template: str, step1_prompt: str, step2_prompt: str,
+                          target_year: int, response_schema=None) -> tuple[str, dict] | None:
+    """
+    個人ルールの確認用文章と structured_data を1回の呼び出しで生成する。
+    戻り値は通常の2ステップと同じ形 (確認用文章の改行区切りテキスト, {職員ID: [structured_data, ...]})。
+    """
+    if ai_client is None or not fast_template or not step1_prompt or not step2_prompt or not natural_language_rules:
+        print("AI処理スキップ(個人 Fast): APIキー、プロンプト、または入力ルールが不足しています。")
         return None
 
+    print(f"Calling AI (fast mode): Translating and structuring personal rules in one call (Target Year: {target_year})...")
+    prompt_prefix, final_prompt = split_prompt(build_fast_prompt(fast_template, step1_prompt, step2_prompt, "{input_csv_data}"),
+                                               "{input_data}", format_rules_for_prompt(natural_language_rules), target_year)
+    try:
+        response_text = ai_client.generate(final_prompt, label="personal_fast", response_schema=response_schema, static_prefix=prompt_prefix)
+    except Exception as e:
+        print(f"エラー(個人 Fast): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        return None
+    print("--- Raw AI Response (Personal Fast: Confirmation Texts + Structured Data) ---")
+    print(response_text)
+    parsed = parse_structured_response(response_text or "", dict, "個人 Fast")
+    if parsed is None:
+        return None
+
+    intermediate_lines = []
+    structured_data_dict = {}
+    for employee_id, entries in parsed.items():
+        if not isinstance(entries, list):
+            print(f"  警告(個人 Fast): {employee_id} の値がリスト形式ではありません。スキップします。")
+            continue
+        for entry in entries:
+            if not isinstance(entry, dict) or 'confirmation_text' not in entry or 'structured_data' not in entry:
+                print(f"  警告(個人 Fast): confirmation_text / structured_data の組になっていない要素をスキップ: {entry}")
+                continue
+            intermediate_lines.append(single_line(entry['confirmation_text']))
+            structured_data_dict.setdefault(employee_id, []).append(entry['structured_data'])
+    return "\n".join(intermediate_lines), structured_data_dict
+
+def call_ai_fast_facility(facility_rules_list: list[str], fast_template: str, step1_prompt: str, step2_prompt: str,
+                          target_year: int, response_schema=None) -> tuple[str, list] | None:
+    """
+    施設ルールの確認用文章と structured_data を1回の呼び出しで生成する。
+    戻り値は (確認用文章の改行区切りテキスト, [structured_data, ...]) で、行と要素は同じ順番で対応する。
+    """
+    if ai_client is None or not fast_template or not step1_prompt or not step2_prompt or not facility_rules_list:
+        print("AI処理スキップ(施設 Fast): APIキー、プロンプト、または入力ルールが不足しています。")
+        return None
+
+    print(f"Calling AI (fast mode): Translating and structuring facility rules in one call (Target Year: {target_year})...")
+    prompt_prefix, final_prompt = split_prompt(build_fast_prompt(fast_template, step1_prompt, step2_prompt, "{facility_rules_text}"),
+                                               "{input_data}", "\n".join(facility_rules_list), target_year)
+    try:
+        response_text = ai_client.generate(final_prompt, label="facility_fast", response_schema=response_schema, static_prefix=prompt_prefix)
+    except Exception as e:
+        print(f"エラー(施設 Fast): AI呼び出しまたは結果処理中にエラーが発生しました: {e}")
+        return None
+    print("--- Raw AI Response (Facility Fast: Confirmation Texts + Structured Data) ---")
+    print(response_text)
+    parsed = parse_structured_response(response_text or "", list, "施設 Fast")
+    if parsed is None:
+        return None
+
+    intermediate_lines = []
+    structured_data_list = []
+    for entry in parsed:
+        if not isinstance(entry, dict) or 'confirmation_text' not in entry or 'structured_data' not in entry:
+            print(f"  警告(施設 Fast): confirmation_text / structured_data の組になっていない要素をスキップ: {entry}")
+            continue
+        conf_text = single_line(entry['confirmation_text'])
+        if not conf_text:
+            print(f"  警告(施設 Fast): 確認用文章が空の要素をスキップ: {entry}")
+            continue
+        intermediate_lines.append(conf_text)
+        structured_data_list.append(entry['structured_data'])
+    return "\n".join(intermediate_lines), structured_data_list
+
 # --- ここまで AI 関連処理 ---
 
-def main():
-    """メイン処理"""
+# --- ルールの検証と最終リスト構築 (ステップ3) ---
+def new_rule_counts() -> dict:
+    """最終リスト構築時の件数集計を初期化"""
+    return {'valid': 0, 'invalid': 0, 'unparsable': 0, 'holiday': 0}
+
+def holiday_rule_to_date_set_rule(employee_id, struct_data: dict) -> dict:
+    """旧形式の PREFER_ALL_HOLIDAYS_OFF を date_type='祝日' の PREFER_SHIFT_ON_DATE_SET に読み替える"""
+    return {
+        "rule_type": "PREFER_SHIFT_ON_DATE_SET",
+        "employee": struct_data.get('employee', employee_id),
+        "date_type": "祝日",
+        "shift": struct_data.get('shift', '公'), # デフォルトは公休
+        "is_hard": struct_data.get('is_hard', False), # デフォルトは推奨
+        "weight": struct_data.get('weight', 1)
+    }
+
+def add_personal_rules_for_employee(employee_id, rules_list, personal_final_rules: list, counts: dict):
+    """1人分の structured_data リストを検証し、personal_final_rules に追加する"""
+    if not isinstance(rules_list, list):
+        print(f"  警告(個人ルール構築): {employee_id} のルールがリスト形式ではありません。スキップします。")
+        return
+    for struct_data in rules_list:
+         # 旧形式の祝日ルールは日付区分ルール1件に読み替える (祝日ごとのルールには展開しない)
+         if isinstance(struct_data, dict) and struct_data.get('rule_type') == 'PREFER_ALL_HOLIDAYS_OFF':
+             struct_data = holiday_rule_to_date_set_rule(employee_id, struct_data)
+             counts['holiday'] += 1
+
+         # 通常ルールの検証
+         validated_rule = validate_and_transform_rule(struct_data, START_DATE, END_DATE)
+         if validated_rule.get('rule_type') == 'INVALID':
+            print(f"  警告(個人ルール構築): 検証NGルールをスキップ: {validated_rule.get('reason')} - Employee: {employee_id}, Original Data: {struct_data}")
+            counts['invalid'] += 1
+         elif validated_rule.get('rule_type') == 'UNPARSABLE':
+             print(f"  情報(個人ルール構築): AI解釈不能ルールを追加: {validated_rule}")
+             personal_final_rules.append(validated_rule)
+             counts['unparsable'] += 1
+         else: # VALID
+             personal_final_rules.append(validated_rule)
+             print(f"  情報(個人ルール構築): ルール追加: {validated_rule}")
+             counts['valid'] += 1
+
+def add_facility_rule(conf_text: str, struct_data, facility_final_rules: list, counts: dict):
+    """確認用文章と structured_data の組を検証し、facility_final_rules に追加する"""
+    validated_rule = validate_facility_rule(struct_data, START_DATE, END_DATE)
+    if validated_rule.get('rule_type') == 'INVALID':
+        print(f"  警告(施設ルール構築): 検証NGルールをスキップ: {validated_rule.get('reason')} - Confirmation: {conf_text.strip()}, Original Data: {struct_data}")
+        counts['invalid'] += 1
+    elif validated_rule.get('rule_type') == 'UNPARSABLE':
+         print(f"  情報(施設ルール構築): AI解釈不能ルールを追加: {validated_rule}")
+         facility_final_rules.append({
+             "confirmation_text": conf_text.strip(),
+             "structured_data": validated_rule
+         })
+         counts['unparsable'] += 1
+    else: # VALID
+        facility_final_rules.append({
+            "confirmation_text": conf_text.strip(),
+            "structured_data": validated_rule
+        })
+        print(f"  情報(施設ルール構築): ルール追加: {conf_text.strip()} -> {validated_rule}")
+        counts['valid'] += 1
+
+def print_personal_rule_counts(counts: dict):
+    print(f"{counts['valid']} valid personal rules processed, {counts['holiday']} holiday rules mapped to date-set rules, {counts['unparsable']} unparsable rules added, {counts['invalid']} rules skipped due to validation errors.")
+
+def print_facility_rule_counts(counts: dict):
+    print(f"{counts['valid']} valid facility rules constructed, {counts['unparsable']} unparsable rules added, {counts['invalid']} rules skipped due to validation errors.")
+
+def load_base_inputs(paths, use_snapshot=SNAPSHOT_ENABLED, verbose=DATA_LOADER_VERBOSE):
+    """従業員情報・勤務履歴 (前期間のシフト表・直前勤務実績)・祝日・グループ索引を paths の入力から読み込む"""
+    return load_inputs(START_DATE, END_DATE,
+                       employee_file=paths['employee_file'], past_shift_file=paths['past_shift_file'],
+                       history_file=paths['history_file'],
+                       output_dir=paths['output_dir'] if HISTORY_FROM_RESULTS else None,
+                       use_snapshot=use_snapshot, snapshot_dir=paths['snapshot_dir'], verbose=verbose)
+
+def main(stream_step2=AI_STREAM_STEP2, fast_mode=AI_FAST_MODE, verbose=DATA_LOADER_VERBOSE, use_snapshot=SNAPSHOT_ENABLED,
+         paths=None, solver_workers=SOLVER_NUM_WORKERS):
+    """
+    メイン処理。paths は入出力パスの辞書 (utils.facility_paths)、省略時はリポジトリ直下の既定パス。
+    戻り値は solve_and_output の結果 (求解ステータスと出力ファイル)。
+    """
     print("--- Shift Generator Script Start ---")
+    if paths is None:
+        paths = facility_paths()
+    init_ai_client()
 
     # 1. データの読み込みと準備
     print("Loading base data...")
-    employees_df = load_employee_data(EMPLOYEE_INFO_FILE)
-    # ★デバッグ: 読み込み直後の行数を表示
-    if employees_df is not None:
-        print(f"DEBUG: employees_df loaded with {len(employees_df)} rows.")
-    else:
-        print("DEBUG: employees_df is None after loading.")
+    # 従業員情報・勤務履歴 (前期間のシフト表・直前勤務実績)・祝日・グループ索引 (入力が変わらなければスナップショットから)
+    base_inputs = load_base_inputs(paths, use_snapshot=use_snapshot, verbose=verbose)
+    natural_language_rules = load_natural_language_rules(paths['rules_file'], verbose=verbose)
+    facility_rules_list = load_facility_rules(paths['facility_rules_file'])
 
-    past_shifts_df = load_past_shifts(PAST_SHIFT_FILE, START_DATE)
-    natural_language_rules = load_natural_language_rules()
-    facility_rules_list = load_facility_rules()
-
-    if employees_df is None:
+    if base_inputs is None:
         print("エラー: 従業員情報の読み込みに失敗しました。処理を中断します。")
         sys.exit(1)
+    employees_df, shift_history, jp_holidays, group_indices = base_inputs
     if not natural_language_rules: print("情報: 個人ルールが見つかりませんでした。")
     if not facility_rules_list: print("情報: 施設ルールが見つかりませんでした。")
 
     target_year = START_DATE.year
     date_range = get_date_range(START_DATE, END_DATE)
-    jp_holidays = get_holidays(START_DATE.year, END_DATE.year)
     employee_ids, emp_id_to_row_index = get_employee_indices(employees_df)
     # ★デバッグ: get_employee_indices 後の要素数を表示
     print(f"DEBUG: employee_ids generated with {len(employee_ids)} elements.")
@@ -248,11 +504,24 @@ def main():
     structured_data_dict_personal = {} # 初期化
     intermediate_facility_texts = None
     structured_data_list_facility = [] # 初期化
+    personal_streamed_result = None # ストリーミング時: (検証済み個人ルール, 件数集計)
+    facility_streamed_result = None # ストリーミング時: (検証済み施設ルール, 件数集計)
 
     # --- 個人ルールAI処理 (2ステップ) --- 
-    # ステップ1: 中間翻訳
+    # 高速モード: ステップ1とステップ2を1回の呼び出しで実行し、2ステップと同じ形の結果を得る
     personal_intermediate_prompt = load_prompt(PERSONAL_INTERMEDIATE_PROMPT_FILE)
-    if api_key and personal_intermediate_prompt and natural_language_rules:
+    personal_structured_data_prompt = load_prompt(PERSONAL_STRUCTURED_DATA_PROMPT_FILE)
+    if fast_mode and ai_client is not None and natural_language_rules:
+        personal_fast_schema = None
+        if AI_USE_RESPONSE_SCHEMA:
+            personal_fast_schema = build_personal_fast_response_schema([emp_id for emp_id, text in natural_language_rules.items() if text])
+        fast_result = call_ai_fast_personal(natural_language_rules, load_prompt(PERSONAL_FAST_PROMPT_FILE),
+                                            personal_intermediate_prompt, personal_structured_data_prompt,
+                                            target_year, response_schema=personal_fast_schema)
+        if fast_result is not None:
+            intermediate_personal_texts, structured_data_dict_personal = fast_result
+    # ステップ1: 中間翻訳
+    elif ai_client is not None and personal_intermediate_prompt and natural_language_rules:
         intermediate_personal_texts = call_ai_to_translate_personal_rules(natural_language_rules, personal_intermediate_prompt, target_year)
     else:
         print("Skipping AI personal rule structuring (Step 1).")
@@ -263,26 +532,20 @@ def main():
     #     print(intermediate_personal_texts)
 
     # ステップ2: structured_data生成
-    personal_structured_data_prompt = load_prompt(PERSONAL_STRUCTURED_DATA_PROMPT_FILE)
-    if api_key and personal_structured_data_prompt and intermediate_personal_texts:
-        structured_data_dict_str = call_ai_to_generate_structured_data_personal(intermediate_personal_texts, personal_structured_data_prompt, target_year)
+    # スキーマ指定出力: ルールを持つ職員IDをキーとする辞書に制約する
+    personal_response_schema = None
+    if AI_USE_RESPONSE_SCHEMA and natural_language_rules:
+        personal_response_schema = build_personal_response_schema([emp_id for emp_id, text in natural_language_rules.items() if text])
+    if fast_mode:
+        pass # 高速モードでは生成済み
+    elif stream_step2 and ai_client is not None and personal_structured_data_prompt and intermediate_personal_texts:
+        personal_streamed_result = stream_structured_data_personal(intermediate_personal_texts, personal_structured_data_prompt, target_year,
+                                                                   response_schema=personal_response_schema)
+    elif ai_client is not None and personal_structured_data_prompt and intermediate_personal_texts:
+        structured_data_dict_str = call_ai_to_generate_structured_data_personal(intermediate_personal_texts, personal_structured_data_prompt, target_year,
+                                                                                response_schema=personal_response_schema)
         if structured_data_dict_str:
-            # クリーニング & パース
-            cleaned_json_string = structured_data_dict_str.strip()
-            if cleaned_json_string.startswith("```json"):
-                cleaned_json_string = cleaned_json_string[7:]
-            if cleaned_json_string.endswith("```"):
-                cleaned_json_string = cleaned_json_string[:-3]
-            cleaned_json_string = cleaned_json_string.strip()
-            try:
-                structured_data_dict_personal = json.loads(cleaned_json_string)
-                if not isinstance(structured_data_dict_personal, dict):
-                    print(f"エラー(個人 Step2): パース結果が辞書形式ではありません。")
-                    structured_data_dict_personal = {}
-            except json.JSONDecodeError as e:
-                print(f"エラー(個人 Step2): JSON辞書のパースに失敗: {e}")
-                print(f"クリーニング後の文字列:\n{cleaned_json_string}")
-                structured_data_dict_personal = {}
+            structured_data_dict_personal = parse_structured_response(structured_data_dict_str, dict, "個人 Step2") or {}
         else:
              print("Skipping personal rule structuring (Step 2) due to empty response from AI.")
     else:
@@ -291,162 +554,210 @@ def main():
 
     # --- 施設ルールAI処理 (2ステップ - 変更なし) ---
     intermediate_prompt = load_prompt(FACILITY_INTERMEDIATE_PROMPT_FILE)
-    if api_key and intermediate_prompt and facility_rules_list:
+    structured_data_prompt = load_prompt(FACILITY_STRUCTURED_DATA_PROMPT_FILE)
+    if fast_mode and ai_client is not None and facility_rules_list:
+        facility_fast_schema = build_facility_fast_response_schema() if AI_USE_RESPONSE_SCHEMA else None
+        fast_result = call_ai_fast_facility(facility_rules_list, load_prompt(FACILITY_FAST_PROMPT_FILE),
+                                            intermediate_prompt, structured_data_prompt,
+                                            target_year, response_schema=facility_fast_schema)
+        if fast_result is not None:
+            intermediate_facility_texts, structured_data_list_facility = fast_result
+    elif ai_client is not None and intermediate_prompt and facility_rules_list:
         intermediate_facility_texts = call_ai_to_translate_facility_rules(facility_rules_list, intermediate_prompt, target_year)
     else:
         print("Skipping AI facility rule structuring (Step 1).")
     # ... (オプションのユーザー修正) ...
-    structured_data_prompt = load_prompt(FACILITY_STRUCTURED_DATA_PROMPT_FILE)
-    if api_key and structured_data_prompt and intermediate_facility_texts:
-        structured_data_json_list_str = call_ai_to_generate_structured_data(intermediate_facility_texts, structured_data_prompt, target_year)
+    facility_response_schema = build_facility_response_schema() if AI_USE_RESPONSE_SCHEMA else None
+    if fast_mode:
+        pass # 高速モードでは生成済み
+    elif stream_step2 and ai_client is not None and structured_data_prompt and intermediate_facility_texts:
+        facility_streamed_result = stream_structured_data_facility(intermediate_facility_texts, structured_data_prompt, target_year,
+                                                                   response_schema=facility_response_schema)
+    elif ai_client is not None and structured_data_prompt and intermediate_facility_texts:
+        structured_data_json_list_str = call_ai_to_generate_structured_data(intermediate_facility_texts, structured_data_prompt, target_year,
+                                                                            response_schema=facility_response_schema)
         if structured_data_json_list_str:
-            # ... (クリーニング & パース - 変更なし) ...
-            cleaned_json_string = structured_data_json_list_str.strip()
-            if cleaned_json_string.startswith("```json"):
-                cleaned_json_string = cleaned_json_string[7:]
-            if cleaned_json_string.endswith("```"):
-                cleaned_json_string = cleaned_json_string[:-3]
-            cleaned_json_string = cleaned_json_string.strip()
-            try:
-                structured_data_list_facility = json.loads(cleaned_json_string)
-                if not isinstance(structured_data_list_facility, list):
-                    print(f"エラー(施設 Step2): パース結果がリスト形式ではありません。")
-                    structured_data_list_facility = []
-            except json.JSONDecodeError as e:
-                print(f"エラー(施設 Step2): JSONリストのパースに失敗: {e}")
-                print(f"クリーニング後の文字列:\n{cleaned_json_string}")
-                structured_data_list_facility = []
+            structured_data_list_facility = parse_structured_response(structured_data_json_list_str, list, "施設 Step2") or []
         else:
             print("Skipping facility rule structuring (Step 2) due to empty response from AI.")
     else:
         print("Skipping AI facility rule structuring (Step 2).")
     # --- 施設ルールAI処理ここまで ---
 
+    # AI呼び出しがリトライ後も失敗した場合、ルールが欠けたままのシフトを出力しないよう中断する
+    if ai_client is not None:
+        print(f"AI client stats: {ai_client.stats}")
+        if ai_client.stats['failures'] > 0 and AI_ABORT_ON_FAILURE:
+            print("エラー: AI呼び出しに失敗したため、ルールが欠けた状態での求解を避けて処理を中断します。")
+            sys.exit(1)
+
     # 3. ルールパーサーの実行 & 最終リスト構築 & 祝日展開
     print("\n--- Step 3: Rule Parsing & Final List Construction ---")
     personal_final_rules = [] # 最終的な個人ルールリスト
     facility_final_rules = [] # 最終的な施設ルールリスト
 
-    # 個人ルールのパースと検証、祝日展開
-    if structured_data_dict_personal:
+    # 個人ルールのパースと検証、祝日展開 (ストリーミング時はステップ2で構築済み)
+    if personal_streamed_result is not None:
+        personal_final_rules, personal_counts = personal_streamed_result
+        print(f"\nPersonal rules were validated while streaming.")
+        print_personal_rule_counts(personal_counts)
+    elif structured_data_dict_personal:
         print(f"\nProcessing final personal rules...")
-        valid_count_p = 0
-        invalid_count_p = 0
-        unparsable_count_p = 0
-        holiday_rules_generated = 0
+        personal_counts = new_rule_counts()
         for employee_id, rules_list in structured_data_dict_personal.items():
-            if not isinstance(rules_list, list):
-                print(f"  警告(個人ルール構築): {employee_id} のルールがリスト形式ではありません。スキップします。")
-                continue
-            for struct_data in rules_list:
-                 # 特別な祝日ルールの処理
-                 if isinstance(struct_data, dict) and struct_data.get('rule_type') == 'PREFER_ALL_HOLIDAYS_OFF':
-                     print(f"  情報(個人ルール構築): 祝日ルール展開中 for {employee_id}...")
-                     holiday_shift = struct_data.get('shift', '公') # デフォルトは公休
-                     holiday_is_hard = struct_data.get('is_hard', False) # デフォルトは推奨
-                     for holiday_date in jp_holidays:
-                         if START_DATE <= holiday_date <= END_DATE:
-                             holiday_rule = {
-                                 "rule_type": "SPECIFY_DATE_SHIFT",
-                                 "employee": employee_id,
-                                 "date": holiday_date.isoformat(), # ★修正: dateオブジェクトをISO形式文字列に変換
-                                 "shift": holiday_shift,
-                                 "is_hard": holiday_is_hard
-                             }
-                             # この生成されたルールも検証する
-                             validated_holiday_rule = validate_and_transform_rule(holiday_rule, START_DATE, END_DATE)
-                             if validated_holiday_rule.get('rule_type') != 'INVALID':
-                                 # 検証成功後、dateはdateオブジェクトになっているはず
-                                 personal_final_rules.append(validated_holiday_rule)
-                                 holiday_rules_generated += 1
-                                 print(f"    -> 生成・追加(祝日): {validated_holiday_rule}")
-                             else:
-                                 print(f"    -> 警告(祝日ルール生成): 生成ルール検証NG: {validated_holiday_rule.get('reason')}")
-                     continue # 元の PREFER_ALL_HOLIDAYS_OFF は追加しない
-
-                 # 通常ルールの検証
-                 validated_rule = validate_and_transform_rule(struct_data, START_DATE, END_DATE)
-                 if validated_rule.get('rule_type') == 'INVALID':
-                    print(f"  警告(個人ルール構築): 検証NGルールをスキップ: {validated_rule.get('reason')} - Employee: {employee_id}, Original Data: {struct_data}")
-                    invalid_count_p += 1
-                 elif validated_rule.get('rule_type') == 'UNPARSABLE':
-                     print(f"  情報(個人ルール構築): AI解釈不能ルールを追加: {validated_rule}")
-                     personal_final_rules.append(validated_rule)
-                     unparsable_count_p += 1
-                 else: # VALID
-                     personal_final_rules.append(validated_rule)
-                     print(f"  情報(個人ルール構築): ルール追加: {validated_rule}")
-                     valid_count_p += 1
-        print(f"{valid_count_p} valid personal rules processed, {holiday_rules_generated} holiday rules generated, {unparsable_count_p} unparsable rules added, {invalid_count_p} rules skipped due to validation errors.")
+            add_personal_rules_for_employee(employee_id, rules_list, personal_final_rules, personal_counts)
+        print_personal_rule_counts(personal_counts)
     else:
         print("Skipping personal rule final list construction.")
 
     # 施設ルールの最終リスト構築と検証
-    if intermediate_facility_texts and structured_data_list_facility:
+    if facility_streamed_result is not None:
+        facility_final_rules, facility_counts = facility_streamed_result
+        print(f"\nFacility rules were validated while streaming.")
+        print_facility_rule_counts(facility_counts)
+    elif intermediate_facility_texts and structured_data_list_facility:
         # ★修正: split後に空行を除去する
         intermediate_lines = [line for line in intermediate_facility_texts.strip().split('\n') if line.strip()]
         if len(intermediate_lines) == len(structured_data_list_facility):
             print(f"\nConstructing final facility rules...")
-            valid_count_f = 0
-            invalid_count_f = 0
-            unparsable_count_f = 0
+            facility_counts = new_rule_counts()
             for conf_text, struct_data in zip(intermediate_lines, structured_data_list_facility):
-                validated_rule = validate_facility_rule(struct_data, START_DATE, END_DATE)
-                if validated_rule.get('rule_type') == 'INVALID':
-                    print(f"  警告(施設ルール構築): 検証NGルールをスキップ: {validated_rule.get('reason')} - Confirmation: {conf_text.strip()}, Original Data: {struct_data}")
-                    invalid_count_f += 1
-                elif validated_rule.get('rule_type') == 'UNPARSABLE':
-                     print(f"  情報(施設ルール構築): AI解釈不能ルールを追加: {validated_rule}")
-                     facility_final_rules.append({
-                         "confirmation_text": conf_text.strip(),
-                         "structured_data": validated_rule
-                     })
-                     unparsable_count_f += 1
-                else: # VALID
-                    facility_final_rules.append({
-                        "confirmation_text": conf_text.strip(),
-                        "structured_data": validated_rule
-                    })
-                    print(f"  情報(施設ルール構築): ルール追加: {conf_text.strip()} -> {validated_rule}")
-                    valid_count_f += 1
-            print(f"{valid_count_f} valid facility rules constructed, {unparsable_count_f} unparsable rules added, {invalid_count_f} rules skipped due to validation errors.")
+                add_facility_rule(conf_text, struct_data, facility_final_rules, facility_counts)
+            print_facility_rule_counts(facility_counts)
         else:
             print(f"エラー(施設ルール構築): 確認テキストの行数({len(intermediate_lines)})と構造化データ数({len(structured_data_list_facility)})が一致しません。")
     else:
         print("Skipping facility rule final list construction.")
 
+    # ルールセットを保存 (次回以降 --from-store で AI・パース処理を省略して求解できる)
+    input_hash = compute_rules_input_hash(natural_language_rules, facility_rules_list)
+    if personal_final_rules or facility_final_rules:
+        try:
+            save_rule_set(personal_final_rules, facility_final_rules, START_DATE, END_DATE, input_hash, db_path=paths['rule_store_file'])
+        except Exception as e:
+            print(f"警告: ルールセットの保存に失敗しました: {e}")
+
+    result = solve_and_output(employees_df, shift_history, date_range, jp_holidays, employee_ids, personal_final_rules, facility_final_rules,
+                              group_indices, output_dir=paths['output_dir'], solver_workers=solver_workers, input_hash=input_hash,
+                              catalog_file=paths['catalog_file'])
+    print("--- Shift Generator Script End ---")
+    return result
+
+def output_solution(status, solver, shifts_vars, penalty_exprs, employees_df, shift_history, date_range, jp_holidays, employee_ids,
+                    facility_rules, output_dir, catalog_file, input_hash=None, solver_workers=SOLVER_NUM_WORKERS, extra_metadata=None):
+    """
+    求解結果を CSV・機械読み取り用の出力に書き、スケジュールカタログに記録する。戻り値は出力したCSV (失敗時は None)。
+    extra_metadata はメタデータに上書きで追加する項目 (修正モードの元のシフト表・固定セルなど)。
+    """
+    initial_shift_df = create_shift_dataframe(employees_df, date_range, jp_holidays)
+    if initial_shift_df is None:
+         print("エラー: 出力用DataFrameの初期化に失敗。")
+         sys.exit(1)
+    # 解は一度だけ行列に取り出し、CSV (表示用) と機械読み取り用の出力の両方に使う
+    shift_matrix = None
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        shift_matrix = extract_solution_matrix(solver, shifts_vars, len(employee_ids), len(date_range))
+    final_shift_df = process_solver_results(status, solver, shifts_vars, employee_ids, date_range, initial_shift_df, employees_df, jp_holidays,
+                                            shift_matrix=shift_matrix)
+    output_file = None
+    if final_shift_df is not None:
+        output_file = save_shift_to_csv(final_shift_df, output_dir, START_DATE)
+        if output_file:
+            penalty_totals = evaluate_penalty_totals(solver, penalty_exprs)
+            print_objective_shares(penalty_totals, PENALTY_WEIGHTS)
+            metadata = build_schedule_metadata(solver, status, START_DATE, END_DATE, input_hash, solver_workers)
+            metadata['weight_profile'] = weight_profile_name()
+            metadata['objective_shares'] = {category: round(share, 4) for category, share in objective_shares(penalty_totals).items()}
+            metadata.update(extra_metadata or {})
+            save_schedule_outputs(shift_matrix, output_file, employees_df, date_range, metadata)
+            try:
+                record_schedule_run({
+                    'path': output_file, 'period_start': START_DATE, 'period_end': END_DATE,
+                    'rules_input_hash': input_hash, 'base_input_hash': compute_base_input_hash(employees_df, shift_history),
+                    'status': metadata['status'], 'objective': metadata['objective'], 'solve_time_sec': metadata['solve_time_sec'],
+                    'solver_workers': solver_workers, 'num_employees': len(employee_ids),
+                }, penalties=penalty_totals,
+                   shortfalls=compute_staffing_shortfalls(shift_matrix, employees_df, date_range, jp_holidays, facility_rules),
+                   db_path=catalog_file)
+            except Exception as e:
+                print(f"警告: スケジュールカタログへの記録に失敗しました: {e}")
+        print("\nShift generation complete. Output saved.")
+    else:
+        print("\nエラー: シフト生成に失敗したため、CSVファイルは出力されませんでした。")
+    return output_file
+
+def solve_and_output(employees_df, shift_history, date_range, jp_holidays, employee_ids, personal_rules, facility_rules, group_indices=None,
+                     output_dir=None, solver_workers=SOLVER_NUM_WORKERS, input_hash=None, catalog_file=None):
+    """
+    モデル構築 → 求解 → 結果出力 (ステップ4〜6)。出力したシフト表はスケジュールカタログ (catalog_file) に記録する。
+    戻り値は {'solver_status': ステータス名, 'output_file': 出力したCSV (失敗時は None)}。
+    """
+    if output_dir is None:
+        output_dir = facility_paths()['output_dir']
+    if catalog_file is None:
+        catalog_file = facility_paths()['catalog_file']
     # 4. OR-Toolsモデルの構築 (最終ルールリストを使用)
     print("\n--- Step 4: Building OR-Tools Model ---")
-    model, shifts_vars, employee_ids_from_model, date_range_from_model = build_shift_model(
+    model, shifts_vars, employee_ids_from_model, date_range_from_model, penalty_exprs = build_shift_model(
         employees_df=employees_df,
-        past_shifts_df=past_shifts_df,
+        past_shifts_df=None, # 境界状態は勤務履歴から求める
         date_range=date_range,
         jp_holidays=jp_holidays,
-        personal_rules=personal_final_rules, # 構築した個人ルールリスト
-        facility_rules=facility_final_rules # 構築した施設ルールリスト
+        personal_rules=personal_rules, # 構築した個人ルールリスト
+        facility_rules=facility_rules, # 構築した施設ルールリスト
+        shift_history=shift_history,
+        group_indices=group_indices
     )
 
     # 5. ソルバーの実行 (変更なし)
     print("\n--- Step 5: Solving the Model ---")
-    status, solver = solve_shift_model(model)
+    status, solver = solve_shift_model(model, num_workers=solver_workers)
 
     # 6. 結果の処理と出力 (変更なし)
     print("\n--- Step 6: Processing Results ---")
-    initial_shift_df = create_shift_dataframe(employees_df, date_range, jp_holidays)
-    if initial_shift_df is None:
-         print("エラー: 出力用DataFrameの初期化に失敗。")
-         sys.exit(1)
-    if past_shifts_df is not None:
-        # ... (過去シフト転記 - 変更なし) ...
-        pass
-    final_shift_df = process_solver_results(status, solver, shifts_vars, employee_ids, date_range, initial_shift_df, employees_df, jp_holidays)
-    if final_shift_df is not None:
-        save_shift_to_csv(final_shift_df, OUTPUT_DIR, START_DATE)
-        print("\nShift generation complete. Output saved.")
-    else:
-        print("\nエラー: シフト生成に失敗したため、CSVファイルは出力されませんでした。")
+    output_file = output_solution(status, solver, shifts_vars, penalty_exprs, employees_df, shift_history, date_range, jp_holidays,
+                                  employee_ids, facility_rules, output_dir, catalog_file, input_hash=input_hash, solver_workers=solver_workers)
+    return {'solver_status': solver.StatusName(status), 'output_file': output_file}
+
+def solve_from_stored_rules(input_hash=None, verbose=DATA_LOADER_VERBOSE, use_snapshot=SNAPSHOT_ENABLED, paths=None, solver_workers=SOLVER_NUM_WORKERS):
+    """保存済みルールセットから求解する (AI呼び出し・ルールのパース/検証は全て省略)"""
+    print("--- Shift Generator Script Start (from stored rules) ---")
+    if paths is None:
+        paths = facility_paths()
+    base_inputs = load_base_inputs(paths, use_snapshot=use_snapshot, verbose=verbose)
+    if base_inputs is None:
+        print("エラー: 従業員情報の読み込みに失敗しました。処理を中断します。")
+        sys.exit(1)
+    employees_df, shift_history, jp_holidays, group_indices = base_inputs
+    date_range = get_date_range(START_DATE, END_DATE)
+    employee_ids, emp_id_to_row_index = get_employee_indices(employees_df)
+
+    personal_rules, facility_rules = load_rules_for_period(START_DATE, END_DATE, input_hash=input_hash, db_path=paths['rule_store_file'])
+    if personal_rules is None:
+        print("エラー: 保存済みルールセットが見つかりません。先に通常モードで実行してください。")
+        sys.exit(1)
+    print(f"保存済みルールセットを読み込みました: 個人 {len(personal_rules)} 件, 施設 {len(facility_rules)} 件")
+    if input_hash is None:
+        input_hash = find_latest_input_hash(START_DATE, END_DATE, db_path=paths['rule_store_file'])
 
+    result = solve_and_output(employees_df, shift_history, date_range, jp_holidays, employee_ids, personal_rules, facility_rules,
+                              group_indices, output_dir=paths['output_dir'], solver_workers=solver_workers, input_hash=input_hash,
+                              catalog_file=paths['catalog_file'])
     print("--- Shift Generator Script End ---")
+    return result
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="介護施設シフト自動生成")
+    parser.add_argument("--from-store", action="store_true", help="保存済みルールセットから求解する (AI・パース処理を省略)")
+    parser.add_argument("--input-hash", default=None, help="--from-store 時に使うルールセットの入力ハッシュ (省略時は期間の最新)")
+    parser.add_argument("--stream", action="store_true", help="ステップ2をストリーミングで受信し、届いたルールから順に検証する")
+    parser.add_argument("--fast", action="store_true", help="確認用文章と structured_data を1回の呼び出しで生成する (無人のバッチ実行向け)")
+    parser.add_argument("--verbose", action="store_true", help="読み込んだ入力データの内容をデバッグ表示する")
+    parser.add_argument("--no-snapshot", action="store_true", help="入力スナップショットを使わずにCSVから読み込む")
+    args = parser.parse_args()
+    verbose = args.verbose or DATA_LOADER_VERBOSE
+    use_snapshot = SNAPSHOT_ENABLED and not args.no_snapshot
+    if args.from_store:
+        solve_from_stored_rules(args.input_hash, verbose=verbose, use_snapshot=use_snapshot)
+    else:
+        main(stream_step2=args.stream or AI_STREAM_STEP2, fast_mode=args.fast or AI_FAST_MODE, verbose=verbose, use_snapshot=use_snapshot)
\ No newline at end of file
@@ -0,0 +1,512 @@
+# AI呼び出しクライアント (タイムアウト・リトライ・サーキットブレーカー付き)
+import hashlib
+import json
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+from src.constants import (
+    AI_MODEL_NAME,
+    AI_BACKEND, AI_CALL_TIMEOUT_SEC,
+    AI_MAX_RETRIES, AI_BACKOFF_BASE_SEC, AI_BACKOFF_MAX_SEC, AI_RETRY_BUDGET,
+    AI_CIRCUIT_BREAKER_THRESHOLD, AI_CIRCUIT_BREAKER_COOLDOWN_SEC,
+    AI_FAKE_RESPONSES_FILE, AI_FAKE_LATENCY_SEC, AI_RECORD_FILE,
+    AI_PREFIX_CACHE, AI_PREFIX_CACHE_TTL_SEC, AI_PREFIX_CACHE_MIN_TOKENS, AI_PREFIX_CACHE_INDEX_FILE
+)
+
+# リトライ対象とする一時的なエラー (google.api_core.exceptions のクラス名)
+RETRYABLE_ERROR_NAMES = {
+    'DeadlineExceeded', 'ServiceUnavailable', 'ResourceExhausted', 'TooManyRequests',
+    'InternalServerError', 'GatewayTimeout', 'Aborted', 'Unknown'
+}
+
+
+class AICallError(Exception):
+    """AI呼び出しがリトライ後も失敗した場合の例外"""
+
+
+class AITimeoutError(AICallError):
+    """1回の呼び出しが期限 (deadline) を超えた場合の例外"""
+
+
+class AICircuitOpenError(AICallError):
+    """サーキットブレーカーが開いているため呼び出しを行わなかった場合の例外"""
+
+
+class AIStreamTruncatedError(AICallError):
+    """ストリーム応答が途中で途切れた場合の例外 (それまでのチャンクは受信済み)"""
+
+
+def prompt_hash(prompt: str) -> str:
+    """プロンプト文字列のハッシュ (録画済み応答の検索キー)"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算 (ASCII は約4文字で1トークン、日本語などの非ASCII文字は1文字1トークンとみなす)"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """一時的な障害 (リトライで回復が見込めるもの) かどうかを判定"""
+    if isinstance(error, AICircuitOpenError):
+        return False
+    if isinstance(error, (AITimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+# --- バックエンド ---
+
+class GeminiBackend:
+    """Gemini API (google.generativeai) を呼び出すバックエンド"""
+    name = 'gemini'
+
+    def __init__(self, model_name=AI_MODEL_NAME):
+        import google.generativeai as genai # APIを使う場合のみ必要
+        self._genai = genai
+        self.model_name = model_name
+
+    @staticmethod
+    def _generation_config(response_schema):
+        # スキーマ指定時は JSON モード + スキーマ制約付きで出力させる
+        if response_schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+    def create_prefix_cache(self, prefix: str, ttl_sec: float, timeout: float):
+        """静的プレフィックスをキャッシュ済みコンテキストとして登録し、(名前, ハンドル) を返す"""
+        # CachedContent.create には期限を渡せないため、同じリクエストを API クライアントに timeout 付きで送る
+        caching = self._genai.caching
+        request = caching.CachedContent._prepare_create_request(
+            model=self.model_name, contents=[prefix], ttl=timedelta(seconds=ttl_sec)
+        )
+        response = caching.get_default_cache_client().create_cached_content(request, timeout=timeout)
+        cached = caching.CachedContent._from_obj(response)
+        return cached.name, cached
+
+    def resolve_prefix_cache(self, name: str, prefix: str):
+        """登録済みのキャッシュ (別プロセスで登録したものを含む) を名前から取得する"""
+        return self._genai.caching.CachedContent.get(name)
+
+    def _model(self, cached_prefix):
+        if cached_prefix is None:
+            return self._genai.GenerativeModel(self.model_name)
+        return self._genai.GenerativeModel.from_cached_content(cached_content=cached_prefix)
+
+    def generate(self, prompt: str, label: str, timeout: float, response_schema=None, cached_prefix=None) -> str:
+        model = self._model(cached_prefix)
+        response = model.generate_content(prompt, generation_config=self._generation_config(response_schema),
+                                          request_options={"timeout": timeout})
+        return response.text
+
+    def generate_stream(self, prompt: str, label: str, timeout: float, response_schema=None, cached_prefix=None):
+        model = self._model(cached_prefix)
+        response = model.generate_content(prompt, generation_config=self._generation_config(response_schema),
+                                          stream=True, request_options={"timeout": timeout})
+        for chunk in response:
+            yield chunk.text
+
+
+class FakeBackend:
+    """
+    オフライン用のバックエンド。録画済み応答の再生 (replay) と、固定遅延・障害の注入を行う。
+    応答はプロンプトのハッシュ、次に呼び出しラベル (例: 'personal_step1') の順に検索する。
+    プレフィックスキャッシュはプロセス内の辞書で代用する (キャッシュ利用時もプレフィックス+サフィックスで検索する)。
+    """
+    name = 'fake'
+    model_name = 'fake'
+
+    def __init__(self, responses=None, replay_file=None, latency_sec=0.0, fail_first_calls=0, stream_chunk_chars=200, truncate_stream_at=None):
+        self.responses = dict(responses or {})
+        if replay_file:
+            self.responses.update(load_recorded_responses(replay_file))
+        self.latency_sec = latency_sec
+        self.fail_first_calls = fail_first_calls # 先頭N回の呼び出しを一時障害として失敗させる
+        self.stream_chunk_chars = stream_chunk_chars # ストリーム時の1チャンクの文字数
+        self.truncate_stream_at = truncate_stream_at # ストリームをこの文字数で途切れさせる (障害注入)
+        self.call_count = 0
+        self._local_prefixes = {} # キャッシュ名 -> プレフィックス (ローカルの代用実装)
+
+    def create_prefix_cache(self, prefix: str, ttl_sec: float, timeout: float):
+        name = f"local/{prompt_hash(prefix)[:16]}"
+        self._local_prefixes[name] = prefix
+        return name, prefix
+
+    def resolve_prefix_cache(self, name: str, prefix: str):
+        if name not in self._local_prefixes:
+            raise KeyError(f"ローカルのプレフィックスキャッシュが見つかりません: {name}")
+        return self._local_prefixes[name]
+
+    def _lookup(self, prompt: str, label: str) -> str:
+        self.call_count += 1
+        if self.call_count <= self.fail_first_calls:
+            raise ConnectionError(f"Injected failure #{self.call_count}")
+        response = self.responses.get(prompt_hash(prompt))
+        if response is None:
+            response = self.responses.get(label)
+        if response is None:
+            raise AICallError(f"録画済み応答が見つかりません (label={label})")
+        return response
+
+    def generate(self, prompt: str, label: str, timeout: float, response_schema=None, cached_prefix=None) -> str:
+        # response_schema は無視する (録画済み応答をそのまま返す)
+        if self.latency_sec > timeout:
+            time.sleep(timeout)
+            raise AITimeoutError(f"Fake backend latency {self.latency_sec}s exceeded deadline {timeout}s")
+        if self.latency_sec > 0:
+            time.sleep(self.latency_sec)
+        return self._lookup((cached_prefix or '') + prompt, label)
+
+    def generate_stream(self, prompt: str, label: str, timeout: float, response_schema=None, cached_prefix=None):
+        # 遅延は全チャンクに均等に配分する (合計は generate と同じ)
+        if self.latency_sec > timeout:
+            time.sleep(timeout)
+            raise AITimeoutError(f"Fake backend latency {self.latency_sec}s exceeded deadline {timeout}s")
+        response = self._lookup((cached_prefix or '') + prompt, label)
+        if self.truncate_stream_at is not None:
+            response = response[:self.truncate_stream_at]
+        chunks = [response[i:i + self.stream_chunk_chars] for i in range(0, len(response), self.stream_chunk_chars)] or ['']
+        for chunk in chunks:
+            if self.latency_sec > 0:
+                time.sleep(self.latency_sec / len(chunks))
+            yield chunk
+        if self.truncate_stream_at is not None:
+            raise ConnectionError(f"Injected stream truncation at {self.truncate_stream_at} chars")
+
+
+class RecordingBackend:
+    """
+    別のバックエンドの応答をファイルに記録するラッパー (FakeBackend での再生用)。
+    FakeBackend はキャッシュ利用時もプレフィックス+サフィックスで検索するため、キャッシュのハンドルは
+    (内側のハンドル, プレフィックスの文字列) の組にして、記録のキーにはプレフィックスの文字列を使う。
+    """
+
+    def __init__(self, inner, record_file):
+        self.inner = inner
+        self.name = f"{inner.name}+record"
+        self.model_name = inner.model_name
+        self.record_file = record_file
+
+    def create_prefix_cache(self, prefix: str, ttl_sec: float, timeout: float):
+        name, handle = self.inner.create_prefix_cache(prefix, ttl_sec, timeout)
+        return name, (handle, prefix)
+
+    def resolve_prefix_cache(self, name: str, prefix: str):
+        return self.inner.resolve_prefix_cache(name, prefix), prefix
+
+    def _record(self, prompt: str, label: str, response: str, cached_prefix=None):
+        recorded = load_recorded_responses(self.record_file) if os.path.exists(self.record_file) else {}
+        prefix = cached_prefix[1] if cached_prefix is not None else ''
+        recorded[prompt_hash(prefix + prompt)] = response
+        recorded[label] = response
+        with open(self.record_file, 'w', encoding='utf-8') as f:
+            json.dump(recorded, f, ensure_ascii=False, indent=2)
+
+    def generate(self, prompt: str, label: str, timeout: float, response_schema=None, cached_prefix=None) -> str:
+        inner_prefix = cached_prefix[0] if cached_prefix is not None else None
+        response = self.inner.generate(prompt, label, timeout, response_schema=response_schema, cached_prefix=inner_prefix)
+        self._record(prompt, label, response, cached_prefix)
+        return response
+
+    def generate_stream(self, prompt: str, label: str, timeout: float, response_schema=None, cached_prefix=None):
+        inner_prefix = cached_prefix[0] if cached_prefix is not None else None
+        chunks = []
+        for chunk in self.inner.generate_stream(prompt, label, timeout, response_schema=response_schema, cached_prefix=inner_prefix):
+            chunks.append(chunk)
+            yield chunk
+        self._record(prompt, label, ''.join(chunks), cached_prefix)
+
+
+def load_recorded_responses(file_path: str) -> dict:
+    """録画済み応答ファイル ({キー: 応答テキスト} のJSON) を読み込む"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        recorded = json.load(f)
+    if not isinstance(recorded, dict):
+        raise ValueError(f"録画済み応答ファイルの形式が不正です: {file_path}")
+    return recorded
+
+
+# --- プロンプトプレフィックスキャッシュ ---
+
+class PromptPrefixCache:
+    """
+    プロンプトの静的プレフィックス (指示文) をモデルごとに1回だけキャッシュ済みコンテキストとして登録し、
+    以降の呼び出しでは可変部分 (入力データ) だけを送るためのレジストリ。
+    登録したキャッシュの名前は index_file に保存し、有効期限内なら別プロセス・次回実行でも再利用する。
+    """
+
+    def __init__(self, backend, ttl_sec=AI_PREFIX_CACHE_TTL_SEC, min_tokens=AI_PREFIX_CACHE_MIN_TOKENS,
+                 index_file=AI_PREFIX_CACHE_INDEX_FILE, timeout_sec=AI_CALL_TIMEOUT_SEC):
+        self.backend = backend
+        self.ttl_sec = ttl_sec
+        self.timeout_sec = timeout_sec # キャッシュ登録の呼び出しの期限
+        self.min_tokens = min_tokens
+        self.index_file = index_file
+        self._handles = {} # キー -> キャッシュのハンドル (このプロセスで解決済みのもの)
+        self._unavailable = set() # 登録に失敗したキー (同じ実行中は再登録しない)
+
+    def _key(self, prefix: str) -> str:
+        return f"{self.backend.model_name}:{prompt_hash(prefix)}"
+
+    def _load_index(self) -> dict:
+        if not self.index_file or not os.path.exists(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return index if isinstance(index, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index_entry(self, key: str, name: str):
+        if not self.index_file:
+            return
+        index = self._load_index()
+        now = datetime.now()
+        # 期限切れのエントリは掃除する
+        index = {k: v for k, v in index.items() if datetime.fromisoformat(v['expires_at']) > now}
+        # 期限ぎりぎりのキャッシュを使わないよう、少し短めの期限を記録する
+        index[key] = {"name": name, "expires_at": (now + timedelta(seconds=self.ttl_sec * 0.9)).isoformat(timespec='seconds')}
+        index_dir = os.path.dirname(self.index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def get(self, prefix: str, call=None):
+        """
+        プレフィックスのキャッシュハンドルを返す。戻り値は (ハンドル, 登録済みだったか)。
+        短すぎる・登録に失敗した等でキャッシュを使えない場合は (None, False)。
+        call はバックエンドの呼び出し (引数なしの関数) を受け取って実行する関数 (AIClient のリトライ付き呼び出し)。省略時はそのまま呼ぶ。
+        """
+        if call is None:
+            call = lambda attempt_call: attempt_call()
+        key = self._key(prefix)
+        if key in self._handles:
+            return self._handles[key], True
+        if key in self._unavailable or estimate_tokens(prefix) < self.min_tokens:
+            return None, False
+
+        entry = self._load_index().get(key)
+        if entry and datetime.fromisoformat(entry['expires_at']) > datetime.now():
+            try:
+                self._handles[key] = call(lambda: self.backend.resolve_prefix_cache(entry['name'], prefix))
+                return self._handles[key], True
+            except Exception:
+                pass # 期限切れ・削除済みなどは登録し直す
+
+        try:
+            name, handle = call(lambda: self.backend.create_prefix_cache(prefix, self.ttl_sec, self.timeout_sec))
+        except Exception as e:
+            print(f"  警告(AI): プロンプトプレフィックスのキャッシュ登録に失敗しました。全文を送信します: {type(e).__name__}: {e}")
+            self._unavailable.add(key)
+            return None, False
+        self._handles[key] = handle
+        try:
+            self._save_index_entry(key, name)
+        except OSError as e:
+            print(f"  警告(AI): プレフィックスキャッシュの索引を保存できませんでした: {e}")
+        return handle, False
+
+
+# --- クライアント ---
+
+class AIClient:
+    """
+    全てのAI呼び出しを仲介するクライアント。
+    呼び出しごとの期限、指数バックオフ付きリトライ、実行全体のリトライ予算、
+    連続失敗時のサーキットブレーカーを提供する。
+    """
+
+    def __init__(self, backend, timeout_sec=AI_CALL_TIMEOUT_SEC, max_retries=AI_MAX_RETRIES,
+                 backoff_base_sec=AI_BACKOFF_BASE_SEC, backoff_max_sec=AI_BACKOFF_MAX_SEC,
+                 retry_budget=AI_RETRY_BUDGET, breaker_threshold=AI_CIRCUIT_BREAKER_THRESHOLD,
+                 breaker_cooldown_sec=AI_CIRCUIT_BREAKER_COOLDOWN_SEC, prefix_cache=None, sleep=time.sleep):
+        self.backend = backend
+        self.prefix_cache = prefix_cache # PromptPrefixCache (None ならプレフィックスも毎回送信)
+        self.timeout_sec = timeout_sec
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.retry_budget = retry_budget # 実行全体で使えるリトライ回数の残り
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown_sec = breaker_cooldown_sec
+        self._sleep = sleep
+        self._consecutive_failures = 0
+        self._breaker_open_until = None
+        self.stats = {'calls': 0, 'retries': 0, 'failures': 0, 'truncated_streams': 0, 'elapsed_sec': 0.0,
+                      'prefix_cache_hits': 0, 'prefix_cache_misses': 0, 'prefix_tokens_saved': 0}
+
+    def backoff_delay(self, attempt: int) -> float:
+        """attempt回目 (0始まり) のリトライ前の待ち時間"""
+        return min(self.backoff_max_sec, self.backoff_base_sec * (2 ** attempt))
+
+    def _check_breaker(self):
+        if self._breaker_open_until is None:
+            return
+        if time.monotonic() < self._breaker_open_until:
+            raise AICircuitOpenError(
+                f"AI呼び出しが {self._consecutive_failures} 回連続で失敗したため、一時的に呼び出しを停止しています。"
+            )
+        # クールダウン経過後は半開状態: 次の1回の結果で開閉を決める
+        self._breaker_open_until = None
+
+    def _record_success(self):
+        self._consecutive_failures = 0
+        self._breaker_open_until = None
+
+    def _record_failure(self):
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= self.breaker_threshold:
+            self._breaker_open_until = time.monotonic() + self.breaker_cooldown_sec
+
+    def _call_with_retry(self, label: str, attempt_call, count_failure=True):
+        """
+        attempt_call() を実行し、一時的なエラーは指数バックオフでリトライする。
+        回復しなかった場合は AICallError を送出する。
+        count_failure が False なら最終的な失敗を stats['failures'] に数えない (呼び出し側に代替手段がある場合)。
+        """
+        self.stats['calls'] += 1
+        started = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                self._check_breaker()
+                try:
+                    result = attempt_call()
+                    self._record_success()
+                    return result
+                except AICallError as e:
+                    if not is_retryable_error(e):
+                        self._record_failure()
+                        raise
+                    last_error = e
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        self._record_failure()
+                        raise AICallError(f"{label}: {type(e).__name__}: {e}") from e
+                    last_error = e
+
+                self._record_failure()
+                if self._breaker_open_until is not None:
+                    raise AICircuitOpenError(f"{label}: 連続失敗のため呼び出しを停止しました: {last_error}") from last_error
+                if attempt >= self.max_retries or self.retry_budget <= 0:
+                    raise AICallError(f"{label}: リトライ上限に達しました ({attempt + 1} 回試行): {last_error}") from last_error
+                delay = self.backoff_delay(attempt)
+                print(f"  警告(AI): {label} の呼び出しに失敗しました ({type(last_error).__name__}: {last_error})。{delay:.1f}秒後にリトライします...")
+                self._sleep(delay)
+                attempt += 1
+                self.retry_budget -= 1
+                self.stats['retries'] += 1
+        except AICallError:
+            if count_failure:
+                self.stats['failures'] += 1
+            raise
+        finally:
+            self.stats['elapsed_sec'] += time.monotonic() - started
+
+    def _apply_prefix_cache(self, prompt: str, static_prefix: str | None):
+        """
+        静的プレフィックスをキャッシュ済みコンテキストに置き換える。
+        戻り値は (送信するプロンプト, キャッシュのハンドル)。キャッシュを使えない場合はプレフィックスを連結して送る。
+        """
+        if not static_prefix:
+            return prompt, None
+        if self.prefix_cache is not None:
+            handle, registered = self.prefix_cache.get(static_prefix, call=self._call_prefix_cache)
+            if handle is not None:
+                if registered:
+                    self.stats['prefix_cache_hits'] += 1
+                    self.stats['prefix_tokens_saved'] += estimate_tokens(static_prefix)
+                else:
+                    self.stats['prefix_cache_misses'] += 1
+                return prompt, handle
+        return static_prefix + prompt, None
+
+    def _call_prefix_cache(self, attempt_call):
+        """
+        プレフィックスキャッシュの登録・取得をリトライ付きで呼ぶ。
+        最終的に失敗してもプレフィックスを連結して送る形に戻るだけなので、中断の判定に使う failures には数えない。
+        """
+        return self._call_with_retry('prefix_cache', attempt_call, count_failure=False)
+
+    def generate(self, prompt: str, label: str, response_schema=None, static_prefix=None) -> str:
+        """
+        プロンプトを送信し、応答テキストを返す。
+        response_schema (JSONスキーマ形式の dict) を指定すると、応答をそのスキーマに沿ったJSONに制約する。
+        static_prefix を指定すると、プロンプトは static_prefix + prompt となり、static_prefix はキャッシュ済みコンテキストとして送る。
+        一時的なエラーはリトライし、回復しなかった場合は AICallError を送出する。
+        """
+        prompt, cached_prefix = self._apply_prefix_cache(prompt, static_prefix)
+        return self._call_with_retry(
+            label, lambda: self.backend.generate(prompt, label, self.timeout_sec, response_schema=response_schema,
+                                                 cached_prefix=cached_prefix)
+        )
+
+    def generate_stream(self, prompt: str, label: str, response_schema=None, static_prefix=None):
+        """
+        プロンプトを送信し、応答テキストをチャンク単位で順に返すイテレータ。
+        リトライは最初のチャンクを受け取るまで (ストリーム確立時) のみ行う。
+        受信途中で途切れた場合は AIStreamTruncatedError を送出する (それまでのチャンクは呼び出し側に渡済み)。
+        """
+        prompt, cached_prefix = self._apply_prefix_cache(prompt, static_prefix)
+
+        def open_stream():
+            chunks = iter(self.backend.generate_stream(prompt, label, self.timeout_sec, response_schema=response_schema,
+                                                       cached_prefix=cached_prefix))
+            return next(chunks, ''), chunks
+
+        first_chunk, chunks = self._call_with_retry(label, open_stream)
+        if first_chunk:
+            yield first_chunk
+        try:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            self.stats['truncated_streams'] += 1
+            raise AIStreamTruncatedError(f"{label}: ストリームが途中で途切れました: {type(e).__name__}: {e}") from e
+
+
+def create_ai_client(api_key: str | None):
+    """
+    設定 (constants / 環境変数) に従ってAIクライアントを作成する。
+    AIが利用できない場合 (Gemini バックエンドでAPIキーがない等) は None を返す。
+    """
+    backend_name = os.getenv("AI_BACKEND", AI_BACKEND)
+    if backend_name == 'fake':
+        replay_file = os.getenv("AI_FAKE_RESPONSES_FILE", AI_FAKE_RESPONSES_FILE)
+        latency_sec = float(os.getenv("AI_FAKE_LATENCY_SEC", AI_FAKE_LATENCY_SEC))
+        try:
+            backend = FakeBackend(replay_file=replay_file if replay_file and os.path.exists(replay_file) else None,
+                                  latency_sec=latency_sec)
+        except (OSError, ValueError) as e:
+            print(f"警告: 録画済み応答ファイルの読み込みに失敗しました: {e}")
+            return None
+        print(f"AI backend: fake (replay={replay_file}, latency={latency_sec}s)")
+    elif backend_name == 'gemini':
+        if not api_key:
+            print("警告: 環境変数 'GEMINI_API_KEY' が設定されていません。AIルール解釈はスキップされます。")
+            return None
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            print("Gemini API Key configured.")
+            backend = GeminiBackend()
+        except Exception as e:
+            print(f"警告: Gemini APIキーの設定に失敗しました: {e}")
+            return None
+    else:
+        print(f"警告: 不明なAIバックエンドです: {backend_name}。AIルール解釈はスキップされます。")
+        return None
+
+    record_file = os.getenv("AI_RECORD_FILE", AI_RECORD_FILE)
+    if record_file:
+        backend = RecordingBackend(backend, record_file)
+    prefix_cache = PromptPrefixCache(backend) if AI_PREFIX_CACHE else None
+    return AIClient(backend, prefix_cache=prefix_cache)
@@ -0,0 +1,66 @@
+# 期間開始時点の境界状態 (直前の連勤・連休、前日のシフトなど) を過去シフトから1回だけ求める
+from datetime import timedelta
+
+import numpy as np
+
+from src.constants import SHIFT_MAP_INT, WORKING_SHIFTS_INT, OFF_SHIFT_INTS
+from src.utils import past_date_key
+
+# 職員1人分の境界状態 (employee_ids と同じ順の構造化配列として持つ)
+#   work_streak: 開始日の前日まで続いている勤務 (日/早/夜/明) の連続日数
+#   off_streak: 同じく休み (公/育休/病休) の連続日数
+#   last_shift: 開始日前日のシフト (SHIFT_MAP_INT の値、記録なしは NO_SHIFT)
+#   pending_ake: 前日が夜勤のため、開始日を明けにする必要がある
+BOUNDARY_STATE_DTYPE = np.dtype([
+    ('work_streak', np.int16),
+    ('off_streak', np.int16),
+    ('last_shift', np.int8),
+    ('pending_ake', np.bool_),
+])
+NO_SHIFT = -1
+
+def get_past_date_columns(past_shifts_df, start_date) -> list:
+    """開始日の前日から遡って途切れずに存在する日付列を、古い順に返す"""
+    if past_shifts_df is None:
+        return []
+    columns = set(past_shifts_df.columns)
+    date_columns = []
+    offset = 1
+    while past_date_key(start_date - timedelta(days=offset)) in columns:
+        date_columns.append(past_date_key(start_date - timedelta(days=offset)))
+        offset += 1
+    return date_columns[::-1]
+
+def _trailing_run_length(mask: np.ndarray) -> np.ndarray:
+    """(職員, 日) の真偽値行列について、各行の末尾から続く True の個数を返す"""
+    if mask.shape[1] == 0:
+        return np.zeros(mask.shape[0], dtype=np.int16)
+    reversed_mask = mask[:, ::-1]
+    run_length = np.where(reversed_mask.all(axis=1), mask.shape[1], reversed_mask.argmin(axis=1))
+    return run_length.astype(np.int16)
+
+def compute_boundary_state_from_codes(codes: np.ndarray) -> np.ndarray:
+    """
+    (職員, 日) のシフト整数行列 (古い順、最後の列が開始日前日、記録なしは NO_SHIFT) から境界状態の配列を求める。
+    記録のない日は勤務にも休みにも数えない (その日で連続が途切れる)。
+    """
+    state = np.zeros(codes.shape[0], dtype=BOUNDARY_STATE_DTYPE)
+    state['last_shift'] = NO_SHIFT
+    if codes.shape[1] == 0:
+        return state
+    state['work_streak'] = _trailing_run_length(np.isin(codes, WORKING_SHIFTS_INT))
+    state['off_streak'] = _trailing_run_length(np.isin(codes, OFF_SHIFT_INTS))
+    state['last_shift'] = codes[:, -1]
+    state['pending_ake'] = codes[:, -1] == SHIFT_MAP_INT['夜']
+    return state
+
+def compute_boundary_state(past_shifts_df, employee_ids, start_date) -> np.ndarray:
+    """直前勤務実績の DataFrame から、職員ごと (employee_ids の順) の境界状態の配列 (BOUNDARY_STATE_DTYPE) を返す"""
+    date_columns = get_past_date_columns(past_shifts_df, start_date)
+    if not date_columns:
+        return compute_boundary_state_from_codes(np.empty((len(employee_ids), 0), dtype=np.int8))
+
+    # 職員の並びをモデルと揃えた (職員, 日) のシフト整数行列 (記録なしは NO_SHIFT)
+    history = past_shifts_df.drop_duplicates('職員ID').set_index('職員ID').reindex(employee_ids)[date_columns]
+    codes = history.apply(lambda column: column.map(SHIFT_MAP_INT)).fillna(NO_SHIFT).to_numpy(dtype=np.int8)
+    return compute_boundary_state_from_codes(codes)
@@ -7,6 +7,40 @@ PAST_SHIFT_FILE = "input/past_shifts.csv"
 RULES_FILE = "input/rules.csv" # 個人ルール用
 FACILITY_RULES_FILE = "input/facility_rules.txt" # 施設ルール用入力ファイル
 OUTPUT_DIR = "results"
+RULE_STORE_FILE = "db/rules.sqlite3" # 検証済みルールセットの保存先 (SQLite)
+SCHEDULE_CATALOG_FILE = "db/schedules.sqlite3" # 生成したシフト表の索引 (求解結果・ペナルティ・人員不足の集計)
+EXTRA_OUTPUT_FORMATS = ["npy", "parquet", "json"] # CSV と同じ名前で出力する機械読み取り用の形式 (npy は .meta.json を併せて出力)
+
+# --- データ読み込み ---
+CSV_SNIFF_BYTES = 64 * 1024 # 文字コード判定に読む先頭バイト数
+CSV_FALLBACK_ENCODING = "cp932" # UTF-8 として読めない場合の文字コード (Excel出力の Shift_JIS を含む)
+DATA_LOADER_VERBOSE = False # True で読み込んだ表の内容 (先頭/末尾) をデバッグ表示する
+HISTORY_FILE = "input/shift_history.csv" # 任意の長さの勤務履歴 (職員ID + 日付列)。無ければ使わない
+HISTORY_FROM_RESULTS = True # OUTPUT_DIR の前期間のシフト表 (shift_*.csv) も勤務履歴として取り込む
+HISTORY_MAX_DAYS = 62 # 勤務履歴として保持する最大日数 (期間開始日の前日から遡る)
+SNAPSHOT_ENABLED = True # 入力 (従業員・勤務履歴・祝日・グループ) をバイナリのスナップショットに保存し、入力が変わらなければ再利用する
+SNAPSHOT_DIR = "db/snapshot" # スナップショットの保存先 (期間ごとにサブディレクトリ)
+
+# --- 求解 ---
+SOLVER_NUM_WORKERS = 0 # CP-SAT の探索ワーカー数 (0 はソルバーがCPUコア数から決める)
+SOLVER_MAX_TIME_SEC = None # 求解の時間制限 (秒)。None は無制限
+WEIGHT_PROFILE = "default" # 目的関数の重みのプロファイル (src/weights.py の組み込み、または WEIGHT_PROFILES_FILE。環境変数 WEIGHT_PROFILE で上書き可)
+WEIGHT_PROFILES_FILE = "input/weight_profiles.json" # 重みのプロファイルの設定ファイル ({プロファイル名: {カテゴリ名: 重み}})。無ければ組み込みのみ
+OBJECTIVE_WEIGHT_MAX = 100 # カテゴリの重みの上限 (係数の幅を小さく保ち、CP-SAT の下界の推論を効かせる)
+RULE_WEIGHT_SCALE_MAX = 10 # ルールの weight (AIが付ける値) を丸める整数の上限
+FAIRNESS_FORMULATION = "min_max" # 回数の均等化の定式化: "min_max" (最大 - 最小) / "deviation" (共通の水準からの差の合計)
+
+# --- 修正モード (repair_schedule.py) ---
+REPAIR_NEIGHBORHOOD_DAYS = 7 # 固定セルの前後何日までを解き直すか (夜勤→明け→公休・連勤の窓が収まる幅)
+REPAIR_MAX_TIME_SEC = 10 # 修正の求解の時間制限 (秒)
+REPAIR_FALLBACK_FULL = True # 近傍だけで解けない場合に全セルを対象に解き直す
+
+# --- 複数施設の一括実行 (batch_generator.py) ---
+FACILITIES_DIR = "facilities" # 施設フォルダ (それぞれにリポジトリ直下と同じ input/ を置く) を並べたディレクトリ
+BATCH_MAX_JOBS = None # 同時に処理する施設数。None は CPUコア数 / BATCH_MIN_WORKERS_PER_JOB
+BATCH_MIN_WORKERS_PER_JOB = 4 # 1施設の求解に割り当てる探索ワーカー数の下限
+BATCH_LOG_FILE = "run_log.txt" # 施設ごとの実行ログ (施設の OUTPUT_DIR 配下)
+BATCH_REPORT_PREFIX = "batch_report" # 集計レポートのファイル名 (FACILITIES_DIR 直下に batch_report_YYYYMMDD_HHMMSS.json)
 
 # --- AI関連 ---
 # AI_PROMPT_FILE = "prompts/rule_shaping_prompt.md" # 古い個人ルール用プロンプト (コメントアウト)
@@ -15,7 +49,29 @@ PERSONAL_STRUCTURED_DATA_PROMPT_FILE = "prompts/rule_shaping_prompt.md" # 個人
 # FACILITY_AI_PROMPT_FILE = "prompts/facility_rule_shaping_prompt.md" # 古い施設ルール用プロンプト (コメントアウト)
 FACILITY_INTERMEDIATE_PROMPT_FILE = "prompts/facility_rule_intermediate_translation_prompt.md" # 施設ルール用 (ステップ1: 中間翻訳)
 FACILITY_STRUCTURED_DATA_PROMPT_FILE = "prompts/facility_rule_shaping_prompt.md" # 施設ルール用 (ステップ2: structured_data生成)
+PERSONAL_FAST_PROMPT_FILE = "prompts/personal_rule_fast_prompt.md" # 個人ルール用 高速モード (ステップ1+2を1回で実行)
+FACILITY_FAST_PROMPT_FILE = "prompts/facility_rule_fast_prompt.md" # 施設ルール用 高速モード (ステップ1+2を1回で実行)
 AI_MODEL_NAME = 'models/gemini-2.5-flash-preview-04-17' # テストに合わせて変更
+# AI呼び出しクライアント設定 (src/ai_client.py)
+AI_BACKEND = 'gemini' # 'gemini' または 'fake' (環境変数 AI_BACKEND で上書き可)
+AI_CALL_TIMEOUT_SEC = 120.0 # 1回の呼び出しの期限
+AI_MAX_RETRIES = 3 # 1回の呼び出しあたりの最大リトライ回数
+AI_BACKOFF_BASE_SEC = 2.0 # 指数バックオフの初期待ち時間 (2, 4, 8, ...秒)
+AI_BACKOFF_MAX_SEC = 30.0 # バックオフ待ち時間の上限
+AI_RETRY_BUDGET = 6 # 1回の実行全体で許容するリトライ回数の合計
+AI_CIRCUIT_BREAKER_THRESHOLD = 4 # 連続失敗がこの回数に達したら呼び出しを停止
+AI_CIRCUIT_BREAKER_COOLDOWN_SEC = 60.0 # 停止してから再試行を許可するまでの時間
+AI_FAKE_RESPONSES_FILE = "input/ai_recorded_responses.json" # fake バックエンドが再生する録画済み応答
+AI_FAKE_LATENCY_SEC = 0.0 # fake バックエンドで注入する固定遅延
+AI_RECORD_FILE = None # 設定すると実際の応答をこのファイルに記録する (fake での再生用)
+AI_PREFIX_CACHE = True # プロンプトの静的な指示文をキャッシュ済みコンテキストとして登録し、可変部分だけを送る
+AI_PREFIX_CACHE_TTL_SEC = 3600 # キャッシュ済みコンテキストの有効期間
+AI_PREFIX_CACHE_MIN_TOKENS = 1024 # これより短い (推定トークン数) プレフィックスはキャッシュしない (APIの最小サイズ)
+AI_PREFIX_CACHE_INDEX_FILE = "db/prompt_cache.json" # 登録済みキャッシュ名の索引 (別プロセス・次回実行で再利用)
+AI_USE_RESPONSE_SCHEMA = True # ステップ2でスキーマ指定出力 (JSONモード) を使う
+AI_FAST_MODE = False # 確認用文章と structured_data を1回の呼び出しでまとめて生成する (無人のバッチ実行向け)
+AI_STREAM_STEP2 = False # ステップ2をストリーミングで受信し、要素が閉じるたびに検証する
+AI_ABORT_ON_FAILURE = True # AI呼び出しが最終的に失敗した場合、ルールなしで求解せずに中断する
 
 # --- 期間設定 ---
 START_DATE = date(2025, 4, 10)
@@ -44,6 +100,7 @@ OFF_SHIFT_INTS = [SHIFT_MAP_INT['公'], SHIFT_MAP_INT['育休']] # 休み扱い
 DEFAULT_MAX_CONSECUTIVE_WORK = 4
 MANAGER_MAX_CONSECUTIVE_WORK = 5 # 管理職の連勤上限 (仮)
 MANAGER_ROLES = ['主任', '副主任', '班長']
+ROLE_ON_DUTY_SHIFTS = ['日', '早', '夜'] # MIN_ROLE_ON_DUTY で出勤とみなすシフト (明けは夜勤の続きなので含めない)
 
 # --- 集計関連 ---
 SUMMARY_COLS_SHIFT_SYMBOLS = ["公休", "祝日", "日勤", "早出", "夜勤", "明勤"]
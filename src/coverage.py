@@ -0,0 +1,169 @@
+# 人員配置 (REQUIRED_STAFFING) と役割の出勤 (MIN_ROLE_ON_DUTY) の需要表
+# 施設ルールを (対象, シフト, 日) -> [下限, 上限] の表 (compile_coverage) にまとめ、モデル (shift_model) と評価 (schedule_evaluator)・
+# 不足の集計 (schedule_catalog) で共通に使う。対象はフロア ('floor', '1F' など) か役職 ('role', '主任' など)。
+# 同じ対象・シフトの日付区分が重なる日は、より限定的な区分のルールを使う (日付指定 > 祝日 > 平日・土日 > 休日・土日祝 > ALL)。
+from ortools.sat.python import cp_model
+
+from src.constants import SHIFT_MAP_INT, ROLE_ON_DUTY_SHIFTS
+
+COVERAGE_RULE_TYPES = ('REQUIRED_STAFFING', 'MIN_ROLE_ON_DUTY')
+ROLE_DUTY_LABEL = '出勤' # MIN_ROLE_ON_DUTY のシフト欄 (ROLE_ON_DUTY_SHIFTS のいずれか)
+DATE_TYPE_PRIORITY = {'祝日': 3, '平日': 2, '土日': 2, '休日': 1, '土日祝': 1, 'ALL': 0} # 日付指定 (YYYY-MM-DD) は 4
+
+
+def date_type_priority(date_type):
+    """日付区分の限定の強さ (重なった日はこの値の大きいルールを使う)"""
+    return DATE_TYPE_PRIORITY.get(date_type, 4)
+
+
+def _coverage_target(rule):
+    """ルールの (種類, 対象, シフト記号, シフト整数のリスト)。無効なら None"""
+    min_count = rule.get('min_count')
+    if not isinstance(min_count, int) or min_count < 0 or not isinstance(rule.get('date_type'), str):
+        return None
+    if rule.get('rule_type') == 'REQUIRED_STAFFING':
+        shift_sym = rule.get('shift')
+        if shift_sym not in SHIFT_MAP_INT:
+            return None
+        return 'floor', rule.get('floor') or 'ALL', shift_sym, [SHIFT_MAP_INT[shift_sym]]
+    role = rule.get('role')
+    if not isinstance(role, str) or not role:
+        return None
+    return 'role', role, ROLE_DUTY_LABEL, sorted({SHIFT_MAP_INT[s] for s in ROLE_ON_DUTY_SHIFTS})
+
+
+def compile_coverage(facility_rules, num_days, days_of_type):
+    """
+    施設ルール (確認用文章と structured_data の組、または structured_data) の REQUIRED_STAFFING / MIN_ROLE_ON_DUTY を需要表にする。
+    days_of_type は日付区分 -> 日インデックスのリストを返す関数。戻り値は
+    {(種類, 対象, シフト記号, d_idx): {'min', 'max' (上限なしは None), 'is_hard', 'rule_type', 'date_type', 'shift_ints'}}。
+    REQUIRED_STAFFING は人数を min_count に合わせる (上限も min_count)、MIN_ROLE_ON_DUTY は下限のみ。
+    同じセルに同じ限定の強さのルールが複数あればハード制約を優先し、人数は大きい方を使う (異なるハード制約の人数は警告)。
+    """
+    rules_by_target = {}
+    for entry in facility_rules or []:
+        rule = entry.get('structured_data', entry) # 施設ルールは {'confirmation_text', 'structured_data'} の組
+        if rule.get('rule_type') not in COVERAGE_RULE_TYPES:
+            continue
+        target = _coverage_target(rule)
+        if target is None:
+            print(f"警告(人員配置): {rule.get('rule_type')} のパラメータが無効です。ルールスキップ: {rule}")
+            continue
+        rules_by_target.setdefault(target[:3], {'shift_ints': target[3], 'rules': []})['rules'].append(rule)
+
+    demand = {}
+    for (kind, target, shift_sym), entry in rules_by_target.items():
+        # 日ごとに、その日を含む最も限定的な日付区分のルールだけを残す
+        day_rules = [[] for _ in range(num_days)]
+        for rule in entry['rules']:
+            for d_idx in days_of_type(rule['date_type']):
+                day_rules[d_idx].append(rule)
+        conflicts = set()
+        for d_idx, rules in enumerate(day_rules):
+            if not rules:
+                continue
+            top = max(date_type_priority(rule['date_type']) for rule in rules)
+            rules = [rule for rule in rules if date_type_priority(rule['date_type']) == top]
+            hard_rules = [rule for rule in rules if rule.get('is_hard', True)]
+            rules = hard_rules or rules
+            chosen = max(rules, key=lambda rule: rule['min_count'])
+            if len(hard_rules) > 1 and len({rule['min_count'] for rule in hard_rules}) > 1:
+                conflicts.add(tuple(sorted({(rule['date_type'], rule['min_count']) for rule in hard_rules})))
+            demand[(kind, target, shift_sym, d_idx)] = {
+                'min': chosen['min_count'], 'max': chosen['min_count'] if kind == 'floor' else None, 'is_hard': bool(hard_rules),
+                'rule_type': chosen['rule_type'], 'date_type': chosen['date_type'], 'shift_ints': entry['shift_ints'],
+            }
+        for conflict in sorted(conflicts):
+            print(f"警告(人員配置): {target} の {shift_sym} に人数の異なるハード制約が重なっています {list(conflict)}。大きい方を使います。")
+    return demand
+
+
+def coverage_members(kind, target, floors, group_indices):
+    """需要表の対象 (フロア / 役職) に数える職員インデックス (育休・病休の職員は含めない)"""
+    active = group_indices.get('ALL', [])
+    if kind == 'role':
+        return list(group_indices.get(target, []))
+    if target == 'ALL':
+        return list(active)
+    return [e_idx for e_idx in active if floors[e_idx] == target]
+
+
+def coverage_penalty_category(kind):
+    """下限の不足のペナルティカテゴリ (超過は over_staffing)"""
+    return 'staffing_shortage' if kind == 'floor' else 'min_role'
+
+
+def add_coverage_constraints(model, counts, demand, members_of):
+    """
+    需要表のセルごとに人数の式を1つ作り (counts.indicator を共有)、下限・上限を1回だけ追加する。
+    members_of は (種類, 対象) -> 職員インデックスのリストを返す関数。
+    戻り値は {'staffing_shortage' / 'min_role' / 'over_staffing': ペナルティ変数のリスト} (ソフト制約の不足・超過)。
+    """
+    penalties = {'staffing_shortage': [], 'min_role': [], 'over_staffing': []}
+    for (kind, target, shift_sym, d_idx), cell in sorted(demand.items()):
+        members = members_of(kind, target)
+        count_expr = cp_model.LinearExpr.Sum([counts.indicator(e_idx, d_idx, s) for e_idx in members for s in cell['shift_ints']])
+        name = f'{kind}_{target}_{shift_sym}_d{d_idx}'
+        if cell['is_hard']:
+            if cell['max'] is None:
+                model.Add(count_expr >= cell['min'])
+            else:
+                model.AddLinearConstraint(count_expr, cell['min'], cell['max'])
+            continue
+        shortage_var = model.NewIntVar(0, cell['min'], f'short_{name}')
+        model.Add(cell['min'] - count_expr <= shortage_var)
+        penalties[coverage_penalty_category(kind)].append(shortage_var)
+        if cell['max'] is not None:
+            excess_var = model.NewIntVar(0, len(members), f'over_{name}')
+            model.Add(count_expr - cell['max'] <= excess_var)
+            penalties['over_staffing'].append(excess_var)
+    return penalties
+
+
+def coverage_report(demand, members_of, num_days):
+    """
+    需要と在籍人数の比較。戻り値は (対象・シフトごとの行のリスト, フロアごとの1日の必要人数の行のリスト)。
+    対象・シフトの行: {'kind', 'target', 'shift', 'days', 'min', 'max', 'hard_days', 'headcount', 'short_days'}
+    ('min' / 'max' は期間中の下限の最小・最大、'short_days' は下限が在籍人数を超える日数)。
+    フロアの行: {'floor', 'headcount', 'peak', 'peak_day'} (その日の全シフトの下限と前日の夜勤の明けの合計の最大)。
+    """
+    by_target = {}
+    for (kind, target, shift_sym, d_idx), cell in demand.items():
+        by_target.setdefault((kind, target, shift_sym), []).append(cell)
+    rows = []
+    for (kind, target, shift_sym), cells in sorted(by_target.items()):
+        headcount = len(members_of(kind, target))
+        mins = [cell['min'] for cell in cells]
+        rows.append({'kind': kind, 'target': target, 'shift': shift_sym, 'days': len(cells), 'min': min(mins), 'max': max(mins),
+                     'hard_days': sum(cell['is_hard'] for cell in cells), 'headcount': headcount,
+                     'short_days': sum(value > headcount for value in mins)})
+    night_int = SHIFT_MAP_INT['夜']
+    floor_rows = []
+    for floor in sorted({target for (kind, target, _, _) in demand if kind == 'floor'}):
+        daily = [0] * num_days
+        for (kind, target, _, d_idx), cell in demand.items():
+            if kind != 'floor' or target != floor:
+                continue
+            daily[d_idx] += cell['min']
+            if cell['shift_ints'] == [night_int] and d_idx + 1 < num_days:
+                daily[d_idx + 1] += cell['min'] # 翌日は明け
+        peak = max(daily)
+        floor_rows.append({'floor': floor, 'headcount': len(members_of('floor', floor)), 'peak': peak, 'peak_day': daily.index(peak)})
+    return rows, floor_rows
+
+
+def print_coverage_report(demand, members_of, date_range):
+    """需要と在籍人数の比較を表示する (在籍人数を超える下限は実行不能の原因になる)"""
+    rows, floor_rows = coverage_report(demand, members_of, len(date_range))
+    if not rows:
+        print("人員配置: 需要なし (REQUIRED_STAFFING / MIN_ROLE_ON_DUTY の施設ルールがありません)")
+        return
+    print(f"--- 人員配置の需要 ({len(demand)} セル) ---")
+    for row in rows:
+        bounds = f"{row['min']}" if row['min'] == row['max'] else f"{row['min']}〜{row['max']}"
+        warning = f"  ★在籍人数を超える日 {row['short_days']}" if row['short_days'] else ""
+        hardness = '必須' if row['hard_days'] == row['days'] else '推奨' if not row['hard_days'] else f"必須 {row['hard_days']} 日"
+        print(f"  {row['target']:<6} {row['shift']:<4} {row['days']:>3} 日  {bounds:>5} 人 ({hardness}) / 在籍 {row['headcount']}{warning}")
+    for row in floor_rows:
+        d = date_range[row['peak_day']]
+        print(f"  {row['floor']}: 1日の必要人数 (明けを含む) 最大 {row['peak']} 人 ({d.month}/{d.day}) / 在籍 {row['headcount']}")
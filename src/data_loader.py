@@ -1,40 +1,134 @@
 # データ読み込み・前処理
+import codecs
+import csv
 import pandas as pd
 import re
 from datetime import date, timedelta
 # constants から新しいファイルパス定数をインポート
 from src.constants import (
     START_DATE, END_DATE, # load_past_shifts で使用
-    EMPLOYEE_INFO_FILE, PAST_SHIFT_FILE, RULES_FILE, FACILITY_RULES_FILE # 各ロード関数で使用
+    EMPLOYEE_INFO_FILE, PAST_SHIFT_FILE, RULES_FILE, FACILITY_RULES_FILE, # 各ロード関数で使用
+    CSV_SNIFF_BYTES, CSV_FALLBACK_ENCODING, DATA_LOADER_VERBOSE
 )
-# from src.utils import get_date_range # load_employee_data内では使わなくなった
+from src.utils import past_date_key
 # from src.constants import SHIFT_MAP_INT # parse_constraints削除により不要
 
-def load_employee_data(filepath=EMPLOYEE_INFO_FILE):
+# pyarrow があれば pyarrow の高速なCSVリーダーで読み込む (なければ pandas 標準の C エンジン)
+# pandas の engine='pyarrow' は型推論した後に dtype を適用するため (ID の先頭0が落ちる)、pyarrow.csv を直接使う
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    pa = pa_csv = None
+    CSV_ENGINE = 'c'
+
+# --- 各CSVの列スキーマ ({列名: 型}) ---
+# 型: 'str' (前後の空白を除去し、空文字は欠損値) / 'bool' (1, true, yes, 可 などを True、それ以外・空欄を False)
+EMPLOYEE_SCHEMA = {
+    '職員ID': 'str', '職員名': 'str', '担当フロア': 'str', '役職': 'str', '常勤/パート': 'str',
+    'status': 'str', 'can_help_other_floor': 'bool',
+}
+EMPLOYEE_OPTIONAL_COLUMNS = ['担当フロア', '役職', '常勤/パート'] # 無い場合は警告して空の列を作る
+RULES_SCHEMA = {'職員ID': 'str', 'ルール・希望 (自然言語)': 'str'}
+PAST_SHIFT_SCHEMA = {'職員ID': 'str'} # 日付列 (シフト記号) は other_type='str' で揃える
+
+BOOL_TRUE_VALUES = ['1', '1.0', 'true', 'yes', 'y', '可', '○']
+
+def _to_str_column(series):
+    stripped = series.str.strip()
+    return stripped.where(stripped != '') # 空文字は欠損値 (NaN) にそろえる
+
+def _to_bool_column(series):
+    return series.str.strip().str.lower().isin(BOOL_TRUE_VALUES)
+
+_COLUMN_CONVERTERS = {'str': _to_str_column, 'bool': _to_bool_column}
+
+def detect_encoding(filepath, sniff_bytes=CSV_SNIFF_BYTES):
+    """ファイル先頭のバイト列から文字コードを判定する (BOM付きUTF-8 / UTF-8 / cp932)"""
+    with open(filepath, 'rb') as f:
+        head = f.read(sniff_bytes)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # 末尾で切れたマルチバイト文字はエラーにしない (final=False)
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return CSV_FALLBACK_ENCODING
+
+def _read_header(filepath, encoding):
+    """ヘッダー行 (列名のリスト) だけを読む"""
+    with open(filepath, 'r', encoding=encoding, newline='') as f:
+        return next(csv.reader(f), [])
+
+def _read_csv_as_strings(filepath, encoding):
+    """全列を文字列として (型推論せずに) 読み込む。空欄は空文字のまま残す"""
+    if pa_csv is not None:
+        header = _read_header(filepath, encoding)
+        read_options = pa_csv.ReadOptions(encoding='utf8' if encoding.startswith('utf-8') else encoding)
+        convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in header}, strings_can_be_null=False)
+        return pa_csv.read_csv(filepath, read_options=read_options, convert_options=convert_options).to_pandas()
+    return pd.read_csv(filepath, encoding=encoding, dtype=str, keep_default_na=False)
+
+def read_csv_typed(filepath, schema, required_columns=(), other_type=None, normalize_column=None, verbose=DATA_LOADER_VERBOSE):
+    """
+    CSVを1回だけ読み込み、schema ({列名: 型}) に従って列をまとめて変換した DataFrame を返す。
+    全列を文字列として読む (型推論をしない) ため、ID の先頭0や数値風の記号も崩れない。
+    schema に無い列は other_type が指定されていればその型で変換し、なければそのまま残す。
+    normalize_column を指定すると、空白除去後の列名をその関数で正規化してから必須列を確認する。
+    必須列が不足している場合は None を返す。FileNotFoundError はそのまま送出する。
+    """
+    encoding = detect_encoding(filepath)
+    try:
+        df = _read_csv_as_strings(filepath, encoding)
+    except (UnicodeDecodeError, ValueError) as e:
+        # 判定に使った先頭部分がASCIIのみで、後半に UTF-8 以外の文字がある場合のみ読み直す
+        # (pyarrow は文字コードの誤りも ValueError (ArrowInvalid: invalid UTF8) で送出する)
+        is_decode_error = isinstance(e, UnicodeDecodeError) or 'utf8' in str(e).lower().replace('-', '')
+        if encoding == CSV_FALLBACK_ENCODING or not is_decode_error:
+            raise
+        encoding = CSV_FALLBACK_ENCODING
+        df = _read_csv_as_strings(filepath, encoding)
+    df.columns = df.columns.str.strip()
+    if normalize_column is not None:
+        df.columns = [normalize_column(col) for col in df.columns]
+
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        print(f"エラー: {filepath} に必要なカラムが不足しています。不足: {missing_columns}, 実際: {df.columns.tolist()}")
+        return None
+
+    for col in df.columns:
+        column_type = schema.get(col, other_type)
+        if column_type is not None:
+            df[col] = _COLUMN_CONVERTERS[column_type](df[col])
+
+    if verbose:
+        print(f"DEBUG: {filepath} (encoding={encoding}, engine={CSV_ENGINE}) shape: {df.shape}")
+        print(f"DEBUG: head:\n{df.head()}")
+        print(f"DEBUG: tail:\n{df.tail()}")
+    return df
+
+def load_employee_data(filepath=EMPLOYEE_INFO_FILE, verbose=DATA_LOADER_VERBOSE):
     """従業員基本情報CSVを読み込む"""
     try:
-        try: df = pd.read_csv(filepath, encoding="utf-8")
-        except UnicodeDecodeError: df = pd.read_csv(filepath, encoding="shift-jis")
-        df.columns = df.columns.str.strip()
-
-        # 基本的な情報（担当フロア、役職など）を抽出・整理
-        # 担当フロア (列が存在すれば)
-        if '担当フロア' in df.columns:
-            # 必要ならここで 1F/2F 以外の値を None にするなどの処理
-            pass # 今回は特に処理不要か
-        else:
-            print(f"警告: {filepath} に '担当フロア' 列がありません。")
-            df['担当フロア'] = None # 列自体を作成
-
-        # 役職 (列が存在すれば)
-        if '役職' not in df.columns:
-             print(f"警告: {filepath} に '役職' 列がありません。")
-             df['役職'] = None
-
-        # 常勤/パート (列が存在すれば)
-        if '常勤/パート' not in df.columns:
-             print(f"警告: {filepath} に '常勤/パート' 列がありません。")
-             df['常勤/パート'] = None
+        df = read_csv_typed(filepath, EMPLOYEE_SCHEMA, required_columns=['職員ID'], verbose=verbose)
+        if df is None:
+            return None
+
+        # 担当フロア・役職・常勤/パート (列が無ければ警告して空の列を作る)
+        for col in EMPLOYEE_OPTIONAL_COLUMNS:
+            if col not in df.columns:
+                print(f"警告: {filepath} に '{col}' 列がありません。")
+                df[col] = None
+
+        if df['職員ID'].isna().any():
+            print(f"警告: {filepath} に職員IDが空の行があります。スキップします。")
+            df = df[df['職員ID'].notna()].reset_index(drop=True)
+        duplicated_ids = df.loc[df['職員ID'].duplicated(), '職員ID'].tolist()
+        if duplicated_ids:
+            print(f"警告: {filepath} に重複した職員IDがあります (先頭の行を使用): {duplicated_ids}")
 
         # 応援可否列は削除されたので、関連処理は不要
 
@@ -44,36 +138,44 @@ def load_employee_data(filepath=EMPLOYEE_INFO_FILE):
         # df['parsed_constraints'] = ...
         # df['job_title'] = ...
 
-        print(f"従業員基本情報を読み込みました: {filepath}")
-        print(f"DEBUG: DataFrame shape: {df.shape}") # DataFrameの行数と列数を表示
-        print(f"DEBUG: DataFrame head:\n{df.head()}") # 最初の5行を表示
-        print(f"DEBUG: DataFrame tail:\n{df.tail()}") # 最後の5行を表示
+        print(f"従業員基本情報を読み込みました: {filepath} ({len(df)} 名)")
         # 必要な基本情報カラムのみを返すようにしても良い
         # return df[['職員ID', '職員名', '担当フロア', '役職', '常勤/パート']]
         return df
     except FileNotFoundError: print(f"エラー: ファイルが見つかりません - {filepath}"); return None
     except Exception as e: print(f"エラー: 従業員情報の読み込み中にエラー - {e}"); import traceback; traceback.print_exc(); return None
 
-def load_past_shifts(filepath=PAST_SHIFT_FILE, start_date=START_DATE):
-    """直前勤務実績をCSVから読み込む"""
-    try:
-        # ヘッダーが日付(4/7形式)であることを期待
-        try: df = pd.read_csv(filepath, encoding="utf-8")
-        except UnicodeDecodeError: df = pd.read_csv(filepath, encoding="shift-jis")
+PAST_DATE_COLUMN_REGEX = re.compile(r"^(?:\d{4}[/-])?(\d{1,2})[/-](\d{1,2})$")
 
-        df.columns = df.columns.str.strip()
-        required_cols = ['職員ID'] + [(start_date - timedelta(days=i)).strftime('%#m/%#d') for i in range(3, 0, -1)]
+def normalize_past_date_column(column_name):
+    """日付らしい列名を past_date_key と同じ 'M/D' 形式にそろえる (それ以外はそのまま)"""
+    match = PAST_DATE_COLUMN_REGEX.match(column_name)
+    if match is None:
+        return column_name
+    return f"{int(match.group(1))}/{int(match.group(2))}"
 
-        # 必要なカラムが存在するかチェック
-        if not all(col in df.columns for col in required_cols):
-            print(f"エラー: 直前勤務実績ファイルに必要なカラムが不足しています。期待: {required_cols}, 実際: {df.columns.tolist()}")
-            return None
+FULL_DATE_COLUMN_REGEX = re.compile(r"^(\d{4})[/-](\d{1,2})[/-](\d{1,2})$")
+
+def parse_date_column(column_name):
+    """年を含む日付の列名 (2025-04-07, 2025/4/7 など) を date にする。日付でなければ None"""
+    match = FULL_DATE_COLUMN_REGEX.match(column_name.strip())
+    if match is None:
+        return None
+    try:
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        return None
 
-        # 職員IDを文字列に変換
-        df['職員ID'] = df['職員ID'].astype(str)
-        # シフト記号の空白を除去
-        for col in required_cols[1:]: # 日付カラムのみ
-             df[col] = df[col].astype(str).str.strip()
+def load_past_shifts(filepath=PAST_SHIFT_FILE, start_date=START_DATE, verbose=DATA_LOADER_VERBOSE):
+    """直前勤務実績をCSVから読み込む"""
+    try:
+        # ヘッダーが日付(4/7形式)であることを期待 (04/07, 4-7, 2025-04-07 も 4/7 にそろえる)
+        required_cols = ['職員ID'] + [past_date_key(start_date - timedelta(days=i)) for i in range(3, 0, -1)]
+        # 職員ID・シフト記号 (日付カラム) とも前後の空白を除去した文字列にそろえる
+        df = read_csv_typed(filepath, PAST_SHIFT_SCHEMA, required_columns=required_cols, other_type='str',
+                            normalize_column=normalize_past_date_column, verbose=verbose)
+        if df is None:
+            return None
 
         print(f"直前勤務実績ファイルを読み込みました: {filepath}")
         return df[required_cols] # 必要な列だけ返す
@@ -81,23 +183,17 @@ def load_past_shifts(filepath=PAST_SHIFT_FILE, start_date=START_DATE):
     except FileNotFoundError: print(f"エラー: ファイルが見つかりません - {filepath}"); return None
     except Exception as e: print(f"エラー: 直前勤務実績ファイルの読み込み中にエラー - {e}"); import traceback; traceback.print_exc(); return None
 
-def load_natural_language_rules(filepath=RULES_FILE):
+def load_natural_language_rules(filepath=RULES_FILE, verbose=DATA_LOADER_VERBOSE):
     """自然言語ルールCSVを読み込み、{職員ID: ルール文字列} の辞書を返す"""
     try:
-        try: df = pd.read_csv(filepath, encoding="utf-8")
-        except UnicodeDecodeError: df = pd.read_csv(filepath, encoding="shift-jis")
-        df.columns = df.columns.str.strip()
-
-        if '職員ID' not in df.columns or 'ルール・希望 (自然言語)' not in df.columns:
+        df = read_csv_typed(filepath, RULES_SCHEMA, required_columns=['職員ID', 'ルール・希望 (自然言語)'], verbose=verbose)
+        if df is None:
              print(f"エラー: ルールファイルに必要なカラム（職員ID, ルール・希望 (自然言語)）がありません: {filepath}")
              return {}
 
-        rules_dict = {}
-        for _, row in df.iterrows():
-            emp_id = str(row['職員ID']).strip()
-            rule_text = row['ルール・希望 (自然言語)']
-            # NaNや空文字列は空のルールとして扱う
-            rules_dict[emp_id] = str(rule_text).strip() if pd.notna(rule_text) else ""
+        df = df[df['職員ID'].notna()]
+        # NaNや空文字列は空のルールとして扱う
+        rules_dict = dict(zip(df['職員ID'], df['ルール・希望 (自然言語)'].fillna("")))
 
         print(f"自然言語ルールファイルを読み込みました: {filepath}")
         return rules_dict
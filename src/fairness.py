@@ -0,0 +1,143 @@
+# グループ単位の公平性 (回数の均等化・期間中の最低回数) の制約
+# 回数の変数は ShiftCounts で (職員, シフトの組, 日付区分) ごとに1回だけ作り、均等化・最低回数 (施設ルール) と
+# 回数の範囲 (個人の TOTAL_SHIFT_COUNT) で共有する。ルールの解釈 (normalize_fairness_rules) は schedule_evaluator と共通。
+from ortools.sat.python import cp_model
+
+from src.constants import SHIFT_MAP_INT, FAIRNESS_FORMULATION
+from src.weights import scale_rule_weight
+
+FAIRNESS_RULE_TYPES = ('BALANCE_OFF_DAYS', 'BALANCE_SPECIFIC_SHIFT_TOTALS', 'MIN_TOTAL_SHIFT_DAYS')
+FAIRNESS_FORMULATIONS = ('min_max', 'deviation')
+
+
+class ShiftCounts:
+    """
+    シフト変数から作る回数の変数の共有表。
+    indicator(e_idx, d_idx, shift_int): その日のシフトが shift_int かの BoolVar (セルとシフト整数の組ごとに1つ)
+    count(e_idx, shift_ints, date_type): date_type の日のうち shift_ints のいずれかだった日数の IntVar ((職員, シフトの組, 日付区分) ごとに1つ)
+    days_of_type は日付区分 -> 日インデックスのリストを返す関数 (build_shift_model の日付区分の解決結果を使う)。
+    """
+
+    def __init__(self, model, shifts, days_of_type):
+        self.model = model
+        self.shifts = shifts
+        self.days_of_type = days_of_type
+        self._indicators = {}
+        self._counts = {}
+
+    def indicator(self, e_idx, d_idx, shift_int):
+        key = (e_idx, d_idx, shift_int)
+        if key not in self._indicators:
+            is_shift = self.model.NewBoolVar(f'is_s{shift_int}_e{e_idx}_d{d_idx}')
+            self.model.Add(self.shifts[(e_idx, d_idx)] == shift_int).OnlyEnforceIf(is_shift)
+            self.model.Add(self.shifts[(e_idx, d_idx)] != shift_int).OnlyEnforceIf(is_shift.Not())
+            self._indicators[key] = is_shift
+        return self._indicators[key]
+
+    def count(self, e_idx, shift_ints, date_type='ALL'):
+        shift_ints = tuple(sorted(set(shift_ints)))
+        key = (e_idx, shift_ints, date_type)
+        if key not in self._counts:
+            days = self.days_of_type(date_type)
+            count_var = self.model.NewIntVar(0, len(days), f"count_e{e_idx}_s{'_'.join(map(str, shift_ints))}_{date_type}")
+            self.model.Add(count_var == cp_model.LinearExpr.Sum([self.indicator(e_idx, d_idx, s) for d_idx in days for s in shift_ints]))
+            self._counts[key] = count_var
+        return self._counts[key]
+
+    @property
+    def num_count_vars(self):
+        return len(self._counts)
+
+
+def normalize_fairness_rules(facility_rules):
+    """
+    施設ルール (確認用文章と structured_data の組、または structured_data) のうち公平性のルールを、モデルと評価で共通の形の辞書のリストにする。
+    {'rule_type', 'group', 'shift_syms', 'shift_ints', 'date_type', 'min_count', 'is_hard', 'unit', 'rule'}
+    BALANCE_OFF_DAYS は「公」の全日の回数の均等化、BALANCE_SPECIFIC_SHIFT_TOTALS は target_shifts のシフトそれぞれの date_type の日の回数の均等化
+    (シフトごとに1件にする。均等化はソフト制約のみ)、MIN_TOTAL_SHIFT_DAYS は職員ごとの期間中の最低回数。
+    無効なルールは警告を出して除き、同じ内容のルールは最初の1件だけにする。
+    """
+    normalized = []
+    seen = set()
+    for entry in facility_rules or []:
+        rule = entry.get('structured_data', entry) # 施設ルールは {'confirmation_text', 'structured_data'} の組
+        rule_type = rule.get('rule_type')
+        if rule_type not in FAIRNESS_RULE_TYPES:
+            continue
+        group_name = rule.get('employee_group', 'ALL')
+        min_count, is_hard, unit, date_type = None, False, 1, 'ALL'
+        if rule_type == 'BALANCE_OFF_DAYS':
+            shift_syms = ['公']
+            unit = scale_rule_weight(rule.get('weight'))
+        elif rule_type == 'BALANCE_SPECIFIC_SHIFT_TOTALS':
+            shift_syms = rule.get('target_shifts')
+            date_type = rule.get('date_type') or 'ALL'
+            unit = scale_rule_weight(rule.get('weight'))
+        else:
+            shift_syms = [rule.get('shift')]
+            min_count = rule.get('min_count')
+            is_hard = rule.get('is_hard', True)
+            if not isinstance(min_count, int) or min_count < 0:
+                print(f"警告(公平性): MIN_TOTAL_SHIFT_DAYS の min_count '{min_count}' が無効です。ルールスキップ: {rule}")
+                continue
+        if not isinstance(shift_syms, list) or not shift_syms or any(s not in SHIFT_MAP_INT for s in shift_syms):
+            print(f"警告(公平性): {rule_type} のシフト記号 '{shift_syms}' が無効です。ルールスキップ: {rule}")
+            continue
+        shift_sets = [[s] for s in dict.fromkeys(shift_syms)] if rule_type == 'BALANCE_SPECIFIC_SHIFT_TOTALS' else [shift_syms]
+        for shift_set in shift_sets:
+            key = (rule_type, group_name, tuple(sorted(shift_set)), date_type, min_count, is_hard)
+            if key in seen:
+                continue
+            seen.add(key)
+            normalized.append({'rule_type': rule_type, 'group': group_name, 'shift_syms': shift_set,
+                               'shift_ints': sorted({SHIFT_MAP_INT[s] for s in shift_set}), 'date_type': date_type,
+                               'min_count': min_count, 'is_hard': is_hard, 'unit': unit, 'rule': rule})
+    return normalized
+
+
+def resolve_formulation(formulation=None):
+    """均等化の定式化の名前 (None は FAIRNESS_FORMULATION。不明な名前は警告を出して min_max)"""
+    formulation = formulation or FAIRNESS_FORMULATION
+    if formulation not in FAIRNESS_FORMULATIONS:
+        print(f"警告(公平性): 均等化の定式化 '{formulation}' は不明です ({' / '.join(FAIRNESS_FORMULATIONS)})。min_max を使います。")
+        return 'min_max'
+    return formulation
+
+
+def add_group_balance(model, counts, e_indices, shift_ints, date_type='ALL', formulation=None, name='balance'):
+    """
+    グループの職員の回数 (counts.count) の偏りを表す IntVar を返す (目的関数で最小化する)。
+    'min_max': 最大 - 最小。'deviation': 共通の水準 (IntVar) からの差の絶対値の合計 (最小化すると水準は中央値になる)。
+    """
+    formulation = resolve_formulation(formulation)
+    count_vars = [counts.count(e_idx, shift_ints, date_type) for e_idx in e_indices]
+    num_days = len(counts.days_of_type(date_type))
+    if formulation == 'min_max':
+        min_count = model.NewIntVar(0, num_days, f'{name}_min')
+        max_count = model.NewIntVar(0, num_days, f'{name}_max')
+        model.AddMinEquality(min_count, count_vars)
+        model.AddMaxEquality(max_count, count_vars)
+        spread = model.NewIntVar(0, num_days, f'{name}_spread')
+        model.Add(spread == max_count - min_count)
+        return spread
+    level = model.NewIntVar(0, num_days, f'{name}_level')
+    deviations = []
+    for e_idx, count_var in zip(e_indices, count_vars):
+        deviation = model.NewIntVar(0, num_days, f'{name}_dev_e{e_idx}')
+        model.Add(deviation >= count_var - level)
+        model.Add(deviation >= level - count_var)
+        deviations.append(deviation)
+    total_deviation = model.NewIntVar(0, num_days * len(deviations), f'{name}_deviation')
+    model.Add(total_deviation == cp_model.LinearExpr.Sum(deviations))
+    return total_deviation
+
+
+def group_imbalance(counts, formulation=None):
+    """回数の配列の偏り (add_group_balance と同じ定式化。schedule_evaluator で使う)"""
+    if len(counts) == 0:
+        return 0
+    if resolve_formulation(formulation) == 'min_max':
+        return int(max(counts) - min(counts))
+    ordered = sorted(int(c) for c in counts)
+    median = ordered[len(ordered) // 2]
+    return sum(abs(c - median) for c in ordered)
@@ -0,0 +1,170 @@
+# 勤務履歴: 前期間のシフト表・履歴ファイル・直前勤務実績から、期間開始前の (職員 x 日) シフト行列を作る
+import csv
+import glob
+import os
+import re
+from datetime import date, timedelta
+
+import numpy as np
+
+from src.constants import (
+    SHIFT_MAP_INT, PAST_SHIFT_FILE, OUTPUT_DIR,
+    HISTORY_FILE, HISTORY_FROM_RESULTS, HISTORY_MAX_DAYS
+)
+from src.data_loader import detect_encoding
+from src.boundary_state import NO_SHIFT # 記録のない日
+
+HISTORY_DTYPE = np.int8
+
+RESULT_FILE_REGEX = re.compile(r"^shift_(\d{8})(?:_v(\d+))?\.csv$")
+MONTH_DAY_REGEX = re.compile(r"^(\d{1,2})[/-](\d{1,2})$")
+
+class ShiftHistory:
+    """
+    期間開始日の前日までの勤務履歴。
+    matrix[e_idx, d] が employee_ids[e_idx] の dates[d] のシフト (SHIFT_MAP_INT の値、記録なしは NO_SHIFT)。
+    dates は古い順の連続した日付で、最後の日が期間開始日の前日。
+    """
+
+    def __init__(self, employee_ids, dates, matrix):
+        self.employee_ids = list(employee_ids)
+        self.dates = list(dates)
+        self.matrix = matrix
+
+    @property
+    def num_days(self):
+        return len(self.dates)
+
+    def tail(self, days):
+        """直近 days 日分の行列"""
+        return self.matrix[:, max(0, self.num_days - days):]
+
+    def count_shifts(self, shift_ints, days=None):
+        """職員ごとに、直近 days 日 (None は全履歴) のうち shift_ints のいずれかだった日数"""
+        window = self.matrix if days is None else self.tail(days)
+        return np.isin(window, shift_ints).sum(axis=1)
+
+def parse_history_date(header, start_date):
+    """
+    履歴の列名を日付に変換する (YYYY-MM-DD, YYYY/MM/DD, M/D 形式)。日付でない列は None。
+    年のない M/D は期間開始日より前で最も近い年とみなす。
+    """
+    header = header.strip()
+    try:
+        return date.fromisoformat(header.replace('/', '-'))
+    except ValueError:
+        pass
+    match = MONTH_DAY_REGEX.match(header)
+    if match is None:
+        return None
+    month, day = int(match.group(1)), int(match.group(2))
+    for year in (start_date.year, start_date.year - 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            continue
+        if candidate < start_date:
+            return candidate
+    return None
+
+def is_empty_file(path):
+    """0バイトのファイル (消えていれば True)"""
+    try:
+        return os.path.getsize(path) == 0
+    except OSError:
+        return True
+
+def find_previous_result_files(output_dir, start_date):
+    """
+    output_dir のシフト表 (shift_YYYYMMDD[_vNN].csv) のうち、開始日が start_date より前のものを古い順に返す。
+    同じ開始日に複数の版がある場合は最新の版だけを使う。
+    空のファイル (claim_output_path で名前を確保したまま書き込みが終わらなかった版) は版として数えない。
+    """
+    latest_by_start = {}
+    for path in glob.glob(os.path.join(output_dir, "shift_*.csv")):
+        match = RESULT_FILE_REGEX.match(os.path.basename(path))
+        if match is None or is_empty_file(path):
+            continue
+        try:
+            file_start = date(int(match.group(1)[:4]), int(match.group(1)[4:6]), int(match.group(1)[6:]))
+        except ValueError:
+            continue
+        if file_start >= start_date:
+            continue
+        version = int(match.group(2)) if match.group(2) else 0
+        if file_start not in latest_by_start or version > latest_by_start[file_start][0]:
+            latest_by_start[file_start] = (version, path)
+    return [latest_by_start[file_start][1] for file_start in sorted(latest_by_start)]
+
+def _read_history_file(path, emp_row_by_id, emp_row_by_name, start_date, first_date, matrix):
+    """
+    CSVを1行ずつ読みながら、期間内 (first_date 〜 開始日前日) の日付列のシフトを matrix に書き込む。
+    職員は 職員ID 列があればIDで、無ければ (シフト表の出力形式) 職員名で特定する。書き込んだセル数を返す。
+    """
+    written = 0
+    with open(path, 'r', encoding=detect_encoding(path), newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        if '職員ID' in header:
+            key_col, emp_rows = header.index('職員ID'), emp_row_by_id
+        elif '職員名' in header:
+            key_col, emp_rows = header.index('職員名'), emp_row_by_name
+        else:
+            print(f"警告(勤務履歴): {path} に 職員ID / 職員名 列がありません。スキップします。")
+            return 0
+        # (列番号, 行列の日インデックス) の組
+        day_columns = []
+        for col, name in enumerate(header):
+            col_date = parse_history_date(name, start_date)
+            if col_date is not None and first_date <= col_date < start_date:
+                day_columns.append((col, (col_date - first_date).days))
+        if not day_columns:
+            return 0
+        for row in reader:
+            if key_col >= len(row):
+                continue
+            e_idx = emp_rows.get(row[key_col].strip())
+            if e_idx is None:
+                continue # 曜日行・集計行・在籍していない職員
+            for col, d_idx in day_columns:
+                if col < len(row):
+                    shift_int = SHIFT_MAP_INT.get(row[col].strip())
+                    if shift_int is not None:
+                        matrix[e_idx, d_idx] = shift_int
+                        written += 1
+    return written
+
+def load_shift_history(employees_df, start_date, past_shift_file=PAST_SHIFT_FILE, history_file=HISTORY_FILE,
+                       output_dir=OUTPUT_DIR if HISTORY_FROM_RESULTS else None, max_days=HISTORY_MAX_DAYS):
+    """
+    勤務履歴 (ShiftHistory) を作る。取り込む順 (後のものが同じ日を上書き):
+      1. output_dir の前期間のシフト表 (古い順)
+      2. history_file (任意の長さの履歴ファイル)
+      3. past_shift_file (直前勤務実績)
+    どの入力も無い場合も、全日 NO_SHIFT の履歴を返す。
+    """
+    employee_ids = employees_df['職員ID'].tolist()
+    emp_row_by_id = {emp_id: idx for idx, emp_id in enumerate(employee_ids)}
+    emp_row_by_name = {}
+    if '職員名' in employees_df.columns:
+        names = employees_df['職員名'].tolist()
+        duplicated_names = {name for name in names if names.count(name) > 1}
+        if duplicated_names:
+            print(f"警告(勤務履歴): 職員名が重複しているため、シフト表からは読み込みません: {sorted(duplicated_names, key=str)}")
+        emp_row_by_name = {name: idx for idx, name in enumerate(names) if isinstance(name, str) and name not in duplicated_names}
+
+    first_date = start_date - timedelta(days=max_days)
+    dates = [first_date + timedelta(days=i) for i in range(max_days)]
+    matrix = np.full((len(employee_ids), max_days), NO_SHIFT, dtype=HISTORY_DTYPE)
+
+    sources = find_previous_result_files(output_dir, start_date) if output_dir else []
+    sources += [path for path in (history_file, past_shift_file) if path and os.path.exists(path)]
+    for path in sources:
+        written = _read_history_file(path, emp_row_by_id, emp_row_by_name, start_date, first_date, matrix)
+        if written:
+            print(f"勤務履歴を読み込みました: {path} ({written} 件)")
+
+    # 記録のある最も古い日から開始日前日までに切り詰める
+    recorded_days = np.flatnonzero((matrix != NO_SHIFT).any(axis=0))
+    first_recorded = int(recorded_days[0]) if len(recorded_days) else max_days
+    return ShiftHistory(employee_ids, dates[first_recorded:], matrix[:, first_recorded:])
@@ -0,0 +1,109 @@
+# ストリーミング応答用のインクリメンタルJSONパーサー
+import json
+
+
+class IncrementalJSONParser:
+    """
+    チャンク単位で届くJSONテキストを走査し、トップレベルのリスト/辞書の要素を
+    閉じた時点で1件ずつ取り出す。
+    - トップレベルがリスト `[...]` の場合: 各要素の値
+    - トップレベルが辞書 `{...}` の場合: (キー, 値) のタプル
+    先頭のMarkdownコードブロック (```json) などトップレベル開始前の文字列は読み飛ばす。
+    壊れた要素はその要素だけを errors に記録して読み飛ばし、途中で途切れた末尾は取り出さない。
+    feed_indexed は要素とともにトップレベルでの通し番号 (0始まり、壊れた要素も数える) を返す
+    (確認用文章など、要素の順番で対応付ける別のリストとの組み合わせに使う)。
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0 # 次に走査する位置 (buffer内)
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._elem_start = None # 走査中の要素の開始位置 (buffer内)
+        self.top_level_type = None # 'list' または 'dict'
+        self.done = False # トップレベルが閉じたか
+        self.items_emitted = 0
+        self.elements_seen = 0 # 閉じたトップレベルの要素の数 (壊れた要素を含む)
+        self.errors = [] # (要素テキスト, エラー内容)
+
+    def feed(self, chunk: str) -> list:
+        """チャンクを追加し、このチャンクで閉じた要素のリストを返す"""
+        return [item for _, item in self.feed_indexed(chunk)]
+
+    def feed_indexed(self, chunk: str) -> list:
+        """チャンクを追加し、このチャンクで閉じた要素の (通し番号, 要素) のリストを返す"""
+        if self.done or not chunk:
+            return []
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self.done:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                # トップレベル開始前: '[' / '{' 以外は読み飛ばす
+                if ch in '[{':
+                    self.top_level_type = 'list' if ch == '[' else 'dict'
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._elem_start is None:
+                    self._elem_start = i
+            elif ch in '[{':
+                if self._depth == 1 and self._elem_start is None:
+                    self._elem_start = i
+                self._depth += 1
+            elif ch in ']}':
+                self._depth -= 1
+                if self._depth == 1 and self._elem_start is not None:
+                    # 入れ子のリスト/辞書が閉じた = 要素 (または キー:値) が完成
+                    self._emit(buffer[self._elem_start:i + 1], items)
+                    self._elem_start = None
+                elif self._depth == 0:
+                    # トップレベルが閉じた。未出力のプリミティブ要素があれば出力
+                    if self._elem_start is not None:
+                        self._emit(buffer[self._elem_start:i], items)
+                        self._elem_start = None
+                    self.done = True
+            elif ch == ',' and self._depth == 1:
+                if self._elem_start is not None:
+                    self._emit(buffer[self._elem_start:i], items)
+                    self._elem_start = None
+            elif self._depth == 1 and self._elem_start is None and not ch.isspace() and ch != ':':
+                self._elem_start = i # 数値・true/false/null などのプリミティブ要素
+            i += 1
+
+        # 処理済みの部分を捨ててバッファを小さく保つ
+        keep_from = self._elem_start if self._elem_start is not None else i
+        self._buffer = buffer[keep_from:]
+        self._pos = i - keep_from
+        if self._elem_start is not None:
+            self._elem_start = 0
+        return items
+
+    def _emit(self, text: str, items: list):
+        text = text.strip()
+        if not text:
+            return
+        ordinal = self.elements_seen
+        self.elements_seen += 1
+        try:
+            if self.top_level_type == 'list':
+                items.append((ordinal, json.loads(text)))
+            else:
+                items.append((ordinal, next(iter(json.loads('{' + text + '}').items()))))
+            self.items_emitted += 1
+        except (json.JSONDecodeError, StopIteration) as e:
+            self.errors.append((text, str(e)))
+
+    def pending_text(self) -> str:
+        """閉じていない (途中で途切れた) 末尾のテキスト"""
+        return self._buffer.strip() if not self.done else ''
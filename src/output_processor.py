@@ -1,16 +1,30 @@
 # 結果処理・CSV出力
+import json
+import numpy as np
 import pandas as pd
 import os
-from datetime import date, timedelta
+import re
+from datetime import date, datetime, timedelta
 from ortools.sat.python import cp_model
-from collections import Counter
 
 from src.constants import (
-    SHIFT_MAP_SYM, SHIFT_MAP_INT,
-    SUMMARY_COLS, DAY_SUMMARY_ROW_NAMES, START_DATE, END_DATE # create_shift_dataframe 用
+    SHIFT_MAP_SYM, SHIFT_MAP_INT, WORKING_SHIFTS_INT,
+    SUMMARY_COLS, DAY_SUMMARY_ROW_NAMES, START_DATE, END_DATE, # create_shift_dataframe 用
+    EXTRA_OUTPUT_FORMATS
 )
 from src.utils import get_employee_info
 
+# Parquet 出力は pyarrow がある場合のみ (無ければスキップ)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+NUM_SHIFT_INTS = max(SHIFT_MAP_INT.values()) + 1
+# シフト整数 -> 出力する勤務記号 (行列をまとめて記号に変換するための表)
+SHIFT_SYMBOL_TABLE = np.array([SHIFT_MAP_SYM.get(i, '?') for i in range(NUM_SHIFT_INTS)], dtype=object)
+
 # create_shift_dataframe は output_processor に移動するのが適切か？
 # もしくは utils か、独立したファイルか。
 # ここでは output_processor に含めてみる
@@ -64,89 +78,226 @@ def create_shift_dataframe(employees_df, date_range, jp_holidays):
     print("シフト表の雛形 (DataFrame) を作成しました。")
     return df
 
-def process_solver_results(status, solver, shifts_vars, employee_ids, date_range, initial_shift_df, employees_df, jp_holidays):
-    """ソルバーの結果を処理し、シフト情報を埋めたDataFrameを返す"""
+def extract_solution_matrix(solver, shifts_vars, num_employees, num_days):
+    """
+    ソルバーの解をシフト整数の行列 (職員 × 日, int8) として一度に取り出す。
+    solver.Value をセルごとに呼ばず、応答の解ベクトルを変数インデックスでまとめて引く。
+    """
+    var_indices = np.fromiter((shifts_vars[(e_idx, d_idx)].Index() for e_idx in range(num_employees) for d_idx in range(num_days)),
+                              dtype=np.int64, count=num_employees * num_days)
+    solution = np.asarray(solver.ResponseProto().solution, dtype=np.int64)
+    return solution[var_indices].astype(np.int8).reshape(num_employees, num_days)
+
+def count_shifts_per_employee(shift_matrix):
+    """職員ごとの各シフト整数の回数 (職員 × シフト整数) を bincount でまとめて数える"""
+    num_employees = shift_matrix.shape[0]
+    offsets = np.arange(num_employees, dtype=np.int64)[:, None] * NUM_SHIFT_INTS
+    counts = np.bincount((shift_matrix.astype(np.int64) + offsets).ravel(), minlength=num_employees * NUM_SHIFT_INTS)
+    return counts.reshape(num_employees, NUM_SHIFT_INTS)
+
+def process_solver_results(status, solver, shifts_vars, employee_ids, date_range, initial_shift_df, employees_df, jp_holidays, shift_matrix=None):
+    """ソルバーの結果を処理し、シフト情報を埋めたDataFrameを返す (shift_matrix を渡せば解の取り出しを省略する)"""
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         print(f"Processing solution (Status: {solver.StatusName(status)}) ")
         filled_shift_df = initial_shift_df.copy()
         employee_data_start_row = 1
+        num_employees = len(employee_ids)
         target_date_cols = [d.strftime('%Y-%m-%d') for d in date_range]
-        all_employees = range(len(employee_ids))
-        all_days = range(len(date_range))
-
-        emp_idx_to_id = {i: emp_id for i, emp_id in enumerate(employee_ids)}
-
-        # DataFrameに結果を書き込む
-        for e_idx in all_employees:
-            row_index = employee_data_start_row + e_idx
-            # emp_info = emp_id_to_info.get(emp_idx_to_id.get(e_idx)) # 応援表記で使わないなら不要
-            # original_floor = emp_info['担当フロア'] if emp_info is not None else None
+        employee_rows = slice(employee_data_start_row, employee_data_start_row + num_employees)
+        date_col_positions = [filled_shift_df.columns.get_loc(col) for col in target_date_cols]
 
-            for d_idx, date_col in enumerate(target_date_cols):
-                target_date = date_range[d_idx]
-                weekday = target_date.weekday()
-                is_weekend_or_holiday = (weekday >= 5) or (target_date in jp_holidays)
-                shift_int = solver.Value(shifts_vars[(e_idx, d_idx)])
-                shift_sym = SHIFT_MAP_SYM.get(shift_int, '?')
-                output_shift_sym = shift_sym # デフォルト
+        # 解を一度だけ取り出し、以降の書き込み・集計は全てこの行列から行う
+        if shift_matrix is None:
+            shift_matrix = extract_solution_matrix(solver, shifts_vars, num_employees, len(date_range))
 
-                # 応援表記の追加ロジックを削除 (is_helping_* を受け取らないため)
-                # if shift_int in ... :
-                #    ...
-
-                filled_shift_df.loc[row_index, date_col] = output_shift_sym
+        # DataFrameに結果を書き込む (職員 × 日 をまとめて代入)
+        filled_shift_df.iloc[employee_rows, date_col_positions] = SHIFT_SYMBOL_TABLE[shift_matrix]
 
         # --- 集計処理 ---
         print("Calculating summaries...")
         summary_cols_map = {
             '集計:公休': [SHIFT_MAP_INT['公']],
-            #'集計:祝日': [], # 祝日勤務は別で考慮が必要
             '集計:日勤': [SHIFT_MAP_INT['日']],
             '集計:早出': [SHIFT_MAP_INT['早']],
             '集計:夜勤': [SHIFT_MAP_INT['夜']],
             '集計:明勤': [SHIFT_MAP_INT['明']]
         }
         # 職員別集計
-        for e_idx in all_employees:
-            row_index = employee_data_start_row + e_idx
-            shift_counts = Counter(solver.Value(shifts_vars[(e_idx, d_idx)]) for d_idx in all_days)
-            for col_name, symbols_int in summary_cols_map.items():
-                count = sum(shift_counts[s_int] for s_int in symbols_int)
-                filled_shift_df.loc[row_index, col_name] = count
-            # TODO: 祝日勤務の集計
+        shift_counts = count_shifts_per_employee(shift_matrix)
+        for col_name, symbols_int in summary_cols_map.items():
+            filled_shift_df.iloc[employee_rows, filled_shift_df.columns.get_loc(col_name)] = shift_counts[:, symbols_int].sum(axis=1)
+        # 祝日勤務: 祝日 (土日は含めない) に勤務シフトに入った日数
+        holiday_mask = np.fromiter((d in jp_holidays for d in date_range), dtype=bool, count=len(date_range))
+        holiday_work = np.isin(shift_matrix[:, holiday_mask], WORKING_SHIFTS_INT).sum(axis=1)
+        filled_shift_df.iloc[employee_rows, filled_shift_df.columns.get_loc('集計:祝日')] = holiday_work
 
         # 日付別集計
-        summary_row_start_index = employee_data_start_row + len(employee_ids)
+        summary_row_start_index = employee_data_start_row + num_employees
         day_summary_map = {
              '日勤合計': [SHIFT_MAP_INT['日']], '早出合計': [SHIFT_MAP_INT['早']],
              '夜勤合計': [SHIFT_MAP_INT['夜']], '明勤合計': [SHIFT_MAP_INT['明']]
         }
-        for i, (row_name, symbols_int) in enumerate(day_summary_map.items()):
-             row_index = summary_row_start_index + i
-             for d_idx, date_col in enumerate(target_date_cols):
-                 count = sum(1 for e_idx in all_employees if solver.Value(shifts_vars[(e_idx, d_idx)]) in symbols_int)
-                 filled_shift_df.loc[row_index, date_col] = count
+        day_counts = np.stack([np.isin(shift_matrix, symbols_int).sum(axis=0) for symbols_int in day_summary_map.values()])
+        summary_rows = slice(summary_row_start_index, summary_row_start_index + len(day_summary_map))
+        filled_shift_df.iloc[summary_rows, date_col_positions] = day_counts
 
         return filled_shift_df.fillna('')
     else:
         print("Solution not found.")
         return None
 
-def save_shift_to_csv(shift_df, output_dir, start_date):
-    """生成されたシフト表をCSVファイルに保存する (バージョン管理付き)"""
+def _scan_versions(output_dir, base_filename, ext):
+    """output_dir を一度だけ走査し、base_filename の既存バージョン番号の最大値を返す (無印は 0、無ければ -1)"""
+    pattern = re.compile(rf"^{re.escape(base_filename)}(?:_v(\d+))?{re.escape(ext)}$")
+    latest = -1
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            match = pattern.match(entry.name)
+            if match:
+                latest = max(latest, int(match.group(1) or 0))
+    return latest
+
+def versioned_filename(base_filename, version, ext):
+    """バージョン 0 は無印 (shift_20250410.csv)、以降は _v01, _v02, ..."""
+    return f"{base_filename}{ext}" if version == 0 else f"{base_filename}_v{version:02d}{ext}"
+
+def claim_output_path(output_dir, base_filename, ext=".csv"):
+    """
+    次のバージョンのファイル名を排他的に作成して確保し、そのパスを返す。
+    既存バージョンはディレクトリを一度走査して求め、同時実行で先に確保された名前は次の番号に進む。
+    """
     os.makedirs(output_dir, exist_ok=True)
+    version = _scan_versions(output_dir, base_filename, ext) + 1
+    while True:
+        output_path = os.path.join(output_dir, versioned_filename(base_filename, version, ext))
+        try:
+            fd = os.open(output_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            version += 1
+            continue
+        os.close(fd)
+        return output_path
+
+def write_file_atomic(path, write_func):
+    """同じディレクトリの一時ファイルに write_func(一時ファイルパス) で書き、書き終えてから置き換える (途中で落ちても壊れたファイルを残さない)"""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        write_func(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def save_shift_to_csv(shift_df, output_dir, start_date):
+    """生成されたシフト表をCSVファイルに保存する (バージョン管理付き。同時実行でも名前が重ならない)"""
     base_filename = f"shift_{start_date.strftime('%Y%m%d')}"
-    version = 1
-    output_filename = f"{base_filename}.csv"
-    output_path = os.path.join(output_dir, output_filename)
-    while os.path.exists(output_path):
-        output_filename = f"{base_filename}_v{version:02d}.csv"
-        output_path = os.path.join(output_dir, output_filename)
-        version += 1
+    output_path = None
     try:
-        shift_df.to_csv(output_path, index=False, header=True, encoding='utf_8_sig')
+        output_path = claim_output_path(output_dir, base_filename)
+        write_file_atomic(output_path, lambda tmp_path: shift_df.to_csv(tmp_path, index=False, header=True, encoding='utf_8_sig'))
         print(f"シフト表をCSVファイルに出力しました: {output_path}")
         return output_path # 保存したパスを返す
     except Exception as e:
         print(f"エラー: CSVファイルへの書き込み中にエラーが発生しました - {e}")
-        return None 
\ No newline at end of file
+        # 確保しただけの空ファイルは残さない
+        if output_path and os.path.exists(output_path) and os.path.getsize(output_path) == 0:
+            os.remove(output_path)
+        return None
+
+# --- 機械読み取り用の出力 (解の行列から直接書く) ---
+
+def build_schedule_metadata(solver, status, start_date, end_date, input_hash, solver_workers=None):
+    """出力ファイルに付けるメタデータ (求解ステータス・目的関数値・求解時間・入力ハッシュ)"""
+    return {
+        'status': solver.StatusName(status),
+        'objective': solver.ObjectiveValue() if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None,
+        'solve_time_sec': round(solver.WallTime(), 3),
+        'input_hash': input_hash,
+        'period_start': start_date.isoformat(),
+        'period_end': end_date.isoformat(),
+        'solver_workers': solver_workers,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'shift_codes': {str(code): symbol for code, symbol in SHIFT_MAP_SYM.items()},
+    }
+
+def save_schedule_npy(shift_matrix, output_stem, employee_ids, date_range, metadata):
+    """職員 × 日 の int8 行列を .npy に、行・列の対応とメタデータを .meta.json に書く"""
+    npy_path = f"{output_stem}.npy"
+    write_file_atomic(npy_path, lambda tmp_path: _save_npy(tmp_path, shift_matrix))
+    sidecar = dict(metadata, employee_ids=list(employee_ids), dates=[d.isoformat() for d in date_range])
+    write_file_atomic(f"{output_stem}.meta.json", lambda tmp_path: _dump_json(tmp_path, sidecar))
+    return npy_path
+
+def _save_npy(path, array):
+    with open(path, 'wb') as f: # np.save はファイル名に .npy を補うため、ファイルオブジェクトで渡す
+        np.save(f, np.ascontiguousarray(array, dtype=np.int8))
+
+def _dump_json(path, obj):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+
+def save_schedule_parquet(shift_matrix, output_stem, employee_ids, floors, date_range, metadata):
+    """縦持ち (職員, 日付, 勤務記号, フロア) の Parquet を書く。メタデータはスキーマのメタデータに入れる"""
+    if pa is None:
+        print("警告: pyarrow がないため Parquet 出力をスキップします (pip install pyarrow でインストールするか、"
+              "EXTRA_OUTPUT_FORMATS から 'parquet' を外してください)。")
+        return None
+    num_employees, num_days = shift_matrix.shape
+    codes = shift_matrix.ravel() # 職員ごとに日付が並ぶ順
+    table = pa.table({
+        'employee': pa.array(np.repeat(np.asarray(employee_ids, dtype=object), num_days), type=pa.string()),
+        'date': pa.array(np.tile(np.array(date_range, dtype='datetime64[D]'), num_employees)),
+        'shift': pa.array(SHIFT_SYMBOL_TABLE[codes], type=pa.string()),
+        'shift_code': pa.array(codes, type=pa.int8()),
+        'floor': pa.array(np.repeat(np.asarray(floors, dtype=object), num_days), type=pa.string()),
+    })
+    table = table.replace_schema_metadata({'schedule_metadata': json.dumps(metadata, ensure_ascii=False)})
+    parquet_path = f"{output_stem}.parquet"
+    write_file_atomic(parquet_path, lambda tmp_path: pq.write_table(table, tmp_path))
+    return parquet_path
+
+def save_schedule_json(shift_matrix, output_stem, employee_ids, floors, date_range, metadata):
+    """メタデータと職員ごとの勤務記号の並びを JSON に書く"""
+    symbols = SHIFT_SYMBOL_TABLE[shift_matrix]
+    document = {
+        'metadata': metadata,
+        'dates': [d.isoformat() for d in date_range],
+        'employees': [
+            {'employee': emp_id, 'floor': floor, 'shifts': symbols[e_idx].tolist()}
+            for e_idx, (emp_id, floor) in enumerate(zip(employee_ids, floors))
+        ],
+    }
+    json_path = f"{output_stem}.json"
+    write_file_atomic(json_path, lambda tmp_path: _dump_json(tmp_path, document))
+    return json_path
+
+def save_schedule_outputs(shift_matrix, csv_path, employees_df, date_range, metadata, formats=EXTRA_OUTPUT_FORMATS):
+    """
+    CSV と同じ名前 (拡張子違い) で機械読み取り用の出力を書く。表示用の DataFrame は経由しない。
+    戻り値は 形式 -> 出力パス の辞書 (失敗・スキップした形式は含めない)。
+    """
+    if shift_matrix is None or not formats:
+        return {}
+    output_stem = os.path.splitext(csv_path)[0]
+    employee_ids = employees_df['職員ID'].tolist()
+    floors = employees_df['担当フロア'].fillna('').astype(str).tolist() if '担当フロア' in employees_df.columns else [''] * len(employee_ids)
+    writers = {
+        'npy': lambda: save_schedule_npy(shift_matrix, output_stem, employee_ids, date_range, metadata),
+        'parquet': lambda: save_schedule_parquet(shift_matrix, output_stem, employee_ids, floors, date_range, metadata),
+        'json': lambda: save_schedule_json(shift_matrix, output_stem, employee_ids, floors, date_range, metadata),
+    }
+    written = {}
+    for output_format in formats:
+        if output_format not in writers:
+            print(f"警告: 未対応の出力形式です: {output_format}")
+            continue
+        try:
+            path = writers[output_format]()
+        except Exception as e:
+            print(f"警告: {output_format} 形式の出力に失敗しました - {e}")
+            continue
+        if path:
+            written[output_format] = path
+    if written:
+        print(f"機械読み取り用の出力を書き込みました: {', '.join(written.values())}")
+    return written
@@ -0,0 +1,139 @@
+# 修正モード (既存のシフト表の一部のセルを固定し、残りを最小限の変更で再調整する)
+# 固定セルは変数の定義域で固定し、それ以外のセルは既存の値をヒントにして、既存からの変更セル数を目的関数に加える。
+# 既定では固定セルの周辺 (同じフロアの職員 × 前後 REPAIR_NEIGHBORHOOD_DAYS 日) だけを解き直し、近傍外のセルは既存の値で固定する。
+from ortools.sat.python import cp_model
+
+from src.constants import REPAIR_NEIGHBORHOOD_DAYS, REPAIR_MAX_TIME_SEC, REPAIR_FALLBACK_FULL, SOLVER_NUM_WORKERS, SHIFT_MAP_INT
+from src.shift_model import build_shift_model, PENALTY_WEIGHTS
+from src.solver import solve_shift_model
+from src.output_processor import extract_solution_matrix
+from src.schedule_evaluator import LEAVE_STATUSES
+from src.utils import build_group_indices
+
+SOLVED_STATUSES = (cp_model.OPTIMAL, cp_model.FEASIBLE)
+
+
+def find_repair_neighborhood(employees_df, pinned_cells, num_days, radius=REPAIR_NEIGHBORHOOD_DAYS):
+    """
+    解き直す範囲 (職員インデックスの集合, 日インデックスの range) を返す。
+    職員は固定セルの職員と、同じフロアの育休・病休以外の職員 (固定で動いた勤務を埋め合わせられるように)。
+    日は最初の固定セルの radius 日前から、最後の固定セルの radius 日後まで。
+    """
+    num_employees = len(employees_df)
+    floors = employees_df['担当フロア'].fillna('').astype(str).tolist() if '担当フロア' in employees_df.columns else [''] * num_employees
+    statuses = employees_df['status'].tolist() if 'status' in employees_df.columns else [None] * num_employees
+    pinned_employees = {e_idx for e_idx, _ in pinned_cells}
+    pinned_floors = {floors[e_idx] for e_idx in pinned_employees}
+    employees = pinned_employees | {e_idx for e_idx in range(num_employees)
+                                    if floors[e_idx] in pinned_floors and statuses[e_idx] not in LEAVE_STATUSES}
+    pinned_days = [d_idx for _, d_idx in pinned_cells]
+    days = range(max(0, min(pinned_days) - radius), min(num_days, max(pinned_days) + radius + 1))
+    return employees, days
+
+
+def build_repair_model(existing_matrix, pinned_cells, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+                       shift_history=None, group_indices=None, neighborhood=None, frozen_cells=None, coverage_group_indices=None):
+    """
+    修正用のモデルを構築する。pinned_cells ({(e_idx, d_idx): シフト整数}) と frozen_cells (同じ形。既存の値のまま動かさないセル) は
+    定義域で固定し、neighborhood ((職員の集合, 日の range)) を指定した場合は近傍外のセルも既存の値で固定する。
+    coverage_group_indices は build_shift_model にそのまま渡す。残りのセルは既存の値をヒントにし、既存と異なるセルの数を 'schedule_change' のペナルティとして目的関数に加える。
+    戻り値は build_shift_model と同じ (model, shifts, employee_ids, date_range, penalty_exprs)。
+    """
+    num_employees, num_days = existing_matrix.shape
+    fixed_cells = dict(frozen_cells or {})
+    if neighborhood is not None:
+        employees, days = neighborhood
+        for e_idx in range(num_employees):
+            for d_idx in range(num_days):
+                if (e_idx not in employees or d_idx not in days) and existing_matrix[e_idx, d_idx] >= 0:
+                    fixed_cells[(e_idx, d_idx)] = existing_matrix[e_idx, d_idx]
+    fixed_cells.update(pinned_cells)
+    print(f"修正モード: 固定セル {len(pinned_cells)}, 既存の値で固定 {len(fixed_cells) - len(pinned_cells)}, "
+          f"解き直すセル {num_employees * num_days - len(fixed_cells)}")
+
+    model, shifts, employee_ids, date_range, penalty_exprs = build_shift_model(
+        employees_df, None, date_range, jp_holidays, personal_rules, facility_rules,
+        shift_history=shift_history, group_indices=group_indices, fixed_cells=fixed_cells, coverage_group_indices=coverage_group_indices
+    )
+    change_vars = []
+    for (e_idx, d_idx), var in shifts.items():
+        existing = int(existing_matrix[e_idx, d_idx])
+        if (e_idx, d_idx) in fixed_cells or existing < 0:
+            continue
+        model.AddHint(var, existing)
+        changed = model.NewBoolVar(f'changed_e{e_idx}_d{d_idx}')
+        model.Add(var != existing).OnlyEnforceIf(changed)
+        model.Add(var == existing).OnlyEnforceIf(changed.Not())
+        change_vars.append(changed)
+    if change_vars:
+        penalty_exprs['schedule_change'] = cp_model.LinearExpr.Sum(change_vars) * PENALTY_WEIGHTS['schedule_change']
+    model.Minimize(cp_model.LinearExpr.Sum(list(penalty_exprs.values())))
+    return model, shifts, employee_ids, date_range, penalty_exprs
+
+
+def repair_schedule(existing_matrix, pinned_cells, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+                    shift_history=None, group_indices=None, use_neighborhood=True, radius=REPAIR_NEIGHBORHOOD_DAYS,
+                    fallback_full=REPAIR_FALLBACK_FULL, frozen_cells=None, max_time_sec=REPAIR_MAX_TIME_SEC, solver_workers=SOLVER_NUM_WORKERS,
+                    coverage_group_indices=None):
+    """
+    既存のシフト表 (employees_df の行順 × date_range の行列) を、固定セルを満たすように最小限の変更で解き直す。
+    近傍で解が見つからない場合は fallback_full なら全セルを対象に解き直す。
+    戻り値は {'status', 'solver', 'shifts', 'penalty_exprs', 'shift_matrix' (解が無ければ None), 'scope' ('neighborhood' / 'full'), 'num_changed'}。
+    """
+    attempts = []
+    if use_neighborhood and pinned_cells:
+        attempts.append(('neighborhood', find_repair_neighborhood(employees_df, list(pinned_cells), len(date_range), radius)))
+    if not attempts or fallback_full:
+        attempts.append(('full', None))
+    for scope, neighborhood in attempts:
+        print(f"\n--- Repair ({scope}) ---")
+        model, shifts, employee_ids, _, penalty_exprs = build_repair_model(
+            existing_matrix, pinned_cells, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+            shift_history=shift_history, group_indices=group_indices, neighborhood=neighborhood, frozen_cells=frozen_cells,
+            coverage_group_indices=coverage_group_indices
+        )
+        status, solver = solve_shift_model(model, num_workers=solver_workers, max_time_sec=max_time_sec)
+        if status in SOLVED_STATUSES:
+            break
+        print(f"情報: {scope} の修正では解が見つかりませんでした ({solver.StatusName(status)})。")
+    result = {'status': status, 'solver': solver, 'shifts': shifts, 'penalty_exprs': penalty_exprs,
+              'shift_matrix': None, 'scope': scope, 'num_changed': None}
+    if status in SOLVED_STATUSES:
+        result['shift_matrix'] = extract_solution_matrix(solver, shifts, len(employee_ids), len(date_range))
+        result['num_changed'] = int((result['shift_matrix'] != existing_matrix).sum())
+    return result
+
+
+def repair_absence(existing_matrix, employee_id, start_date, status, employees_df, date_range, jp_holidays, personal_rules, facility_rules,
+                   shift_history=None, max_time_sec=REPAIR_MAX_TIME_SEC, solver_workers=SOLVER_NUM_WORKERS):
+    """
+    公開済みのシフト表の途中で employee_id が start_date から status (育休/病休) になった場合の修正。
+    start_date より前のセルは全職員とも公開済みの値で固定し (期間開始前の履歴と同じく連勤・夜勤明けの持ち越しに効く)、
+    その職員の start_date 以降を status に固定して、残りの日を公開済みからの変更が最小になるように解き直す。
+    その職員は期間の残りを休むため、本人の個人ルールを外し、従業員情報の status を変えたコピーでモデルを作る
+    (夜勤ローテーション・グループのルールの対象外になる)。人員配置・役割の出勤は元の従業員情報のグループで数え、
+    開始日より前の勤務は人数に入れる (開始日以降は status に固定したセルなので人数に入らない)。
+    戻り値は repair_schedule と同じ dict に 'employees_df' (モデルに使った従業員情報) を加えたもの。不正な指定は None。
+    """
+    employee_ids = employees_df['職員ID'].tolist()
+    if employee_id not in employee_ids or start_date not in date_range or status not in LEAVE_STATUSES:
+        print(f"エラー: 休みの指定 {employee_id} {start_date} {status} が不正です (職員ID・期間内の日付・{'/'.join(LEAVE_STATUSES)} を確認してください)。")
+        return None
+    e_idx, start_d_idx = employee_ids.index(employee_id), list(date_range).index(start_date)
+    status_int = SHIFT_MAP_INT[status]
+    num_employees = existing_matrix.shape[0]
+    frozen_cells = {(row, d_idx): existing_matrix[row, d_idx]
+                    for row in range(num_employees) for d_idx in range(start_d_idx) if existing_matrix[row, d_idx] >= 0}
+    absence_cells = {(e_idx, d_idx): status_int for d_idx in range(start_d_idx, len(date_range))}
+
+    model_employees_df = employees_df.copy()
+    model_employees_df.loc[model_employees_df['職員ID'] == employee_id, 'status'] = status
+    remaining_rules = [rule for rule in personal_rules if (rule.get('employee') or rule.get('employee1')) != employee_id]
+    print(f"休みによる修正: {employee_id} {start_date} 〜 {status} (固定する前半 {start_d_idx} 日, 外した個人ルール {len(personal_rules) - len(remaining_rules)} 件)")
+    result = repair_schedule(existing_matrix, absence_cells, model_employees_df, date_range, jp_holidays, remaining_rules, facility_rules,
+                             shift_history=shift_history, group_indices=None, use_neighborhood=False, fallback_full=False,
+                             frozen_cells=frozen_cells, max_time_sec=max_time_sec, solver_workers=solver_workers,
+                             coverage_group_indices=build_group_indices(employees_df))
+    result['scope'] = 'absence'
+    result['employees_df'] = model_employees_df
+    return result
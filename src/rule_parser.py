@@ -55,6 +55,170 @@ def parse_and_validate_date(date_str, start_date, end_date):
             # どちらの形式でもパースできない
             return None, f"Unrecognized date format: {date_str}"
 
+# --- 宣言的なルールスキーマと検証関数のコンパイル ---
+# ルールタイプごとに {"fields": {フィールド名: フィールド定義}, "checks": [複数フィールドにまたがる検証]} を定義し、
+# import 時に1回だけ検証関数へコンパイルする。
+# フィールド定義のキー:
+#   type: 'shift' / 'shift_list' / 'int' / 'number' / 'bool' / 'str' / 'date' / 'date_type' / 'employee_group'
+#   required: 必須か (既定 False。任意項目はキーがある場合のみ検証する)
+#   nullable: None を未指定として扱うか (既定 False)
+#   min / max: 数値の範囲, enum: 許可する値の集合, non_empty: 空のリスト・文字列を不可とする
+#   default: 未指定時の既定値 (fill=True のときのみルールに書き込む。それ以外は参照側の既定値の記録)
+# checks の各関数は rule_data を受け取り、問題があれば理由の文字列、なければ None を返す。
+_MISSING = object()
+
+def _is_valid_shift_list(shifts):
+    return isinstance(shifts, list) and all(isinstance(s, str) and s in VALID_SHIFT_SYMBOLS for s in shifts)
+
+def _is_valid_date_type(dtype):
+    if not isinstance(dtype, str):
+        return False
+    if dtype in VALID_DATE_TYPES:
+        return True
+    # YYYY-MM-DD形式かチェック (特定日指定)
+    try:
+        date.fromisoformat(dtype)
+        return True
+    except ValueError:
+        return False
+
+def _is_valid_employee_group(group):
+    # 文字列であり、空でないことのみをチェック。
+    # 存在するグループ/役職名かの最終確認は shift_model 側で行う。
+    return isinstance(group, str) and bool(group.strip()) # 空白のみの文字列も False にする
+
+# フィールドの型ごとの検証 (isinstance で判定できる型はクラス、それ以外は検証関数)
+_TYPE_CLASSES = {
+    'int': int,
+    'number': (int, float),
+    'bool': bool,
+    'str': str,
+    'date': date, # 日付文字列は共通処理で dateオブジェクトに変換済み
+}
+_TYPE_PREDICATES = {
+    'shift': lambda value: isinstance(value, str) and value in VALID_SHIFT_SYMBOLS,
+    'shift_list': _is_valid_shift_list,
+    'date_type': _is_valid_date_type,
+    'employee_group': _is_valid_employee_group,
+}
+
+def _compile_field_check(rule_type, name, field_spec):
+    """
+    1フィールドの検証関数 (rule_data を受け取り、問題があれば理由の文字列、なければ None を返す) を作る。
+    フィールド定義の解釈 (型・範囲・列挙値・理由の文字列) はここで1回だけ行い、検証関数はその結果だけを参照する。
+    """
+    type_class = _TYPE_CLASSES.get(field_spec['type'])
+    is_type = _TYPE_PREDICATES.get(field_spec['type'])
+    min_val, max_val = field_spec.get('min'), field_spec.get('max')
+    allowed = frozenset(field_spec['enum']) if field_spec.get('enum') is not None else None
+    non_empty = bool(field_spec.get('non_empty'))
+    has_extra = min_val is not None or max_val is not None or allowed is not None or non_empty
+    nullable = bool(field_spec.get('nullable'))
+    missing_reason = f"Missing {name} for {rule_type}" if field_spec.get('required') else None
+    fill = bool(field_spec.get('fill')) and missing_reason is None
+    default = field_spec.get('default')
+    invalid_prefix = f"Invalid {name} for {rule_type}: "
+
+    def check(rule_data):
+        value = rule_data.get(name, _MISSING)
+        if value is _MISSING or (nullable and value is None):
+            if fill:
+                rule_data[name] = default
+            return missing_reason
+        if not (isinstance(value, type_class) if type_class is not None else is_type(value)):
+            return invalid_prefix + repr(value)
+        if has_extra and ((min_val is not None and value < min_val) or (max_val is not None and value > max_val)
+                          or (allowed is not None and value not in allowed) or (non_empty and not value)):
+            return invalid_prefix + repr(value)
+        return None
+    return check
+
+def compile_rule_validator(rule_type, spec, common_fields=None):
+    """
+    ルールタイプのスキーマを検証関数にコンパイルする。
+    フィールドごとの検証関数 (型・範囲などの条件はフィールド定義から1回だけ組み立てる) をルールタイプごとに1回作っておき、
+    検証時にはスキーマを解釈せずにそれらを順に呼ぶ。
+    返す関数は rule_data を検証し (fill 指定の既定値は書き込む)、問題があれば理由の文字列、なければ None を返す。
+    """
+    fields = dict(common_fields or {})
+    fields.update(spec.get('fields', {})) # ルールタイプ側の定義を優先 (例: 任意の is_hard を必須にする)
+    field_checks = tuple(_compile_field_check(rule_type, name, field_spec) for name, field_spec in fields.items())
+    checks = tuple(spec.get('checks', ()))
+    suffix = f" for {rule_type}"
+
+    def validate(rule_data):
+        for field_check in field_checks:
+            reason = field_check(rule_data)
+            if reason:
+                return reason
+        for check in checks:
+            reason = check(rule_data)
+            if reason:
+                return reason + suffix
+        return None
+    return validate
+
+def compile_rule_validators(specs, common_fields=None):
+    """{rule_type: スキーマ} を {rule_type: 検証関数} にコンパイルする"""
+    return {rule_type: compile_rule_validator(rule_type, spec, common_fields) for rule_type, spec in specs.items()}
+
+def _check_min_or_max(rule_data):
+    if rule_data.get('min') is None and rule_data.get('max') is None:
+        return "min or max must be specified"
+    return None
+
+def _check_min_not_above_max(rule_data):
+    min_val, max_val = rule_data.get('min'), rule_data.get('max')
+    if min_val is not None and max_val is not None and min_val > max_val:
+        return f"min > max: min={min_val}, max={max_val}"
+    return None
+
+_SHIFT = {'type': 'shift', 'required': True}
+
+# --- 個人ルールのスキーマ ---
+# 全ルールタイプ共通: employee または employee1 (必須、共通処理で検証)、is_hard / employee2 (任意)、date (任意、dateオブジェクトに変換)
+PERSONAL_COMMON_FIELDS = {
+    'is_hard': {'type': 'bool'},
+    'employee2': {'type': 'str'},
+}
+PERSONAL_RULE_SPECS = {
+    'SPECIFY_DATE_SHIFT': {'fields': {
+        'date': {'type': 'date', 'required': True},
+        'shift': _SHIFT,
+        'is_hard': {'type': 'bool', 'required': True},
+    }},
+    'MAX_CONSECUTIVE_WORK': {'fields': {'max_days': {'type': 'int', 'required': True, 'min': 1}}},
+    'FORBID_SHIFT': {'fields': {'shift': _SHIFT}},
+    'ALLOW_ONLY_SHIFTS': {'fields': {'allowed_shifts': {'type': 'shift_list', 'required': True}}},
+    'FORBID_SIMULTANEOUS_SHIFT': {'fields': {
+        'employee2': {'type': 'str', 'required': True},
+        'shift': _SHIFT,
+    }},
+    'TOTAL_SHIFT_COUNT': {
+        'fields': {
+            'shifts': {'type': 'shift_list', 'required': True},
+            'min': {'type': 'int', 'nullable': True, 'min': 0},
+            'max': {'type': 'int', 'nullable': True, 'min': 0},
+        },
+        'checks': [_check_min_or_max, _check_min_not_above_max],
+    },
+    'PREFER_WEEKDAY_SHIFT': {'fields': {
+        'weekday': {'type': 'int', 'required': True, 'min': 0, 'max': 6},
+        'shift': _SHIFT,
+        'weight': {'type': 'number', 'nullable': True},
+    }},
+    'MAX_CONSECUTIVE_OFF': {'fields': {'max_days': {'type': 'int', 'required': True, 'min': 1}}},
+    'FORBID_SHIFT_SEQUENCE': {'fields': {'preceding_shift': _SHIFT, 'subsequent_shift': _SHIFT}},
+    'ENFORCE_SHIFT_SEQUENCE': {'fields': {'preceding_shift': _SHIFT, 'subsequent_shift': _SHIFT}},
+    # 日付区分 (祝日・土日祝など) の全日に同じシフトを希望する。日付の解決は shift_model 側でカレンダーから1回だけ行う
+    'PREFER_SHIFT_ON_DATE_SET': {'fields': {
+        'date_type': {'type': 'date_type', 'required': True},
+        'shift': _SHIFT,
+        'weight': {'type': 'number', 'nullable': True, 'min': 0},
+    }},
+}
+_PERSONAL_VALIDATORS = compile_rule_validators(PERSONAL_RULE_SPECS, PERSONAL_COMMON_FIELDS)
+
 def validate_and_transform_rule(rule_data, start_date, end_date):
     """
     単一の構造化ルールデータ(辞書)を検証し、必要なら変換する。
@@ -76,14 +240,9 @@ def validate_and_transform_rule(rule_data, start_date, end_date):
 
     if not rule_type:
         return {'rule_type': 'INVALID', 'reason': 'Missing rule_type.'}
-
-    # is_hard があればブール型かチェック
-    if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-         return {'rule_type': 'INVALID', 'reason': 'is_hard must be a boolean.'}
-
-    # employee2 があれば文字列かチェック
-    if 'employee2' in rule_data and not isinstance(rule_data['employee2'], str):
-         return {'rule_type': 'INVALID', 'reason': 'employee2 must be a string.'}
+    validator = _PERSONAL_VALIDATORS.get(rule_type) if isinstance(rule_type, str) else None
+    if validator is None: # 未知のルールタイプ
+        return {'rule_type': 'INVALID', 'reason': f"Unknown rule_type: {rule_type}"}
 
     # --- 日付関連の処理 --- 
     if 'date' in rule_data:
@@ -93,108 +252,9 @@ def validate_and_transform_rule(rule_data, start_date, end_date):
         else:
             return {'rule_type': 'INVALID', 'reason': reason or "Invalid date found."} # 理由があれば使う
 
-    # シフト記号の検証関数
-    def is_valid_shift(shift):
-        return isinstance(shift, str) and shift in VALID_SHIFT_SYMBOLS
-
-    # --- ルールタイプごとの検証 --- 
-    if rule_type == 'SPECIFY_DATE_SHIFT':
-        # date は上で検証・変換済み
-        if 'date' not in rule_data or not isinstance(rule_data.get('date'), date):
-            # 通常ここには来ないはずだが念のため
-             return {'rule_type': 'INVALID', 'reason': f"Missing or invalid date after validation for {rule_type}"}
-        shift = rule_data.get('shift')
-        if not is_valid_shift(shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid or missing shift symbol for {rule_type}: {shift}"}
-        if not isinstance(rule_data.get('is_hard'), bool):
-             return {'rule_type': 'INVALID', 'reason': f"Missing or invalid is_hard for {rule_type}"}
-
-    elif rule_type == 'MAX_CONSECUTIVE_WORK':
-        if not isinstance(rule_data.get('max_days'), int) or rule_data['max_days'] <= 0:
-             return {'rule_type': 'INVALID', 'reason': f"Invalid max_days for {rule_type}: {rule_data.get('max_days')}"}
-        # is_hard の検証を追加 (オプショナルだが、あれば bool)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    elif rule_type == 'FORBID_SHIFT':
-        shift = rule_data.get('shift')
-        if not is_valid_shift(shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid or missing shift symbol for {rule_type}: {shift}"}
-
-    elif rule_type == 'ALLOW_ONLY_SHIFTS':
-        allowed = rule_data.get('allowed_shifts')
-        if not isinstance(allowed, list) or not all(is_valid_shift(s) for s in allowed):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid allowed_shifts for {rule_type}: {allowed}"}
-
-    elif rule_type == 'FORBID_SIMULTANEOUS_SHIFT':
-        if not isinstance(rule_data.get('employee2'), str):
-             return {'rule_type': 'INVALID', 'reason': f"Missing or invalid employee2 for {rule_type}"}
-        shift = rule_data.get('shift')
-        if not is_valid_shift(shift):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid or missing shift symbol for {rule_type}: {shift}"}
-
-    elif rule_type == 'TOTAL_SHIFT_COUNT':
-        shifts_list = rule_data.get('shifts')
-        if not isinstance(shifts_list, list) or not all(is_valid_shift(s) for s in shifts_list):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid shifts list for {rule_type}: {shifts_list}"}
-        min_val = rule_data.get('min')
-        max_val = rule_data.get('max')
-        if min_val is None and max_val is None:
-             return {'rule_type': 'INVALID', 'reason': f"min or max must be specified for {rule_type}"}
-        if min_val is not None and (not isinstance(min_val, int) or min_val < 0):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid min value for {rule_type}: {min_val}"}
-        if max_val is not None and (not isinstance(max_val, int) or max_val < 0):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid max value for {rule_type}: {max_val}"}
-        if min_val is not None and max_val is not None and min_val > max_val:
-            return {'rule_type': 'INVALID', 'reason': f"min > max for {rule_type}: min={min_val}, max={max_val}"}
-        # is_hard の検証を追加 (オプショナルだが、あれば bool)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    elif rule_type == 'PREFER_WEEKDAY_SHIFT': # PREFER_WEEKDAY_SHIFT の検証を追加 (weightはオプショナル)
-         if not isinstance(rule_data.get('weekday'), int) or not (0 <= rule_data['weekday'] <= 6):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid weekday for {rule_type}: {rule_data.get('weekday')}"}
-         shift = rule_data.get('shift')
-         if not is_valid_shift(shift):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid or missing shift symbol for {rule_type}: {shift}"}
-         weight = rule_data.get('weight')
-         if weight is not None and not isinstance(weight, (int, float)):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid weight for {rule_type}: {weight}"}
-         # is_hard の検証を追加 (オプショナルだが、あれば bool)
-         if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    elif rule_type == 'MAX_CONSECUTIVE_OFF':
-        if not isinstance(rule_data.get('max_days'), int) or rule_data['max_days'] <= 0:
-             return {'rule_type': 'INVALID', 'reason': f"Invalid max_days for {rule_type}: {rule_data.get('max_days')}"}
-        # is_hard の検証を追加 (オプショナルだが、あれば bool)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    elif rule_type == 'FORBID_SHIFT_SEQUENCE':
-        pre_shift = rule_data.get('preceding_shift')
-        sub_shift = rule_data.get('subsequent_shift')
-        if not is_valid_shift(pre_shift) or not is_valid_shift(sub_shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid shift symbols for {rule_type}: {pre_shift} -> {sub_shift}"}
-        # is_hard の検証を追加 (オプショナル)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    elif rule_type == 'ENFORCE_SHIFT_SEQUENCE':
-        pre_shift = rule_data.get('preceding_shift')
-        sub_shift = rule_data.get('subsequent_shift')
-        if not is_valid_shift(pre_shift) or not is_valid_shift(sub_shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid shift symbols for {rule_type}: {pre_shift} -> {sub_shift}"}
-        # is_hard の検証を追加 (オプショナル)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    # PREFER_CALENDAR_SCHEDULE は削除されたので検証不要
-    # MAX_CONSECUTIVE_OFF も現在AI解釈対象外なので検証不要
-
-    else: # 未知のルールタイプ
-        return {'rule_type': 'INVALID', 'reason': f"Unknown rule_type: {rule_type}"}
-
+    reason = validator(rule_data)
+    if reason:
+        return {'rule_type': 'INVALID', 'reason': reason}
     # 特に問題なければ、元のデータを（日付変換などを適用して）返す
     return rule_data
 
@@ -250,6 +310,60 @@ VALID_EMPLOYEE_GROUPS = {"ALL", "常勤", "パート"} # 必要に応じて役
 VALID_FLOORS = {"1F", "2F", "ALL"} # constants.py から取る方が良いかも
 
 
+# --- 施設ルールのスキーマ ---
+# employee_group / floor の既定値 'ALL' はルールに書き込まない (shift_model 側で同じ既定値を使う)
+FACILITY_COMMON_FIELDS = {
+    'is_hard': {'type': 'bool'},
+}
+_EMPLOYEE_GROUP = {'type': 'employee_group', 'default': 'ALL'}
+FACILITY_RULE_SPECS = {
+    'REQUIRED_STAFFING': {'fields': {
+        'floor': {'type': 'str', 'enum': VALID_FLOORS, 'default': 'ALL'},
+        'shift': _SHIFT,
+        'date_type': {'type': 'date_type', 'required': True},
+        'min_count': {'type': 'int', 'required': True, 'min': 0},
+    }},
+    'MIN_ROLE_ON_DUTY': {'fields': {
+        # 役職名は employees.csv に依存するので、ここでは文字列であることのみチェック
+        'role': {'type': 'str', 'required': True, 'non_empty': True},
+        'min_count': {'type': 'int', 'required': True, 'min': 0},
+        'date_type': {'type': 'date_type', 'required': True},
+    }},
+    'MAX_CONSECUTIVE_OFF': {'fields': {
+        'employee_group': _EMPLOYEE_GROUP,
+        'max_days': {'type': 'int', 'required': True, 'min': 1},
+    }},
+    'BALANCE_OFF_DAYS': {'fields': {
+        'employee_group': _EMPLOYEE_GROUP,
+        'weight': {'type': 'number', 'nullable': True},
+    }},
+    'BALANCE_SPECIFIC_SHIFT_TOTALS': {'fields': {
+        'employee_group': _EMPLOYEE_GROUP,
+        'target_shifts': {'type': 'shift_list', 'required': True, 'non_empty': True},
+        'date_type': {'type': 'date_type', 'default': 'ALL'}, # 数える日 (例: 祝日の公休の均等化)
+        'weight': {'type': 'number', 'nullable': True, 'default': 1, 'fill': True}, # 未指定なら重み1を書き込む
+    }},
+    'MIN_TOTAL_SHIFT_DAYS': {'fields': {
+        'employee_group': _EMPLOYEE_GROUP,
+        'shift': _SHIFT, # 対象となるシフト記号 (例: '公')
+        'min_count': {'type': 'int', 'required': True, 'min': 0}, # 0日もありうる
+        'is_hard': {'type': 'bool', 'required': True},
+    }},
+    'MAX_CONSECUTIVE_WORK': {'fields': { # 施設版
+        'employee_group': _EMPLOYEE_GROUP,
+        'max_days': {'type': 'int', 'required': True, 'min': 1},
+        'is_hard': {'type': 'bool', 'required': True},
+    }},
+    'FORBID_SHIFT': {'fields': {'employee_group': _EMPLOYEE_GROUP, 'shift': _SHIFT}}, # 施設向け禁止シフト
+    'FORBID_SHIFT_SEQUENCE': {'fields': {
+        'employee_group': _EMPLOYEE_GROUP, 'preceding_shift': _SHIFT, 'subsequent_shift': _SHIFT,
+    }},
+    'ENFORCE_SHIFT_SEQUENCE': {'fields': {
+        'employee_group': _EMPLOYEE_GROUP, 'preceding_shift': _SHIFT, 'subsequent_shift': _SHIFT,
+    }},
+}
+_FACILITY_VALIDATORS = compile_rule_validators(FACILITY_RULE_SPECS, FACILITY_COMMON_FIELDS)
+
 def validate_facility_rule(rule_data, start_date, end_date):
     """
     単一の構造化された施設ルールデータ(辞書)を検証し、必要なら変換する。
@@ -263,163 +377,13 @@ def validate_facility_rule(rule_data, start_date, end_date):
         return rule_data
     if not rule_type:
         return {'rule_type': 'INVALID', 'reason': 'Missing rule_type for facility rule.'}
-
-    # is_hard があればブール型かチェック
-    if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-         return {'rule_type': 'INVALID', 'reason': f'is_hard must be a boolean for {rule_type}.'}
-
-    # シフト記号の検証関数 (再利用)
-    def is_valid_shift(shift):
-        return isinstance(shift, str) and shift in VALID_SHIFT_SYMBOLS
-
-    # 日付タイプの検証関数
-    def is_valid_date_type(dtype):
-        if isinstance(dtype, str):
-            if dtype in VALID_DATE_TYPES:
-                return True
-            # YYYY-MM-DD形式かチェック (特定日指定)
-            try:
-                 date.fromisoformat(dtype)
-                 return True
-            except ValueError:
-                 return False
-        return False
-
-    # 従業員グループの検証関数
-    def is_valid_employee_group(group):
-        # 文字列であり、空でないことのみをチェック。
-        # 存在するグループ/役職名かの最終確認は shift_model 側で行う。
-        return isinstance(group, str) and bool(group.strip()) # 空白のみの文字列も False にする
-
-    # --- ルールタイプごとの検証 --- 
-    if rule_type == 'REQUIRED_STAFFING':
-        floor = rule_data.get('floor', 'ALL') # デフォルト ALL
-        shift = rule_data.get('shift')
-        date_type = rule_data.get('date_type')
-        min_count = rule_data.get('min_count')
-        if not isinstance(floor, str) or floor not in VALID_FLOORS:
-            return {'rule_type': 'INVALID', 'reason': f"Invalid floor for {rule_type}: {floor}"}
-        if not is_valid_shift(shift):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid shift for {rule_type}: {shift}"}
-        if not is_valid_date_type(date_type):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid date_type for {rule_type}: {date_type}"}
-        if not isinstance(min_count, int) or min_count < 0:
-            return {'rule_type': 'INVALID', 'reason': f"Invalid min_count for {rule_type}: {min_count}"}
-        # is_hard は共通部分でチェック済み
-
-    elif rule_type == 'MIN_ROLE_ON_DUTY':
-        role = rule_data.get('role')
-        min_count = rule_data.get('min_count')
-        date_type = rule_data.get('date_type')
-        # 役職名は employees.csv に依存するので、ここでは文字列であることのみチェック
-        if not isinstance(role, str) or not role:
-            return {'rule_type': 'INVALID', 'reason': f"Invalid role for {rule_type}: {role}"}
-        if not isinstance(min_count, int) or min_count < 0:
-            return {'rule_type': 'INVALID', 'reason': f"Invalid min_count for {rule_type}: {min_count}"}
-        if not is_valid_date_type(date_type):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid date_type for {rule_type}: {date_type}"}
-        # is_hard は共通部分でチェック済み
-
-    elif rule_type == 'MAX_CONSECUTIVE_OFF':
-        # 個人ルールとパラメータが同じなので、共通部分 + グループ検証
-        group = rule_data.get('employee_group', 'ALL') # デフォルト ALL
-        max_days = rule_data.get('max_days')
-        if not is_valid_employee_group(group):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        if not isinstance(max_days, int) or max_days <= 0:
-             return {'rule_type': 'INVALID', 'reason': f"Invalid max_days for {rule_type}: {max_days}"}
-        # is_hard は共通部分でチェック済み
-
-    elif rule_type == 'BALANCE_OFF_DAYS':
-        group = rule_data.get('employee_group', 'ALL')
-        weight = rule_data.get('weight')
-        if not is_valid_employee_group(group):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        if weight is not None and not isinstance(weight, (int, float)):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid weight for {rule_type}: {weight}"}
-
-    elif rule_type == 'BALANCE_SPECIFIC_SHIFT_TOTALS':
-        group = rule_data.get('employee_group', 'ALL') # デフォルト 'ALL'
-        target_shifts = rule_data.get('target_shifts')
-        weight = rule_data.get('weight') # オプション
-
-        if not is_valid_employee_group(group):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        
-        if not isinstance(target_shifts, list) or not target_shifts: # リストであり、空でない
-            return {'rule_type': 'INVALID', 'reason': f"target_shifts must be a non-empty list for {rule_type}: {target_shifts}"}
-        if not all(is_valid_shift(s) for s in target_shifts): # 各要素が有効なシフト記号か
-            return {'rule_type': 'INVALID', 'reason': f"Invalid shift symbol found in target_shifts for {rule_type}: {target_shifts}"}
-
-        if weight is not None and not isinstance(weight, (int, float)):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid weight for {rule_type}: {weight}"}
-        
-        # デフォルトの重み (もしAIが生成しなかった場合など)
-        if weight is None:
-            rule_data['weight'] = 1 # デフォルト値を設定
-
-    elif rule_type == 'MIN_TOTAL_SHIFT_DAYS':
-        group = rule_data.get('employee_group', 'ALL')
-        shift = rule_data.get('shift') # 対象となるシフト記号 (例: '公')
-        min_count = rule_data.get('min_count')
-        # is_hard は共通部分でチェック済みだが、意味合いとして True が期待されることが多い
-
-        if not is_valid_employee_group(group):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        if not is_valid_shift(shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid or missing shift symbol for {rule_type}: {shift}"}
-        if not isinstance(min_count, int) or min_count < 0: # 0日もありうる
-            return {'rule_type': 'INVALID', 'reason': f"Invalid min_count for {rule_type}: {min_count}"}
-        if not isinstance(rule_data.get('is_hard'), bool): # is_hard は必須とする
-             return {'rule_type': 'INVALID', 'reason': f"Missing or invalid is_hard for {rule_type}"}
-
-    elif rule_type == 'MAX_CONSECUTIVE_WORK': # 施設版
-        group = rule_data.get('employee_group', 'ALL')
-        max_days = rule_data.get('max_days')
-        # is_hard は共通部分でチェック済み
-
-        if not is_valid_employee_group(group):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type} (facility version): {group}"}
-        if not isinstance(max_days, int) or max_days <= 0:
-             return {'rule_type': 'INVALID', 'reason': f"Invalid max_days for {rule_type} (facility version): {max_days}"}
-        if not isinstance(rule_data.get('is_hard'), bool): # is_hard は必須とする
-             return {'rule_type': 'INVALID', 'reason': f"Missing or invalid is_hard for {rule_type} (facility version)"}
-
-    elif rule_type == 'FORBID_SHIFT': # 施設向け禁止シフト
-        group = rule_data.get('employee_group', 'ALL')
-        shift = rule_data.get('shift')
-        if not is_valid_employee_group(group):
-             return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        if not is_valid_shift(shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid shift symbol for {rule_type}: {shift}"}
-
-    elif rule_type == 'FORBID_SHIFT_SEQUENCE':
-        group = rule_data.get('employee_group', 'ALL')
-        pre_shift = rule_data.get('preceding_shift')
-        sub_shift = rule_data.get('subsequent_shift')
-        if not is_valid_employee_group(group):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        if not is_valid_shift(pre_shift) or not is_valid_shift(sub_shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid shift symbols for {rule_type}: {pre_shift} -> {sub_shift}"}
-        # is_hard の検証を追加 (オプショナル)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    elif rule_type == 'ENFORCE_SHIFT_SEQUENCE':
-        group = rule_data.get('employee_group', 'ALL')
-        pre_shift = rule_data.get('preceding_shift')
-        sub_shift = rule_data.get('subsequent_shift')
-        if not is_valid_employee_group(group):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid employee_group for {rule_type}: {group}"}
-        if not is_valid_shift(pre_shift) or not is_valid_shift(sub_shift):
-            return {'rule_type': 'INVALID', 'reason': f"Invalid shift symbols for {rule_type}: {pre_shift} -> {sub_shift}"}
-        # is_hard の検証を追加 (オプショナル)
-        if 'is_hard' in rule_data and not isinstance(rule_data['is_hard'], bool):
-             return {'rule_type': 'INVALID', 'reason': f"is_hard must be a boolean for {rule_type}"}
-
-    else:
+    validator = _FACILITY_VALIDATORS.get(rule_type) if isinstance(rule_type, str) else None
+    if validator is None:
         return {'rule_type': 'INVALID', 'reason': f"Unknown facility rule_type: {rule_type}"}
 
+    reason = validator(rule_data)
+    if reason:
+        return {'rule_type': 'INVALID', 'reason': reason}
     return rule_data
 
 def parse_facility_rules_from_ai(ai_output_list, start_date, end_date):
@@ -452,4 +416,138 @@ def parse_facility_rules_from_ai(ai_output_list, start_date, end_date):
     unparsable_count = sum(1 for r in all_facility_rules if r.get('rule_type') == 'UNPARSABLE')
     print(f"{valid_rule_count} valid facility rules and {unparsable_count} unparsable facility rules extracted.")
 
-    return all_facility_rules 
\ No newline at end of file
+    return all_facility_rules
+
+def validate_rules_batch(rules, start_date, end_date, scope='personal'):
+    """
+    ルールのリストをまとめて検証する。scope は 'personal' または 'facility'。
+    戻り値は (有効なルールのリスト, [(無効なルール, 理由), ...])。
+    UNPARSABLE は有効側に含める (呼び出し側で解釈不能ルールとして扱うため)。
+    """
+    if scope == 'personal':
+        validate = validate_and_transform_rule
+    elif scope == 'facility':
+        validate = validate_facility_rule
+    else:
+        raise ValueError(f"Unknown scope: {scope}")
+    valid_rules = []
+    invalid_rules = []
+    for rule in rules:
+        result = validate(rule, start_date, end_date)
+        if result.get('rule_type') == 'INVALID':
+            invalid_rules.append((rule, result.get('reason')))
+        else:
+            valid_rules.append(result)
+    return valid_rules, invalid_rules
+
+# --- AI応答スキーマ (ステップ2の structured_data の形) ---
+# 上の検証スキーマ (PERSONAL_RULE_SPECS / FACILITY_RULE_SPECS) のルールタイプとパラメータから、スキーマ指定出力 (response_schema) 用のスキーマを組み立てる。
+# Gemini のスキーマは oneOf を扱えないため、ルールオブジェクトは全パラメータを任意項目として持つ1つの object で表し、
+# ルールタイプごとの必須項目・範囲は validate_and_transform_rule / validate_facility_rule で検証する。
+PERSONAL_RULE_TYPES = list(PERSONAL_RULE_SPECS) + [
+    'PREFER_ALL_HOLIDAYS_OFF', # 旧形式。shift_generator.py で date_type='祝日' の PREFER_SHIFT_ON_DATE_SET に読み替える
+    'UNPARSABLE'
+]
+FACILITY_RULE_TYPES = list(FACILITY_RULE_SPECS) + ['UNPARSABLE']
+
+_SHIFT_SCHEMA = {"type": "string", "enum": sorted(VALID_SHIFT_SYMBOLS)}
+RULE_FIELD_SCHEMAS = {
+    "employee": {"type": "string"},
+    "employee1": {"type": "string"},
+    "employee2": {"type": "string"},
+    "date": {"type": "string", "description": "YYYY-MM-DD"},
+    "shift": _SHIFT_SCHEMA,
+    "allowed_shifts": {"type": "array", "items": _SHIFT_SCHEMA},
+    "shifts": {"type": "array", "items": _SHIFT_SCHEMA},
+    "target_shifts": {"type": "array", "items": _SHIFT_SCHEMA},
+    "preceding_shift": _SHIFT_SCHEMA,
+    "subsequent_shift": _SHIFT_SCHEMA,
+    "is_hard": {"type": "boolean"},
+    "max_days": {"type": "integer"},
+    "min": {"type": "integer"},
+    "max": {"type": "integer"},
+    "min_count": {"type": "integer"},
+    "weekday": {"type": "integer", "description": "0=月曜 ... 6=日曜"},
+    "weight": {"type": "number"},
+    "floor": {"type": "string", "enum": sorted(VALID_FLOORS)},
+    "date_type": {"type": "string", "description": f"{' / '.join(sorted(VALID_DATE_TYPES))} または YYYY-MM-DD"},
+    "role": {"type": "string"},
+    "employee_group": {"type": "string"},
+    "original_text": {"type": "string"},
+    "reason": {"type": "string"},
+}
+PERSONAL_RULE_FIELDS = [
+    "employee", "employee1", "employee2", "date", "shift", "allowed_shifts", "shifts",
+    "preceding_shift", "subsequent_shift", "is_hard", "max_days", "min", "max", "weekday", "weight",
+    "date_type", "original_text", "reason"
+]
+FACILITY_RULE_FIELDS = [
+    "floor", "shift", "date_type", "min_count", "role", "employee_group", "max_days", "weight",
+    "target_shifts", "preceding_shift", "subsequent_shift", "is_hard", "original_text", "reason"
+]
+
+def build_rule_object_schema(rule_types, fields):
+    """1件の structured_data オブジェクトのスキーマ (rule_type は列挙値で必須、他は任意)"""
+    properties = {"rule_type": {"type": "string", "enum": list(rule_types)}}
+    for field in fields:
+        properties[field] = RULE_FIELD_SCHEMAS[field]
+    return {"type": "object", "properties": properties, "required": ["rule_type"]}
+
+def build_personal_response_schema(employee_ids):
+    """
+    個人ルール ステップ2の応答スキーマ: {職員ID: [structured_data, ...], ...}
+    スキーマでは任意キーの辞書を表せないため、ルールを持つ職員IDをプロパティとして列挙する。
+    """
+    rule_list_schema = {"type": "array", "items": build_rule_object_schema(PERSONAL_RULE_TYPES, PERSONAL_RULE_FIELDS)}
+    return {"type": "object", "properties": {emp_id: rule_list_schema for emp_id in employee_ids}}
+
+def build_facility_response_schema():
+    """施設ルール ステップ2の応答スキーマ: [structured_data, ...] (確認用文章と同じ順番)"""
+    return {"type": "array", "items": build_rule_object_schema(FACILITY_RULE_TYPES, FACILITY_RULE_FIELDS)}
+
+def _build_fast_entry_schema(rule_types, fields):
+    """高速モード (ステップ1+2を1回で実行) の要素: {"confirmation_text": 確認用文章, "structured_data": ルール}"""
+    return {
+        "type": "object",
+        "properties": {
+            "confirmation_text": {"type": "string"},
+            "structured_data": build_rule_object_schema(rule_types, fields)
+        },
+        "required": ["confirmation_text", "structured_data"]
+    }
+
+def build_personal_fast_response_schema(employee_ids):
+    """個人ルール 高速モードの応答スキーマ: {職員ID: [{"confirmation_text", "structured_data"}, ...], ...}"""
+    entry_list_schema = {"type": "array", "items": _build_fast_entry_schema(PERSONAL_RULE_TYPES, PERSONAL_RULE_FIELDS)}
+    return {"type": "object", "properties": {emp_id: entry_list_schema for emp_id in employee_ids}}
+
+def build_facility_fast_response_schema():
+    """施設ルール 高速モードの応答スキーマ: [{"confirmation_text", "structured_data"}, ...]"""
+    return {"type": "array", "items": _build_fast_entry_schema(FACILITY_RULE_TYPES, FACILITY_RULE_FIELDS)}
+
+def parse_structured_response(response_text, expected_type, context):
+    """
+    ステップ2の応答テキストを dict / list にパースする。
+    スキーマ指定出力ならそのまま json.loads できるため、コードブロック除去はパースに失敗した場合の
+    フォールバック (スキーマ指定に対応しないバックエンドや録画済み応答向け) としてのみ行う。
+    失敗時は None を返す。
+    """
+    try:
+        parsed = json.loads(response_text)
+    except json.JSONDecodeError:
+        cleaned_json_string = response_text.strip()
+        if cleaned_json_string.startswith("```json"):
+            cleaned_json_string = cleaned_json_string[7:]
+        if cleaned_json_string.endswith("```"):
+            cleaned_json_string = cleaned_json_string[:-3]
+        cleaned_json_string = cleaned_json_string.strip()
+        try:
+            parsed = json.loads(cleaned_json_string)
+        except json.JSONDecodeError as e:
+            print(f"エラー({context}): JSONのパースに失敗: {e}")
+            print(f"クリーニング後の文字列:\n{cleaned_json_string}")
+            return None
+    if not isinstance(parsed, expected_type):
+        print(f"エラー({context}): パース結果が{'辞書' if expected_type is dict else 'リスト'}形式ではありません。")
+        return None
+    return parsed
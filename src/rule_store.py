@@ -0,0 +1,213 @@
+# 検証済みルールセットの永続化 (SQLite)
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+
+from src.constants import (
+    RULE_STORE_FILE, AI_MODEL_NAME,
+    PERSONAL_INTERMEDIATE_PROMPT_FILE, PERSONAL_STRUCTURED_DATA_PROMPT_FILE,
+    FACILITY_INTERMEDIATE_PROMPT_FILE, FACILITY_STRUCTURED_DATA_PROMPT_FILE,
+    PERSONAL_FAST_PROMPT_FILE, FACILITY_FAST_PROMPT_FILE
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rule_sets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (period_start, period_end, input_hash)
+);
+CREATE TABLE IF NOT EXISTS rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rule_set_id INTEGER NOT NULL REFERENCES rule_sets(id) ON DELETE CASCADE,
+    scope TEXT NOT NULL, -- 'personal' または 'facility'
+    position INTEGER NOT NULL, -- 元のリスト内の順序
+    employee TEXT, -- 個人ルールの対象職員ID (施設ルールは NULL)
+    rule_type TEXT NOT NULL,
+    confirmation_text TEXT, -- 施設ルールの確認用文章
+    data TEXT NOT NULL -- 検証済み structured_data (JSON)
+);
+CREATE INDEX IF NOT EXISTS idx_rule_sets_period ON rule_sets (period_start, period_end, id);
+CREATE INDEX IF NOT EXISTS idx_rules_set_employee ON rules (rule_set_id, employee);
+CREATE INDEX IF NOT EXISTS idx_rules_set_type ON rules (rule_set_id, rule_type);
+"""
+
+
+def _encode_value(value):
+    """json.dumps 用: dateオブジェクトを復元可能な形式にする"""
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_object(obj):
+    """json.loads 用: {"$date": ...} を dateオブジェクトに戻す"""
+    if len(obj) == 1 and "$date" in obj:
+        return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def compute_rules_input_hash(natural_language_rules, facility_rules_list, prompt_files=None):
+    """
+    ルールセットの元になった入力 (自然言語ルール、施設ルール、プロンプト、AIモデル) のハッシュを計算する。
+    入力が同じなら同じハッシュになるため、保存済みルールセットの再利用判定に使う。
+    """
+    if prompt_files is None:
+        prompt_files = [
+            PERSONAL_INTERMEDIATE_PROMPT_FILE, PERSONAL_STRUCTURED_DATA_PROMPT_FILE,
+            FACILITY_INTERMEDIATE_PROMPT_FILE, FACILITY_STRUCTURED_DATA_PROMPT_FILE,
+            PERSONAL_FAST_PROMPT_FILE, FACILITY_FAST_PROMPT_FILE
+        ]
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(natural_language_rules or {}, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    hasher.update(json.dumps(facility_rules_list or [], ensure_ascii=False).encode('utf-8'))
+    hasher.update(AI_MODEL_NAME.encode('utf-8'))
+    for file_path in prompt_files:
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+def connect_rule_store(db_path=RULE_STORE_FILE):
+    """ルールストアに接続し、必要ならスキーマを作成する"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def save_rule_set(personal_rules, facility_rules, period_start, period_end, input_hash, db_path=RULE_STORE_FILE):
+    """
+    検証済みの個人ルール・施設ルールを保存し、rule_set_id を返す。
+    同じ期間・同じ入力ハッシュのルールセットが既にあれば、それを削除して (版番号は引き継ぐ) 新しい id で保存し直す。
+    最新のルールセットは id の大きい順で選ぶため、保存し直したものが期間の最新になる。
+    """
+    conn = connect_rule_store(db_path)
+    try:
+        with conn:
+            row = conn.execute(
+                "SELECT id, version FROM rule_sets WHERE period_start = ? AND period_end = ? AND input_hash = ?",
+                (period_start.isoformat(), period_end.isoformat(), input_hash)
+            ).fetchone()
+            if row:
+                version = row[1]
+                conn.execute("DELETE FROM rule_sets WHERE id = ?", (row[0],)) # ルールは ON DELETE CASCADE で削除
+            else:
+                (version,) = conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM rule_sets WHERE period_start = ? AND period_end = ?",
+                    (period_start.isoformat(), period_end.isoformat())
+                ).fetchone()
+            cursor = conn.execute(
+                "INSERT INTO rule_sets (period_start, period_end, input_hash, version, created_at) VALUES (?, ?, ?, ?, ?)",
+                (period_start.isoformat(), period_end.isoformat(), input_hash, version, datetime.now().isoformat(timespec='seconds'))
+            )
+            rule_set_id = cursor.lastrowid
+
+            rows = []
+            for position, rule in enumerate(personal_rules):
+                employee = rule.get('employee') or rule.get('employee1')
+                rows.append((rule_set_id, 'personal', position, employee, rule.get('rule_type'), None,
+                             json.dumps(rule, ensure_ascii=False, default=_encode_value)))
+            for position, rule_entry in enumerate(facility_rules):
+                structured_data = rule_entry.get('structured_data', {})
+                rows.append((rule_set_id, 'facility', position, None, structured_data.get('rule_type'),
+                             rule_entry.get('confirmation_text'),
+                             json.dumps(structured_data, ensure_ascii=False, default=_encode_value)))
+            conn.executemany(
+                "INSERT INTO rules (rule_set_id, scope, position, employee, rule_type, confirmation_text, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        print(f"ルールセットを保存しました: {db_path} (rule_set_id={rule_set_id}, 個人 {len(personal_rules)} 件, 施設 {len(facility_rules)} 件)")
+        return rule_set_id
+    finally:
+        conn.close()
+
+
+def _rows_to_rules(rows):
+    """(scope, confirmation_text, data) の行を build_shift_model 用の2つのリストに戻す"""
+    personal_rules = []
+    facility_rules = []
+    for scope, confirmation_text, data in rows:
+        rule = json.loads(data, object_hook=_decode_object)
+        if scope == 'personal':
+            personal_rules.append(rule)
+        else:
+            facility_rules.append({"confirmation_text": confirmation_text, "structured_data": rule})
+    return personal_rules, facility_rules
+
+
+def load_rules_for_period(period_start, period_end, input_hash=None, db_path=RULE_STORE_FILE):
+    """
+    指定期間の最新ルールセット (input_hash 指定時はそのハッシュのもの) を1回のクエリで読み込む。
+    戻り値は (personal_rules, facility_rules)。見つからなければ (None, None)。
+    """
+    if not os.path.exists(db_path):
+        print(f"情報: ルールストアが見つかりません: {db_path}")
+        return None, None
+    conn = connect_rule_store(db_path)
+    try:
+        hash_condition = "AND input_hash = ?" if input_hash else ""
+        params = [period_start.isoformat(), period_end.isoformat()] + ([input_hash] if input_hash else [])
+        rows = conn.execute(
+            f"""
+            SELECT scope, confirmation_text, data FROM rules
+            WHERE rule_set_id = (
+                SELECT id FROM rule_sets
+                WHERE period_start = ? AND period_end = ? {hash_condition}
+                ORDER BY id DESC LIMIT 1
+            )
+            ORDER BY scope DESC, position
+            """,
+            params
+        ).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        print(f"情報: 期間 {period_start}〜{period_end} の保存済みルールセットがありません。")
+        return None, None
+    return _rows_to_rules(rows)
+
+
+def find_latest_input_hash(period_start, period_end, db_path=RULE_STORE_FILE):
+    """指定期間の最新ルールセットの入力ハッシュを返す (無ければ None)"""
+    if not os.path.exists(db_path):
+        return None
+    conn = connect_rule_store(db_path)
+    try:
+        row = conn.execute(
+            "SELECT input_hash FROM rule_sets WHERE period_start = ? AND period_end = ? ORDER BY id DESC LIMIT 1",
+            (period_start.isoformat(), period_end.isoformat())
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def query_rules(rule_set_id, employee=None, rule_type=None, db_path=RULE_STORE_FILE):
+    """ルールセット内のルールを職員ID・ルールタイプで絞り込んで返す (インデックス使用)"""
+    conditions = ["rule_set_id = ?"]
+    params = [rule_set_id]
+    if employee is not None:
+        conditions.append("employee = ?")
+        params.append(employee)
+    if rule_type is not None:
+        conditions.append("rule_type = ?")
+        params.append(rule_type)
+    conn = connect_rule_store(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT scope, confirmation_text, data FROM rules WHERE {' AND '.join(conditions)} ORDER BY scope DESC, position",
+            params
+        ).fetchall()
+    finally:
+        conn.close()
+    return _rows_to_rules(rows)
@@ -0,0 +1,245 @@
+# 生成したシフト表の索引 (SQLite)
+# 保存のたびに 出力パス・期間・入力ハッシュ・求解ステータス・目的関数値・求解時間・ワーカー数・
+# ペナルティのカテゴリ別合計・フロア/シフト別の人員不足を記録し、CSV を開かずに実行結果を比較できるようにする。
+import csv
+import glob
+import hashlib
+import os
+import sqlite3
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from src.constants import SCHEDULE_CATALOG_FILE
+from src.history import RESULT_FILE_REGEX, is_empty_file
+from src.shift_model import resolve_date_type_days
+from src.coverage import compile_coverage, coverage_members
+from src.utils import build_group_indices
+
+SOLVED_STATUSES = ("OPTIMAL", "FEASIBLE")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE, -- 出力したシフト表 (CSV)
+    period_start TEXT NOT NULL,
+    period_end TEXT,
+    rules_input_hash TEXT, -- ルールセットの入力ハッシュ (rule_store.compute_rules_input_hash)
+    base_input_hash TEXT, -- 従業員情報・勤務履歴の内容のハッシュ
+    status TEXT NOT NULL, -- ソルバーのステータス名 (既存ファイルの取り込み時は 'UNKNOWN')
+    objective REAL,
+    solve_time_sec REAL,
+    solver_workers INTEGER,
+    num_employees INTEGER,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_penalties (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    category TEXT NOT NULL, -- shift_model のペナルティカテゴリ名
+    total INTEGER NOT NULL, -- 重み付き合計
+    PRIMARY KEY (run_id, category)
+);
+CREATE TABLE IF NOT EXISTS run_shortfalls (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    floor TEXT NOT NULL, -- REQUIRED_STAFFING の floor ('ALL' を含む)
+    shift TEXT NOT NULL, -- 勤務記号
+    total INTEGER NOT NULL, -- 期間内の不足人数の合計
+    days INTEGER NOT NULL, -- 不足があった日数
+    PRIMARY KEY (run_id, floor, shift)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_period_status ON runs (period_start, status, objective);
+CREATE INDEX IF NOT EXISTS idx_shortfalls_floor_shift ON run_shortfalls (floor, shift, total);
+"""
+
+
+def connect_catalog(db_path=SCHEDULE_CATALOG_FILE):
+    """カタログに接続し、必要ならスキーマを作成する"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def compute_base_input_hash(employees_df, shift_history=None):
+    """求解に使った従業員情報と勤務履歴の内容のハッシュ (CSV・スナップショットのどちらから読んでも同じ値になる)"""
+    hasher = hashlib.sha256()
+    hasher.update(pd.util.hash_pandas_object(employees_df.astype(str), index=False).values.tobytes())
+    if shift_history is not None:
+        hasher.update("\n".join(shift_history.employee_ids).encode('utf-8'))
+        hasher.update("\n".join(d.isoformat() for d in shift_history.dates).encode('utf-8'))
+        hasher.update(np.ascontiguousarray(shift_history.matrix).tobytes())
+    return hasher.hexdigest()
+
+
+def evaluate_penalty_totals(solver, penalty_exprs):
+    """build_shift_model が返したカテゴリ別ペナルティ式を解で評価する"""
+    return {category: int(solver.Value(expr)) for category, expr in (penalty_exprs or {}).items()}
+
+
+def compute_staffing_shortfalls(shift_matrix, employees_df, date_range, jp_holidays, facility_rules):
+    """
+    REQUIRED_STAFFING の施設ルールに対する人員不足を解の行列から数える (日付区分の重なりは coverage.compile_coverage と同じく解決する)。
+    戻り値は {(floor, 勤務記号): (不足人数の合計, 不足日数)}。
+    """
+    shortfalls = {}
+    if shift_matrix is None or not facility_rules:
+        return shortfalls
+    floors = employees_df['担当フロア'].fillna('').astype(str).tolist() if '担当フロア' in employees_df.columns else [''] * len(employees_df)
+    group_indices = build_group_indices(employees_df)
+    demand = compile_coverage(facility_rules, len(date_range), lambda date_type: resolve_date_type_days(date_range, date_type, jp_holidays))
+    for (kind, floor, shift_sym, d_idx), cell in demand.items():
+        if kind != 'floor':
+            continue
+        members = coverage_members(kind, floor, floors, group_indices)
+        missing = max(cell['min'] - int(np.isin(shift_matrix[members, d_idx], cell['shift_ints']).sum()), 0)
+        total, days = shortfalls.get((floor, shift_sym), (0, 0))
+        shortfalls[(floor, shift_sym)] = (total + missing, days + int(missing > 0))
+    return shortfalls
+
+
+def record_schedule_run(run, penalties=None, shortfalls=None, db_path=SCHEDULE_CATALOG_FILE):
+    """
+    1回分の出力をカタログに記録し、run id を返す。同じパスの記録があれば置き換える。
+    run は path, period_start, period_end, rules_input_hash, base_input_hash, status, objective,
+    solve_time_sec, solver_workers, num_employees のキーを持つ辞書 (期間は date または ISO 文字列)。
+    """
+    values = {key: (value.isoformat() if isinstance(value, date) else value) for key, value in run.items()}
+    values.setdefault('created_at', datetime.now().isoformat(timespec='seconds'))
+    columns = ['path', 'period_start', 'period_end', 'rules_input_hash', 'base_input_hash', 'status',
+               'objective', 'solve_time_sec', 'solver_workers', 'num_employees', 'created_at']
+    conn = connect_catalog(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM runs WHERE path = ?", (values['path'],))
+            cursor = conn.execute(
+                f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [values.get(column) for column in columns]
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO run_penalties (run_id, category, total) VALUES (?, ?, ?)",
+                [(run_id, category, total) for category, total in (penalties or {}).items()]
+            )
+            conn.executemany(
+                "INSERT INTO run_shortfalls (run_id, floor, shift, total, days) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, floor, shift, total, days) for (floor, shift), (total, days) in (shortfalls or {}).items()]
+            )
+    finally:
+        conn.close()
+    return run_id
+
+
+def _query(sql, params=(), db_path=SCHEDULE_CATALOG_FILE):
+    if not os.path.exists(db_path):
+        print(f"情報: スケジュールカタログが見つかりません: {db_path}")
+        return []
+    conn = connect_catalog(db_path)
+    try:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def _period_key(period_start):
+    return period_start.isoformat() if isinstance(period_start, date) else period_start
+
+
+def list_runs(period_start=None, status=None, limit=None, db_path=SCHEDULE_CATALOG_FILE):
+    """記録済みの実行を新しい順に返す (期間開始日・ステータスで絞り込み)"""
+    conditions, params = [], []
+    if period_start is not None:
+        conditions.append("period_start = ?")
+        params.append(_period_key(period_start))
+    if status is not None:
+        conditions.append("status = ?")
+        params.append(status)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_clause = f"LIMIT {int(limit)}" if limit else ""
+    return _query(f"SELECT * FROM runs {where} ORDER BY id DESC {limit_clause}", params, db_path)
+
+
+def find_best_run(period_start, db_path=SCHEDULE_CATALOG_FILE):
+    """期間内で解が得られた実行のうち目的関数値が最小のもの (同値なら新しいもの)。無ければ None"""
+    rows = _query(
+        f"""
+        SELECT * FROM runs
+        WHERE period_start = ? AND status IN ({', '.join('?' for _ in SOLVED_STATUSES)}) AND objective IS NOT NULL
+        ORDER BY objective ASC, id DESC LIMIT 1
+        """,
+        [_period_key(period_start), *SOLVED_STATUSES], db_path
+    )
+    return rows[0] if rows else None
+
+
+def find_runs_with_shortfall(floor=None, shift=None, min_total=1, period_start=None, db_path=SCHEDULE_CATALOG_FILE):
+    """人員不足の合計が min_total 以上の実行を、フロア・シフトごとの不足と合わせて返す"""
+    conditions, params = ["s.total >= ?"], [min_total]
+    if floor is not None:
+        conditions.append("s.floor = ?")
+        params.append(floor)
+    if shift is not None:
+        conditions.append("s.shift = ?")
+        params.append(shift)
+    if period_start is not None:
+        conditions.append("r.period_start = ?")
+        params.append(_period_key(period_start))
+    return _query(
+        f"""
+        SELECT r.*, s.floor AS shortfall_floor, s.shift AS shortfall_shift, s.total AS shortfall_total, s.days AS shortfall_days
+        FROM run_shortfalls s JOIN runs r ON r.id = s.run_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY s.total DESC, r.id DESC
+        """,
+        params, db_path
+    )
+
+
+def get_run_details(run_id, db_path=SCHEDULE_CATALOG_FILE):
+    """実行1件の記録とペナルティ・人員不足の内訳。無ければ None"""
+    rows = _query("SELECT * FROM runs WHERE id = ?", (run_id,), db_path)
+    if not rows:
+        return None
+    run = rows[0]
+    run['penalties'] = {row['category']: row['total'] for row in _query(
+        "SELECT category, total FROM run_penalties WHERE run_id = ? ORDER BY total DESC", (run_id,), db_path)}
+    run['shortfalls'] = _query(
+        "SELECT floor, shift, total, days FROM run_shortfalls WHERE run_id = ? ORDER BY total DESC", (run_id,), db_path)
+    return run
+
+
+def register_existing_files(output_dir, db_path=SCHEDULE_CATALOG_FILE):
+    """
+    カタログに無い出力済みのシフト表 (shift_*.csv) をステータス 'UNKNOWN' で登録する。
+    期間はファイル名とヘッダーの日付列から求める (CSV の本体は読まない)。登録件数を返す。
+    空のファイル (名前を確保したまま書き込みが終わらなかった版) は登録しない。
+    """
+    known = {row['path'] for row in _query("SELECT path FROM runs", (), db_path)} if os.path.exists(db_path) else set()
+    registered = 0
+    for path in sorted(glob.glob(os.path.join(output_dir, "shift_*.csv"))):
+        match = RESULT_FILE_REGEX.match(os.path.basename(path))
+        if not match or path in known or is_empty_file(path):
+            continue
+        period_start = datetime.strptime(match.group(1), "%Y%m%d").date()
+        try:
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                header = next(csv.reader(f), [])
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"警告: {path} のヘッダーを読めませんでした - {e}")
+            continue
+        dates = []
+        for column in header:
+            try:
+                dates.append(date.fromisoformat(column))
+            except ValueError:
+                continue
+        period_end = max(dates) if dates else None
+        record_schedule_run({'path': path, 'period_start': period_start, 'period_end': period_end, 'status': 'UNKNOWN',
+                             'created_at': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')},
+                            db_path=db_path)
+        registered += 1
+    return registered
@@ -0,0 +1,179 @@
+# シフト表の差分評価 (手修正の候補を、再求解せずにその場で採点する)
+# schedule_evaluator の項 (RuleTerm) を職員ごとに索引し、セルの変更・2人の入れ替えで影響する項だけを
+# (連続上限は変更セルを含む窓だけ、並びは前後の日だけ) 評価し直す。日別の人数・職員別の回数・グループ別の合計も差分で更新する。
+import numpy as np
+
+from src.constants import SHIFT_MAP_INT, SHIFT_MAP_SYM
+from src.shift_model import PENALTY_WEIGHTS
+from src.utils import build_group_indices
+from src.schedule_diff import coverage_counts, NUM_SHIFT_INTS
+from src.schedule_evaluator import compile_rule_terms, evaluate_terms, resolve_boundary_state, LEAVE_STATUSES
+
+
+class ChangeDelta:
+    """
+    変更1組を反映したときの評価の差。
+    changes: [(職員ID, 日付, 変更前の記号, 変更後の記号)]
+    hard_delta: ハード制約の違反数の差 / penalty_deltas: カテゴリ名 -> 重み付きペナルティの差 (0 のカテゴリは含めない)
+    """
+
+    def __init__(self, changes, hard_delta, penalty_deltas):
+        self.changes = changes
+        self.hard_delta = hard_delta
+        self.penalty_deltas = penalty_deltas
+
+    @property
+    def objective_delta(self):
+        return sum(self.penalty_deltas.values())
+
+    @property
+    def adds_violations(self):
+        """ハード制約の違反が増えるか (増えなければ実行可能な変更とみなす)"""
+        return self.hard_delta > 0
+
+
+class SwapCandidate(ChangeDelta):
+    """入れ替え候補 (対象の職員と partner がその日のシフトを交換する)"""
+
+    def __init__(self, partner, partner_floor, changes, hard_delta, penalty_deltas):
+        super().__init__(changes, hard_delta, penalty_deltas)
+        self.partner = partner
+        self.partner_floor = partner_floor
+
+
+class IncrementalEvaluator:
+    """
+    シフト行列 (employees_df の行順 × date_range) と検証済みルールから作る差分評価器。
+    num_violations / penalties は現在の行列の評価 (evaluate_schedule と同じ値) で、apply_changes のたびに差分で更新する。
+    coverage (シフト整数 × 日) / shift_counts (職員 × シフト整数) / group_counts (グループ名 -> シフト整数ごとの合計) も同様。
+    """
+
+    def __init__(self, shift_matrix, employees_df, date_range, jp_holidays, personal_rules=None, facility_rules=None,
+                 boundary_state=None, shift_history=None, past_shifts_df=None, group_indices=None):
+        self.matrix = np.array(shift_matrix, dtype=np.int8) # 呼び出し元の行列は書き換えない
+        self.employee_ids = employees_df['職員ID'].tolist()
+        self.date_range = list(date_range)
+        self.emp_id_to_idx = {emp_id: idx for idx, emp_id in enumerate(self.employee_ids)}
+        self.date_to_d_idx = {d: idx for idx, d in enumerate(self.date_range)}
+        self.statuses = employees_df['status'].tolist() if 'status' in employees_df.columns else [None] * len(self.employee_ids)
+        self.floors = employees_df['担当フロア'].tolist() if '担当フロア' in employees_df.columns else [None] * len(self.employee_ids)
+
+        boundary_state = resolve_boundary_state(employees_df, self.date_range, boundary_state, shift_history, past_shifts_df)
+        self.terms = compile_rule_terms(employees_df, self.date_range, jp_holidays, personal_rules, facility_rules, boundary_state)
+        self.terms_by_employee = {e_idx: [] for e_idx in range(len(self.employee_ids))}
+        for term in self.terms:
+            term.bind(self.matrix)
+            for e_idx in term.employees:
+                self.terms_by_employee[e_idx].append(term)
+
+        evaluation = evaluate_terms(self.matrix, self.terms, self.employee_ids, self.date_range)
+        self.num_violations = evaluation.num_violations
+        self.penalties = dict(evaluation.penalties)
+
+        # 日別の人数・職員別の回数・グループ別の合計 (記録なしのセルは数えない)
+        self.coverage = coverage_counts(self.matrix)
+        valid = self.matrix >= 0
+        rows = np.broadcast_to(np.arange(self.matrix.shape[0])[:, None], self.matrix.shape)[valid]
+        self.shift_counts = np.bincount(rows * NUM_SHIFT_INTS + self.matrix[valid].astype(np.int64),
+                                        minlength=self.matrix.shape[0] * NUM_SHIFT_INTS).reshape(-1, NUM_SHIFT_INTS)
+        self.group_indices = group_indices if group_indices is not None else build_group_indices(employees_df)
+        self.groups_of_employee = {e_idx: [] for e_idx in range(len(self.employee_ids))}
+        for group_name, indices in self.group_indices.items():
+            for e_idx in indices:
+                self.groups_of_employee[e_idx].append(group_name)
+        self.group_counts = {group_name: self.shift_counts[list(indices)].sum(axis=0) for group_name, indices in self.group_indices.items()}
+
+    @property
+    def objective(self):
+        return sum(self.penalties.values())
+
+    def _cell(self, employee_id, target_date):
+        e_idx, d_idx = self.emp_id_to_idx.get(employee_id), self.date_to_d_idx.get(target_date)
+        if e_idx is None or d_idx is None:
+            raise KeyError(f"職員 {employee_id} / 日付 {target_date} はこのシフト表にありません")
+        return e_idx, d_idx
+
+    def _affected_terms(self, changes):
+        affected = {}
+        for e_idx, _ in changes:
+            for term in self.terms_by_employee[e_idx]:
+                affected[id(term)] = term
+        return affected.values()
+
+    def evaluate_changes(self, changes):
+        """changes ({(e_idx, d_idx): 新しいシフト整数}) を反映したときの ChangeDelta (行列は変えない)"""
+        changes = {cell: value for cell, value in changes.items() if self.matrix[cell] != value}
+        hard_delta, amounts = 0, {}
+        for term in self._affected_terms(changes):
+            term_hard, term_amount = term.delta(self.matrix, changes)
+            hard_delta += term_hard
+            if term_amount:
+                amounts[term.category] = amounts.get(term.category, 0) + term_amount
+        penalty_deltas = {category: amount * PENALTY_WEIGHTS[category] for category, amount in amounts.items() if amount}
+        change_list = [(self.employee_ids[e_idx], self.date_range[d_idx], SHIFT_MAP_SYM.get(int(self.matrix[e_idx, d_idx]), '-'),
+                        SHIFT_MAP_SYM.get(int(value), '-')) for (e_idx, d_idx), value in sorted(changes.items())]
+        return ChangeDelta(change_list, hard_delta, penalty_deltas)
+
+    def apply_changes(self, changes):
+        """changes を行列に反映し、評価と集計を差分で更新する。戻り値は反映した ChangeDelta"""
+        changes = {cell: value for cell, value in changes.items() if self.matrix[cell] != value}
+        delta = self.evaluate_changes(changes)
+        for term in self._affected_terms(changes):
+            term.commit(self.matrix, changes)
+        self.num_violations += delta.hard_delta
+        for category, amount in delta.penalty_deltas.items():
+            self.penalties[category] = self.penalties.get(category, 0) + amount
+        for (e_idx, d_idx), value in changes.items():
+            old_value = int(self.matrix[e_idx, d_idx])
+            for shift_int, step in ((old_value, -1), (int(value), 1)):
+                if shift_int < 0:
+                    continue
+                self.coverage[shift_int, d_idx] += step
+                self.shift_counts[e_idx, shift_int] += step
+                for group_name in self.groups_of_employee[e_idx]:
+                    self.group_counts[group_name][shift_int] += step
+            self.matrix[e_idx, d_idx] = value
+        return delta
+
+    def change_cell(self, employee_id, target_date, shift_sym, apply=False):
+        """1セルを shift_sym に変えたときの ChangeDelta (apply=True なら反映する)"""
+        changes = {self._cell(employee_id, target_date): SHIFT_MAP_INT[shift_sym]}
+        return self.apply_changes(changes) if apply else self.evaluate_changes(changes)
+
+    def swap(self, employee_id, partner_id, target_date, apply=False):
+        """2人がその日のシフトを交換したときの ChangeDelta (apply=True なら反映する)"""
+        e_idx, d_idx = self._cell(employee_id, target_date)
+        partner_idx, _ = self._cell(partner_id, target_date)
+        changes = {(e_idx, d_idx): self.matrix[partner_idx, d_idx], (partner_idx, d_idx): self.matrix[e_idx, d_idx]}
+        return self.apply_changes(changes) if apply else self.evaluate_changes(changes)
+
+    def find_swaps(self, employee_id, target_date, include_infeasible=False, limit=None):
+        """
+        employee_id の target_date のシフトを、同じ日に別のシフトの職員と1対1で交換する候補の一覧を返す。
+        日別のシフトごとの人数は変わらない。違反数の差が小さい順 (違反が減る候補が先)、同じなら目的関数値の差の小さい順に並べる。
+        ハード制約の違反が増える候補は include_infeasible=True のときだけ含める。育休・病休の職員と記録のないセルは対象外。
+        """
+        e_idx, d_idx = self._cell(employee_id, target_date)
+        own_value = self.matrix[e_idx, d_idx]
+        if own_value < 0 or self.statuses[e_idx] in LEAVE_STATUSES:
+            return []
+        candidates = []
+        for partner_idx, partner_value in enumerate(self.matrix[:, d_idx]):
+            if partner_idx == e_idx or partner_value < 0 or partner_value == own_value or self.statuses[partner_idx] in LEAVE_STATUSES:
+                continue
+            delta = self.evaluate_changes({(e_idx, d_idx): partner_value, (partner_idx, d_idx): own_value})
+            if delta.adds_violations and not include_infeasible:
+                continue
+            candidates.append(SwapCandidate(self.employee_ids[partner_idx], self.floors[partner_idx],
+                                            delta.changes, delta.hard_delta, delta.penalty_deltas))
+        candidates.sort(key=lambda c: (c.hard_delta, c.objective_delta, c.partner))
+        return candidates[:limit] if limit else candidates
+
+    def group_spread(self, group_name, shift_syms):
+        """グループ内の職員ごとの shift_syms の回数の (最小, 最大)。公休数などの偏りの確認用"""
+        indices = self.group_indices.get(group_name)
+        if not indices:
+            return None
+        shift_ints = sorted({SHIFT_MAP_INT[s] for s in shift_syms if s in SHIFT_MAP_INT})
+        counts = self.shift_counts[np.ix_(indices, shift_ints)].sum(axis=1)
+        return int(counts.min()), int(counts.max())
@@ -0,0 +1,212 @@
+# シフト表の版どうしの差分 (職員 × 日 の int8 行列に揃えて、変更セル・職員別の変更数・日別の人数差をまとめて求める)
+import csv
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+from src.constants import SHIFT_MAP_INT, SHIFT_MAP_SYM, DAY_SUMMARY_ROW_NAMES, SCHEDULE_CATALOG_FILE
+from src.boundary_state import NO_SHIFT # 記録のないセル
+from src.data_loader import detect_encoding, parse_date_column
+
+NUM_SHIFT_INTS = max(SHIFT_MAP_INT.values()) + 1
+
+class ScheduleMatrix:
+    """
+    1つの版のシフト表。matrix[e_idx, d_idx] が employee_keys[e_idx] の dates[d_idx] のシフト整数 (記録なしは NO_SHIFT)。
+    employee_keys は職員ID (CSV に職員ID列が無く従業員情報も渡されない場合は職員名)。
+    metadata は .meta.json のメタデータ (求解ステータス・目的関数値・入力ハッシュなど。CSV から読んだ版は None)。
+    """
+
+    def __init__(self, employee_keys, dates, matrix, path=None, metadata=None):
+        self.employee_keys = list(employee_keys)
+        self.dates = list(dates)
+        self.matrix = matrix
+        self.path = path
+        self.metadata = metadata
+
+    def coverage(self):
+        """日ごとの各シフトの人数 (シフト整数 × 日)"""
+        return coverage_counts(self.matrix)
+
+def coverage_counts(matrix):
+    """(職員 × 日) の行列から、日ごとの各シフトの人数 (シフト整数 × 日) を bincount でまとめて数える"""
+    num_days = matrix.shape[1]
+    valid = matrix >= 0
+    flat = (matrix.astype(np.int64) * num_days + np.arange(num_days))[valid]
+    return np.bincount(flat, minlength=NUM_SHIFT_INTS * num_days).reshape(NUM_SHIFT_INTS, num_days)
+
+def _employee_key_map(employees_df):
+    """職員名 -> 職員ID (重複する名前は除く)"""
+    if employees_df is None or '職員名' not in employees_df.columns:
+        return {}
+    names = employees_df['職員名'].tolist()
+    duplicated = {name for name in names if names.count(name) > 1}
+    return {name: emp_id for name, emp_id in zip(names, employees_df['職員ID']) if name not in duplicated}
+
+def _load_npy_schedule(npy_path, meta_path, path):
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    matrix = np.load(npy_path)
+    employee_ids, dates = meta.pop('employee_ids'), meta.pop('dates')
+    return ScheduleMatrix(employee_ids, [date.fromisoformat(d) for d in dates], matrix, path=path, metadata=meta)
+
+def _load_csv_schedule(path, employees_df=None):
+    """出力形式のCSV (曜日行・集計行を含む) から職員行の日付列だけを読む"""
+    name_to_id = _employee_key_map(employees_df)
+    keys, rows = [], []
+    with open(path, 'r', encoding=detect_encoding(path), newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        if '職員ID' in header:
+            key_col, use_names = header.index('職員ID'), False
+        elif '職員名' in header:
+            key_col, use_names = header.index('職員名'), True
+        else:
+            print(f"エラー: {path} に 職員ID / 職員名 列がありません。")
+            return None
+        day_columns, dates = [], []
+        for col, name in enumerate(header):
+            day = parse_date_column(name) # 2025-04-07 / 2025/4/7 (Excel で保存し直した版) の両方
+            if day is not None:
+                dates.append(day)
+                day_columns.append(col)
+        if not day_columns:
+            print(f"エラー: {path} に日付の列 (2025-04-07 / 2025/4/7 形式) がありません。")
+            return None
+        for row in reader:
+            key = row[key_col].strip() if key_col < len(row) else ''
+            if not key or key in DAY_SUMMARY_ROW_NAMES:
+                continue # 曜日行・集計行
+            if use_names and name_to_id:
+                key = name_to_id.get(key, key)
+            keys.append(key)
+            rows.append([SHIFT_MAP_INT.get(row[col].strip(), NO_SHIFT) if col < len(row) else NO_SHIFT for col in day_columns])
+    matrix = np.array(rows, dtype=np.int8).reshape(len(rows), len(day_columns))
+    # 出力の先頭にある前期間の列 (空欄) は落とす
+    recorded = (matrix != NO_SHIFT).any(axis=0)
+    return ScheduleMatrix(keys, [d for d, keep in zip(dates, recorded) if keep], matrix[:, recorded], path=path)
+
+def load_schedule(path, employees_df=None):
+    """
+    シフト表の1つの版を読み込む。.npy (と .meta.json) があればそれを使い、無ければCSVを読む。
+    employees_df を渡すと、職員ID列の無いCSVの職員名を職員IDに置き換える (.npy の版と揃えるため)。読めなければ None。
+    """
+    stem, ext = os.path.splitext(path)
+    npy_path, meta_path = f"{stem}.npy", f"{stem}.meta.json"
+    if ext in ('.csv', '.npy') and os.path.exists(npy_path) and os.path.exists(meta_path):
+        return _load_npy_schedule(npy_path, meta_path, path)
+    if ext == '.csv' and os.path.exists(path):
+        return _load_csv_schedule(path, employees_df)
+    print(f"エラー: シフト表を読み込めません: {path}")
+    return None
+
+def load_catalog_schedule(run_id, employees_df=None, db_path=SCHEDULE_CATALOG_FILE):
+    """スケジュールカタログの実行 id の出力を読み込む"""
+    from src.schedule_catalog import get_run_details # カタログを使わない呼び出しでは shift_model を読み込まない
+    run = get_run_details(run_id, db_path=db_path)
+    if run is None:
+        print(f"エラー: 実行 #{run_id} はカタログに記録されていません。")
+        return None
+    return load_schedule(run['path'], employees_df)
+
+def align_schedules(schedules):
+    """
+    複数の版を、全ての版にある職員 (先頭の版の順) と日付 (昇順) に揃えた (版 × 職員 × 日) の配列にする。
+    戻り値は (employee_keys, dates, stacked)。共通の職員・日付が無ければ None。
+    """
+    common_keys = set(schedules[0].employee_keys).intersection(*(s.employee_keys for s in schedules[1:]))
+    common_dates = set(schedules[0].dates).intersection(*(s.dates for s in schedules[1:]))
+    if not common_keys or not common_dates:
+        missing = '職員' if not common_keys else '日付'
+        print(f"エラー: 比較する版に共通の{missing}がありません ({', '.join(str(s.path) for s in schedules)})。"
+              f"職員ID / 職員名や対象期間が揃っているか確認してください。")
+        return None
+    employee_keys = [key for key in schedules[0].employee_keys if key in common_keys]
+    dates = sorted(common_dates)
+    stacked = np.empty((len(schedules), len(employee_keys), len(dates)), dtype=np.int8)
+    for i, schedule in enumerate(schedules):
+        row_of = {key: idx for idx, key in enumerate(schedule.employee_keys)}
+        col_of = {d: idx for idx, d in enumerate(schedule.dates)}
+        rows = np.array([row_of[key] for key in employee_keys], dtype=np.intp)
+        cols = np.array([col_of[d] for d in dates], dtype=np.intp)
+        stacked[i] = schedule.matrix[np.ix_(rows, cols)]
+    return employee_keys, dates, stacked
+
+def reindex_schedule(schedule, employee_keys, dates):
+    """
+    版を指定した職員・日付の順の行列に並べ替える (版に無い職員・日付のセルは NO_SHIFT)。
+    戻り値は (matrix, missing_employees, missing_dates)。
+    """
+    row_of = {key: idx for idx, key in enumerate(schedule.employee_keys)}
+    col_of = {d: idx for idx, d in enumerate(schedule.dates)}
+    matrix = np.full((len(employee_keys), len(dates)), NO_SHIFT, dtype=np.int8)
+    rows = np.array([row_of.get(key, -1) for key in employee_keys], dtype=np.intp)
+    cols = np.array([col_of.get(d, -1) for d in dates], dtype=np.intp)
+    row_found, col_found = rows >= 0, cols >= 0
+    matrix[np.ix_(row_found, col_found)] = schedule.matrix[np.ix_(rows[row_found], cols[col_found])]
+    missing_employees = [key for key, found in zip(employee_keys, row_found) if not found]
+    missing_dates = [d for d, found in zip(dates, col_found) if not found]
+    return matrix, missing_employees, missing_dates
+
+class ScheduleDiff:
+    """2つの版の差分 (old -> new)。行列は揃えた職員・日付の順。共通の職員・日付が無ければ ValueError"""
+
+    def __init__(self, old, new):
+        self.old_path, self.new_path = old.path, new.path
+        aligned = align_schedules([old, new])
+        if aligned is None:
+            raise ValueError(f"{old.path} と {new.path} に共通の職員・日付がありません")
+        self.employee_keys, self.dates, stacked = aligned
+        self.old_matrix, self.new_matrix = stacked[0], stacked[1]
+        self.changed = self.old_matrix != self.new_matrix
+        self.changed_employees, self.changed_days = np.nonzero(self.changed)
+        self.per_employee_changes = self.changed.sum(axis=1)
+        self.per_day_changes = self.changed.sum(axis=0)
+        self.coverage_delta = coverage_counts(self.new_matrix) - coverage_counts(self.old_matrix) # シフト整数 × 日
+        common = set(self.employee_keys)
+        self.only_in_old = [key for key in old.employee_keys if key not in common]
+        self.only_in_new = [key for key in new.employee_keys if key not in common]
+
+    @property
+    def num_changed(self):
+        return len(self.changed_employees)
+
+    def change_list(self):
+        """変更セルの一覧 [(職員, 日付, 変更前の記号, 変更後の記号)] (職員順・日付順)"""
+        old_values = self.old_matrix[self.changed_employees, self.changed_days]
+        new_values = self.new_matrix[self.changed_employees, self.changed_days]
+        return [
+            (self.employee_keys[e_idx], self.dates[d_idx], SHIFT_MAP_SYM.get(int(old), '-'), SHIFT_MAP_SYM.get(int(new), '-'))
+            for e_idx, d_idx, old, new in zip(self.changed_employees, self.changed_days, old_values, new_values)
+        ]
+
+    def coverage_changes(self):
+        """人数が変わった (日付, 記号, 差) の一覧"""
+        shift_ints, day_indices = np.nonzero(self.coverage_delta)
+        return [(self.dates[d_idx], SHIFT_MAP_SYM.get(int(s_int), '?'), int(self.coverage_delta[s_int, d_idx]))
+                for s_int, d_idx in sorted(zip(shift_ints, day_indices), key=lambda item: (item[1], item[0]))]
+
+def diff_schedules(old, new):
+    """2つの版 (ScheduleMatrix) の差分。共通の職員・日付が無ければ None"""
+    try:
+        return ScheduleDiff(old, new)
+    except ValueError:
+        return None # 理由は align_schedules が表示済み
+
+def pairwise_change_counts(schedules):
+    """
+    全ての版の組について変更セル数を求める (安定性の分析用)。戻り値は (版 × 版) の対称行列。
+    版を揃えた配列に積み、1版ずつ残りの版とまとめて比較する。共通の職員・日付が無ければ None。
+    """
+    aligned = align_schedules(schedules)
+    if aligned is None:
+        return None
+    _, _, stacked = aligned
+    num_versions = len(schedules)
+    counts = np.zeros((num_versions, num_versions), dtype=np.int64)
+    flat = stacked.reshape(num_versions, -1)
+    for i in range(num_versions - 1):
+        counts[i, i + 1:] = (flat[i + 1:] != flat[i]).sum(axis=1)
+    return counts + counts.T
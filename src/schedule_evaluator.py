@@ -0,0 +1,655 @@
+# ソルバーを使わないシフト表の評価
+# (職員 × 日) のシフト整数行列を、検証済みルールに対して build_shift_model と同じ意味・同じ重みで評価し、
+# ハード制約の違反とソフト制約のペナルティ (カテゴリ別) を NumPy の窓和・マスクで求める。
+# 手で修正したシフト表の検証、保存済みの版の採点、ソルバーが報告した目的関数値の照合に使う。
+# ルールは職員 (と日) に局所的な「項」(RuleTerm) に変換し、一括評価 (evaluate) と差分評価 (delta, schedule_delta で使う) の両方を項ごとに持つ。
+import numpy as np
+
+from src.constants import SHIFT_MAP_INT, WORKING_SHIFTS_INT, OFF_SHIFT_INTS
+from src.boundary_state import compute_boundary_state, compute_boundary_state_from_codes
+from src.shift_model import PENALTY_WEIGHTS, resolve_date_type_days
+from src.fairness import normalize_fairness_rules, group_imbalance, resolve_formulation
+from src.weights import scale_rule_weight
+from src.coverage import compile_coverage, coverage_members, coverage_penalty_category
+from src.utils import build_group_indices
+
+LEAVE_STATUSES = ('育休', '病休')
+NUM_SHIFT_INTS = max(SHIFT_MAP_INT.values()) + 1
+
+
+def membership_table(shift_ints):
+    """
+    シフト整数 -> 該当するかの真偽値表。table[matrix] で行列全体を一度に引ける (np.isin より速い)。
+    末尾の要素は記録なし (NO_SHIFT = -1) 用で常に False。
+    """
+    table = np.zeros(NUM_SHIFT_INTS + 1, dtype=bool)
+    table[list(shift_ints)] = True
+    return table
+
+
+class ScheduleEvaluation:
+    """
+    評価結果。
+    hard_violations: [{'rule_type', 'employee', 'dates', 'count', 'detail'}] (ルール・職員ごとに1件)
+    penalties: カテゴリ名 -> 重み付き合計 (build_shift_model の penalty_exprs と同じカテゴリ)
+    """
+
+    def __init__(self, employee_ids, date_range):
+        self.employee_ids = employee_ids
+        self.date_range = date_range
+        self.hard_violations = []
+        self.penalties = {}
+        self._violation_index = {} # (rule_type, 職員, 内容) -> hard_violations の要素
+
+    @property
+    def objective(self):
+        return sum(self.penalties.values())
+
+    @property
+    def is_feasible(self):
+        return not self.hard_violations
+
+    @property
+    def num_violations(self):
+        return sum(violation['count'] for violation in self.hard_violations)
+
+    def add_violation(self, rule_type, e_idx, day_indices, detail=''):
+        """
+        違反した日 (または窓の開始日。-1 は期間開始前からの持ち越し) のインデックスを記録する。空なら何もしない。
+        同じルール・職員・内容の違反は1件にまとめる。
+        """
+        day_indices = [int(d_idx) for d_idx in np.atleast_1d(day_indices)]
+        if not day_indices:
+            return
+        employee = self.employee_ids[e_idx] if e_idx is not None else None
+        dates = [self.date_range[max(d_idx, 0)] for d_idx in day_indices]
+        violation = self._violation_index.get((rule_type, employee, detail))
+        if violation is not None:
+            violation['dates'] = sorted(violation['dates'] + dates)
+            violation['count'] += len(day_indices)
+            return
+        violation = {'rule_type': rule_type, 'employee': employee, 'dates': dates, 'count': len(day_indices), 'detail': detail}
+        self._violation_index[(rule_type, employee, detail)] = violation
+        self.hard_violations.append(violation)
+
+    def add_penalty(self, category, amount):
+        """重み付け前のペナルティ量を加える (重みは PENALTY_WEIGHTS)"""
+        self.penalties[category] = self.penalties.get(category, 0) + int(amount) * PENALTY_WEIGHTS[category]
+
+
+def window_starts_and_limits(num_days, initial_streak, max_days):
+    """
+    build_shift_model の連続上限 (MAX_CONSECUTIVE_WORK / OFF) と同じ窓の開始日インデックス (昇順・連続) と、窓ごとの上限。
+    窓は長さ max_days + 1 で、期間開始前から続いている連続日数 (initial_streak) の分だけ前にずらした窓も含む
+    (前にはみ出した窓の上限は、期間内の日数 - 1)。
+    """
+    window_size = max_days + 1
+    initial = min(int(initial_streak), window_size)
+    starts = np.arange(-initial, num_days - max_days)
+    effective_size = window_size + np.minimum(starts, 0)
+    starts, effective_size = starts[effective_size > 0], effective_size[effective_size > 0]
+    limits = np.where(starts < 0, np.maximum(effective_size - 1, 0), max_days)
+    return starts, limits
+
+
+def window_sums(mask_row, starts, max_days):
+    """各窓 (開始日 starts, 長さ max_days + 1、期間外の日は除く) の該当日数を累積和で求める"""
+    num_days = len(mask_row)
+    cumulative = np.concatenate(([0], np.cumsum(mask_row, dtype=np.int64)))
+    return cumulative[np.minimum(starts + max_days + 1, num_days)] - cumulative[np.maximum(starts, 0)]
+
+
+class RuleTerm:
+    """
+    ルール1件 (またはハードコードの制約) を1人 (同時勤務禁止は2人) の職員に適用した項。
+    evaluate(matrix) は行列全体から (違反した日のインデックス, 重み付け前のペナルティ量) を返し、
+    delta(matrix, changes) は changes ({(e_idx, d_idx): 新しいシフト整数}) を反映したときの (違反数の差, ペナルティ量の差) を
+    変更セルの周辺 (影響する窓・前後の日) だけから求める。状態を持つ項は bind で初期化し、commit で変更を反映する。
+    """
+    employees = ()
+    group_level = False # 職員ではなく日ごとの人数に対する項 (違反を職員に結び付けない)
+
+    def __init__(self, rule_type, is_hard, category, detail):
+        self.rule_type = rule_type
+        self.is_hard = is_hard
+        self.category = category # ソフト制約のペナルティカテゴリ (ハード制約は None)
+        self.detail = detail
+
+    def bind(self, matrix):
+        pass
+
+    def commit(self, matrix, changes):
+        pass
+
+    def _cost(self, num_bad, amount):
+        """ハード制約は違反数、ソフト制約はペナルティ量として返す"""
+        return (int(num_bad), 0) if self.is_hard else (0, int(amount))
+
+
+def _value(matrix, changes, e_idx, d_idx):
+    return changes.get((e_idx, d_idx), matrix[e_idx, d_idx])
+
+
+def _changed_days(changes, e_idx):
+    return sorted({d_idx for (changed_e, d_idx) in changes if changed_e == e_idx})
+
+
+class CellTerm(RuleTerm):
+    """day_mask の日ごとに、シフトが target_ints に含まれる (must=False) / 含まれない (must=True) と違反になる項"""
+
+    def __init__(self, rule_type, e_idx, day_mask, target_ints, must, is_hard=True, category=None, unit=1, detail=''):
+        super().__init__(rule_type, is_hard, category, detail)
+        self.employees = (e_idx,)
+        self.day_mask = day_mask
+        self.table = membership_table(target_ints)
+        self.must = must
+        self.unit = unit # ソフト制約の1日あたりのペナルティ量
+
+    def _bad(self, values):
+        matched = self.table[values]
+        return ~matched if self.must else matched
+
+    def _bad_cell(self, value):
+        return int(self.table[value] != self.must)
+
+    def evaluate(self, matrix):
+        bad_days = np.flatnonzero(self.day_mask & self._bad(matrix[self.employees[0]]))
+        return bad_days, len(bad_days) * self.unit
+
+    def delta(self, matrix, changes):
+        e_idx = self.employees[0]
+        change = sum(self._bad_cell(value) - self._bad_cell(matrix[cell]) for cell, value in changes.items()
+                     if cell[0] == e_idx and self.day_mask[cell[1]])
+        return self._cost(change, change * self.unit)
+
+
+class CountTerm(RuleTerm):
+    """期間内の target_ints の回数が [min_count, max_count] を外れると違反 (ソフト制約は不足分 + 超過分) になる項"""
+
+    def __init__(self, rule_type, e_idx, target_ints, min_count, max_count, is_hard=True, category=None, detail=''):
+        super().__init__(rule_type, is_hard, category, detail)
+        self.employees = (e_idx,)
+        self.table = membership_table(target_ints)
+        self.min_count = min_count
+        self.max_count = max_count
+        self.count = 0
+
+    def _deviation(self, count):
+        shortage = max(0, self.min_count - count) if self.min_count is not None else 0
+        excess = max(0, count - self.max_count) if self.max_count is not None else 0
+        return shortage + excess
+
+    def _count_change(self, matrix, changes):
+        e_idx = self.employees[0]
+        return sum(int(self.table[value]) - int(self.table[matrix[cell]]) for cell, value in changes.items() if cell[0] == e_idx)
+
+    def evaluate(self, matrix):
+        deviation = self._deviation(int(self.table[matrix[self.employees[0]]].sum()))
+        return (np.array([0]) if deviation else np.array([], dtype=int)), deviation
+
+    def bind(self, matrix):
+        self.count = int(self.table[matrix[self.employees[0]]].sum())
+
+    def delta(self, matrix, changes):
+        count_change = self._count_change(matrix, changes)
+        if not count_change:
+            return 0, 0
+        before, after = self._deviation(self.count), self._deviation(self.count + count_change)
+        return self._cost(bool(after) - bool(before), after - before)
+
+    def commit(self, matrix, changes):
+        self.count += self._count_change(matrix, changes)
+
+
+class WindowTerm(RuleTerm):
+    """連続上限 (長さ max_days + 1 の窓ごとの該当日数が上限以下) の項。窓和は bind で求め、変更セルを含む窓だけを更新する"""
+
+    def __init__(self, rule_type, e_idx, mask_ints, initial_streak, max_days, num_days, is_hard=True, category=None, detail=''):
+        super().__init__(rule_type, is_hard, category, detail)
+        self.employees = (e_idx,)
+        self.table = membership_table(mask_ints)
+        self.max_days = max_days
+        self.starts, self.limits = window_starts_and_limits(num_days, initial_streak, max_days)
+        self.sums = None
+
+    def _excess_cost(self, excess):
+        return self._cost((excess > 0).sum(), np.maximum(excess, 0).sum())
+
+    def evaluate(self, matrix):
+        excess = window_sums(self.table[matrix[self.employees[0]]], self.starts, self.max_days) - self.limits
+        return self.starts[excess > 0], np.maximum(excess, 0).sum()
+
+    def bind(self, matrix):
+        self.sums = window_sums(self.table[matrix[self.employees[0]]], self.starts, self.max_days)
+
+    def _sum_changes(self, matrix, changes):
+        """変更セルを含む窓の位置 (starts の添字) と、その窓和の増減"""
+        e_idx = self.employees[0]
+        adds = {}
+        if not len(self.starts):
+            return adds
+        first_start, last_start = int(self.starts[0]), int(self.starts[-1])
+        for d_idx in _changed_days(changes, e_idx):
+            change = int(self.table[changes[(e_idx, d_idx)]]) - int(self.table[matrix[e_idx, d_idx]])
+            if not change:
+                continue
+            # 開始日 s の窓は s 〜 s + max_days の日を含む
+            for position in range(max(d_idx - self.max_days, first_start) - first_start, min(d_idx, last_start) - first_start + 1):
+                adds[position] = adds.get(position, 0) + change
+        return adds
+
+    def delta(self, matrix, changes):
+        adds = self._sum_changes(matrix, changes)
+        if not adds:
+            return 0, 0
+        positions = np.fromiter(adds.keys(), dtype=np.intp)
+        before = self.sums[positions] - self.limits[positions]
+        after = before + np.fromiter(adds.values(), dtype=np.int64)
+        hard_after, amount_after = self._excess_cost(after)
+        hard_before, amount_before = self._excess_cost(before)
+        return hard_after - hard_before, amount_after - amount_before
+
+    def commit(self, matrix, changes):
+        for position, change in self._sum_changes(matrix, changes).items():
+            self.sums[position] += change
+
+
+class SequenceTerm(RuleTerm):
+    """
+    前日が pre_int の日の並びの項。enforce=True なら翌日が sub_int でないと違反、False なら翌日が sub_int だと違反。
+    違反は前日のインデックスで数える。
+    """
+
+    def __init__(self, rule_type, e_idx, pre_int, sub_int, enforce, is_hard=True, category=None, detail=''):
+        super().__init__(rule_type, is_hard, category, detail)
+        self.employees = (e_idx,)
+        self.pre_int = pre_int
+        self.sub_int = sub_int
+        self.enforce = enforce
+
+    def _broken(self, pre_values, next_values):
+        is_pre = np.asarray(pre_values) == self.pre_int
+        is_sub = np.asarray(next_values) == self.sub_int
+        return is_pre & ~is_sub if self.enforce else is_pre & is_sub
+
+    def evaluate(self, matrix):
+        row = matrix[self.employees[0]]
+        broken_days = np.flatnonzero(self._broken(row[:-1], row[1:]))
+        return broken_days, len(broken_days)
+
+    def _broken_pair(self, pre_value, next_value):
+        return int(pre_value == self.pre_int and ((next_value != self.sub_int) if self.enforce else (next_value == self.sub_int)))
+
+    def delta(self, matrix, changes):
+        e_idx = self.employees[0]
+        num_days = matrix.shape[1]
+        pairs = {p for d_idx in _changed_days(changes, e_idx) for p in (d_idx - 1, d_idx) if 0 <= p < num_days - 1}
+        change = sum(self._broken_pair(_value(matrix, changes, e_idx, p), _value(matrix, changes, e_idx, p + 1))
+                     - self._broken_pair(matrix[e_idx, p], matrix[e_idx, p + 1]) for p in pairs)
+        return self._cost(change, change)
+
+
+class SimultaneousTerm(RuleTerm):
+    """2人の職員が同じ日に shift_int になると違反になる項"""
+
+    def __init__(self, rule_type, e_idx, e2_idx, shift_int, detail=''):
+        super().__init__(rule_type, True, None, detail)
+        self.employees = (e_idx, e2_idx)
+        self.shift_int = shift_int
+
+    def evaluate(self, matrix):
+        e_idx, e2_idx = self.employees
+        both_days = np.flatnonzero((matrix[e_idx] == self.shift_int) & (matrix[e2_idx] == self.shift_int))
+        return both_days, len(both_days)
+
+    def delta(self, matrix, changes):
+        e_idx, e2_idx = self.employees
+        days = sorted(set(_changed_days(changes, e_idx)) | set(_changed_days(changes, e2_idx)))
+        if not days:
+            return 0, 0
+        before = sum(matrix[e_idx, d] == self.shift_int and matrix[e2_idx, d] == self.shift_int for d in days)
+        after = sum(_value(matrix, changes, e_idx, d) == self.shift_int and _value(matrix, changes, e2_idx, d) == self.shift_int
+                    for d in days)
+        return int(after - before), 0
+
+
+class GroupBalanceTerm(RuleTerm):
+    """
+    グループの職員ごとの day_mask の日の target_ints の回数の偏り (fairness.group_imbalance) × unit をペナルティにする項。
+    職員ごとの回数は bind で求め、変更セルの分だけ更新する。
+    """
+
+    def __init__(self, rule_type, e_indices, day_mask, target_ints, formulation, category, unit=1, detail=''):
+        super().__init__(rule_type, False, category, detail)
+        self.employees = tuple(e_indices)
+        self.positions = {e_idx: position for position, e_idx in enumerate(self.employees)}
+        self.day_mask = day_mask
+        self.table = membership_table(target_ints)
+        self.formulation = formulation
+        self.unit = unit
+        self.counts = None
+
+    def _counts(self, matrix):
+        return (self.table[matrix[list(self.employees)]] & self.day_mask).sum(axis=1)
+
+    def evaluate(self, matrix):
+        return np.array([], dtype=int), group_imbalance(self._counts(matrix), self.formulation) * self.unit
+
+    def bind(self, matrix):
+        self.counts = self._counts(matrix)
+
+    def _count_changes(self, matrix, changes):
+        adds = {}
+        for (e_idx, d_idx), value in changes.items():
+            position = self.positions.get(e_idx)
+            if position is None or not self.day_mask[d_idx]:
+                continue
+            step = int(self.table[value]) - int(self.table[matrix[e_idx, d_idx]])
+            if step:
+                adds[position] = adds.get(position, 0) + step
+        return adds
+
+    def delta(self, matrix, changes):
+        adds = self._count_changes(matrix, changes)
+        if not adds:
+            return 0, 0
+        after = self.counts.copy()
+        for position, step in adds.items():
+            after[position] += step
+        return 0, (group_imbalance(after, self.formulation) - group_imbalance(self.counts, self.formulation)) * self.unit
+
+    def commit(self, matrix, changes):
+        for position, step in self._count_changes(matrix, changes).items():
+            self.counts[position] += step
+
+
+class CoverageTerm(RuleTerm):
+    """
+    日ごとの対象の職員 (フロア・役職) のうち target_ints のシフトの人数が [lower, upper] を外れると違反になる項 (src/coverage.py の需要表)。
+    ハード制約は外れた日を、ソフト制約は下限の不足・上限の超過の人数の合計をペナルティにする。日ごとの人数は bind で求め、差分で更新する。
+    """
+    group_level = True
+
+    def __init__(self, rule_type, e_indices, target_ints, lower, upper, is_hard=True, category=None, detail=''):
+        super().__init__(rule_type, is_hard, category, detail)
+        self.employees = tuple(e_indices)
+        self.table = membership_table(target_ints)
+        self.lower = lower
+        self.upper = upper
+        self.counts = None
+
+    def _counts(self, matrix):
+        return self.table[matrix[list(self.employees)]].sum(axis=0)
+
+    def _outside(self, counts):
+        return np.maximum(self.lower - counts, 0) + np.maximum(counts - self.upper, 0)
+
+    def evaluate(self, matrix):
+        outside = self._outside(self._counts(matrix))
+        return np.flatnonzero(outside) if self.is_hard else np.array([], dtype=int), int(outside.sum())
+
+    def bind(self, matrix):
+        self.counts = self._counts(matrix)
+
+    def _count_changes(self, matrix, changes):
+        members = set(self.employees)
+        adds = {}
+        for (e_idx, d_idx), value in changes.items():
+            if e_idx not in members:
+                continue
+            step = int(self.table[value]) - int(self.table[matrix[e_idx, d_idx]])
+            if step:
+                adds[d_idx] = adds.get(d_idx, 0) + step
+        return adds
+
+    def delta(self, matrix, changes):
+        adds = self._count_changes(matrix, changes)
+        if not adds:
+            return 0, 0
+        days = np.fromiter(adds, dtype=int)
+        before = self.counts[days]
+        after = before + np.fromiter(adds.values(), dtype=int)
+        outside_before = np.maximum(self.lower[days] - before, 0) + np.maximum(before - self.upper[days], 0)
+        outside_after = np.maximum(self.lower[days] - after, 0) + np.maximum(after - self.upper[days], 0)
+        return self._cost((outside_after > 0).sum() - (outside_before > 0).sum(), outside_after.sum() - outside_before.sum())
+
+    def commit(self, matrix, changes):
+        for d_idx, step in self._count_changes(matrix, changes).items():
+            self.counts[d_idx] += step
+
+
+def coverage_terms(demand, members_of, num_days):
+    """
+    需要表 (coverage.compile_coverage) を CoverageTerm にする。対象・シフトごとに、ハード制約の日は下限・上限を1つの項に、
+    ソフト制約の日は下限の不足 (staffing_shortage / min_role) と上限の超過 (over_staffing) を別の項にする。
+    """
+    grouped = {}
+    for (kind, target, shift_sym, d_idx), cell in demand.items():
+        grouped.setdefault((kind, target, shift_sym), []).append((d_idx, cell))
+    terms = []
+    for (kind, target, shift_sym), cells in sorted(grouped.items()):
+        members = members_of(kind, target)
+        no_upper = len(members) + 1
+        shift_ints, rule_type = cells[0][1]['shift_ints'], cells[0][1]['rule_type']
+        bounds = {} # (is_hard, 種類) -> (下限の配列, 上限の配列)
+        for d_idx, cell in cells:
+            sides = [('range', cell['min'], cell['max'])] if cell['is_hard'] else \
+                    [('short', cell['min'], None)] + ([('over', 0, cell['max'])] if cell['max'] is not None else [])
+            for side, lower, upper in sides:
+                if (cell['is_hard'], side) not in bounds:
+                    bounds[(cell['is_hard'], side)] = (np.zeros(num_days, dtype=int), np.full(num_days, no_upper))
+                bounds[(cell['is_hard'], side)][0][d_idx] = lower
+                bounds[(cell['is_hard'], side)][1][d_idx] = no_upper if upper is None else upper
+        for (is_hard, side), (lower, upper) in bounds.items():
+            category = None if is_hard else ('over_staffing' if side == 'over' else coverage_penalty_category(kind))
+            terms.append(CoverageTerm(rule_type, members, shift_ints, lower, upper, is_hard=is_hard, category=category,
+                                      detail=f"{target} の {shift_sym} の人数"))
+    return terms
+
+
+def compile_rule_terms(employees_df, date_range, jp_holidays, personal_rules=None, facility_rules=None, boundary_state=None):
+    """
+    検証済みルールを RuleTerm のリストにする。ルールの適用範囲は build_shift_model と同じ
+    (個人ルールは職員ごとに適用し、同じキーのルールは最初の1件だけ、育休・病休の固定と育休/病休の記号の禁止は全職員、
+    夜勤→明け→公休の並びは全職員)。施設ルールは公平性のルール (均等化・期間中の最低回数、src/fairness.py) と
+    人員配置・役割の出勤 (src/coverage.py の需要表) を項にする。
+    """
+    employee_ids = employees_df['職員ID'].tolist()
+    num_employees, num_days = len(employee_ids), len(date_range)
+    emp_id_to_idx = {emp_id: idx for idx, emp_id in enumerate(employee_ids)}
+    date_to_d_idx = {d: idx for idx, d in enumerate(date_range)}
+    statuses = employees_df['status'].tolist() if 'status' in employees_df.columns else [None] * num_employees
+    all_days = np.ones(num_days, dtype=bool)
+    weekday_of_day = np.array([d.weekday() for d in date_range])
+    date_type_masks = {}
+    leave_int = SHIFT_MAP_INT['育休']
+    terms = []
+
+    def day_mask(day_indices):
+        mask = np.zeros(num_days, dtype=bool)
+        mask[list(day_indices)] = True
+        return mask
+
+    # 個人ルールを職員ごとに振り分ける (employee が無ければ employee1)
+    employee_rules = {e_idx: [] for e_idx in range(num_employees)}
+    for rule in personal_rules or []:
+        e_idx = emp_id_to_idx.get(rule.get('employee'))
+        if e_idx is None:
+            e_idx = emp_id_to_idx.get(rule.get('employee1'))
+        if e_idx is not None:
+            employee_rules[e_idx].append(rule)
+
+    processed = set()
+    for e_idx in range(num_employees):
+        emp_id = employee_ids[e_idx]
+        # 育休/病休の職員は全日その記号に固定し、他のルールは適用しない。それ以外の職員は育休/病休の記号を禁止
+        if statuses[e_idx] in LEAVE_STATUSES:
+            terms.append(CellTerm('STATUS', e_idx, all_days, [SHIFT_MAP_INT[statuses[e_idx]]], must=True, detail=f"{statuses[e_idx]} に固定"))
+            continue
+        terms.append(CellTerm('STATUS', e_idx, all_days, [leave_int], must=False, detail="育休/病休の記号は使えない"))
+
+        for rule in employee_rules[e_idx]:
+            rule_type = rule.get('rule_type')
+            if rule_type == 'SPECIFY_DATE_SHIFT':
+                target_date, shift_sym, is_hard = rule.get('date'), rule.get('shift'), rule.get('is_hard', True)
+                if target_date not in date_to_d_idx or shift_sym not in SHIFT_MAP_INT or not isinstance(is_hard, bool):
+                    continue
+                shift_int = SHIFT_MAP_INT[shift_sym]
+                category = None if is_hard else ('night_preference' if shift_int == SHIFT_MAP_INT['夜'] else 'weekday')
+                terms.append(CellTerm(rule_type, e_idx, day_mask([date_to_d_idx[target_date]]), [shift_int], must=True,
+                                      is_hard=is_hard, category=category, detail=f"{shift_sym} を指定"))
+
+            elif rule_type in ('MAX_CONSECUTIVE_WORK', 'MAX_CONSECUTIVE_OFF'):
+                max_days, is_hard = rule.get('max_days'), rule.get('is_hard', True)
+                is_work_rule = rule_type == 'MAX_CONSECUTIVE_WORK'
+                rule_key = f"{'max_work' if is_work_rule else 'max_off'}_{e_idx}"
+                if rule_key in processed or not (isinstance(max_days, int) and max_days >= 0):
+                    continue
+                if is_work_rule and not isinstance(is_hard, bool):
+                    continue
+                processed.add(rule_key)
+                streak = boundary_state['work_streak' if is_work_rule else 'off_streak'][e_idx]
+                category = None if is_hard else ('max_consecutive_work' if is_work_rule else 'max_consecutive_off')
+                terms.append(WindowTerm(rule_type, e_idx, WORKING_SHIFTS_INT if is_work_rule else OFF_SHIFT_INTS, streak, max_days, num_days,
+                                        is_hard=is_hard, category=category, detail=f"{max_days} 日を超える連続"))
+
+            elif rule_type == 'FORBID_SHIFT':
+                shift_sym = rule.get('shift')
+                if shift_sym in SHIFT_MAP_INT:
+                    terms.append(CellTerm(rule_type, e_idx, all_days, [SHIFT_MAP_INT[shift_sym]], must=False, detail=f"{shift_sym} は禁止"))
+
+            elif rule_type == 'FORBID_SIMULTANEOUS_SHIFT':
+                employee2_id, shift_sym = rule.get('employee2'), rule.get('shift')
+                rule_key = f"combo_{e_idx}_{employee2_id}_{shift_sym}"
+                if employee2_id in emp_id_to_idx and shift_sym in SHIFT_MAP_INT and rule_key not in processed:
+                    e2_idx = emp_id_to_idx[employee2_id]
+                    terms.append(SimultaneousTerm(rule_type, e_idx, e2_idx, SHIFT_MAP_INT[shift_sym], detail=f"{employee2_id} と同時に {shift_sym}"))
+                    processed.add(rule_key)
+                    processed.add(f"combo_{e2_idx}_{emp_id}_{shift_sym}")
+
+            elif rule_type == 'ALLOW_ONLY_SHIFTS':
+                allowed = rule.get('allowed_shifts')
+                if isinstance(allowed, list) and f'allow_{e_idx}' not in processed:
+                    allowed_ints = [SHIFT_MAP_INT[s] for s in allowed if s in SHIFT_MAP_INT]
+                    forbidden = [i for i in SHIFT_MAP_INT.values() if i not in allowed_ints and i != leave_int]
+                    if forbidden:
+                        terms.append(CellTerm(rule_type, e_idx, all_days, forbidden, must=False, detail=f"{allowed} 以外は禁止"))
+                    processed.add(f'allow_{e_idx}')
+
+            elif rule_type == 'TOTAL_SHIFT_COUNT':
+                shifts_sym, min_count, max_count, is_hard = rule.get('shifts'), rule.get('min'), rule.get('max'), rule.get('is_hard', True)
+                if not (isinstance(shifts_sym, list) and (min_count is not None or max_count is not None) and isinstance(is_hard, bool)):
+                    continue
+                rule_key = f"total_{e_idx}_{'_'.join(shifts_sym)}_{min_count}_{max_count}_{is_hard}"
+                target_ints = [SHIFT_MAP_INT[s] for s in shifts_sym if s in SHIFT_MAP_INT]
+                if rule_key in processed or not target_ints:
+                    continue
+                processed.add(rule_key)
+                terms.append(CountTerm(rule_type, e_idx, target_ints, min_count, max_count, is_hard=is_hard,
+                                       category=None if is_hard else 'total_shift_count', detail=f"{shifts_sym} の回数 (範囲 {min_count}〜{max_count})"))
+
+            elif rule_type == 'PREFER_WEEKDAY_SHIFT':
+                weekday, shift_sym, is_hard, weight = rule.get('weekday'), rule.get('shift'), rule.get('is_hard', False), scale_rule_weight(rule.get('weight'))
+                rule_key = f"pref_weekday_{e_idx}_{weekday}_{shift_sym}_{is_hard}"
+                if rule_key in processed or not (isinstance(weekday, int) and 0 <= weekday <= 6 and shift_sym in SHIFT_MAP_INT):
+                    continue
+                processed.add(rule_key)
+                terms.append(CellTerm(rule_type, e_idx, weekday_of_day == weekday, [SHIFT_MAP_INT[shift_sym]], must=True, is_hard=is_hard,
+                                      category=None if is_hard else 'weekday', unit=weight, detail=f"曜日 {weekday} は {shift_sym}"))
+
+            elif rule_type == 'PREFER_SHIFT_ON_DATE_SET':
+                date_type, shift_sym, is_hard = rule.get('date_type'), rule.get('shift'), rule.get('is_hard', False)
+                weight = scale_rule_weight(rule.get('weight'))
+                rule_key = f"pref_date_set_{e_idx}_{date_type}_{shift_sym}_{is_hard}"
+                if rule_key in processed or not (isinstance(date_type, str) and shift_sym in SHIFT_MAP_INT and isinstance(is_hard, bool)):
+                    continue
+                processed.add(rule_key)
+                if date_type not in date_type_masks:
+                    date_type_masks[date_type] = day_mask(resolve_date_type_days(date_range, date_type, jp_holidays))
+                terms.append(CellTerm(rule_type, e_idx, date_type_masks[date_type], [SHIFT_MAP_INT[shift_sym]], must=True, is_hard=is_hard,
+                                      category=None if is_hard else 'date_set', unit=weight, detail=f"{date_type} は {shift_sym}"))
+
+            elif rule_type in ('ENFORCE_SHIFT_SEQUENCE', 'FORBID_SHIFT_SEQUENCE'):
+                pre_sym, sub_sym, is_hard = rule.get('preceding_shift'), rule.get('subsequent_shift'), rule.get('is_hard', True)
+                is_enforce = rule_type == 'ENFORCE_SHIFT_SEQUENCE'
+                rule_key = f"{'enforce_seq' if is_enforce else 'forbid_seq'}_{e_idx}_{pre_sym}_{sub_sym}"
+                if rule_key in processed or pre_sym not in SHIFT_MAP_INT or sub_sym not in SHIFT_MAP_INT:
+                    continue
+                processed.add(rule_key)
+                terms.append(SequenceTerm(rule_type, e_idx, SHIFT_MAP_INT[pre_sym], SHIFT_MAP_INT[sub_sym], is_enforce, is_hard=is_hard,
+                                          category=None if is_hard else ('enforce_sequence' if is_enforce else 'forbid_sequence'),
+                                          detail=f"{pre_sym} の翌日は {sub_sym}" + ("" if is_enforce else " 以外")))
+
+    # 夜勤 → 明け → 公休 の並び (育休・病休以外の全職員。期間開始前の持ち越しは初日の固定として扱う)
+    night, ake, off = SHIFT_MAP_INT['夜'], SHIFT_MAP_INT['明'], SHIFT_MAP_INT['公']
+    first_day = day_mask([0])
+    rotation_detail = "夜勤の翌日は明け、明けの翌日は公休"
+    for e_idx in range(num_employees):
+        if statuses[e_idx] in LEAVE_STATUSES:
+            continue
+        terms.append(SequenceTerm('NIGHT_ROTATION', e_idx, night, ake, True, detail=rotation_detail))
+        terms.append(SequenceTerm('NIGHT_ROTATION', e_idx, ake, off, True, detail=rotation_detail))
+        if boundary_state['pending_ake'][e_idx]:
+            terms.append(CellTerm('NIGHT_ROTATION', e_idx, first_day, [ake], must=True, detail=rotation_detail))
+        elif boundary_state['last_shift'][e_idx] == ake:
+            terms.append(CellTerm('NIGHT_ROTATION', e_idx, first_day, [off], must=True, detail=rotation_detail))
+    # 公平性の施設ルール (グループは build_shift_model と同じく育休・病休の職員を含めない)
+    group_indices = build_group_indices(employees_df)
+    formulation = resolve_formulation()
+    for fairness_rule in normalize_fairness_rules(facility_rules):
+        target_indices = group_indices.get(fairness_rule['group'], [])
+        rule_type, shift_syms = fairness_rule['rule_type'], fairness_rule['shift_syms']
+        if rule_type == 'MIN_TOTAL_SHIFT_DAYS':
+            is_hard = fairness_rule['is_hard']
+            for e_idx in target_indices:
+                terms.append(CountTerm(rule_type, e_idx, fairness_rule['shift_ints'], fairness_rule['min_count'], None, is_hard=is_hard,
+                                       category=None if is_hard else 'facility_min_total_shift',
+                                       detail=f"{shift_syms} の回数 (最低 {fairness_rule['min_count']})"))
+        elif len(target_indices) > 1:
+            date_type = fairness_rule['date_type']
+            if date_type not in date_type_masks:
+                date_type_masks[date_type] = day_mask(resolve_date_type_days(date_range, date_type, jp_holidays))
+            terms.append(GroupBalanceTerm(rule_type, target_indices, date_type_masks[date_type], fairness_rule['shift_ints'], formulation,
+                                          'balance_off_days' if rule_type == 'BALANCE_OFF_DAYS' else 'balance_shift_totals',
+                                          unit=fairness_rule['unit'], detail=f"{fairness_rule['group']} の {shift_syms} ({date_type}) の偏り"))
+    # 人員配置・役割の出勤の施設ルール (需要表は build_shift_model と同じ)
+    floors = employees_df['担当フロア'].fillna('').astype(str).tolist() if '担当フロア' in employees_df.columns else [''] * num_employees
+    demand = compile_coverage(facility_rules, num_days, lambda date_type: resolve_date_type_days(date_range, date_type, jp_holidays))
+    terms.extend(coverage_terms(demand, lambda kind, target: coverage_members(kind, target, floors, group_indices), num_days))
+    return terms
+
+
+def resolve_boundary_state(employees_df, date_range, boundary_state=None, shift_history=None, past_shifts_df=None):
+    """build_shift_model と同じ優先順 (boundary_state → shift_history → past_shifts_df) で期間開始時点の境界状態を求める"""
+    if boundary_state is not None:
+        return boundary_state
+    employee_ids = employees_df['職員ID'].tolist()
+    if shift_history is not None and shift_history.employee_ids == employee_ids:
+        return compute_boundary_state_from_codes(shift_history.matrix)
+    return compute_boundary_state(past_shifts_df, employee_ids, date_range[0])
+
+
+def evaluate_terms(shift_matrix, terms, employee_ids, date_range):
+    """コンパイル済みの項で行列全体を評価する"""
+    result = ScheduleEvaluation(employee_ids, date_range)
+    for term in terms:
+        bad_days, amount = term.evaluate(shift_matrix)
+        if term.is_hard:
+            if term.rule_type == 'NIGHT_ROTATION' and isinstance(term, CellTerm):
+                bad_days = bad_days - 1 # 期間開始前からの持ち越し (初日の固定) は前日 (-1) の違反として記録する
+            result.add_violation(term.rule_type, None if term.group_level else term.employees[0], bad_days, term.detail)
+        elif amount:
+            result.add_penalty(term.category, amount)
+    return result
+
+
+def evaluate_schedule(shift_matrix, employees_df, date_range, jp_holidays, personal_rules=None, facility_rules=None,
+                      boundary_state=None, shift_history=None, past_shifts_df=None):
+    """
+    シフト行列 (employees_df の行順 × date_range) を評価し、ScheduleEvaluation を返す。
+    ルールの適用範囲は compile_rule_terms (= build_shift_model) と同じ。
+    """
+    shift_matrix = np.asarray(shift_matrix)
+    boundary_state = resolve_boundary_state(employees_df, date_range, boundary_state, shift_history, past_shifts_df)
+    terms = compile_rule_terms(employees_df, date_range, jp_holidays, personal_rules, facility_rules, boundary_state)
+    return evaluate_terms(shift_matrix, terms, employees_df['職員ID'].tolist(), date_range)
@@ -1,21 +1,48 @@
 # OR-Toolsモデル構築
 from ortools.sat.python import cp_model
-from datetime import timedelta, date
+from datetime import date
 
 from src.constants import (
     SHIFT_MAP_INT, WORKING_SHIFTS_INT, OFF_SHIFT_INTS,
     DEFAULT_MAX_CONSECUTIVE_WORK,
     MANAGER_MAX_CONSECUTIVE_WORK, MANAGER_ROLES,
-    START_DATE,
     WORK_SYMBOLS # 応援変数定義で必要
 )
-from src.utils import get_employee_info, get_employees_by_group # 役職や制約取得に使う
-
-def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, personal_rules, facility_rules):
-    """OR-Tools CP-SATモデルを構築し、制約を追加する (個人ルール+施設ルール入力版)"""
+from src.utils import get_employee_info, build_group_indices # 役職や制約取得に使う
+from src.rule_store import load_rules_for_period
+from src.boundary_state import compute_boundary_state, compute_boundary_state_from_codes
+from src.fairness import ShiftCounts, normalize_fairness_rules, add_group_balance, resolve_formulation
+from src.weights import load_weight_profile, scale_rule_weight
+from src.coverage import compile_coverage, coverage_members, add_coverage_constraints, print_coverage_report
+
+# ペナルティのカテゴリ名 -> 目的関数での重み (プロファイルは src/weights.py。schedule_evaluator も同じ重みで評価する)
+PENALTY_WEIGHTS = load_weight_profile()
+
+def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, personal_rules=None, facility_rules=None, rule_store_path=None,
+                      boundary_state=None, shift_history=None, group_indices=None, fixed_cells=None,
+                      coverage_group_indices=None):
+    """
+    OR-Tools CP-SATモデルを構築し、制約を追加する (個人ルール+施設ルール入力版)
+    personal_rules / facility_rules が None で rule_store_path が指定された場合は、
+    ルールストアから対象期間の最新ルールセットを読み込んで使う。
+    shift_history (src.history.ShiftHistory) を渡すと、期間開始前の勤務履歴として連勤・連休の持ち越しなどに使う。
+    boundary_state (src.boundary_state の配列) が None の場合は shift_history (無ければ past_shifts_df) から求める。
+    group_indices (utils.build_group_indices の結果) が None の場合は employees_df から1回だけ作る。
+    fixed_cells ({(e_idx, d_idx): シフト整数}) のセルは変数の定義域をその値だけにする (修正モードの固定セル・近傍外のセル)。
+    coverage_group_indices は人員配置・役割の出勤で数える職員のグループ (None なら group_indices)。期間の途中から休む職員を
+    休む前の日には数えるために使う (休む日のセルは育休/病休に固定されるため人数に入らない)。
+    戻り値は (model, shifts, employee_ids, date_range, penalty_exprs)。penalty_exprs はペナルティのカテゴリ名 -> 重み付き合計の式。
+    """
     model = cp_model.CpModel()
     print("Shift model building started...")
 
+    if (personal_rules is None or facility_rules is None) and rule_store_path:
+        stored_personal_rules, stored_facility_rules = load_rules_for_period(date_range[0], date_range[-1], db_path=rule_store_path)
+        if personal_rules is None: personal_rules = stored_personal_rules
+        if facility_rules is None: facility_rules = stored_facility_rules
+    personal_rules = personal_rules or []
+    facility_rules = facility_rules or []
+
     # --- データ準備 ---
     employee_ids = employees_df['職員ID'].tolist()
     num_employees = len(employee_ids)
@@ -26,17 +53,39 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
     emp_idx_to_id = {i: emp_id for i, emp_id in enumerate(employee_ids)}
     emp_id_to_idx = {emp_id: idx for idx, emp_id in emp_idx_to_id.items()}
     date_to_d_idx = {d: idx for idx, d in enumerate(date_range)}
-    past_shifts_lookup = past_shifts_df.set_index('職員ID') if past_shifts_df is not None else None
+    if group_indices is None:
+        group_indices = build_group_indices(employees_df)
+    date_type_days = {} # 日付区分 -> 該当する日インデックスのリスト (カレンダー解決は区分ごとに1回)
+    if shift_history is not None and shift_history.employee_ids != employee_ids:
+        print("警告(モデル): 勤務履歴の職員の並びが従業員情報と一致しないため、勤務履歴を使いません。")
+        shift_history = None
+    if boundary_state is None:
+        if shift_history is not None:
+            boundary_state = compute_boundary_state_from_codes(shift_history.matrix)
+        else:
+            boundary_state = compute_boundary_state(past_shifts_df, employee_ids, date_range[0])
 
     # --- 変数定義 ---
     shifts = {}
     max_shift_int_value = max(SHIFT_MAP_INT.values()) # SHIFT_MAP_INT の値の最大値 (5)
+    fixed_cells = fixed_cells or {}
     for e in all_employees:
         for d in all_days:
             # 上限値を修正 (len(SHIFT_MAP_INT)-1 ではなく max_shift_int_value を使う)
-            shifts[(e, d)] = model.NewIntVar(0, max_shift_int_value, f'shift_e{e}_d{d}')
+            if (e, d) in fixed_cells:
+                fixed_value = int(fixed_cells[(e, d)])
+                shifts[(e, d)] = model.NewIntVar(fixed_value, fixed_value, f'shift_e{e}_d{d}')
+            else:
+                shifts[(e, d)] = model.NewIntVar(0, max_shift_int_value, f'shift_e{e}_d{d}')
     print("Variables defined.")
 
+    # 回数の変数の共有表 (個人の TOTAL_SHIFT_COUNT と施設の均等化・最低回数で共有する)
+    def days_of_type(date_type):
+        if date_type not in date_type_days:
+            date_type_days[date_type] = resolve_date_type_days(date_range, date_type, jp_holidays)
+        return date_type_days[date_type]
+    shift_counts = ShiftCounts(model, shifts, days_of_type)
+
     # --- 応援変数定義 ---
     is_helping_1F_to_2F = {}
     is_helping_2F_to_1F = {}
@@ -62,6 +111,7 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
     # ペナルティリストの初期化
     ab_schedule_penalties = []
     weekday_penalties = []
+    date_set_penalties = [] # 日付区分希望 (PREFER_SHIFT_ON_DATE_SET) の外れ日数 (従業員・ルールごとに1項)
     night_preference_penalties = []
     ake_count_deviation_penalties = []
     max_consecutive_work_penalties = []
@@ -73,17 +123,13 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
     min_role_penalties = [] # 役割最低出勤不足ペナルティ
     forbid_sequence_penalties = [] # 新しいペナルティリスト
     enforce_sequence_penalties = [] # 新しいペナルティリスト
-    balance_specific_shift_penalties = [] # 新しいペナルティリスト
+    balance_shift_totals_penalties = [] # 回数の均等化 (BALANCE_SPECIFIC_SHIFT_TOTALS)
     facility_min_total_shift_penalties = [] # 新しいペナルティリスト (ソフト制約用)
     facility_max_consecutive_work_penalties = [] # 新しいペナルティリスト (ソフト制約用)
-    off_days_difference = None # 均等化用
-    full_time_employee_indices = [] # 均等化用
-    num_off_days_vars = {} # 均等化用
 
     # <<< 個人ルールの処理 >>>
     print("Processing personal rules...")
     processed_rule_types = set()
-    processed_facility_rules = set() # 施設ルール用の処理済みセットを追加
     employee_specific_rules = {e_idx: [] for e_idx in all_employees}
     for rule in personal_rules:
         employee_id = rule.get('employee')
@@ -107,21 +153,23 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
             print(f"警告(個人モデル): 従業員情報が見つかりません: {emp_id}")
             continue
 
+        # 育休/病休 (基本情報から) の職員は全日その記号に固定し、個人ルールは適用しない。
+        # それ以外の職員には育休/病休の記号を使わせない (ルールの有無によらず全職員。人員配置の上限を満たすために余った職員を休みにしない)。
+        # 固定セル (修正モードの固定・期間途中からの休み) は呼び出し側の値を優先する
+        current_status = emp_info.get('status')
+        if current_status in ['育休', '病休']:
+            for d_idx in all_days:
+                if (e_idx, d_idx) not in fixed_cells:
+                    model.Add(shifts[(e_idx, d_idx)] == SHIFT_MAP_INT[current_status])
+            continue
+        for d_idx in all_days:
+            if (e_idx, d_idx) not in fixed_cells:
+                model.Add(shifts[(e_idx, d_idx)] != SHIFT_MAP_INT['育休'])
+
         # --- 従業員ごとのルールを適用 ---
         for rule in employee_specific_rules[e_idx]:
             rule_type = rule.get('rule_type')
 
-            # 育休/病休 (基本情報から。ルールリストには含めない方が良いかも)
-            current_status = emp_info.get('status')
-            if current_status in ['育休', '病休']:
-                 status_int = SHIFT_MAP_INT.get(current_status)
-                 if status_int is not None:
-                     for d_idx in all_days: model.Add(shifts[(e_idx, d_idx)] == status_int)
-                 continue # 他のルールは適用しない
-            # 育休/病休でないなら、それらのシフトを禁止
-            if SHIFT_MAP_INT.get('育休') is not None:
-                 for d_idx in all_days: model.Add(shifts[(e_idx, d_idx)] != SHIFT_MAP_INT['育休'])
-
             # 'ASSIGN' から 'SPECIFY_DATE_SHIFT' に変更
             if rule_type == 'SPECIFY_DATE_SHIFT':
                 target_date = rule.get('date')
@@ -160,16 +208,8 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                     continue
 
                 if rule_key not in processed_rule_types:
-                    initial_consecutive_work = 0
-                    if past_shifts_lookup is not None and emp_id in past_shifts_lookup.index:
-                         for i in range(1, max_days + 2):
-                              past_date_str = (START_DATE - timedelta(days=i)).strftime('%#m/%#d')
-                              if past_date_str in past_shifts_lookup.columns:
-                                  past_shift = past_shifts_lookup.loc[emp_id, past_date_str]
-                                  if past_shift and past_shift not in ['公', '育休', '病休']:
-                                      initial_consecutive_work += 1
-                                  else: break
-                              else: break
+                    # 期間開始前から続いている連勤 (上限+1日まで見れば十分)
+                    initial_consecutive_work = min(int(boundary_state['work_streak'][e_idx]), max_days + 1)
 
                     # 各日が勤務かどうかのブール変数 (変更なし)
                     is_working = [model.NewBoolVar(f'is_work_r6_e{e_idx}_d{d_idx}') for d_idx in all_days]
@@ -179,7 +219,6 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                          model.AddForbiddenAssignments((shifts[(e_idx, d_idx)],), allowed_tuples).OnlyEnforceIf(is_working[d_idx].Not())
 
                     window_size = max_days + 1
-                    max_consecutive_work_penalties = [] # ソフト制約用のペナルティリスト
 
                     for d_start in range(-initial_consecutive_work, num_days - max_days):
                          vars_in_window = []
@@ -216,8 +255,6 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
 
                     processed_rule_types.add(rule_key) # 処理済みマーク
 
-                    # ソフト制約の場合、ペナルティを目的関数に追加 (後でまとめて行うのでここではリストに追加のみ)
-                    # TODO: max_consecutive_work_penalties を目的関数の penalties_with_weights に追加する -> 削除
 
             elif rule_type == 'FORBID_SHIFT':
                 shift_sym = rule.get('shift')
@@ -274,14 +311,7 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                  if rule_key not in processed_rule_types:
                       target_ints = [SHIFT_MAP_INT[s] for s in target_shifts_sym if s in SHIFT_MAP_INT]
                       if target_ints:
-                           count_vars = []
-                           allowed_tuples = [(t_int,) for t_int in target_ints]
-                           for d_idx in all_days:
-                                is_target = model.NewBoolVar(f'is_total_count_e{e_idx}_d{d_idx}_{rule_key[:10]}')
-                                model.AddAllowedAssignments((shifts[(e_idx, d_idx)],), allowed_tuples).OnlyEnforceIf(is_target)
-                                model.AddForbiddenAssignments((shifts[(e_idx, d_idx)],), allowed_tuples).OnlyEnforceIf(is_target.Not())
-                                count_vars.append(is_target)
-                           actual_count_expr = cp_model.LinearExpr.Sum(count_vars)
+                           actual_count_expr = shift_counts.count(e_idx, target_ints) # 共有の回数の変数
 
                            if is_hard:
                                # ハード制約
@@ -319,18 +349,7 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                         model.AddAllowedAssignments((shifts[(e_idx, d_idx)],), off_tuples_personal).OnlyEnforceIf(is_off_personal[d_idx])
                         model.AddForbiddenAssignments((shifts[(e_idx, d_idx)],), off_tuples_personal).OnlyEnforceIf(is_off_personal[d_idx].Not())
 
-                    initial_consecutive_off = 0
-                    if past_shifts_lookup is not None and emp_id in past_shifts_lookup.index:
-                        for i in range(1, max_off_days + 2):
-                            past_date_str = (START_DATE - timedelta(days=i)).strftime('%#m/%#d')
-                            if past_date_str in past_shifts_lookup.columns:
-                                past_shift = past_shifts_lookup.loc[emp_id, past_date_str]
-                                if past_shift and past_shift in SHIFT_MAP_INT and SHIFT_MAP_INT[past_shift] in OFF_SHIFT_INTS:
-                                    initial_consecutive_off += 1
-                                else:
-                                    break
-                            else:
-                                break
+                    initial_consecutive_off = min(int(boundary_state['off_streak'][e_idx]), max_off_days + 1)
                     
                     window_size = max_off_days + 1
                     for d_start in range(-initial_consecutive_off, num_days - max_off_days):
@@ -368,7 +387,7 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                 weekday = rule.get('weekday') # 0=月曜日, 6=日曜日
                 shift_sym = rule.get('shift')
                 is_hard = rule.get('is_hard', False) # デフォルトはソフト制約
-                weight = rule.get('weight', 1) # ソフト制約時の重み
+                weight = scale_rule_weight(rule.get('weight')) # ソフト制約時の重み (1〜RULE_WEIGHT_SCALE_MAX の整数)
                 rule_key = f"pref_weekday_{e_idx}_{weekday}_{shift_sym}_{is_hard}"
 
                 if rule_key not in processed_rule_types and isinstance(weekday, int) and 0 <= weekday <= 6 and shift_sym in SHIFT_MAP_INT:
@@ -381,39 +400,47 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                                 penalty_var = model.NewBoolVar(f'pref_weekday_penalty_e{e_idx}_d{d_idx}_w{weekday}_s{shift_sym}')
                                 model.Add(shifts[(e_idx, d_idx)] != shift_int).OnlyEnforceIf(penalty_var)
                                 model.Add(shifts[(e_idx, d_idx)] == shift_int).OnlyEnforceIf(penalty_var.Not())
-                                # 重み付けされたペナルティとして weekday_penalties に追加 (weight は整数化して扱う)
-                                weekday_penalties.append(penalty_var * int(weight))
+                                # 重み付けされたペナルティとして weekday_penalties に追加
+                                weekday_penalties.append(penalty_var * weight)
                     processed_rule_types.add(rule_key)
                 elif rule_key in processed_rule_types:
                     print(f"情報(モデル): PREFER_WEEKDAY_SHIFT ルールは既に処理済み: {emp_id}, weekday={weekday}, shift={shift_sym}")
                 else:
                     print(f"警告(モデル): 無効なパラメータを持つ PREFER_WEEKDAY_SHIFT ルールをスキップ: {rule}")
 
-            elif rule_type == 'BALANCE_OFF_DAYS':
-                group_name = rule.get('employee_group', 'ALL')
-                weight = rule.get('weight', 1)
-                target_employee_indices = get_employees_by_group(employees_df, group_name, emp_id_to_idx)
-                
-                if len(target_employee_indices) > 1:
-                    num_off_days_vars = {}
-                    off_day_int_eq = SHIFT_MAP_INT['公']
-                    for e_idx in target_employee_indices:
-                        off_count_expr = cp_model.LinearExpr.Sum([shifts[(e_idx, d_idx)] == off_day_int_eq for d_idx in all_days])
-                        num_off_days_vars[e_idx] = model.NewIntVar(0, num_days, f'off_count_bal_e{e_idx}')
-                        model.Add(num_off_days_vars[e_idx] == off_count_expr)
-                    
-                    min_off_days = model.NewIntVar(0, num_days, f'min_off_bal_{group_name}')
-                    max_off_days = model.NewIntVar(0, num_days, f'max_off_bal_{group_name}')
-                    model.AddMinEquality(min_off_days, list(num_off_days_vars.values()))
-                    model.AddMaxEquality(max_off_days, list(num_off_days_vars.values()))
-                    off_days_difference = model.NewIntVar(0, num_days, f'off_diff_bal_{group_name}')
-                    model.Add(off_days_difference == max_off_days - min_off_days)
-                    # 重みを考慮してペナルティリストに追加
-                    penalty_value = int(round(weight * 100)) if isinstance(weight, (int, float)) else 100
-                    balance_off_days_penalties.append(off_days_difference * penalty_value)
-                    processed_facility_rules.add(rule_key)
+            elif rule_type == 'PREFER_SHIFT_ON_DATE_SET':
+                date_type = rule.get('date_type')
+                shift_sym = rule.get('shift')
+                is_hard = rule.get('is_hard', False) # デフォルトはソフト制約
+                weight = scale_rule_weight(rule.get('weight')) # ソフト制約時の重み (None は 1)
+                rule_key = f"pref_date_set_{e_idx}_{date_type}_{shift_sym}_{is_hard}"
+
+                if rule_key not in processed_rule_types and isinstance(date_type, str) and shift_sym in SHIFT_MAP_INT and isinstance(is_hard, bool):
+                    if date_type not in date_type_days:
+                        date_type_days[date_type] = resolve_date_type_days(date_range, date_type, jp_holidays)
+                    target_days = date_type_days[date_type]
+                    shift_int = SHIFT_MAP_INT[shift_sym]
+                    if not target_days:
+                        print(f"情報(モデル): 期間内に '{date_type}' の日がないため PREFER_SHIFT_ON_DATE_SET は制約なし: {emp_id}")
+                    elif is_hard:
+                        # ハード制約: 該当日のシフト変数をまとめて固定する
+                        for d_idx in target_days:
+                            model.Add(shifts[(e_idx, d_idx)] == shift_int)
+                    else:
+                        # ソフト制約: 希望通りになった日数を数え、外れた日数 × weight を1項のペナルティにする
+                        hit_vars = []
+                        for d_idx in target_days:
+                            is_hit = model.NewBoolVar(f'pref_date_set_hit_e{e_idx}_d{d_idx}_s{shift_int}')
+                            model.Add(shifts[(e_idx, d_idx)] == shift_int).OnlyEnforceIf(is_hit)
+                            model.Add(shifts[(e_idx, d_idx)] != shift_int).OnlyEnforceIf(is_hit.Not())
+                            hit_vars.append(is_hit)
+                        miss_count_expr = len(target_days) - cp_model.LinearExpr.Sum(hit_vars)
+                        date_set_penalties.append(miss_count_expr * weight)
+                    processed_rule_types.add(rule_key)
+                elif rule_key in processed_rule_types:
+                    print(f"情報(モデル): PREFER_SHIFT_ON_DATE_SET ルールは既に処理済み: {emp_id}, date_type={date_type}, shift={shift_sym}")
                 else:
-                    print(f"警告(施設モデル): 対象者が1名以下のため BALANCE_OFF_DAYS ルールはスキップ: {rule}")
+                    print(f"警告(モデル): 無効なパラメータを持つ PREFER_SHIFT_ON_DATE_SET ルールをスキップ: {rule}")
 
             elif rule_type == 'ENFORCE_SHIFT_SEQUENCE':
                 preceding_shift_sym = rule.get('preceding_shift')
@@ -449,89 +476,8 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                 else:
                     print(f"警告(モデル): 無効なパラメータを持つ ENFORCE_SHIFT_SEQUENCE ルールをスキップ: {rule}")
 
-            elif rule_type == 'MIN_TOTAL_SHIFT_DAYS':
-                group_name = rule.get('employee_group', 'ALL')
-                target_shift_sym = rule.get('shift')
-                min_days = rule.get('min_count')
-                is_hard = rule.get('is_hard', True)
-                rule_key = f"facility_min_total_days_{group_name}_{target_shift_sym}_{min_days}_{is_hard}"
-
-                if rule_key not in processed_facility_rules: # 施設ルール用の処理済みセットで確認
-                    target_employee_indices = get_employees_by_group(employees_df, group_name, emp_id_to_idx)
-                    target_shift_int = SHIFT_MAP_INT.get(target_shift_sym)
-
-                    if not target_employee_indices:
-                        print(f"警告(施設モデル): MIN_TOTAL_SHIFT_DAYS の対象グループ '{group_name}' が見つかりません。ルールスキップ: {rule}")
-                    elif target_shift_int is None:
-                        print(f"警告(施設モデル): MIN_TOTAL_SHIFT_DAYS のシフト記号 '{target_shift_sym}' が無効です。ルールスキップ: {rule}")
-                    elif not isinstance(min_days, int) or min_days < 0:
-                        print(f"警告(施設モデル): MIN_TOTAL_SHIFT_DAYS の min_count '{min_days}' が無効です。ルールスキップ: {rule}")
-                    else:
-                        for e_idx_facility in target_employee_indices: # e_idx だと個人ルールループの変数と被るので変更
-                            emp_id_current = emp_idx_to_id.get(e_idx_facility) # 育休等チェックのため
-                            emp_info_current = get_employee_info(employees_df, emp_id_current)
-                            if emp_info_current and emp_info_current.get('status') in ['育休', '病休']:
-                                continue # 育休・病休者はスキップ
-
-                            actual_shift_count_expr = cp_model.LinearExpr.Sum(
-                                [shifts[(e_idx_facility, d_idx)] == target_shift_int for d_idx in all_days]
-                            )
-                            if is_hard:
-                                model.Add(actual_shift_count_expr >= min_days)
-                            else:
-                                shortage_var = model.NewIntVar(0, min_days, f'fac_min_total_short_e{e_idx_facility}_s{target_shift_sym}')
-                                model.Add(min_days - actual_shift_count_expr <= shortage_var)
-                                facility_min_total_shift_penalties.append(shortage_var)
-                        processed_facility_rules.add(rule_key)
             elif rule_type == 'UNPARSABLE':
                 print(f"情報(施設モデル): 処理できないルール: {rule}")
-            elif rule_type == 'REQUIRED_STAFFING':
-                floor = rule.get('floor', 'ALL')
-                target_shift_sym = rule.get('shift')
-                date_type = rule.get('date_type')
-                min_count = rule.get('min_count')
-                is_hard = rule.get('is_hard', True)
-                rule_key = f"staffing_{floor}_{target_shift_sym}_{date_type}_{min_count}_{is_hard}"
-
-                if rule_key not in processed_facility_rules:
-                    target_shift_int = SHIFT_MAP_INT.get(target_shift_sym)
-                    if target_shift_int is None:
-                        print(f"警告(施設モデル): REQUIRED_STAFFING のシフト記号 '{target_shift_sym}' が無効です。ルールスキップ: {rule}")
-                        continue
-
-                    target_employee_indices = get_employees_by_group(employees_df, "ALL", emp_id_to_idx)
-                    if floor != 'ALL':
-                        target_employee_indices = [
-                            e_idx for e_idx in target_employee_indices
-                            if get_employee_info(employees_df, emp_idx_to_id.get(e_idx)).get('担当フロア') == floor
-                        ]
-
-                    if not target_employee_indices:
-                         print(f"警告(施設モデル): REQUIRED_STAFFING の対象フロア '{floor}' の従業員が見つかりません。ルールスキップ: {rule}")
-                         continue
-
-                    for d_idx, current_date in enumerate(date_range):
-                        if match_date_type(current_date, date_type, jp_holidays):
-                            actual_staff_count_expr = cp_model.LinearExpr.Sum(
-                                [shifts[(e_idx, d_idx)] == target_shift_int for e_idx in target_employee_indices]
-                            )
-
-                            if is_hard:
-                                # ★修正: ハード制約の場合、人数を min_count に一致させる
-                                model.Add(actual_staff_count_expr == min_count)
-                                # ★削除: is_hard=True の場合の超過ペナルティは不要になる
-                            else:
-                                # ソフト制約: 不足と超過の両方にペナルティ (既存のまま)
-                                max_possible_shortage = min_count
-                                shortage_var = model.NewIntVar(0, max_possible_shortage, f'short_staff_s_f{floor}_s{target_shift_sym}_d{d_idx}')
-                                model.Add(min_count - actual_staff_count_expr <= shortage_var)
-                                total_staffing_penalties.append(shortage_var)
-
-                                max_possible_excess = len(target_employee_indices)
-                                excess_var = model.NewIntVar(0, max_possible_excess, f'over_staff_s_f{floor}_s{target_shift_sym}_d{d_idx}')
-                                model.Add(actual_staff_count_expr - min_count <= excess_var)
-                                over_staffing_penalties.append(excess_var)
-                    processed_facility_rules.add(rule_key)
             elif rule_type == 'FORBID_SHIFT_SEQUENCE':
                 preceding_shift_sym = rule.get('preceding_shift')
                 subsequent_shift_sym = rule.get('subsequent_shift')
@@ -567,9 +513,8 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
                             model.Add(shifts[(e_idx, d_idx + 1)] != sub_shift_int).OnlyEnforceIf(lit_sub_eq.Not())
 
                             model.AddBoolAnd([lit_pre_eq, lit_sub_eq]).OnlyEnforceIf(violation_var)
-                            # If not violating, at least one must be false (or violation_var is false)
-                            model.AddImplication(violation_var.Not(), model.BoolOr([lit_pre_eq.Not(), lit_sub_eq.Not()])) 
-                            # This might still not be perfect for penalty. More direct: Add (lit_pre_eq * lit_sub_eq) to penalty.
+                            # 両方が一致したら violation_var を True にする (無いとペナルティが常に 0 になる)
+                            model.AddBoolOr([lit_pre_eq.Not(), lit_sub_eq.Not(), violation_var])
                             forbid_sequence_penalties.append(violation_var) # Assuming weight of 1 for now
 
                     processed_rule_types.add(rule_key)
@@ -582,16 +527,67 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
 
     # <<< ここまで施設全体ルールの処理 >>>
 
+    # <<< 公平性 (グループ単位の回数ルール: src/fairness.py) >>>
+    # 回数の変数は shift_counts を共有し、均等化は定式化 (FAIRNESS_FORMULATION) に応じた偏りの変数を1ルールにつき1つ作る
+    formulation = resolve_formulation()
+    for fairness_rule in normalize_fairness_rules(facility_rules):
+        group_name = fairness_rule['group']
+        target_employee_indices = get_employees_by_group(employees_df, group_name, emp_id_to_idx, group_indices)
+        if fairness_rule['rule_type'] == 'MIN_TOTAL_SHIFT_DAYS':
+            if not target_employee_indices:
+                print(f"警告(施設モデル): MIN_TOTAL_SHIFT_DAYS の対象グループ '{group_name}' が見つかりません。ルールスキップ: {fairness_rule['rule']}")
+                continue
+            min_days = fairness_rule['min_count']
+            for e_idx_facility in target_employee_indices:
+                actual_shift_count_expr = shift_counts.count(e_idx_facility, fairness_rule['shift_ints'])
+                if fairness_rule['is_hard']:
+                    model.Add(actual_shift_count_expr >= min_days)
+                else:
+                    shortage_var = model.NewIntVar(0, min_days, f"fac_min_total_short_e{e_idx_facility}_s{'_'.join(fairness_rule['shift_syms'])}")
+                    model.Add(min_days - actual_shift_count_expr <= shortage_var)
+                    facility_min_total_shift_penalties.append(shortage_var)
+        elif len(target_employee_indices) > 1:
+            imbalance = add_group_balance(model, shift_counts, target_employee_indices, fairness_rule['shift_ints'], fairness_rule['date_type'],
+                                          formulation, name=f"bal_{group_name}_{'_'.join(fairness_rule['shift_syms'])}_{fairness_rule['date_type']}")
+            penalty_list = balance_off_days_penalties if fairness_rule['rule_type'] == 'BALANCE_OFF_DAYS' else balance_shift_totals_penalties
+            penalty_list.append(imbalance * fairness_rule['unit'])
+        else:
+            print(f"警告(施設モデル): 対象者が1名以下のため {fairness_rule['rule_type']} ルールはスキップ: {fairness_rule['rule']}")
+    print(f"Fairness rules applied ({formulation}, shared count variables: {shift_counts.num_count_vars}).")
+
+    # <<< 人員配置・役割の出勤 (REQUIRED_STAFFING / MIN_ROLE_ON_DUTY: src/coverage.py) >>>
+    # (対象, シフト, 日) ごとの需要表にまとめ、セルごとに人数の式を1つ作って下限・上限を1回だけ追加する
+    floors = employees_df['担当フロア'].fillna('').astype(str).tolist() if '担当フロア' in employees_df.columns else [''] * num_employees
+    if coverage_group_indices is None:
+        coverage_group_indices = group_indices
+    coverage_members_cache = {}
+    def members_of(kind, target):
+        if (kind, target) not in coverage_members_cache:
+            coverage_members_cache[(kind, target)] = coverage_members(kind, target, floors, coverage_group_indices)
+        return coverage_members_cache[(kind, target)]
+    coverage_demand = compile_coverage(facility_rules, num_days, days_of_type)
+    print_coverage_report(coverage_demand, members_of, date_range)
+    coverage_penalties = add_coverage_constraints(model, shift_counts, coverage_demand, members_of)
+    total_staffing_penalties.extend(coverage_penalties['staffing_shortage'])
+    min_role_penalties.extend(coverage_penalties['min_role'])
+    over_staffing_penalties.extend(coverage_penalties['over_staffing'])
+
     # <<< 既存の全体ルールのうち、AI解釈に置き換えられないもの >>>
     # 直前勤務 (#3) は個人ルール側で処理される想定
     # 夜勤ローテーション (#5) は ENFORCE_SHIFT_SEQUENCE で代替想定 (現状ハードコード)
     # -> 夜勤ローテのハードコードは残す (ENFORCE_SHIFT_SEQUENCE が facility_rules になければ)
-    night_seq_enforced_by_rule = any(r.get('rule_type') == 'ENFORCE_SHIFT_SEQUENCE' and r.get('employee_group') == 'ALL' for r in facility_rules)
+    night_seq_enforced_by_rule = any(r.get('structured_data', r).get('rule_type') == 'ENFORCE_SHIFT_SEQUENCE' and r.get('structured_data', r).get('employee_group') == 'ALL'
+                                     for r in facility_rules)
     if not night_seq_enforced_by_rule:
         print("Applying hardcoded night rotation rule (no facility rule found).")
     for e_idx in all_employees:
         emp_info = get_employee_info(employees_df, emp_idx_to_id.get(e_idx))
         if emp_info is not None and emp_info.get('status') in ['育休', '病休']: continue
+        # 期間開始前からの持ち越し: 前日が夜勤なら初日は明け、前日が明けなら初日は公休
+        if boundary_state['pending_ake'][e_idx]:
+            model.Add(shifts[(e_idx, 0)] == SHIFT_MAP_INT['明'])
+        elif boundary_state['last_shift'][e_idx] == SHIFT_MAP_INT['明']:
+            model.Add(shifts[(e_idx, 0)] == SHIFT_MAP_INT['公'])
         for d_idx in range(num_days - 1):
             b_night = model.NewBoolVar(f'b_n_e{e_idx}d{d_idx}_hc')
             model.Add(shifts[(e_idx, d_idx)] == SHIFT_MAP_INT['夜']).OnlyEnforceIf(b_night)
@@ -602,15 +598,7 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
             model.Add(shifts[(e_idx, d_idx)] != SHIFT_MAP_INT['明']).OnlyEnforceIf(b_ake.Not())
             model.Add(shifts[(e_idx, d_idx + 1)] == SHIFT_MAP_INT['公']).OnlyEnforceIf(b_ake)
 
-    # 人員配置基準 (#4) - ハードコード部分をコメントアウト (REQUIRED_STAFFINGルールで代替)
-    # personnel_key_map = ...
-    # total_required_personnel = ...
-    # ... (ループと制約追加)
-
-    # 副主任勤務 (#14) - ハードコード部分をコメントアウト (MIN_ROLE_ON_DUTYルールで代替)
-    # vice_manager_indices = ...
-    # if vice_manager_indices:
-    #    ... (ループと制約追加)
+    # 人員配置基準 (#4)・副主任勤務 (#14) のハードコードは REQUIRED_STAFFING / MIN_ROLE_ON_DUTY (上の需要表) で代替
 
     # 明け人数均等化 (ソフト#3) はスコープ外
     # 応援最小化 (ソフト#2) は目的関数で直接扱う？（現状ハードコード） -> そのまま
@@ -619,36 +607,38 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
     objective_terms = []
     # 各ペナルティリスト名と重み
     helping_penalties = list(is_helping_1F_to_2F.values()) + list(is_helping_2F_to_1F.values()) # 辞書の値(BoolVar)をリスト化
-    penalties_with_weights = [
-        (ab_schedule_penalties, 1),
-        (weekday_penalties, 1),
-        (night_preference_penalties, 1),
-        (max_consecutive_work_penalties, 1),
-        (max_consecutive_off_penalties, 1),
-        (total_shift_count_penalties, 1),
-        (balance_off_days_penalties, 1),
-        (ake_count_deviation_penalties, 1),
-        (total_staffing_penalties, 100), # 不足ペナルティ (重みを仮に100とする)
-        (over_staffing_penalties, 10),   # ★超過ペナルティ (重みを仮に10とする)
-        (min_role_penalties, 1),
-        (forbid_sequence_penalties, 1),
-        (enforce_sequence_penalties, 1),
-        (helping_penalties, 1), # ★応援ペナルティを追加 (重みは仮に1)
-        (facility_min_total_shift_penalties, 10),
-        (facility_max_consecutive_work_penalties, 5),
-        # balance_specific_shift_penalties is handled differently as it's already weighted
-    ]
+    # カテゴリ名 -> ペナルティリスト (重みは PENALTY_WEIGHTS)。カテゴリ別の合計は求解後の集計 (スケジュールカタログ) に使う
+    penalty_lists = {
+        'ab_schedule': ab_schedule_penalties,
+        'weekday': weekday_penalties,
+        'date_set': date_set_penalties,
+        'night_preference': night_preference_penalties,
+        'max_consecutive_work': max_consecutive_work_penalties,
+        'max_consecutive_off': max_consecutive_off_penalties,
+        'total_shift_count': total_shift_count_penalties,
+        'balance_off_days': balance_off_days_penalties,
+        'balance_shift_totals': balance_shift_totals_penalties,
+        'ake_count_deviation': ake_count_deviation_penalties,
+        'staffing_shortage': total_staffing_penalties,
+        'over_staffing': over_staffing_penalties,
+        'min_role': min_role_penalties,
+        'forbid_sequence': forbid_sequence_penalties,
+        'enforce_sequence': enforce_sequence_penalties,
+        'helping': helping_penalties,
+        'facility_min_total_shift': facility_min_total_shift_penalties,
+        'facility_max_consecutive_work': facility_max_consecutive_work_penalties,
+    }
 
     # 目的関数にペナルティ項を追加
-    for penalty_list, weight in penalties_with_weights:
+    penalty_exprs = {} # カテゴリ名 -> 重み付き合計の式
+    for category, penalty_list in penalty_lists.items():
+         weight = PENALTY_WEIGHTS[category]
          if penalty_list:
              # リスト内の各要素(IntVar or BoolVar)に重みを掛けて合計
              # BoolVarもIntVarと同様にSumできる (True=1, False=0)
              weighted_terms = [term * weight for term in penalty_list]
-             objective_terms.append(cp_model.LinearExpr.Sum(weighted_terms))
-
-    # if off_days_difference is not None: # 公休均等化はコメントアウト中
-    #     objective_terms.append(off_balance_penalty_weight * off_days_difference)
+             penalty_exprs[category] = cp_model.LinearExpr.Sum(weighted_terms)
+             objective_terms.append(penalty_exprs[category])
 
     if objective_terms:
         model.Minimize(cp_model.LinearExpr.Sum(objective_terms))
@@ -658,7 +648,7 @@ def build_shift_model(employees_df, past_shifts_df, date_range, jp_holidays, per
         print("No objective function set.")
 
     print("Constraints added.")
-    return model, shifts, employee_ids, date_range 
+    return model, shifts, employee_ids, date_range, penalty_exprs
 
 
 # --- ヘルパー関数 (新規追加/修正) ---
@@ -680,10 +670,16 @@ def match_date_type(target_date: date, date_type: str, jp_holidays: set) -> bool
     except ValueError:
         return False # 不明なタイプ
 
-def get_employees_by_group(employees_df, group_name, emp_id_to_idx):
-    """指定されたグループ名に属する従業員のインデックスリストを返す"""
+def resolve_date_type_days(date_range, date_type: str, jp_holidays: set) -> list:
+    """期間内で日付タイプに一致する日のインデックスのリストを返す"""
+    return [d_idx for d_idx, current_date in enumerate(date_range) if match_date_type(current_date, date_type, jp_holidays)]
+
+def get_employees_by_group(employees_df, group_name, emp_id_to_idx, group_indices=None):
+    """指定されたグループ名に属する従業員のインデックスリストを返す (group_indices にあればそれを使う)"""
+    if group_indices and group_name in group_indices:
+        return list(group_indices[group_name])
     target_indices = []
-    for idx, eid in emp_id_to_idx.items():
+    for eid, idx in emp_id_to_idx.items(): # emp_id_to_idx は {職員ID: インデックス}
         emp_info = get_employee_info(employees_df, eid)
         # ここも is not None でチェック (前回修正済みのはず)
         if emp_info is None: continue
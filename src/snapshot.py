@@ -0,0 +1,209 @@
+# 入力データのバイナリスナップショット (従業員情報・勤務履歴・祝日・グループ索引)
+# 初回の読み込み後に NumPy 配列 (.npy) として保存し、元ファイルが変わっていなければそれを読み込んで
+# CSV のパースや祝日計算を省略する (勤務履歴の行列とグループ索引は mmap。従業員表の文字列列は pandas の object 列にコピーする)。
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import holidays
+import numpy as np
+import pandas as pd
+
+from src.constants import (
+    EMPLOYEE_INFO_FILE, PAST_SHIFT_FILE, OUTPUT_DIR,
+    HISTORY_FILE, HISTORY_FROM_RESULTS, HISTORY_MAX_DAYS, SNAPSHOT_DIR
+)
+from src.data_loader import load_employee_data
+from src.history import ShiftHistory, load_shift_history, find_previous_result_files
+from src.utils import get_holidays, build_group_indices
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_META_FILE = "meta.json"
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _source_record(path):
+    stat = os.stat(path)
+    return {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": _file_sha256(path)}
+
+def list_snapshot_sources(start_date, employee_file=EMPLOYEE_INFO_FILE, past_shift_file=PAST_SHIFT_FILE,
+                          history_file=HISTORY_FILE, output_dir=OUTPUT_DIR if HISTORY_FROM_RESULTS else None):
+    """スナップショットの元になる (存在する) 入力ファイルのリスト"""
+    sources = [employee_file]
+    if output_dir:
+        sources += find_previous_result_files(output_dir, start_date)
+    sources += [path for path in (history_file, past_shift_file) if path and os.path.exists(path)]
+    return sources
+
+def snapshot_path(start_date, end_date, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, f"{start_date:%Y%m%d}_{end_date:%Y%m%d}")
+
+def _settings(start_date, end_date):
+    """入力ファイル以外でスナップショットの内容を左右する設定"""
+    return {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+        "history_max_days": HISTORY_MAX_DAYS, "holidays_version": holidays.__version__,
+    }
+
+def is_snapshot_valid(meta, sources, start_date, end_date):
+    """
+    スナップショットが現在の入力と一致するか。
+    ファイルの更新時刻とサイズが記録と同じならハッシュ計算を省略し、違う場合だけ内容のハッシュで比較する
+    (一致すれば meta の更新時刻を書き換える。保存し直すのは呼び出し側 (write_snapshot_meta))。
+    """
+    if meta.get("settings") != _settings(start_date, end_date):
+        return False
+    recorded = meta.get("sources", [])
+    if [record["path"] for record in recorded] != list(sources):
+        return False
+    for record in recorded:
+        try:
+            stat = os.stat(record["path"])
+        except OSError:
+            return False
+        if stat.st_mtime_ns == record["mtime_ns"] and stat.st_size == record["size"]:
+            continue
+        if stat.st_size != record["size"] or _file_sha256(record["path"]) != record["sha256"]:
+            return False
+        record["mtime_ns"] = stat.st_mtime_ns # 内容は同じ (touch されただけ)
+    return True
+
+def write_snapshot_meta(path, meta):
+    """meta.json を一時ファイルに書いてから置き換える (読み込み中のプロセスが書きかけの meta を見ないように)"""
+    meta_file = os.path.join(path, SNAPSHOT_META_FILE)
+    tmp_file = f"{meta_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, meta_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def _to_fixed_width_strings(values):
+    """文字列の列を NumPy の固定長文字列配列にする (欠損値は空文字)"""
+    return np.array(['' if pd.isna(value) else str(value) for value in values], dtype=str)
+
+def write_snapshot(path, sources, start_date, end_date, employees_df, shift_history, jp_holidays, group_indices):
+    """スナップショットを一時ディレクトリに書いてから置き換える (読み込み中のプロセスが壊れた状態を見ないように)"""
+    parent = os.path.dirname(path) or '.'
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".snapshot_")
+    try:
+        columns = []
+        for i, col in enumerate(employees_df.columns):
+            values = employees_df[col]
+            if values.dtype == bool:
+                np.save(os.path.join(tmp_dir, f"employee_{i}.npy"), values.to_numpy(dtype=bool))
+                columns.append({"name": col, "type": "bool"})
+            else:
+                np.save(os.path.join(tmp_dir, f"employee_{i}.npy"), _to_fixed_width_strings(values))
+                columns.append({"name": col, "type": "str"})
+
+        np.save(os.path.join(tmp_dir, "history.npy"), shift_history.matrix)
+        np.save(os.path.join(tmp_dir, "history_dates.npy"), np.array([d.toordinal() for d in shift_history.dates], dtype=np.int32))
+
+        holiday_items = sorted(jp_holidays.items())
+        np.save(os.path.join(tmp_dir, "holiday_dates.npy"), np.array([d.toordinal() for d, _ in holiday_items], dtype=np.int32))
+        np.save(os.path.join(tmp_dir, "holiday_names.npy"), _to_fixed_width_strings([name for _, name in holiday_items]))
+
+        # グループ索引は1本の配列に連結し、グループごとの (開始位置, 件数) を meta に持つ
+        group_offsets = {}
+        group_members = []
+        for name, indices in group_indices.items():
+            group_offsets[name] = [len(group_members), len(indices)]
+            group_members.extend(indices)
+        np.save(os.path.join(tmp_dir, "group_members.npy"), np.array(group_members, dtype=np.int32))
+
+        meta = {
+            "settings": _settings(start_date, end_date),
+            "sources": [_source_record(source) for source in sources],
+            "employee_columns": columns,
+            "group_offsets": group_offsets,
+        }
+        with open(os.path.join(tmp_dir, SNAPSHOT_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def read_snapshot(path, meta):
+    """
+    スナップショットを読み込み、(employees_df, shift_history, jp_holidays, group_indices) を返す。
+    配列は mmap で開く。勤務履歴の行列はそのまま使い、従業員表の文字列列は欠損値を扱うため object 列にコピーする (職員数ぶんだけ)。
+    """
+    def load(name):
+        return np.load(os.path.join(path, name), mmap_mode='r')
+
+    employees_df = pd.DataFrame({
+        column["name"]: load(f"employee_{i}.npy") for i, column in enumerate(meta["employee_columns"])
+    })
+    for column in meta["employee_columns"]:
+        if column["type"] == "str":
+            values = employees_df[column["name"]].astype(object)
+            employees_df[column["name"]] = values.where(values != '') # 空文字は欠損値 (CSV読み込み時と同じ)
+
+    history_dates = [date.fromordinal(int(ordinal)) for ordinal in load("history_dates.npy")]
+    shift_history = ShiftHistory(employees_df['職員ID'].tolist(), history_dates, load("history.npy"))
+
+    jp_holidays = dict(zip((date.fromordinal(int(o)) for o in load("holiday_dates.npy")), load("holiday_names.npy").tolist()))
+
+    group_members = load("group_members.npy")
+    group_indices = {name: group_members[offset:offset + count].tolist() for name, (offset, count) in meta["group_offsets"].items()}
+    return employees_df, shift_history, jp_holidays, group_indices
+
+def load_inputs(start_date, end_date, employee_file=EMPLOYEE_INFO_FILE, past_shift_file=PAST_SHIFT_FILE, history_file=HISTORY_FILE,
+                output_dir=OUTPUT_DIR if HISTORY_FROM_RESULTS else None, use_snapshot=True, snapshot_dir=SNAPSHOT_DIR, verbose=False):
+    """
+    従業員情報・勤務履歴・祝日・グループ索引を読み込む。
+    use_snapshot が True なら、入力が変わっていない限りスナップショットを使い、変わっていれば読み込み直して保存し直す。
+    戻り値は (employees_df, shift_history, jp_holidays, group_indices)。従業員情報が読めない場合は None。
+    """
+    sources = list_snapshot_sources(start_date, employee_file, past_shift_file, history_file, output_dir)
+    path = snapshot_path(start_date, end_date, snapshot_dir)
+    meta_file = os.path.join(path, SNAPSHOT_META_FILE)
+    if use_snapshot and os.path.exists(meta_file):
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            recorded_mtimes = [record.get("mtime_ns") for record in meta.get("sources", [])]
+            if is_snapshot_valid(meta, sources, start_date, end_date):
+                loaded = read_snapshot(path, meta)
+                if [record["mtime_ns"] for record in meta["sources"]] != recorded_mtimes:
+                    # 内容が同じで更新時刻だけ変わったファイルがあれば、次回からハッシュ計算を省略できるよう記録し直す
+                    try:
+                        write_snapshot_meta(path, meta)
+                    except OSError as e:
+                        print(f"警告: スナップショットの meta.json を更新できませんでした: {e}")
+                print(f"入力スナップショットを読み込みました: {path} (従業員 {len(loaded[0])} 名, 勤務履歴 {loaded[1].num_days} 日)")
+                return loaded
+            print("情報: 入力ファイルが変更されているため、スナップショットを作り直します。")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"警告: スナップショットの読み込みに失敗しました。CSVから読み込みます: {e}")
+
+    employees_df = load_employee_data(employee_file, verbose=verbose)
+    if employees_df is None:
+        return None
+    shift_history = load_shift_history(employees_df, start_date, past_shift_file, history_file, output_dir)
+    jp_holidays = get_holidays(start_date.year, end_date.year)
+    group_indices = build_group_indices(employees_df)
+    if use_snapshot:
+        try:
+            write_snapshot(path, sources, start_date, end_date, employees_df, shift_history, jp_holidays, group_indices)
+            print(f"入力スナップショットを保存しました: {path}")
+        except OSError as e:
+            print(f"警告: スナップショットの保存に失敗しました: {e}")
+    return employees_df, shift_history, jp_holidays, group_indices
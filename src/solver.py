@@ -1,12 +1,18 @@
 # ソルバー実行
 from ortools.sat.python import cp_model
+from src.constants import SOLVER_NUM_WORKERS, SOLVER_MAX_TIME_SEC
 
-def solve_shift_model(model):
-    """CP-SATモデルを解き、ステータスとソルバーオブジェクトを返す"""
-    print("Solver started...")
+def solve_shift_model(model, num_workers=SOLVER_NUM_WORKERS, max_time_sec=SOLVER_MAX_TIME_SEC):
+    """
+    CP-SATモデルを解き、ステータスとソルバーオブジェクトを返す。
+    num_workers は探索ワーカー数 (0 はソルバー任せ)。複数施設を並列に解く場合は施設ごとにCPUを分けて渡す。
+    """
+    print(f"Solver started... (workers: {num_workers or 'auto'})")
     solver = cp_model.CpSolver()
-    # タイムリミットを設定 (例: 60秒)
-    # solver.parameters.max_time_in_seconds = 60.0
+    if num_workers:
+        solver.parameters.num_workers = num_workers
+    if max_time_sec is not None:
+        solver.parameters.max_time_in_seconds = float(max_time_sec)
     # 探索ログを表示する場合
     # solver.parameters.log_search_progress = True
     status = solver.Solve(model)
@@ -1,13 +1,55 @@
 # ユーティリティ関数
 from datetime import date, timedelta
+import os
 import holidays
 from src.constants import MANAGER_ROLES # 役職名を使う場合
+from src.constants import (
+    EMPLOYEE_INFO_FILE, PAST_SHIFT_FILE, HISTORY_FILE, RULES_FILE, FACILITY_RULES_FILE,
+    OUTPUT_DIR, RULE_STORE_FILE, SNAPSHOT_DIR, SCHEDULE_CATALOG_FILE
+)
 import pandas as pd
 
 def get_date_range(start_date, end_date):
     """指定された期間の日付リストを生成する"""
     return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
 
+def past_date_key(target_date):
+    """直前勤務実績CSVの日付列名 ('4/7' 形式, 月日ともゼロ埋めなし)。strftime('%#m/%#d') は Windows 専用のため使わない"""
+    return f"{target_date.month}/{target_date.day}"
+
+def parse_period_date(text, date_range):
+    """YYYY-MM-DD または M/D (期間内の日付) を date にする。見つからなければ None"""
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    month_day = text.split('/')
+    if len(month_day) == 2 and all(part.isdigit() for part in month_day):
+        for d in date_range:
+            if (d.month, d.day) == (int(month_day[0]), int(month_day[1])):
+                return d
+    return None
+
+def facility_paths(base_dir=None):
+    """
+    施設フォルダを基準にした入出力パスの辞書を返す。
+    施設フォルダはリポジトリ直下と同じ構成 (input/, results/, db/) とする。base_dir が None ならリポジトリ直下の既定パス。
+    """
+    paths = {
+        'employee_file': EMPLOYEE_INFO_FILE,
+        'past_shift_file': PAST_SHIFT_FILE,
+        'history_file': HISTORY_FILE,
+        'rules_file': RULES_FILE,
+        'facility_rules_file': FACILITY_RULES_FILE,
+        'output_dir': OUTPUT_DIR,
+        'rule_store_file': RULE_STORE_FILE,
+        'snapshot_dir': SNAPSHOT_DIR,
+        'catalog_file': SCHEDULE_CATALOG_FILE,
+    }
+    if base_dir is None:
+        return paths
+    return {key: os.path.join(base_dir, path) for key, path in paths.items()}
+
 def get_holidays(start_year, end_year):
     """指定された年の日本の祝日を取得する"""
     jp_holidays = holidays.JP(years=start_year) # holidays v0.44 では years を使う
@@ -31,6 +73,25 @@ def get_employee_info(employees_df, emp_id):
         return emp_data.iloc[0]
     return None 
 
+def build_group_indices(employees_df):
+    """
+    グループ名 -> 従業員インデックス (employees_df の行順) のリストの辞書を作る。
+    グループは ALL / 常勤 / パート / 各役職名で、育休・病休の職員は含めない (shift_model.get_employees_by_group と同じ判定)。
+    対象者がいないグループはキーを作らない。
+    """
+    active = ~employees_df['status'].isin(['育休', '病休']) if 'status' in employees_df.columns else pd.Series(True, index=employees_df.index)
+    job_type = employees_df['常勤/パート'].astype(str) if '常勤/パート' in employees_df.columns else pd.Series('', index=employees_df.index)
+    positions = pd.Series(range(len(employees_df)), index=employees_df.index)
+    masks = {
+        'ALL': active,
+        '常勤': active & (job_type == '常勤'),
+        'パート': active & job_type.str.contains('パート', regex=False),
+    }
+    if '役職' in employees_df.columns:
+        for role in employees_df.loc[active, '役職'].dropna().unique():
+            masks[role] = active & (employees_df['役職'] == role)
+    return {name: positions[mask].tolist() for name, mask in masks.items() if mask.any()}
+
 def get_employees_by_group(employees_df, group_name, emp_id_to_idx):
     """指定されたグループ名に属する従業員のインデックスリストを返す"""
     print(f"DEBUG (get_employees_by_group): Requesting group: '{group_name}'")
@@ -0,0 +1,113 @@
+# 目的関数の重み (ペナルティのカテゴリ別の重みのプロファイルと、AIが付けたルールの weight の整数化)
+# CP-SAT は係数の幅が小さいほど下界の推論が効き、最適性を証明しやすい。カテゴリの重みは OBJECTIVE_WEIGHT_MAX 以下、
+# ルールの weight は 1〜RULE_WEIGHT_SCALE_MAX の整数に収める。
+import json
+import os
+
+from src.constants import WEIGHT_PROFILE, WEIGHT_PROFILES_FILE, OBJECTIVE_WEIGHT_MAX, RULE_WEIGHT_SCALE_MAX
+
+# 組み込みのプロファイル。'default' は全カテゴリの重みを持ち、他のプロファイルと設定ファイルのプロファイルは差分だけを書く
+BUILTIN_WEIGHT_PROFILES = {
+    'default': {
+        'ab_schedule': 1,
+        'weekday': 1,
+        'date_set': 1,
+        'night_preference': 1,
+        'max_consecutive_work': 1,
+        'max_consecutive_off': 1,
+        'total_shift_count': 1,
+        'balance_off_days': 1,
+        'balance_shift_totals': 1, # BALANCE_SPECIFIC_SHIFT_TOTALS (夜勤・早出・休日の公休などの回数の均等化)
+        'ake_count_deviation': 1,
+        'staffing_shortage': 20, # 不足1人日がルールの weight の上限 (RULE_WEIGHT_SCALE_MAX) の希望1件より重くなるように
+        'over_staffing': 5,
+        'min_role': 1,
+        'forbid_sequence': 1,
+        'enforce_sequence': 1,
+        'helping': 1,
+        'facility_min_total_shift': 10,
+        'facility_max_consecutive_work': 5,
+        'schedule_change': 1, # 修正モード (src/repair.py) の既存シフト表からの変更セル数
+    },
+    'coverage_first': {'staffing_shortage': 50, 'over_staffing': 10, 'min_role': 10}, # 人員配置を最優先
+    'fairness_first': {'balance_off_days': 5, 'balance_shift_totals': 5, 'ake_count_deviation': 3}, # 回数の均等化を重視
+    'preference_first': {'ab_schedule': 3, 'weekday': 3, 'date_set': 3, 'night_preference': 3}, # 職員の希望を重視
+}
+
+
+def read_weight_profiles(path=WEIGHT_PROFILES_FILE):
+    """設定ファイル (JSON: {プロファイル名: {カテゴリ名: 重み}}) のプロファイルを読む。ファイルが無い・読めない場合は {}"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告(重み): 重みの設定ファイル {path} を読めませんでした: {e}")
+        return {}
+    if not isinstance(profiles, dict) or not all(isinstance(weights, dict) for weights in profiles.values()):
+        print(f"警告(重み): 重みの設定ファイル {path} は {{プロファイル名: {{カテゴリ名: 重み}}}} の形ではありません。無視します。")
+        return {}
+    return profiles
+
+
+def weight_profile_name():
+    """使う重みのプロファイル名 (環境変数 WEIGHT_PROFILE、無ければ定数 WEIGHT_PROFILE)"""
+    return os.getenv('WEIGHT_PROFILE', WEIGHT_PROFILE)
+
+
+def load_weight_profile(name=None, path=WEIGHT_PROFILES_FILE):
+    """
+    重みのプロファイルを読み、全カテゴリの重みの辞書を返す。name が None なら weight_profile_name()。
+    設定ファイルのプロファイルは同じ名前の組み込みプロファイルより優先し、書いていないカテゴリは 'default' の重みを使う。
+    不明なカテゴリは無視し、重みは 0〜OBJECTIVE_WEIGHT_MAX の整数に丸める。不明なプロファイル名は警告を出して 'default'。
+    """
+    name = name or weight_profile_name()
+    profiles = {**BUILTIN_WEIGHT_PROFILES, **read_weight_profiles(path)}
+    weights = dict(BUILTIN_WEIGHT_PROFILES['default'])
+    if name not in profiles:
+        print(f"警告(重み): 重みのプロファイル '{name}' はありません ({' / '.join(profiles)})。default を使います。")
+        return weights
+    for category, weight in profiles[name].items():
+        if category not in weights:
+            print(f"警告(重み): プロファイル '{name}' のカテゴリ '{category}' は不明です。無視します。")
+            continue
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+            print(f"警告(重み): プロファイル '{name}' の {category} の重み '{weight}' が数値ではありません。default の値を使います。")
+            continue
+        bounded = min(max(int(round(weight)), 0), OBJECTIVE_WEIGHT_MAX)
+        if bounded != weight:
+            print(f"情報(重み): プロファイル '{name}' の {category} の重み {weight} を {bounded} にしました (0〜{OBJECTIVE_WEIGHT_MAX} の整数)。")
+        weights[category] = bounded
+    return weights
+
+
+def scale_rule_weight(weight, default=1):
+    """
+    ルール (AIが付けた weight) の重みを 1〜RULE_WEIGHT_SCALE_MAX の整数にする。weight が無い・数値でなければ default。
+    0 以下はそのルールのペナルティを無効にする 0。端数は四捨五入し、1 未満の正の値は 1 とする。
+    """
+    if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+        return default
+    if weight <= 0:
+        return 0
+    return min(max(int(round(weight)), 1), RULE_WEIGHT_SCALE_MAX)
+
+
+def objective_shares(penalty_totals):
+    """カテゴリ別のペナルティ (重み付け後) の、目的関数値に占める割合 ({カテゴリ名: 0〜1}。合計が0なら {})"""
+    total = sum(penalty_totals.values())
+    if total <= 0:
+        return {}
+    return {category: value / total for category, value in sorted(penalty_totals.items(), key=lambda item: -item[1]) if value}
+
+
+def print_objective_shares(penalty_totals, weights):
+    """目的関数の内訳 (カテゴリ別のペナルティ・重み・割合) を表示する"""
+    shares = objective_shares(penalty_totals)
+    if not shares:
+        print("目的関数の内訳: ペナルティなし")
+        return
+    print(f"--- 目的関数の内訳 (合計 {sum(penalty_totals.values())}) ---")
+    for category, share in shares.items():
+        print(f"  {category:<30} {penalty_totals[category]:>8} (重み {weights.get(category, '-'):>3}) {share:6.1%}")
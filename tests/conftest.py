@@ -0,0 +1,35 @@
+# テスト共通の小さな施設 (2フロア × 5名、2週間、祝日なし) と施設ルール
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from src.constants import SHIFT_MAP_INT
+
+START = date(2025, 4, 7) # 月曜日
+
+
+def make_employees(statuses=None):
+    rows = []
+    for i in range(10):
+        rows.append({'職員ID': f'EMP{i + 1:03d}', '職員名': chr(ord('A') + i), '担当フロア': '1F' if i < 5 else '2F',
+                     '役職': '主任' if i in (0, 5) else None, '常勤/パート': '常勤', 'status': (statuses or {}).get(i),
+                     'can_help_other_floor': 0})
+    return pd.DataFrame(rows)
+
+
+def facility_rule(**rule):
+    return {'confirmation_text': '', 'structured_data': rule}
+
+
+@pytest.fixture
+def facility():
+    """(employees_df, date_range, jp_holidays, facility_rules)。フロアごとに毎日 夜1・日1 のハード制約"""
+    date_range = [START + timedelta(days=offset) for offset in range(14)]
+    facility_rules = [facility_rule(rule_type='REQUIRED_STAFFING', floor=floor, shift=shift, date_type='ALL', min_count=1, is_hard=True)
+                      for floor in ('1F', '2F') for shift in ('夜', '日')]
+    return make_employees(), date_range, set(), facility_rules
+
+
+def shift_int(sym):
+    return SHIFT_MAP_INT[sym]
@@ -0,0 +1,151 @@
+# AIクライアントのリトライ・サーキットブレーカー・ストリームの途切れ・プレフィックスキャッシュ (FakeBackend で障害を注入)
+import pytest
+
+from src.ai_client import (AIClient, FakeBackend, RecordingBackend, PromptPrefixCache, AICallError, AICircuitOpenError,
+                           AIStreamTruncatedError, prompt_hash, load_recorded_responses)
+
+
+def make_client(backend, **options):
+    sleeps = []
+    client = AIClient(backend, sleep=sleeps.append, **options)
+    return client, sleeps
+
+
+def test_transient_failures_are_retried_with_backoff():
+    backend = FakeBackend(responses={'step1': 'ok'}, fail_first_calls=2)
+    client, sleeps = make_client(backend, max_retries=3, backoff_base_sec=1.0, backoff_max_sec=10.0)
+    assert client.generate('prompt', label='step1') == 'ok'
+    assert backend.call_count == 3
+    assert sleeps == [1.0, 2.0]
+    assert client.stats['retries'] == 2 and client.stats['failures'] == 0
+
+
+def test_retries_stop_at_max_retries_and_budget():
+    backend = FakeBackend(responses={'step1': 'ok'}, fail_first_calls=10)
+    client, _ = make_client(backend, max_retries=2, breaker_threshold=100)
+    with pytest.raises(AICallError, match='リトライ上限'):
+        client.generate('prompt', label='step1')
+    assert backend.call_count == 3
+
+    backend = FakeBackend(responses={'step1': 'ok'}, fail_first_calls=10)
+    client, _ = make_client(backend, max_retries=5, retry_budget=1, breaker_threshold=100)
+    with pytest.raises(AICallError):
+        client.generate('prompt', label='step1')
+    assert backend.call_count == 2 and client.retry_budget == 0
+
+
+def test_missing_response_is_not_retried():
+    backend = FakeBackend(responses={})
+    client, sleeps = make_client(backend)
+    with pytest.raises(AICallError, match='録画済み応答'):
+        client.generate('prompt', label='unknown')
+    assert backend.call_count == 1 and sleeps == []
+
+
+def test_circuit_breaker_opens_and_rejects_without_calling_backend():
+    backend = FakeBackend(responses={'step1': 'ok'}, fail_first_calls=3)
+    client, _ = make_client(backend, max_retries=5, breaker_threshold=3, breaker_cooldown_sec=3600)
+    with pytest.raises(AICircuitOpenError):
+        client.generate('prompt', label='step1')
+    assert backend.call_count == 3
+    with pytest.raises(AICircuitOpenError):
+        client.generate('prompt', label='step1')
+    assert backend.call_count == 3 # 開いている間はバックエンドを呼ばない
+
+
+def test_circuit_breaker_half_opens_after_cooldown():
+    backend = FakeBackend(responses={'step1': 'ok'}, fail_first_calls=2)
+    client, _ = make_client(backend, max_retries=5, breaker_threshold=2, breaker_cooldown_sec=0.0)
+    with pytest.raises(AICircuitOpenError):
+        client.generate('prompt', label='step1')
+    assert client.generate('prompt', label='step1') == 'ok' # クールダウン経過後の1回が成功すれば閉じる
+    assert client._consecutive_failures == 0
+
+
+def test_stream_truncation_keeps_received_chunks():
+    backend = FakeBackend(responses={'step2': '[1, 2, 3, 4]'}, stream_chunk_chars=4, truncate_stream_at=8)
+    client, _ = make_client(backend)
+    received = []
+    with pytest.raises(AIStreamTruncatedError):
+        for chunk in client.generate_stream('prompt', label='step2'):
+            received.append(chunk)
+    assert ''.join(received) == '[1, 2, 3'
+    assert client.stats['truncated_streams'] == 1
+
+
+def test_prefix_cache_sends_prefix_once(tmp_path):
+    prefix, suffix = '指示文' * 10, '入力データ'
+    backend = FakeBackend(responses={prompt_hash(prefix + suffix): 'ok'})
+    cache = PromptPrefixCache(backend, min_tokens=1, index_file=str(tmp_path / 'prefix_cache.json'))
+    client, _ = make_client(backend, prefix_cache=cache)
+    assert client.generate(suffix, label='step1', static_prefix=prefix) == 'ok'
+    assert client.generate(suffix, label='step1', static_prefix=prefix) == 'ok'
+    assert client.stats['prefix_cache_misses'] == 1 and client.stats['prefix_cache_hits'] == 1
+    # 別のクライアント (次回実行) は索引ファイルのキャッシュを再利用する
+    assert PromptPrefixCache(backend, min_tokens=1, index_file=str(tmp_path / 'prefix_cache.json')).get(prefix) == (prefix, True)
+
+
+class FlakyPrefixBackend(FakeBackend):
+    """キャッシュ登録の先頭N回を一時障害 (または恒久的なエラー) にする"""
+
+    def __init__(self, prefix_failures, error=ConnectionError, **options):
+        super().__init__(**options)
+        self.prefix_failures = prefix_failures
+        self.error = error
+        self.prefix_calls = 0
+
+    def create_prefix_cache(self, prefix, ttl_sec, timeout):
+        self.prefix_calls += 1
+        if self.prefix_calls <= self.prefix_failures:
+            raise self.error(f"Injected prefix cache failure #{self.prefix_calls}")
+        return super().create_prefix_cache(prefix, ttl_sec, timeout)
+
+
+def test_prefix_cache_registration_is_retried(tmp_path):
+    prefix, suffix = '指示文' * 10, '入力データ'
+    backend = FlakyPrefixBackend(2, responses={prompt_hash(prefix + suffix): 'ok'})
+    client, sleeps = make_client(backend, prefix_cache=PromptPrefixCache(backend, min_tokens=1, index_file=str(tmp_path / 'index.json')))
+    assert client.generate(suffix, label='step1', static_prefix=prefix) == 'ok'
+    assert backend.prefix_calls == 3 and len(sleeps) == 2
+    assert client.stats['prefix_cache_misses'] == 1 and client.stats['failures'] == 0
+
+
+def test_prefix_cache_failure_falls_back_to_full_prompt(tmp_path):
+    prefix, suffix = '指示文' * 10, '入力データ'
+    backend = FlakyPrefixBackend(100, error=ValueError, responses={prompt_hash(prefix + suffix): 'ok'})
+    client, sleeps = make_client(backend, prefix_cache=PromptPrefixCache(backend, min_tokens=1, index_file=str(tmp_path / 'index.json')))
+    assert client.generate(suffix, label='step1', static_prefix=prefix) == 'ok'
+    assert client.generate(suffix, label='step1', static_prefix=prefix) == 'ok'
+    assert backend.prefix_calls == 1 and sleeps == [] # 恒久的なエラーはリトライせず、同じ実行中は登録し直さない
+    assert client.stats['failures'] == 0 and client.stats['prefix_cache_misses'] == 0
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_recorded_responses_replay_with_prefix_cache(tmp_path, stream):
+    # キャッシュ利用時に記録した応答は、プレフィックス+サフィックスのハッシュで再生できる
+    prefix, suffix = '指示文' * 10, '入力データ'
+    record_file = str(tmp_path / 'recorded.json')
+    backend = RecordingBackend(FakeBackend(responses={'step1': '[1, 2]'}), record_file)
+    client, _ = make_client(backend, prefix_cache=PromptPrefixCache(backend, min_tokens=1, index_file=str(tmp_path / 'index.json')))
+    response = ''.join(client.generate_stream(suffix, label='step1', static_prefix=prefix)) if stream \
+        else client.generate(suffix, label='step1', static_prefix=prefix)
+    assert response == '[1, 2]' and client.stats['prefix_cache_misses'] == 1
+    recorded = load_recorded_responses(record_file)
+    assert recorded[prompt_hash(prefix + suffix)] == '[1, 2]' and prompt_hash(suffix) not in recorded
+
+    replay = FakeBackend(responses={prompt_hash(prefix + suffix): recorded[prompt_hash(prefix + suffix)]})
+    replay_client, _ = make_client(replay, prefix_cache=PromptPrefixCache(replay, min_tokens=1, index_file=None))
+    assert replay_client.generate(suffix, label='other', static_prefix=prefix) == '[1, 2]'
+
+
+def test_importing_scripts_does_not_create_client(monkeypatch):
+    # repair_schedule.py などは shift_generator を import するだけで、AIクライアントは main() で初めて作る
+    import shift_generator
+    monkeypatch.setattr(shift_generator, 'ai_client', None)
+    monkeypatch.setenv('AI_BACKEND', 'fake')
+    monkeypatch.setenv('AI_FAKE_RESPONSES_FILE', '')
+    import repair_schedule, batch_generator
+    assert shift_generator.ai_client is None
+    client = shift_generator.init_ai_client()
+    assert isinstance(client, AIClient) and isinstance(client.backend, FakeBackend)
+    assert shift_generator.init_ai_client() is client
@@ -0,0 +1,29 @@
+# 複数施設の一括実行: CPUの割り当てと施設フォルダの検出
+import pytest
+
+from src.constants import BATCH_MIN_WORKERS_PER_JOB
+from batch_generator import plan_cpu_budget, find_facilities
+
+
+@pytest.mark.parametrize('num_facilities, total_cpus, max_jobs, expected', [
+    (10, 16, None, (16 // BATCH_MIN_WORKERS_PER_JOB, BATCH_MIN_WORKERS_PER_JOB, 16)), # 1施設あたり下限のワーカー数を確保
+    (2, 16, None, (2, 8, 16)),   # 施設が少なければ余ったコアを施設に配る
+    (5, 2, None, (1, 2, 2)),     # コアが少なくても1施設ずつは解く
+    (5, 12, 5, (5, 2, 12)),      # 同時実行数を指定した場合は下限より優先
+    (0, 8, None, (1, 8, 8)),
+])
+def test_plan_cpu_budget(num_facilities, total_cpus, max_jobs, expected):
+    jobs, workers_per_job, cpus = plan_cpu_budget(num_facilities, total_cpus=total_cpus, max_jobs=max_jobs)
+    assert (jobs, workers_per_job, cpus) == expected
+    assert jobs * workers_per_job <= cpus
+
+
+def test_find_facilities_orders_by_employee_file_size(tmp_path, capsys):
+    for name, rows in (('a_small', 1), ('b_large', 30), ('c_medium', 10)):
+        (tmp_path / name / 'input').mkdir(parents=True)
+        (tmp_path / name / 'input' / 'employees.csv').write_text('職員ID\n' + 'EMP001\n' * rows, encoding='utf-8')
+    (tmp_path / 'd_empty').mkdir()
+    facilities = find_facilities(str(tmp_path))
+    assert [name for name, _ in facilities] == ['b_large', 'c_medium', 'a_small']
+    assert 'd_empty' in capsys.readouterr().out
+    assert find_facilities(str(tmp_path / 'none')) == []
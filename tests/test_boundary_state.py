@@ -0,0 +1,40 @@
+# 期間開始時点の境界状態 (直前の連勤・連休、前日のシフト、明けの持ち越し)
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from conftest import shift_int
+from src.boundary_state import compute_boundary_state_from_codes, compute_boundary_state, NO_SHIFT
+
+
+def codes(*rows):
+    return np.array([[NO_SHIFT if sym is None else shift_int(sym) for sym in row] for row in rows], dtype=np.int8)
+
+
+def test_streaks_and_last_shift():
+    state = compute_boundary_state_from_codes(codes(
+        ['公', '日', '早', '夜'],   # 3連勤中、前日が夜勤 -> 開始日は明け
+        ['日', '夜', '明', '公'],   # 明けは勤務、公休で途切れる
+        ['日', '公', '育休', '病休'], # 休みの記号はどれも連休に数える
+        ['日', '日', None, '日'],   # 記録のない日で連続が途切れる
+        ['早', '早', '早', '早'],   # 全日勤務
+    ))
+    assert state['work_streak'].tolist() == [3, 0, 0, 1, 4]
+    assert state['off_streak'].tolist() == [0, 1, 3, 0, 0]
+    assert state['last_shift'].tolist() == [shift_int('夜'), shift_int('公'), shift_int('病休'), shift_int('日'), shift_int('早')]
+    assert state['pending_ake'].tolist() == [True, False, False, False, False]
+
+
+def test_no_history_is_unknown():
+    state = compute_boundary_state_from_codes(np.empty((2, 0), dtype=np.int8))
+    assert state['last_shift'].tolist() == [NO_SHIFT, NO_SHIFT]
+    assert state['work_streak'].tolist() == [0, 0] and not state['pending_ake'].any()
+
+
+def test_boundary_state_from_past_shift_table():
+    # 開始日の前日から途切れずに続く列だけを使い、職員は employee_ids の順 (表に無い職員は記録なし)
+    past = pd.DataFrame({'職員ID': ['EMP002', 'EMP001'], '4/3': ['夜', '夜'], '4/5': ['日', '夜'], '4/6': ['日', '明']})
+    state = compute_boundary_state(past, ['EMP001', 'EMP002', 'EMP003'], date(2025, 4, 7))
+    assert state['work_streak'].tolist() == [2, 2, 0]
+    assert state['last_shift'].tolist() == [shift_int('明'), shift_int('日'), NO_SHIFT]
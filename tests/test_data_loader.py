@@ -0,0 +1,71 @@
+# CSVの型付き読み込み (文字コードの判定・cp932 への読み直し・列の型変換)
+from datetime import date
+
+import pytest
+
+from src.constants import CSV_SNIFF_BYTES
+from src import data_loader
+from src.data_loader import detect_encoding, read_csv_typed, load_employee_data, load_past_shifts, parse_date_column, EMPLOYEE_SCHEMA
+
+EMPLOYEE_CSV = "職員ID,職員名,担当フロア,役職,常勤/パート,status,can_help_other_floor\n" \
+               "007,山田, 1F ,主任,常勤,,可\n" \
+               "EMP002,佐藤,2F,,パート,育休,0\n"
+
+
+@pytest.mark.parametrize('encoding, expected', [('utf-8-sig', 'utf-8-sig'), ('utf-8', 'utf-8'), ('cp932', 'cp932')])
+def test_encoding_is_detected(tmp_path, encoding, expected):
+    path = tmp_path / 'employees.csv'
+    path.write_text(EMPLOYEE_CSV, encoding=encoding)
+    assert detect_encoding(str(path)) == expected
+    df = load_employee_data(str(path))
+    assert df.columns[0] == '職員ID' # BOM が列名に残らない
+    assert df['職員名'].tolist() == ['山田', '佐藤']
+
+
+def test_columns_are_typed_without_inference(tmp_path):
+    path = tmp_path / 'employees.csv'
+    path.write_text(EMPLOYEE_CSV, encoding='utf-8')
+    df = read_csv_typed(str(path), EMPLOYEE_SCHEMA, required_columns=['職員ID'])
+    assert df['職員ID'].tolist() == ['007', 'EMP002'] # 先頭の0が残る
+    assert df['担当フロア'].tolist() == ['1F', '2F'] # 前後の空白を除去
+    assert df['役職'].isna().tolist() == [False, True] # 空欄は欠損値
+    assert df['can_help_other_floor'].tolist() == [True, False]
+
+
+@pytest.mark.parametrize('use_pyarrow', [True, False])
+def test_non_utf8_after_sniffed_prefix_falls_back_to_cp932(tmp_path, monkeypatch, use_pyarrow):
+    if not use_pyarrow:
+        monkeypatch.setattr(data_loader, 'pa_csv', None) # pandas の C エンジンで読む場合
+    elif data_loader.pa_csv is None:
+        pytest.skip('pyarrow がありません')
+    # 判定に使う先頭部分は ASCII のみで、後半に cp932 の文字がある
+    filler = ''.join(f"EMP{i:05d},name{i}\n" for i in range(CSV_SNIFF_BYTES // 10))
+    path = tmp_path / 'employees.csv'
+    path.write_bytes(b"id,name\n" + filler.encode('ascii') + "EMP99999,鈴木\n".encode('cp932'))
+    assert len(filler) > CSV_SNIFF_BYTES and detect_encoding(str(path)) == 'utf-8'
+    df = read_csv_typed(str(path), {'id': 'str'}, required_columns=['id', 'name'])
+    assert df['id'].iloc[0] == 'EMP00000'
+    assert df['name'].iloc[-1] == '鈴木'
+
+
+def test_missing_required_columns_returns_none(tmp_path, capsys):
+    path = tmp_path / 'rules.csv'
+    path.write_text("職員名\n山田\n", encoding='utf-8')
+    assert read_csv_typed(str(path), {}, required_columns=['職員ID']) is None
+    assert '不足' in capsys.readouterr().out
+
+
+def test_past_shift_date_columns_are_normalized(tmp_path):
+    path = tmp_path / 'past.csv'
+    path.write_text("職員ID,2025/04/04,4-5,2025-04-06\nEMP001, 日 ,夜,明\n", encoding='cp932')
+    df = load_past_shifts(str(path), start_date=date(2025, 4, 7))
+    assert df.columns.tolist() == ['職員ID', '4/4', '4/5', '4/6']
+    assert df.iloc[0].tolist() == ['EMP001', '日', '夜', '明']
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('2025-04-07', date(2025, 4, 7)), ('2025/4/7', date(2025, 4, 7)), (' 2025/12/31 ', date(2025, 12, 31)),
+    ('4/7', None), ('2025/2/30', None), ('職員名', None),
+])
+def test_parse_date_column(name, expected):
+    assert parse_date_column(name) == expected
@@ -0,0 +1,53 @@
+# 回数の変数の共有表 (ShiftCounts) と、グループの回数の偏り (add_group_balance / group_imbalance)
+import pytest
+from ortools.sat.python import cp_model
+
+from conftest import shift_int
+from src.fairness import ShiftCounts, add_group_balance, group_imbalance
+
+# 3名 × 6日 (土日は 4, 5 日目)。夜勤の回数は 2, 0, 3
+ROWS = [['夜', '明', '公', '夜', '明', '公'],
+        ['日', '日', '公', '日', '早', '公'],
+        ['夜', '明', '夜', '明', '夜', '明']]
+DAYS_OF_TYPE = {'ALL': list(range(6)), '土日': [4, 5]}
+
+
+def fixed_model():
+    model = cp_model.CpModel()
+    shifts = {(e_idx, d_idx): model.NewConstant(shift_int(sym)) for e_idx, row in enumerate(ROWS) for d_idx, sym in enumerate(row)}
+    return model, ShiftCounts(model, shifts, DAYS_OF_TYPE.__getitem__)
+
+
+def test_count_variables_are_shared():
+    model, counts = fixed_model()
+    night, ake = shift_int('夜'), shift_int('明')
+    assert counts.count(0, [night, ake]) is counts.count(0, [ake, night, ake])
+    assert counts.count(0, [night]) is not counts.count(0, [night], '土日')
+    assert counts.indicator(0, 1, ake) is counts.indicator(0, 1, ake)
+    assert counts.num_count_vars == 3
+
+    # 回数の変数は求解の前に作っておく
+    totals = [counts.count(e_idx, [night, ake]) for e_idx in range(3)]
+    weekends = [counts.count(e_idx, [night], '土日') for e_idx in range(3)]
+    assert counts.num_count_vars == 7 # 職員 0 の2つは作り直さない
+    solver = cp_model.CpSolver()
+    assert solver.Solve(model) == cp_model.OPTIMAL
+    assert [solver.Value(var) for var in totals] == [4, 0, 6]
+    assert [solver.Value(var) for var in weekends] == [0, 0, 1]
+
+
+@pytest.mark.parametrize('formulation', ['min_max', 'deviation'])
+@pytest.mark.parametrize('date_type', ['ALL', '土日'])
+def test_group_balance_matches_evaluator(formulation, date_type):
+    model, counts = fixed_model()
+    balance = add_group_balance(model, counts, [0, 1, 2], [shift_int('夜')], date_type, formulation=formulation)
+    model.Minimize(balance)
+    solver = cp_model.CpSolver()
+    assert solver.Solve(model) == cp_model.OPTIMAL
+    night_counts = [sum(ROWS[e_idx][d_idx] == '夜' for d_idx in DAYS_OF_TYPE[date_type]) for e_idx in range(3)]
+    assert solver.Value(balance) == group_imbalance(night_counts, formulation)
+    assert group_imbalance([2, 0, 3], formulation) == 3 # min_max: 3 - 0、deviation: 中央値 2 からの差 0 + 2 + 1
+
+
+def test_group_imbalance_of_empty_group():
+    assert group_imbalance([], 'min_max') == 0 and group_imbalance([], 'deviation') == 0
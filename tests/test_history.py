@@ -0,0 +1,56 @@
+# 勤務履歴の読み込み (前期間のシフト表・履歴ファイル・直前勤務実績の重ね合わせ)
+import os
+from datetime import date, timedelta
+
+from conftest import make_employees, shift_int
+from src.boundary_state import NO_SHIFT
+from src.history import find_previous_result_files, load_shift_history
+
+START = date(2025, 5, 5)
+
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_previous_results_skip_empty_claimed_versions(tmp_path):
+    # 名前を確保したまま書き込みが終わらなかった (0バイトの) 版は最新の版として扱わない
+    first = write(tmp_path / 'shift_20250407.csv', '職員名,2025-04-07\n')
+    latest = write(tmp_path / 'shift_20250407_v01.csv', '職員名,2025-04-07\n')
+    write(tmp_path / 'shift_20250407_v02.csv', '')
+    write(tmp_path / 'shift_20250505.csv', '職員名,2025-05-05\n') # 開始日以降の版は使わない
+    older = write(tmp_path / 'shift_20250310.csv', '職員名,2025-03-10\n')
+    assert find_previous_result_files(str(tmp_path), START) == [older, latest]
+    os.remove(latest)
+    assert find_previous_result_files(str(tmp_path), START) == [older, first]
+
+
+def test_sources_are_layered_and_truncated(tmp_path):
+    # 前期間のシフト表 (職員名) < 履歴ファイル (職員ID) < 直前勤務実績 の順に同じ日を上書きする
+    employees_df = make_employees()
+    output_dir = tmp_path / 'results'
+    output_dir.mkdir()
+    write(output_dir / 'shift_20250407.csv', '職員名,2025-05-01,2025-05-02,2025-05-03,2025-05-04\n'
+                                              ',木,金,土,日\n'
+                                              'A,日,日,日,日\n'
+                                              'B,夜,明,公,早\n'
+                                              '日勤,1,1,1,1\n')
+    history_file = write(tmp_path / 'history.csv', '職員ID,2025-05-02,2025-05-03\nEMP001,公,公\nEMP099,夜,夜\n')
+    past_shift_file = write(tmp_path / 'past.csv', '職員ID,5/3,5/4,5/5\nEMP001,夜, 明 ,日\n')
+
+    history = load_shift_history(employees_df, START, past_shift_file, history_file, str(output_dir), max_days=62)
+    assert history.dates == [date(2025, 5, 1) + timedelta(days=offset) for offset in range(4)] # 記録のある最も古い日から
+    assert history.matrix[0].tolist() == [shift_int(sym) for sym in ('日', '公', '夜', '明')] # 開始日 (5/5) の列は使わない
+    assert history.matrix[1].tolist() == [shift_int(sym) for sym in ('夜', '明', '公', '早')]
+    assert (history.matrix[2:] == NO_SHIFT).all()
+    assert history.count_shifts([shift_int('公')]).tolist()[:2] == [1, 1]
+
+    short = load_shift_history(employees_df, START, past_shift_file, history_file, str(output_dir), max_days=2)
+    assert short.dates == [date(2025, 5, 3), date(2025, 5, 4)] and (short.matrix == history.tail(2)).all()
+
+
+def test_no_sources_gives_empty_history(tmp_path):
+    history = load_shift_history(make_employees(), START, str(tmp_path / 'none.csv'), None, None)
+    assert history.num_days == 0 and history.matrix.shape == (10, 0)
+    assert history.employee_ids == make_employees()['職員ID'].tolist()
@@ -0,0 +1,47 @@
+# ストリーミング応答のパーサーと、施設ルールの確認用文章との組み合わせ
+import json
+
+import shift_generator
+from src.ai_client import AIClient, FakeBackend
+from src.json_stream import IncrementalJSONParser
+
+
+def staffing(floor, shift, min_count):
+    return {'rule_type': 'REQUIRED_STAFFING', 'floor': floor, 'shift': shift, 'date_type': 'ALL', 'min_count': min_count, 'is_hard': True}
+
+
+def test_ordinals_when_one_chunk_closes_several_elements():
+    parser = IncrementalJSONParser()
+    assert parser.feed_indexed('```json\n[{"a": 1}, {"a"') == [(0, {'a': 1})]
+    assert parser.feed_indexed(': 2}, {"a": 3}, {"a": 4}]') == [(1, {'a': 2}), (2, {'a': 3}), (3, {'a': 4})]
+    assert parser.done and parser.elements_seen == 4
+
+
+def test_broken_element_keeps_later_ordinals():
+    parser = IncrementalJSONParser()
+    items = parser.feed_indexed('[{"a": 1}, {"a": }, {"a": 3}]')
+    assert items == [(0, {'a': 1}), (2, {'a': 3})]
+    assert len(parser.errors) == 1 and parser.elements_seen == 3 and parser.items_emitted == 2
+
+
+def test_feed_returns_items_without_ordinals():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"x": [1, 2], "y": 3}') == [('x', [1, 2]), ('y', 3)]
+
+
+def test_stream_pairs_rules_with_confirmation_texts(monkeypatch):
+    rules = [staffing('1F', '夜', 1), staffing('1F', '日', 2), staffing('2F', '夜', 1), staffing('2F', '日', 3)]
+    texts = ['1階は毎日夜勤1名', '1階は毎日日勤2名', '2階は夜勤が壊れた行', '2階は毎日日勤3名']
+    elements = [json.dumps(rule, ensure_ascii=False) for rule in rules]
+    elements[2] = '{"rule_type": "REQUIRED_STAFFING", "floor": }' # 壊れた要素
+    response = '[' + ', '.join(elements) + ']'
+    # 1チャンクで複数の要素が閉じるようにする
+    backend = FakeBackend(responses={'facility_step2': response}, stream_chunk_chars=len(response) // 2 + 1)
+    monkeypatch.setattr(shift_generator, 'ai_client', AIClient(backend, sleep=lambda _: None))
+
+    result = shift_generator.stream_structured_data_facility('\n'.join(texts), 'rules:\n{intermediate_confirmation_texts}', 2025)
+    assert result is not None
+    final_rules, counts = result
+    paired = [(entry['confirmation_text'], entry['structured_data']['floor'], entry['structured_data']['min_count']) for entry in final_rules]
+    assert paired == [(texts[0], '1F', 1), (texts[1], '1F', 2), (texts[3], '2F', 3)]
+    assert counts['valid'] == 3
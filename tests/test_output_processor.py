@@ -0,0 +1,103 @@
+# 解の行列の取り出し・回数の集計、行列からの出力 (npy・Parquet・JSON の書き出し) と出力ファイル名の確保
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from ortools.sat.python import cp_model
+
+from conftest import START, make_employees, shift_int
+from src import output_processor
+from src.output_processor import save_schedule_outputs, claim_output_path, extract_solution_matrix, count_shifts_per_employee, NUM_SHIFT_INTS
+
+DATE_RANGE = [START + timedelta(days=offset) for offset in range(3)]
+METADATA = {'status': 'OPTIMAL', 'objective': 12.0, 'input_hash': 'abc'}
+
+
+@pytest.fixture
+def matrix():
+    matrix = np.full((10, len(DATE_RANGE)), shift_int('公'), dtype=np.int8)
+    matrix[0] = [shift_int('夜'), shift_int('明'), shift_int('公')]
+    matrix[9, 2] = shift_int('日')
+    return matrix
+
+
+def test_extract_solution_matrix_matches_solver_values():
+    # 変数インデックスが (職員, 日) の順に並んでいなくても、セルごとの solver.Value と同じ行列になる
+    model = cp_model.CpModel()
+    rng = np.random.default_rng(0)
+    expected = rng.integers(0, NUM_SHIFT_INTS, size=(3, 4))
+    shifts = {}
+    for d_idx in reversed(range(4)):
+        for e_idx in range(3):
+            model.NewBoolVar(f'other_e{e_idx}_d{d_idx}')
+            shifts[(e_idx, d_idx)] = model.NewIntVar(0, NUM_SHIFT_INTS - 1, f'shift_e{e_idx}_d{d_idx}')
+            model.Add(shifts[(e_idx, d_idx)] == int(expected[e_idx, d_idx]))
+    solver = cp_model.CpSolver()
+    assert solver.Solve(model) == cp_model.OPTIMAL
+    matrix = extract_solution_matrix(solver, shifts, 3, 4)
+    assert matrix.dtype == np.int8 and (matrix == expected).all()
+    assert matrix.tolist() == [[solver.Value(shifts[(e_idx, d_idx)]) for d_idx in range(4)] for e_idx in range(3)]
+
+
+def test_count_shifts_per_employee(matrix):
+    counts = count_shifts_per_employee(matrix)
+    assert counts.shape == (10, NUM_SHIFT_INTS)
+    assert counts.tolist() == [[int((row == code).sum()) for code in range(NUM_SHIFT_INTS)] for row in matrix]
+    assert counts[0, shift_int('夜')] == 1 and counts[9, shift_int('公')] == 2
+
+
+def test_npy_and_json_outputs(tmp_path, matrix):
+    csv_path = str(tmp_path / 'shift_20250407.csv')
+    written = save_schedule_outputs(matrix, csv_path, make_employees(), DATE_RANGE, METADATA, formats=['npy', 'json'])
+    assert written == {'npy': str(tmp_path / 'shift_20250407.npy'), 'json': str(tmp_path / 'shift_20250407.json')}
+
+    loaded = np.load(written['npy'])
+    assert loaded.dtype == np.int8 and (loaded == matrix).all()
+    sidecar = json.loads((tmp_path / 'shift_20250407.meta.json').read_text(encoding='utf-8'))
+    assert sidecar['input_hash'] == 'abc' and sidecar['dates'] == ['2025-04-07', '2025-04-08', '2025-04-09']
+    assert sidecar['employee_ids'] == [f'EMP{i:03d}' for i in range(1, 11)]
+
+    document = json.loads((tmp_path / 'shift_20250407.json').read_text(encoding='utf-8'))
+    assert document['metadata'] == METADATA and document['dates'] == sidecar['dates']
+    assert document['employees'][0] == {'employee': 'EMP001', 'floor': '1F', 'shifts': ['夜', '明', '公']}
+    assert document['employees'][9]['floor'] == '2F' and document['employees'][9]['shifts'][2] == '日'
+    assert not list(tmp_path.glob('.*.tmp')) # 一時ファイルは残らない
+
+
+def test_parquet_output_is_long_format(tmp_path, matrix):
+    pq = pytest.importorskip('pyarrow.parquet')
+    written = save_schedule_outputs(matrix, str(tmp_path / 'shift.csv'), make_employees(), DATE_RANGE, METADATA, formats=['parquet'])
+    table = pq.read_table(written['parquet'])
+    assert table.num_rows == matrix.size
+    rows = table.to_pylist()
+    assert rows[0] == {'employee': 'EMP001', 'date': START, 'shift': '夜', 'shift_code': shift_int('夜'), 'floor': '1F'}
+    assert [row['shift_code'] for row in rows] == matrix.ravel().tolist()
+    assert json.loads(table.schema.metadata[b'schedule_metadata']) == METADATA
+
+
+def test_parquet_is_skipped_without_pyarrow(tmp_path, matrix, monkeypatch, capsys):
+    monkeypatch.setattr(output_processor, 'pa', None)
+    written = save_schedule_outputs(matrix, str(tmp_path / 'shift.csv'), make_employees(), DATE_RANGE, METADATA, formats=['parquet', 'json', 'xlsx'])
+    assert list(written) == ['json']
+    out = capsys.readouterr().out
+    assert 'pyarrow' in out and 'xlsx' in out
+
+
+def test_claim_output_path_under_contention(tmp_path):
+    # 同時に確保しても同じ名前にならず、既存の版の次の番号から順に確保される
+    (tmp_path / 'shift_20250407.csv').write_text('x', encoding='utf-8')
+    (tmp_path / 'shift_20250407_v03.csv').write_text('x', encoding='utf-8')
+    barrier = threading.Barrier(8)
+
+    def claim(_):
+        barrier.wait()
+        return claim_output_path(str(tmp_path), 'shift_20250407')
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(claim, range(8)))
+    assert sorted(os.path.basename(path) for path in paths) == [f'shift_20250407_v{version:02d}.csv' for version in range(4, 12)]
+    assert all(os.path.getsize(path) == 0 for path in paths)
@@ -0,0 +1,47 @@
+# 修正モード (固定セル・期間途中からの休み) が実行可能な修正を返すこと
+import numpy as np
+
+from src.constants import SHIFT_MAP_INT
+from src.shift_model import build_shift_model
+from src.solver import solve_shift_model
+from src.output_processor import extract_solution_matrix
+from src.repair import repair_schedule, repair_absence, SOLVED_STATUSES
+from src.schedule_evaluator import evaluate_schedule
+
+
+def solve_base(employees_df, date_range, jp_holidays, facility_rules):
+    model, shifts, employee_ids, _, _ = build_shift_model(employees_df, None, date_range, jp_holidays, [], facility_rules)
+    status, solver = solve_shift_model(model, num_workers=4, max_time_sec=20)
+    assert status in SOLVED_STATUSES
+    return extract_solution_matrix(solver, shifts, len(employee_ids), len(date_range))
+
+
+def test_pin_repair_keeps_pin_and_staffing(facility):
+    employees_df, date_range, jp_holidays, facility_rules = facility
+    existing = solve_base(employees_df, date_range, jp_holidays, facility_rules)
+    e_idx, d_idx = 1, 5
+    new_value = SHIFT_MAP_INT['公'] if existing[e_idx, d_idx] != SHIFT_MAP_INT['公'] else SHIFT_MAP_INT['日']
+    result = repair_schedule(existing, {(e_idx, d_idx): new_value}, employees_df, date_range, jp_holidays, [], facility_rules,
+                             max_time_sec=20, solver_workers=4)
+    repaired = result['shift_matrix']
+    assert repaired is not None
+    assert repaired[e_idx, d_idx] == new_value
+    assert result['num_changed'] == int((repaired != existing).sum()) >= 1
+    assert evaluate_schedule(repaired, employees_df, date_range, jp_holidays, [], facility_rules).is_feasible
+
+
+def test_mid_period_absence_is_feasible(facility):
+    employees_df, date_range, jp_holidays, facility_rules = facility
+    existing = solve_base(employees_df, date_range, jp_holidays, facility_rules)
+    # 前半に勤務している職員が期間の途中から休む (前半の勤務はハードの人員配置に数えられたまま)
+    e_idx = next(row for row in range(len(employees_df)) if np.isin(existing[row, :7], [SHIFT_MAP_INT['日'], SHIFT_MAP_INT['夜']]).any())
+    start_d_idx = 7
+    result = repair_absence(existing, employees_df['職員ID'][e_idx], date_range[start_d_idx], '病休', employees_df, date_range,
+                            jp_holidays, [], facility_rules, max_time_sec=20, solver_workers=4)
+    assert result['status'] in SOLVED_STATUSES
+    repaired = result['shift_matrix']
+    assert (repaired[:, :start_d_idx] == existing[:, :start_d_idx]).all()
+    assert (repaired[e_idx, start_d_idx:] == SHIFT_MAP_INT['病休']).all()
+    # 元の従業員情報で数えても、休み前も休み後も人員配置を満たす
+    evaluation = evaluate_schedule(repaired, employees_df, date_range, jp_holidays, [], facility_rules)
+    assert not [v for v in evaluation.hard_violations if v['rule_type'] == 'REQUIRED_STAFFING']
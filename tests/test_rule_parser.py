@@ -0,0 +1,108 @@
+# コンパイル済みのルール検証関数が、スキーマ (PERSONAL_RULE_SPECS / FACILITY_RULE_SPECS) どおりに判定すること
+from datetime import date
+
+import pytest
+
+from src.rule_parser import (validate_and_transform_rule, validate_facility_rule, validate_rules_batch, compile_rule_validator,
+                             PERSONAL_RULE_SPECS, FACILITY_RULE_SPECS)
+
+START, END = date(2025, 4, 7), date(2025, 5, 7)
+
+
+@pytest.mark.parametrize('rule, reason', [
+    ({'rule_type': 'FORBID_SHIFT', 'employee': 'EMP001', 'shift': '夜'}, None),
+    ({'rule_type': 'FORBID_SHIFT', 'employee': 'EMP001', 'shift': 'X'}, 'Invalid shift for FORBID_SHIFT'),
+    ({'rule_type': 'FORBID_SHIFT', 'employee': 'EMP001'}, 'Missing shift for FORBID_SHIFT'),
+    ({'rule_type': 'FORBID_SHIFT', 'shift': '夜'}, 'Missing or invalid employee'),
+    ({'rule_type': 'MAX_CONSECUTIVE_WORK', 'employee': 'EMP001', 'max_days': 0}, 'Invalid max_days'),
+    ({'rule_type': 'PREFER_WEEKDAY_SHIFT', 'employee': 'EMP001', 'weekday': 7, 'shift': '公'}, 'Invalid weekday'),
+    ({'rule_type': 'PREFER_WEEKDAY_SHIFT', 'employee': 'EMP001', 'weekday': 6, 'shift': '公', 'weight': None}, None),
+    ({'rule_type': 'TOTAL_SHIFT_COUNT', 'employee': 'EMP001', 'shifts': ['夜']}, 'min or max must be specified'),
+    ({'rule_type': 'TOTAL_SHIFT_COUNT', 'employee': 'EMP001', 'shifts': ['夜'], 'min': 5, 'max': 3}, 'min > max'),
+    ({'rule_type': 'TOTAL_SHIFT_COUNT', 'employee': 'EMP001', 'shifts': ['夜'], 'min': None, 'max': 3}, None),
+    ({'rule_type': 'ALLOW_ONLY_SHIFTS', 'employee': 'EMP001', 'allowed_shifts': ['日', 'Z']}, 'Invalid allowed_shifts'),
+    ({'rule_type': 'FORBID_SIMULTANEOUS_SHIFT', 'employee1': 'EMP001', 'shift': '夜'}, 'Missing employee2'),
+    ({'rule_type': 'PREFER_SHIFT_ON_DATE_SET', 'employee': 'EMP001', 'date_type': '祝日', 'shift': '公'}, None),
+    ({'rule_type': 'PREFER_SHIFT_ON_DATE_SET', 'employee': 'EMP001', 'date_type': '毎日', 'shift': '公'}, 'Invalid date_type'),
+    ({'rule_type': 'SPECIFY_DATE_SHIFT', 'employee': 'EMP001', 'date': '2025-06-01', 'shift': '公', 'is_hard': True}, 'outside the period'),
+    ({'rule_type': 'NO_SUCH_RULE', 'employee': 'EMP001'}, 'Unknown rule_type'),
+])
+def test_personal_rule_validation(rule, reason):
+    result = validate_and_transform_rule(dict(rule), START, END)
+    if reason is None:
+        assert result['rule_type'] == rule['rule_type']
+    else:
+        assert result['rule_type'] == 'INVALID' and reason in result['reason']
+
+
+def test_date_without_year_is_completed():
+    rule = {'rule_type': 'SPECIFY_DATE_SHIFT', 'employee': 'EMP001', 'date': '4/20', 'shift': '公', 'is_hard': False}
+    assert validate_and_transform_rule(rule, START, END)['date'] == date(2025, 4, 20)
+
+
+@pytest.mark.parametrize('rule, reason', [
+    ({'rule_type': 'REQUIRED_STAFFING', 'floor': '1F', 'shift': '夜', 'date_type': 'ALL', 'min_count': 1}, None),
+    ({'rule_type': 'REQUIRED_STAFFING', 'floor': '3F', 'shift': '夜', 'date_type': 'ALL', 'min_count': 1}, 'Invalid floor'),
+    ({'rule_type': 'REQUIRED_STAFFING', 'shift': '夜', 'date_type': '2025-04-29', 'min_count': -1}, 'Invalid min_count'),
+    ({'rule_type': 'MIN_ROLE_ON_DUTY', 'role': '', 'min_count': 1, 'date_type': 'ALL'}, 'Invalid role'),
+    ({'rule_type': 'MIN_TOTAL_SHIFT_DAYS', 'shift': '公', 'min_count': 8}, 'Missing is_hard'),
+    ({'rule_type': 'MAX_CONSECUTIVE_OFF', 'employee_group': '  ', 'max_days': 3}, 'Invalid employee_group'),
+    ({'rule_type': 'FORBID_SHIFT', 'employee_group': 'パート', 'shift': '夜', 'is_hard': 'yes'}, 'Invalid is_hard'),
+])
+def test_facility_rule_validation(rule, reason):
+    result = validate_facility_rule(dict(rule), START, END)
+    if reason is None:
+        assert result['rule_type'] == rule['rule_type']
+    else:
+        assert result['rule_type'] == 'INVALID' and reason in result['reason']
+
+
+def test_fill_default_is_written_only_when_missing():
+    rule = validate_facility_rule({'rule_type': 'BALANCE_SPECIFIC_SHIFT_TOTALS', 'target_shifts': ['夜']}, START, END)
+    assert rule['weight'] == 1 and 'employee_group' not in rule
+    rule = validate_facility_rule({'rule_type': 'BALANCE_SPECIFIC_SHIFT_TOTALS', 'target_shifts': ['夜'], 'weight': 3}, START, END)
+    assert rule['weight'] == 3
+
+
+@pytest.mark.parametrize('specs', [PERSONAL_RULE_SPECS, FACILITY_RULE_SPECS])
+def test_first_missing_required_field_is_reported(specs):
+    # スキーマの定義順で最初の必須項目が欠落として報告されること (必須項目の無いルールタイプは有効)
+    for rule_type, spec in specs.items():
+        required = [name for name, field_spec in spec['fields'].items() if field_spec.get('required')]
+        reason = compile_rule_validator(rule_type, spec)({'rule_type': rule_type})
+        assert reason == (f'Missing {required[0]} for {rule_type}' if required else None)
+
+
+def test_batch_matches_single_rule_validation():
+    rules = [
+        {'rule_type': 'FORBID_SHIFT', 'employee': 'EMP001', 'shift': '夜'},
+        {'rule_type': 'FORBID_SHIFT', 'employee': 'EMP001', 'shift': 'X'},
+        {'rule_type': 'UNPARSABLE', 'original_text': '?'},
+    ]
+    valid, invalid = validate_rules_batch([dict(rule) for rule in rules], START, END)
+    assert [rule['rule_type'] for rule in valid] == ['FORBID_SHIFT', 'UNPARSABLE']
+    assert invalid == [(rules[1], validate_and_transform_rule(dict(rules[1]), START, END)['reason'])]
+    with pytest.raises(ValueError):
+        validate_rules_batch(rules, START, END, scope='unknown')
+
+
+@pytest.mark.parametrize('rule, reason', [
+    ({'level': 3, 'floor': '1F', 'shifts': ['日']}, None),
+    ({'level': True, 'floor': '1F'}, "Invalid level for T: True"), # True は int として範囲 (2 以上) で判定される
+    ({'level': 11, 'floor': '1F'}, "Invalid level for T: 11"),
+    ({'level': '3', 'floor': '1F'}, "Invalid level for T: '3'"),
+    ({'level': 3, 'floor': '3F'}, "Invalid floor for T: '3F'"),
+    ({'level': 3, 'floor': '1F', 'shifts': []}, "Invalid shifts for T: []"),
+    ({'level': 3, 'floor': None}, None), # nullable は None を未指定として扱う
+    ({'floor': '1F'}, "Missing level for T"),
+    ({'level': 5, 'floor': '1F', 'note': 'x'}, "level is odd for T"),
+])
+def test_compiled_validator_conditions(rule, reason):
+    spec = {'fields': {'level': {'type': 'int', 'required': True, 'min': 2, 'max': 10},
+                       'floor': {'type': 'str', 'enum': ['1F', '2F'], 'nullable': True, 'fill': True, 'default': 'ALL'},
+                       'shifts': {'type': 'shift_list', 'non_empty': True}},
+            'checks': [lambda rule_data: 'level is odd' if rule_data.get('note') and rule_data['level'] % 2 else None]}
+    floor_is_null = 'floor' in rule and rule['floor'] is None
+    assert compile_rule_validator('T', spec)(rule) == reason
+    if floor_is_null:
+        assert rule['floor'] == 'ALL' # fill の既定値を書き込む
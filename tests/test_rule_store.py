@@ -0,0 +1,55 @@
+# ルールストアの保存・読み込み (日付の復元、入力ハッシュでの検索、保存し直したルールセットが最新になること)
+from datetime import date
+
+from conftest import facility_rule
+from src.rule_store import (compute_rules_input_hash, save_rule_set, load_rules_for_period, find_latest_input_hash, query_rules,
+                            connect_rule_store)
+
+PERIOD = (date(2025, 4, 7), date(2025, 5, 4))
+PERSONAL_RULES = [
+    {'rule_type': 'SPECIFY_DATE_SHIFT', 'employee': 'EMP001', 'date': date(2025, 4, 10), 'shift': '公', 'is_hard': True},
+    {'rule_type': 'MAX_CONSECUTIVE_WORK', 'employee': 'EMP002', 'max_days': 4, 'is_hard': False},
+    {'rule_type': 'PREFER_WEEKDAY_SHIFT', 'employee': 'EMP001', 'weekday': 0, 'shift': '夜', 'weight': 2},
+]
+FACILITY_RULES = [facility_rule(rule_type='REQUIRED_STAFFING', floor='1F', shift='夜', date_type='ALL', min_count=1, is_hard=True)]
+
+
+def test_round_trip_restores_rules(tmp_path):
+    db_path = str(tmp_path / 'rules.sqlite3')
+    rule_set_id = save_rule_set(PERSONAL_RULES, FACILITY_RULES, *PERIOD, 'hash-a', db_path=db_path)
+    assert load_rules_for_period(*PERIOD, db_path=db_path) == (PERSONAL_RULES, FACILITY_RULES) # date も復元される
+    assert query_rules(rule_set_id, employee='EMP001', db_path=db_path)[0] == [PERSONAL_RULES[0], PERSONAL_RULES[2]]
+    assert query_rules(rule_set_id, rule_type='REQUIRED_STAFFING', db_path=db_path) == ([], FACILITY_RULES)
+    assert load_rules_for_period(date(2025, 5, 5), date(2025, 6, 1), db_path=db_path) == (None, None)
+    assert load_rules_for_period(*PERIOD, db_path=str(tmp_path / 'none.sqlite3')) == (None, None)
+
+
+def test_lookup_by_input_hash_and_resave_becomes_latest(tmp_path):
+    db_path = str(tmp_path / 'rules.sqlite3')
+    save_rule_set(PERSONAL_RULES[:1], [], *PERIOD, 'hash-a', db_path=db_path)
+    save_rule_set(PERSONAL_RULES[1:], [], *PERIOD, 'hash-b', db_path=db_path)
+    assert find_latest_input_hash(*PERIOD, db_path=db_path) == 'hash-b'
+    assert load_rules_for_period(*PERIOD, input_hash='hash-a', db_path=db_path)[0] == PERSONAL_RULES[:1]
+    assert load_rules_for_period(*PERIOD, input_hash='hash-c', db_path=db_path) == (None, None)
+
+    # 以前の入力に戻して保存し直すと、そのルールセットが期間の最新になる (版番号と件数は変わらない)
+    save_rule_set(PERSONAL_RULES, [], *PERIOD, 'hash-a', db_path=db_path)
+    assert find_latest_input_hash(*PERIOD, db_path=db_path) == 'hash-a'
+    assert load_rules_for_period(*PERIOD, db_path=db_path)[0] == PERSONAL_RULES
+    conn = connect_rule_store(db_path)
+    try:
+        assert conn.execute("SELECT input_hash, version FROM rule_sets ORDER BY version").fetchall() == [('hash-a', 1), ('hash-b', 2)]
+        assert conn.execute("SELECT COUNT(*) FROM rules").fetchone()[0] == len(PERSONAL_RULES) + 2
+    finally:
+        conn.close()
+
+
+def test_input_hash_depends_on_rules_and_prompts(tmp_path):
+    prompt = tmp_path / 'prompt.txt'
+    prompt.write_text('v1', encoding='utf-8')
+    rules = {'EMP001': '月曜は夜勤希望'}
+    base = compute_rules_input_hash(rules, ['夜勤は2名'], prompt_files=[str(prompt)])
+    assert compute_rules_input_hash(dict(rules), ['夜勤は2名'], prompt_files=[str(prompt)]) == base
+    assert compute_rules_input_hash(rules, ['夜勤は3名'], prompt_files=[str(prompt)]) != base
+    prompt.write_text('v2', encoding='utf-8')
+    assert compute_rules_input_hash(rules, ['夜勤は2名'], prompt_files=[str(prompt)]) != base
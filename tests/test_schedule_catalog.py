@@ -0,0 +1,71 @@
+# スケジュールカタログの記録・検索と、解の行列からの人員不足の集計
+from datetime import date
+
+import numpy as np
+
+from conftest import facility_rule, shift_int
+from src.schedule_catalog import (record_schedule_run, list_runs, find_best_run, find_runs_with_shortfall, get_run_details,
+                                  compute_staffing_shortfalls, register_existing_files)
+
+PERIOD = (date(2025, 4, 7), date(2025, 5, 7))
+
+
+def record(db_path, path, status, objective, penalties=None, shortfalls=None, period_start=PERIOD[0]):
+    run = {'path': path, 'period_start': period_start, 'period_end': PERIOD[1], 'rules_input_hash': 'r', 'base_input_hash': 'b',
+           'status': status, 'objective': objective, 'solve_time_sec': 1.0, 'solver_workers': 4, 'num_employees': 10}
+    return record_schedule_run(run, penalties, shortfalls, db_path=db_path)
+
+
+def test_record_and_query_runs(tmp_path):
+    db_path = str(tmp_path / 'catalog.sqlite')
+    first = record(db_path, 'results/a.csv', 'FEASIBLE', 120.0, {'staffing_shortage': 100, 'weekday': 20}, {('1F', '日'): (5, 3)})
+    best = record(db_path, 'results/b.csv', 'OPTIMAL', 80.0, {'weekday': 80})
+    record(db_path, 'results/c.csv', 'INFEASIBLE', None)
+    record(db_path, 'results/d.csv', 'OPTIMAL', 10.0, period_start=date(2025, 5, 8))
+
+    assert [run['path'] for run in list_runs(period_start=PERIOD[0], db_path=db_path)] == ['results/c.csv', 'results/b.csv', 'results/a.csv']
+    assert [run['path'] for run in list_runs(status='OPTIMAL', limit=1, db_path=db_path)] == ['results/d.csv']
+    assert find_best_run(PERIOD[0], db_path=db_path)['id'] == best
+    assert find_best_run(date(2024, 1, 1), db_path=db_path) is None
+
+    rows = find_runs_with_shortfall(floor='1F', db_path=db_path)
+    assert [(row['id'], row['shortfall_total'], row['shortfall_days']) for row in rows] == [(first, 5, 3)]
+    assert find_runs_with_shortfall(floor='2F', db_path=db_path) == []
+
+    details = get_run_details(first, db_path=db_path)
+    assert details['penalties'] == {'staffing_shortage': 100, 'weekday': 20}
+    assert details['shortfalls'] == [{'floor': '1F', 'shift': '日', 'total': 5, 'days': 3}]
+    assert get_run_details(999, db_path=db_path) is None
+
+
+def test_same_path_replaces_previous_record(tmp_path):
+    db_path = str(tmp_path / 'catalog.sqlite')
+    old_id = record(db_path, 'results/a.csv', 'FEASIBLE', 120.0, {'weekday': 120})
+    new_id = record(db_path, 'results/a.csv', 'OPTIMAL', 90.0, {'weekday': 90})
+    assert [run['id'] for run in list_runs(db_path=db_path)] == [new_id]
+    assert get_run_details(old_id, db_path=db_path) is None
+    assert get_run_details(new_id, db_path=db_path)['penalties'] == {'weekday': 90}
+
+
+def test_missing_catalog_returns_empty(tmp_path):
+    assert list_runs(db_path=str(tmp_path / 'none.sqlite')) == []
+
+
+def test_staffing_shortfalls_use_the_most_specific_date_type(facility):
+    employees_df, date_range, jp_holidays, _ = facility
+    rules = [facility_rule(rule_type='REQUIRED_STAFFING', floor='1F', shift='日', date_type='ALL', min_count=2, is_hard=False),
+             facility_rule(rule_type='REQUIRED_STAFFING', floor='1F', shift='日', date_type='土日', min_count=1, is_hard=False)]
+    matrix = np.full((len(employees_df), len(date_range)), shift_int('公'), dtype=np.int8)
+    matrix[0, :] = shift_int('日') # 1F の日勤は毎日1名 (平日は1名不足、土日は充足)
+    shortfalls = compute_staffing_shortfalls(matrix, employees_df, date_range, jp_holidays, rules)
+    assert shortfalls == {('1F', '日'): (10, 10)}
+
+
+def test_register_existing_files_skips_empty_claimed_files(tmp_path):
+    db_path = str(tmp_path / 'catalog.sqlite')
+    (tmp_path / 'shift_20250407.csv').write_text('\ufeff職員名,2025-04-07,2025-05-04\n', encoding='utf-8')
+    (tmp_path / 'shift_20250407_v01.csv').write_text('', encoding='utf-8') # 書き込みが終わらなかった版
+    assert register_existing_files(str(tmp_path), db_path=db_path) == 1
+    runs = list_runs(db_path=db_path)
+    assert [(run['path'], run['status'], run['period_end']) for run in runs] == [(str(tmp_path / 'shift_20250407.csv'), 'UNKNOWN', '2025-05-04')]
+    assert register_existing_files(str(tmp_path), db_path=db_path) == 0 # 登録済みは登録し直さない
@@ -0,0 +1,50 @@
+# シフト表の版どうしの差分 (CSV の日付列の形式、共通の職員・日付が無い場合)
+from datetime import date
+
+import diff_schedules
+from src.schedule_diff import load_schedule, diff_schedules as diff_versions, pairwise_change_counts
+
+
+def write_schedule(path, day_headers, rows, encoding='utf-8-sig'):
+    lines = [','.join(['職員ID', '職員名'] + day_headers), ',,' + ','.join('月火水'[:len(day_headers)])]
+    lines += [','.join([emp_id, emp_id.lower()] + shifts) for emp_id, shifts in rows]
+    path.write_text('\n'.join(lines) + '\n', encoding=encoding)
+    return str(path)
+
+
+def test_slash_date_headers_match_iso_headers(tmp_path):
+    old = write_schedule(tmp_path / 'old.csv', ['2025-04-07', '2025-04-08', '2025-04-09'],
+                         [('EMP001', ['日', '夜', '明']), ('EMP002', ['公', '日', '日'])])
+    new = write_schedule(tmp_path / 'new.csv', ['2025/4/7', '2025/4/8', '2025/4/9'],
+                         [('EMP001', ['日', '公', '日']), ('EMP002', ['公', '日', '日'])], encoding='cp932')
+    new_schedule = load_schedule(new)
+    assert new_schedule.dates == [date(2025, 4, 7), date(2025, 4, 8), date(2025, 4, 9)]
+
+    diff = diff_versions(load_schedule(old), new_schedule)
+    assert diff.num_changed == 2
+    assert diff.change_list() == [('EMP001', date(2025, 4, 8), '夜', '公'), ('EMP001', date(2025, 4, 9), '明', '日')]
+    assert diff.per_employee_changes.tolist() == [2, 0]
+
+
+def test_csv_without_date_columns_is_rejected(tmp_path, capsys):
+    path = write_schedule(tmp_path / 'bad.csv', ['4月7日', '4月8日'], [('EMP001', ['日', '夜'])])
+    assert load_schedule(path) is None
+    assert '日付の列' in capsys.readouterr().out
+
+
+def test_no_common_dates_reports_error(tmp_path, capsys):
+    april = write_schedule(tmp_path / 'april.csv', ['2025-04-07'], [('EMP001', ['日'])])
+    may = write_schedule(tmp_path / 'may.csv', ['2025-05-07'], [('EMP001', ['日'])])
+    schedules = [load_schedule(april), load_schedule(may)]
+    assert diff_versions(*schedules) is None
+    assert pairwise_change_counts(schedules) is None
+    assert '共通の日付' in capsys.readouterr().out
+    assert diff_schedules.main([april, may, '--employees', str(tmp_path / 'none.csv')]) == 1
+
+
+def test_pairwise_change_counts(tmp_path):
+    headers = ['2025-04-07', '2025-04-08']
+    paths = [write_schedule(tmp_path / f'v{i}.csv', headers, [('EMP001', shifts)])
+             for i, shifts in enumerate([['日', '日'], ['日', '夜'], ['公', '夜']])]
+    counts = pairwise_change_counts([load_schedule(path) for path in paths])
+    assert counts.tolist() == [[0, 1, 2], [1, 0, 1], [2, 1, 0]]
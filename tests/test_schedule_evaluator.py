@@ -0,0 +1,123 @@
+# 評価器 (schedule_evaluator / schedule_delta) がソルバーの目的関数と同じ値を返すこと
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from conftest import START, make_employees, facility_rule
+from src.constants import SHIFT_MAP_INT
+from src.shift_model import build_shift_model
+from src.solver import solve_shift_model
+from src.output_processor import extract_solution_matrix
+from src.schedule_catalog import evaluate_penalty_totals
+from src.schedule_evaluator import evaluate_schedule
+from src.schedule_delta import IncrementalEvaluator
+from src.schedule_diff import coverage_counts
+from src.repair import SOLVED_STATUSES
+
+# ハードの夜勤に加え、ソフトの人員配置 (超過も数える)・役職の出勤・公休数の均等化・重み付きの個人の希望
+FACILITY_RULES = (
+    [facility_rule(rule_type='REQUIRED_STAFFING', floor=floor, shift='夜', date_type='ALL', min_count=1, is_hard=True) for floor in ('1F', '2F')]
+    + [facility_rule(rule_type='REQUIRED_STAFFING', floor=floor, shift='日', date_type='平日', min_count=2, is_hard=False) for floor in ('1F', '2F')]
+    + [facility_rule(rule_type='REQUIRED_STAFFING', floor='1F', shift='日', date_type='土日', min_count=1, is_hard=False),
+       facility_rule(rule_type='MIN_ROLE_ON_DUTY', role='主任', min_count=2, date_type='ALL', is_hard=False),
+       facility_rule(rule_type='BALANCE_OFF_DAYS', weight=2)]
+)
+PERSONAL_RULES = [
+    {'rule_type': 'PREFER_WEEKDAY_SHIFT', 'employee': 'EMP002', 'weekday': 0, 'shift': '夜', 'weight': 3},
+    {'rule_type': 'PREFER_SHIFT_ON_DATE_SET', 'employee': 'EMP007', 'date_type': '土日', 'shift': '公', 'weight': 2.4},
+    {'rule_type': 'MAX_CONSECUTIVE_WORK', 'employee': 'EMP003', 'max_days': 3, 'is_hard': False},
+    {'rule_type': 'TOTAL_SHIFT_COUNT', 'employee': 'EMP008', 'shifts': ['夜'], 'min': 3, 'max': 4, 'is_hard': False},
+]
+
+
+@pytest.fixture(scope='module')
+def solved():
+    """(employees_df, date_range, 解の行列, ソルバーのカテゴリ別ペナルティ, 目的関数値)"""
+    employees_df = make_employees()
+    date_range = [START + timedelta(days=offset) for offset in range(14)]
+    model, shifts, employee_ids, _, penalty_exprs = build_shift_model(employees_df, None, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    status, solver = solve_shift_model(model, num_workers=4, max_time_sec=20)
+    assert status in SOLVED_STATUSES
+    matrix = extract_solution_matrix(solver, shifts, len(employee_ids), len(date_range))
+    return employees_df, date_range, matrix, evaluate_penalty_totals(solver, penalty_exprs), solver.ObjectiveValue()
+
+
+def fixed_objective(employees_df, date_range, matrix):
+    """行列の全セルを固定したモデルの目的関数値 (実行不能なら None)"""
+    fixed_cells = {(e_idx, d_idx): int(matrix[e_idx, d_idx]) for e_idx in range(matrix.shape[0]) for d_idx in range(matrix.shape[1])}
+    model, _, _, _, penalty_exprs = build_shift_model(employees_df, None, date_range, set(), PERSONAL_RULES, FACILITY_RULES, fixed_cells=fixed_cells)
+    status, solver = solve_shift_model(model, num_workers=4, max_time_sec=20)
+    if status not in SOLVED_STATUSES:
+        return None
+    return evaluate_penalty_totals(solver, penalty_exprs), solver.ObjectiveValue()
+
+
+def test_evaluator_matches_solver_penalties(solved):
+    employees_df, date_range, matrix, solver_penalties, objective = solved
+    evaluation = evaluate_schedule(matrix, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    assert evaluation.is_feasible
+    assert evaluation.penalties == {category: total for category, total in solver_penalties.items() if total}
+    assert evaluation.objective == objective
+    assert sum(solver_penalties.values()) == objective
+
+
+def test_evaluator_matches_solver_on_another_schedule(solved):
+    # 最適解ではない (希望を外した) 実行可能な版でも、全セルを固定したモデルの目的関数値と一致する
+    employees_df, date_range, matrix, _, _ = solved
+    forced = [{'rule_type': 'SPECIFY_DATE_SHIFT', 'employee': 'EMP007', 'date': date_range[5], 'shift': '日', 'is_hard': True},
+              {'rule_type': 'SPECIFY_DATE_SHIFT', 'employee': 'EMP001', 'date': date_range[2], 'shift': '公', 'is_hard': True}]
+    model, shifts, employee_ids, _, _ = build_shift_model(employees_df, None, date_range, set(), PERSONAL_RULES + forced, FACILITY_RULES)
+    status, solver = solve_shift_model(model, num_workers=4, max_time_sec=20)
+    assert status in SOLVED_STATUSES
+    other = extract_solution_matrix(solver, shifts, len(employee_ids), len(date_range))
+
+    evaluation = evaluate_schedule(other, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    solver_penalties, objective = fixed_objective(employees_df, date_range, other)
+    assert evaluation.is_feasible
+    assert evaluation.penalties == {category: total for category, total in solver_penalties.items() if total}
+    assert evaluation.objective == objective
+
+
+def test_hard_violations_are_reported(solved):
+    employees_df, date_range, matrix, _, _ = solved
+    broken = matrix.copy()
+    night = SHIFT_MAP_INT['夜']
+    e_idx = int(np.flatnonzero(broken[:5, 3] == night)[0]) # 1F の夜勤を外す
+    broken[e_idx, 3] = SHIFT_MAP_INT['公']
+    evaluation = evaluate_schedule(broken, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    assert not evaluation.is_feasible
+    assert any(v['rule_type'] == 'REQUIRED_STAFFING' and date_range[3] in v['dates'] for v in evaluation.hard_violations)
+    assert fixed_objective(employees_df, date_range, broken) is None
+
+
+def test_incremental_evaluator_matches_full_evaluation(solved):
+    employees_df, date_range, matrix, _, _ = solved
+    evaluator = IncrementalEvaluator(matrix, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    rng = np.random.default_rng(0)
+    work_shifts = [SHIFT_MAP_INT[sym] for sym in ('公', '日', '早', '夜', '明')]
+    for _ in range(40):
+        e_idx, d_idx = int(rng.integers(len(employees_df))), int(rng.integers(len(date_range)))
+        before = evaluator.objective
+        delta = evaluator.apply_changes({(e_idx, d_idx): int(rng.choice(work_shifts))})
+        full = evaluate_schedule(evaluator.matrix, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+        assert evaluator.num_violations == full.num_violations
+        assert {k: v for k, v in evaluator.penalties.items() if v} == full.penalties
+        assert evaluator.objective == before + delta.objective_delta
+    assert (evaluator.coverage == coverage_counts(evaluator.matrix)).all() # 差分で更新した人数と数え直した人数
+
+
+def test_swap_candidates_match_full_evaluation(solved):
+    employees_df, date_range, matrix, _, _ = solved
+    evaluator = IncrementalEvaluator(matrix, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    base = evaluate_schedule(matrix, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+    candidates = evaluator.find_swaps('EMP002', date_range[4], include_infeasible=True)
+    assert candidates
+    for candidate in candidates:
+        swapped = matrix.copy()
+        partner_idx = employees_df['職員ID'].tolist().index(candidate.partner)
+        swapped[[1, partner_idx], 4] = swapped[[partner_idx, 1], 4]
+        full = evaluate_schedule(swapped, employees_df, date_range, set(), PERSONAL_RULES, FACILITY_RULES)
+        assert candidate.hard_delta == full.num_violations - base.num_violations
+        assert candidate.objective_delta == full.objective - base.objective
+    assert (evaluator.matrix == matrix).all() # 候補の評価では行列を変えない
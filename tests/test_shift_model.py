@@ -0,0 +1,103 @@
+# モデルの構築: 人員配置の需要表 (日付区分の優先) と育休/病休の記号の扱い
+from pathlib import Path
+
+import pytest
+
+from conftest import make_employees, shift_int
+from src.ai_client import AIClient, FakeBackend
+from src.coverage import compile_coverage
+from src.shift_model import build_shift_model
+from src.solver import solve_shift_model
+from src.output_processor import extract_solution_matrix
+from src.repair import SOLVED_STATUSES
+from src.schedule_evaluator import evaluate_schedule
+import shift_generator
+
+ROOT = Path(__file__).resolve().parent.parent
+# 1週間 (4/7 月曜日): 4/9 を祝日、4/12・4/13 を土日とする
+DAYS_OF_TYPE = {'ALL': list(range(7)), '平日': [0, 1, 2, 3, 4], '土日': [5, 6], '祝日': [2], '2025-04-13': [6]}
+
+
+def staffing(shift, date_type, min_count, is_hard=True, floor='1F'):
+    return {'rule_type': 'REQUIRED_STAFFING', 'floor': floor, 'shift': shift, 'date_type': date_type, 'min_count': min_count, 'is_hard': is_hard}
+
+
+def demand_by_day(demand, shift='日', target='1F'):
+    return [(cell['min'], cell['max'], cell['is_hard'], cell['date_type']) if cell else None
+            for cell in (demand.get(('floor', target, shift, d_idx)) for d_idx in range(7))]
+
+
+def test_most_specific_date_type_wins():
+    rules = [staffing('日', 'ALL', 3), staffing('日', '土日', 1, is_hard=False), staffing('日', '祝日', 2), staffing('日', '2025-04-13', 4)]
+    demand = compile_coverage(rules, 7, DAYS_OF_TYPE.__getitem__)
+    assert demand_by_day(demand) == [(3, 3, True, 'ALL'), (3, 3, True, 'ALL'), (2, 2, True, '祝日'), (3, 3, True, 'ALL'),
+                                     (3, 3, True, 'ALL'), (1, 1, False, '土日'), (4, 4, True, '2025-04-13')]
+
+
+def test_same_date_type_prefers_hard_then_larger_count(capsys):
+    rules = [staffing('夜', 'ALL', 1), staffing('夜', 'ALL', 3, is_hard=False), staffing('夜', '平日', 2), staffing('夜', '平日', 1)]
+    demand = compile_coverage(rules, 7, DAYS_OF_TYPE.__getitem__)
+    assert demand_by_day(demand, shift='夜') == [(2, 2, True, '平日')] * 5 + [(1, 1, True, 'ALL')] * 2
+    assert '人数の異なるハード制約' in capsys.readouterr().out
+
+
+def test_role_demand_has_no_upper_bound():
+    rules = [{'rule_type': 'MIN_ROLE_ON_DUTY', 'role': '主任', 'min_count': 1, 'date_type': '平日', 'is_hard': True},
+             {'structured_data': staffing('早', 'ALL', 2, floor=None)}]
+    demand = compile_coverage(rules, 7, DAYS_OF_TYPE.__getitem__)
+    assert {d_idx for (kind, _, _, d_idx), cell in demand.items() if kind == 'role' and cell['max'] is None} == {0, 1, 2, 3, 4}
+    assert demand_by_day(demand, shift='早', target='ALL') == [(2, 2, True, 'ALL')] * 7
+
+
+def assert_leave_only_for_leave_staff(matrix, statuses):
+    leave = shift_int('育休')
+    for e_idx, status in enumerate(statuses):
+        if status in ('育休', '病休'):
+            assert (matrix[e_idx] == leave).all(), f'{e_idx}: {status} の職員が休み以外になっています'
+        else:
+            assert not (matrix[e_idx] == leave).any(), f'{e_idx}: 育休/病休でない職員に休みの記号があります'
+
+
+def test_leave_status_is_pinned_and_forbidden_for_others(facility):
+    # 人員配置の上限で余った職員 (個人ルールなし) も育休/病休の記号にしない
+    _, date_range, jp_holidays, facility_rules = facility
+    employees_df = make_employees(statuses={2: '病休', 7: '育休'})
+    personal_rules = [{'rule_type': 'MAX_CONSECUTIVE_WORK', 'employee': 'EMP003', 'max_days': 3, 'is_hard': True}]
+    model, shifts, employee_ids, _, _ = build_shift_model(employees_df, None, date_range, jp_holidays, personal_rules, facility_rules)
+    status, solver = solve_shift_model(model, num_workers=4, max_time_sec=20)
+    assert status in SOLVED_STATUSES
+    matrix = extract_solution_matrix(solver, shifts, len(employee_ids), len(date_range))
+    assert_leave_only_for_leave_staff(matrix, employees_df['status'].tolist())
+
+    # 評価器もルールのない職員の育休/病休の記号をハード制約違反として数える
+    assert evaluate_schedule(matrix, employees_df, date_range, jp_holidays, personal_rules, facility_rules).is_feasible
+    broken = matrix.copy()
+    broken[9, 0] = shift_int('病休')
+    violations = evaluate_schedule(broken, employees_df, date_range, jp_holidays, personal_rules, facility_rules).hard_violations
+    assert any(v['rule_type'] == 'STATUS' and v['employee'] == 'EMP010' for v in violations)
+
+
+@pytest.fixture
+def real_inputs(tmp_path, monkeypatch):
+    """input/ の実データと録画済みのAI応答から、shift_generator.main が求解に渡す入力とルールを得る"""
+    monkeypatch.chdir(ROOT)
+    backend = FakeBackend(replay_file=str(ROOT / 'input' / 'ai_recorded_responses.json'))
+    monkeypatch.setattr(shift_generator, 'ai_client', AIClient(backend))
+    captured = {}
+    monkeypatch.setattr(shift_generator, 'solve_and_output', lambda *args, **kwargs: captured.setdefault('args', args))
+    paths = dict(shift_generator.facility_paths(), output_dir=str(tmp_path / 'results'), rule_store_file=str(tmp_path / 'rules.sqlite3'),
+                 snapshot_dir=str(tmp_path / 'snapshot'), catalog_file=str(tmp_path / 'schedules.sqlite3'))
+    shift_generator.main(use_snapshot=False, paths=paths)
+    return captured['args']
+
+
+def test_real_input_has_no_leave_symbol_for_active_staff(real_inputs):
+    employees_df, shift_history, date_range, jp_holidays, _, personal_rules, facility_rules, group_indices = real_inputs
+    statuses = employees_df['status'].tolist()
+    assert {'育休', '病休'} <= set(statuses) and personal_rules and facility_rules
+    model, shifts, employee_ids, _, _ = build_shift_model(employees_df, None, date_range, jp_holidays, personal_rules, facility_rules,
+                                                          shift_history=shift_history, group_indices=group_indices)
+    status, solver = solve_shift_model(model, num_workers=8, max_time_sec=30)
+    assert status in SOLVED_STATUSES
+    matrix = extract_solution_matrix(solver, shifts, len(employee_ids), len(date_range))
+    assert_leave_only_for_leave_staff(matrix, statuses)
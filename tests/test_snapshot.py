@@ -0,0 +1,73 @@
+# 入力スナップショットの保存・再利用と、入力の変更の検出
+import json
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from src import snapshot
+from src.snapshot import load_inputs, snapshot_path, SNAPSHOT_META_FILE
+
+START = date(2025, 4, 10)
+END = START + timedelta(days=27)
+EMPLOYEE_CSV = "職員ID,職員名,担当フロア,役職,常勤/パート,status,can_help_other_floor\n" \
+               "EMP001,山田,1F,主任,常勤,,可\n" \
+               "EMP002,佐藤,2F,,パート,育休,0\n"
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """(load_inputs のキーワード引数, 従業員ファイル, 直前勤務実績ファイル)"""
+    employee_file, past_shift_file = tmp_path / 'employees.csv', tmp_path / 'past_shifts.csv'
+    employee_file.write_text(EMPLOYEE_CSV, encoding='utf-8')
+    past_shift_file.write_text("職員ID,4/8,4/9\nEMP001,夜,明\nEMP002,公,公\n", encoding='utf-8')
+    options = dict(employee_file=str(employee_file), past_shift_file=str(past_shift_file), history_file=None, output_dir=None,
+                   snapshot_dir=str(tmp_path / 'snapshot'))
+    return options, employee_file, past_shift_file
+
+
+def read_meta(options):
+    with open(os.path.join(snapshot_path(START, END, options['snapshot_dir']), SNAPSHOT_META_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def assert_same_inputs(loaded, expected):
+    employees_df, shift_history, jp_holidays, group_indices = loaded
+    assert employees_df.equals(expected[0])
+    assert shift_history.dates == expected[1].dates and (shift_history.matrix == expected[1].matrix).all()
+    assert dict(jp_holidays) == dict(expected[2]) and group_indices == expected[3]
+
+
+def test_snapshot_is_reused_and_matches_csv(inputs, capsys):
+    options, _, _ = inputs
+    from_csv = load_inputs(START, END, use_snapshot=False, **options)
+    first = load_inputs(START, END, **options)
+    assert '保存しました' in capsys.readouterr().out
+    second = load_inputs(START, END, **options)
+    assert '読み込みました: ' + snapshot_path(START, END, options['snapshot_dir']) in capsys.readouterr().out
+    assert_same_inputs(first, from_csv)
+    assert_same_inputs(second, from_csv)
+    assert second[0]['役職'].isna().tolist() == [False, True] # 空文字は欠損値に戻す
+
+
+def test_touched_source_refreshes_meta_without_rehashing(inputs, monkeypatch):
+    options, employee_file, _ = inputs
+    load_inputs(START, END, **options)
+    stat = os.stat(employee_file)
+    os.utime(employee_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9)) # 内容は同じで更新時刻だけ変わる
+    load_inputs(START, END, **options)
+    assert read_meta(options)['sources'][0]['mtime_ns'] == stat.st_mtime_ns + 10**9
+
+    # 記録し直した後はハッシュを計算しない
+    monkeypatch.setattr(snapshot, '_file_sha256', lambda path: pytest.fail(f'ハッシュを計算しました: {path}'))
+    assert load_inputs(START, END, **options) is not None
+
+
+def test_changed_source_rebuilds_snapshot(inputs, capsys):
+    options, _, past_shift_file = inputs
+    load_inputs(START, END, **options)
+    past_shift_file.write_text("職員ID,4/8,4/9\nEMP001,日,日\nEMP002,公,公\n", encoding='utf-8')
+    capsys.readouterr()
+    load_inputs(START, END, **options)
+    assert '作り直します' in capsys.readouterr().out
+    assert_same_inputs(load_inputs(START, END, **options), load_inputs(START, END, use_snapshot=False, **options))
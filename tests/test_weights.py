@@ -0,0 +1,48 @@
+# 重みのプロファイルの読み込みとルールの weight の整数化
+import json
+
+import pytest
+
+from src.constants import OBJECTIVE_WEIGHT_MAX, RULE_WEIGHT_SCALE_MAX
+from src.weights import BUILTIN_WEIGHT_PROFILES, load_weight_profile, scale_rule_weight, objective_shares
+
+
+def test_builtin_profile_overrides_default():
+    weights = load_weight_profile('coverage_first', path=None)
+    assert weights['staffing_shortage'] == 50
+    assert weights['weekday'] == BUILTIN_WEIGHT_PROFILES['default']['weekday']
+    assert set(weights) == set(BUILTIN_WEIGHT_PROFILES['default'])
+
+
+def test_profile_file_is_bounded_and_validated(tmp_path, capsys):
+    path = tmp_path / 'weights.json'
+    path.write_text(json.dumps({'site': {'weekday': 2.6, 'staffing_shortage': 1000, 'helping': -3, 'min_role': 'high', 'unknown': 5},
+                                'coverage_first': {'over_staffing': 7}}), encoding='utf-8')
+    weights = load_weight_profile('site', path=str(path))
+    assert weights['weekday'] == 3
+    assert weights['staffing_shortage'] == OBJECTIVE_WEIGHT_MAX
+    assert weights['helping'] == 0
+    assert weights['min_role'] == BUILTIN_WEIGHT_PROFILES['default']['min_role']
+    assert 'unknown' not in weights
+    # 設定ファイルのプロファイルは同じ名前の組み込みプロファイルを置き換える
+    assert load_weight_profile('coverage_first', path=str(path))['staffing_shortage'] == BUILTIN_WEIGHT_PROFILES['default']['staffing_shortage']
+    assert load_weight_profile('no_such_profile', path=str(path)) == BUILTIN_WEIGHT_PROFILES['default']
+    assert 'no_such_profile' in capsys.readouterr().out
+
+
+def test_broken_profile_file_is_ignored(tmp_path):
+    path = tmp_path / 'weights.json'
+    path.write_text('{"site": [1, 2]}', encoding='utf-8')
+    assert load_weight_profile('site', path=str(path)) == BUILTIN_WEIGHT_PROFILES['default']
+
+
+@pytest.mark.parametrize('weight, expected', [
+    (None, 1), ('3', 1), (True, 1), (0, 0), (-2, 0), (0.2, 1), (2.6, 3), (7, 7), (1e6, RULE_WEIGHT_SCALE_MAX),
+])
+def test_scale_rule_weight(weight, expected):
+    assert scale_rule_weight(weight) == expected
+
+
+def test_objective_shares():
+    assert objective_shares({'weekday': 0}) == {}
+    assert objective_shares({'weekday': 25, 'staffing_shortage': 75, 'helping': 0}) == {'staffing_shortage': 0.75, 'weekday': 0.25}